@@ -0,0 +1,208 @@
+"""
+批量问答模块
+从 JSONL 文件读取问题，分组批量计算查询向量、用一次多查询 FAISS 搜索检索文档块，
+在并发上限内同时调用大模型，每个问题完成后立即写入结果文件；单个问题失败不影响其他问题
+"""
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterator, Tuple
+
+from instrumentation import count, span
+
+
+def read_batch_items(input_path: str) -> Iterator[Tuple[str, str, str]]:
+    """
+    逐行读取问题文件
+
+    每行是一个 JSON 对象，问题放在 "query"（或 "question"）字段，可选的 "id" 字段原样写回结果；
+    没有 id 时使用行号
+
+    参数:
+        input_path: JSONL 问题文件路径
+
+    返回:
+        (id, query, error) 迭代器，行格式错误时 query 为None、error 为错误信息
+    """
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield str(line_number), None, f"第 {line_number} 行不是合法的 JSON：{e}"
+                continue
+            if not isinstance(item, dict):
+                yield str(line_number), None, f"第 {line_number} 行不是 JSON 对象"
+                continue
+            item_id = str(item.get("id", line_number))
+            query = item.get("query") or item.get("question")
+            if not isinstance(query, str) or not query.strip():
+                yield item_id, None, f"第 {line_number} 行缺少 query 字段"
+                continue
+            yield item_id, query, None
+
+
+class BatchWriter:
+    """将结果逐行写入 JSONL 文件并立即刷新，同时统计成功和失败数量"""
+
+    def __init__(self, output_path: str):
+        self._file = open(output_path, "w", encoding="utf-8")
+        self.succeeded = 0
+        self.failed = 0
+
+    def write(self, item_id: str, query: str, answer: str = None, sources: list = None, timings: dict = None, error: str = None):
+        record = {"id": item_id, "query": query}
+        if error is None:
+            record.update(answer=answer, sources=sources or [])
+            self.succeeded += 1
+        else:
+            record["error"] = error
+            self.failed += 1
+        record["timings"] = {name: round(value * 1000, 2) for name, value in (timings or {}).items()}
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def embed_group(engine, queries: list) -> list:
+    """批量计算一组查询向量；整批失败时逐条重试，单条失败的位置为异常对象"""
+    try:
+        return engine.embed_queries(queries)
+    except Exception:
+        vectors = []
+        for query in queries:
+            try:
+                vectors.append(engine.embed_queries([query])[0])
+            except Exception as e:
+                vectors.append(e)
+        return vectors
+
+
+def run_batch(engine, input_path: str, output_path: str, batch_size: int = 64, max_concurrency: int = 8) -> dict:
+    """
+    批量回答问题文件中的全部问题，结果按完成顺序写入输出文件
+
+    所有问题都在查询引擎的默认检索范围（engine.search_filter）内检索。
+    每个结果包含 id、query、answer、sources 以及各阶段耗时（毫秒）：
+    embed / search 为所在分组的批量嵌入和搜索耗时，llm 为该问题的大模型调用耗时，
+    total 为从分组开始处理到写入结果的耗时；失败的问题写入 error 字段
+
+    参数:
+        engine: QueryEngine 实例
+        input_path: JSONL 问题文件路径
+        output_path: JSONL 结果文件路径
+        batch_size: 每组批量嵌入和搜索的问题数
+        max_concurrency: 同时进行的大模型请求数上限
+
+    返回:
+        统计信息字典：total / succeeded / failed / seconds
+    """
+    start = time.perf_counter()
+    writer = BatchWriter(output_path)
+    pending = {}  # 未完成的大模型请求 → (id, 问题, 上下文, 阶段耗时, 分组开始时间)
+    scope = engine.cache_scope()
+
+    def generate(query, context, embedding, timings):
+        """在线程池中调用大模型（上下文已在主线程构建）"""
+        llm_start = time.perf_counter()
+        prompt = engine.build_prompt(query, context.text)
+        count("llm_calls")
+        count("prompt_chars", len(prompt))
+        try:
+            with span("query.llm"):
+                response_text = engine.llm.invoke(prompt)
+        finally:
+            timings["llm"] = time.perf_counter() - llm_start
+        if engine.answer_cache is not None:
+            engine.answer_cache.put(embedding, response_text, context.docs, scope)
+        return response_text
+
+    def drain(limit: int):
+        """写出已完成的请求，直到未完成的请求数不超过 limit"""
+        while len(pending) > limit:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item_id, query, context, timings, group_start = pending.pop(future)
+                try:
+                    response_text = future.result()
+                except Exception as e:
+                    timings["total"] = time.perf_counter() - group_start
+                    writer.write(item_id, query, timings=timings, error=f"大模型调用失败：{e}")
+                    continue
+                timings["total"] = time.perf_counter() - group_start
+                writer.write(item_id, query, response_text, engine.get_sources(context.docs), timings)
+
+    try:
+        items = read_batch_items(input_path)
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+            while True:
+                group = []
+                for item_id, query, error in items:
+                    if error is not None:
+                        writer.write(item_id, query, error=error)
+                        continue
+                    group.append((item_id, query))
+                    if len(group) >= batch_size:
+                        break
+                if not group:
+                    break
+
+                group_start = time.perf_counter()
+                engine.check_snapshot()
+                queries = [query for _, query in group]
+
+                # 阶段一：批量计算查询向量
+                embed_start = time.perf_counter()
+                vectors = embed_group(engine, queries)
+                embed_seconds = time.perf_counter() - embed_start
+
+                # 语义答案缓存命中的问题直接写出，其余问题参与检索
+                to_search = []
+                for (item_id, query), vector in zip(group, vectors):
+                    if isinstance(vector, Exception):
+                        writer.write(item_id, query, timings={"embed": embed_seconds}, error=f"查询嵌入失败：{vector}")
+                        continue
+                    cached = engine.answer_cache.get(vector, scope) if engine.answer_cache is not None else None
+                    if cached is not None:
+                        writer.write(item_id, query, cached[0], engine.get_sources(cached[1]),
+                                     {"embed": embed_seconds, "total": time.perf_counter() - group_start})
+                        continue
+                    to_search.append((item_id, query, vector))
+                if not to_search:
+                    continue
+
+                # 阶段二：一次多查询 FAISS 搜索
+                search_start = time.perf_counter()
+                try:
+                    results = engine.retrieve_many([vector for _, _, vector in to_search])
+                except Exception as e:
+                    for item_id, query, _ in to_search:
+                        writer.write(item_id, query, timings={"embed": embed_seconds}, error=f"检索失败：{e}")
+                    continue
+                search_seconds = time.perf_counter() - search_start
+
+                # 阶段三：并发调用大模型，完成一个写出一个
+                for (item_id, query, vector), docs in zip(to_search, results):
+                    timings = {"embed": embed_seconds, "search": search_seconds}
+                    if not docs:
+                        writer.write(item_id, query, timings=timings, error="检索范围内没有文档块")
+                        continue
+                    context = engine.build_context(docs)
+                    future = executor.submit(generate, query, context, vector, timings)
+                    pending[future] = (item_id, query, context, timings, group_start)
+                    # 控制排队中的请求数量，边提交边写出已完成的结果
+                    drain(max_concurrency * 2)
+            drain(0)
+    finally:
+        writer.close()
+    return {
+        "total": writer.succeeded + writer.failed,
+        "succeeded": writer.succeeded,
+        "failed": writer.failed,
+        "seconds": time.perf_counter() - start,
+    }
@@ -0,0 +1,109 @@
+"""
+近似最近邻索引基准测试：在不同规模的合成向量上对比 Flat / IVF / HNSW 索引，
+报告相对 Flat 精确搜索的 recall@k 以及单条查询延迟的 p50 / p99
+
+合成向量由若干高斯簇组成（接近真实嵌入的聚类结构），查询向量为库内向量加噪声
+
+使用方法:
+    python benchmarks/bench_ann_index.py --sizes 10000 50000 --dim 256 --k 4
+    python benchmarks/bench_ann_index.py --nlist 256 --nprobe 8 32 --ef-search 32 128
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_index import (  # noqa: E402
+    MIN_POINTS_PER_CENTROID,
+    apply_search_params,
+    create_index,
+    describe_index,
+    make_index_config,
+    training_size,
+)
+
+
+def synthetic_vectors(n, dim, clusters=64, seed=0):
+    """生成由 clusters 个高斯簇组成的单位向量"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(vectors, count, seed=1):
+    """从库内向量中抽样并加噪声作为查询向量"""
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.integers(0, len(vectors), count)] + 0.05 * rng.standard_normal((count, vectors.shape[1])).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def measure(index, queries, k):
+    """逐条查询（与在线问答一致），返回 (结果ID矩阵, p50毫秒, p99毫秒)"""
+    results = np.empty((len(queries), k), dtype=np.int64)
+    latencies = []
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results[i] = ids[0]
+    return results, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def recall_at_k(results, ground_truth):
+    """ANN 结果中命中精确 top-k 的比例"""
+    hits = sum(len(set(r) & set(g)) for r, g in zip(results, ground_truth))
+    return hits / ground_truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="近似最近邻索引基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 50_000], help="向量库规模")
+    parser.add_argument("--dim", type=int, default=256, help="向量维度")
+    parser.add_argument("--k", type=int, default=4, help="每次检索返回的数量")
+    parser.add_argument("--queries", type=int, default=500, help="查询数量")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF 聚类数（默认：约 4*sqrt(N)）")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 32], help="IVF 每次搜索的聚类数")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW 每个节点的邻居数")
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[32, 128], help="HNSW 查询候选队列长度")
+    args = parser.parse_args()
+
+    print(f"{'规模':>8} | {'索引':<48} | {'构建(s)':>8} | {'recall@' + str(args.k):>9} | {'p50(ms)':>8} | {'p99(ms)':>8}")
+    print("-" * 102)
+    for size in args.sizes:
+        vectors = synthetic_vectors(size, args.dim)
+        queries = make_queries(vectors, args.queries)
+        nlist = min(args.nlist or int(4 * np.sqrt(size)), size // MIN_POINTS_PER_CENTROID)
+
+        configs = [make_index_config("flat")]
+        configs += [make_index_config("ivf", nlist=nlist, nprobe=nprobe) for nprobe in args.nprobe]
+        configs += [make_index_config("hnsw", m=args.hnsw_m, ef_search=ef) for ef in args.ef_search]
+
+        ground_truth = None
+        built = {}
+        for config in configs:
+            # 同一索引结构只构建一次，不同搜索参数（nprobe / efSearch）复用同一个索引
+            key = (config["type"], config.get("nlist"), config.get("m"))
+            build_time = "-"
+            if key not in built:
+                start = time.perf_counter()
+                index = create_index(args.dim, config, training_vectors=vectors[:training_size(config)])
+                index.add(vectors)
+                build_time = f"{time.perf_counter() - start:.2f}"
+                built[key] = index
+            index = built[key]
+            apply_search_params(index, config)
+
+            results, p50, p99 = measure(index, queries, args.k)
+            if ground_truth is None:
+                ground_truth = results
+            recall = recall_at_k(results, ground_truth)
+            print(f"{size:>8} | {describe_index(config):<48} | {build_time:>8} | {recall:>9.3f} | {p50:>8.3f} | {p99:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
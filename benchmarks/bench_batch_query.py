@@ -0,0 +1,85 @@
+"""
+批量问答基准测试：对比逐个调用 QueryEngine.answer 与 run_batch（批量嵌入 + 一次多查询搜索 + 并发大模型调用）
+回答同一组问题的总耗时和吞吐量，并汇总结果文件中各阶段耗时的中位数
+
+使用方法:
+    python benchmarks/bench_batch_query.py --questions 200 --embed-latency 0.05 --llm-latency 0.5 --concurrency 1 8 32
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_query import run_batch  # noqa: E402
+from benchmarks.bench_query_engine import build_store  # noqa: E402
+from benchmarks.fakes import FakeEmbeddings, FakeLLM  # noqa: E402
+from user_query import QueryEngine  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量问答基准测试")
+    parser.add_argument("--chunks", type=int, default=20000, help="索引中的文本块数量")
+    parser.add_argument("--questions", type=int, default=200, help="问题数量")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="每次嵌入请求的模拟延迟（秒）")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="每次大模型调用的模拟延迟（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.02, help="大模型调用的模拟失败率")
+    parser.add_argument("--batch-size", type=int, default=64, help="每组批量嵌入和检索的问题数")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="大模型并发上限")
+    parser.add_argument("--skip-sequential", action="store_true", help="跳过逐个回答的对照组")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store_path = os.path.join(tmp, "store")
+        build_store(store_path, args.chunks, FakeEmbeddings())
+        input_path = os.path.join(tmp, "questions.jsonl")
+        questions = [f"客户经理被投诉{i}次扣多少分？" for i in range(args.questions)]
+        with open(input_path, "w", encoding="utf-8") as f:
+            for i, question in enumerate(questions):
+                f.write(json.dumps({"id": i, "query": question}, ensure_ascii=False) + "\n")
+
+        def make_engine():
+            embeddings = FakeEmbeddings(latency=args.embed_latency)
+            llm = FakeLLM(latency=args.llm_latency, failure_rate=args.failure_rate)
+            with contextlib.redirect_stdout(io.StringIO()):
+                # 问题互不相同，关闭缓存以免影响对比
+                return QueryEngine(store_path, embeddings=embeddings, llm=llm, query_cache_size=0, answer_cache_threshold=None)
+
+        print(f"{'方式':<18} | {'总耗时(s)':>9} | {'问题/秒':>8} | {'失败':>4} | {'embed p50':>9} | {'search p50':>10} | {'llm p50':>8}")
+        print("-" * 86)
+        if not args.skip_sequential:
+            engine = make_engine()
+            failed = 0
+            start = time.perf_counter()
+            for question in questions:
+                try:
+                    engine.answer(question)
+                except Exception:
+                    failed += 1
+            elapsed = time.perf_counter() - start
+            print(f"{'逐个回答':<18} | {elapsed:>9.2f} | {len(questions) / elapsed:>8.1f} | {failed:>4} | {'-':>9} | {'-':>10} | {'-':>8}")
+
+        for concurrency in args.concurrency:
+            engine = make_engine()
+            output_path = os.path.join(tmp, f"results-{concurrency}.jsonl")
+            stats = run_batch(engine, input_path, output_path, batch_size=args.batch_size, max_concurrency=concurrency)
+            with open(output_path, "r", encoding="utf-8") as f:
+                timings = [json.loads(line)["timings"] for line in f]
+
+            def p50(name):
+                values = [t[name] for t in timings if name in t]
+                return f"{statistics.median(values):.1f}ms" if values else "-"
+
+            label = f"run_batch 并发{concurrency}"
+            print(f"{label:<18} | {stats['seconds']:>9.2f} | {stats['total'] / stats['seconds']:>8.1f} | {stats['failed']:>4} | "
+                  f"{p50('embed'):>9} | {p50('search'):>10} | {p50('llm'):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+文本块页码映射基准测试：对比旧的逐块 text.find + 线性扫描行范围的做法
+与偏移量分割 + 二分查找的做法，并校验两者得到的页码完全一致
+
+使用方法:
+    python benchmarks/bench_chunk_mapping.py --dataset ./dataset --scales 1 16 64
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunking import chunk_text_with_pages, create_text_splitter  # noqa: E402
+from data_process import extract_pdf_files  # noqa: E402
+
+
+def legacy_page_mapping(text, chunks, page_numbers, line_ranges):
+    """重构前 process_text_with_splitter 中的页码映射逻辑（仅用于对比）"""
+    result = []
+    search_start = 0
+    for chunk in chunks:
+        search_from = max(0, search_start - 128)
+        chunk_start = text.find(chunk, search_from)
+        if chunk_start == -1:
+            chunk_start = text.find(chunk)
+        if chunk_start != -1:
+            page_num = page_numbers[0]
+            for line_idx, (line_start, line_end) in enumerate(line_ranges):
+                if line_start <= chunk_start <= line_end:
+                    page_num = page_numbers[line_idx]
+                    break
+                elif chunk_start < line_start:
+                    if line_idx > 0:
+                        page_num = page_numbers[line_idx - 1]
+                    break
+            else:
+                page_num = page_numbers[-1]
+            search_start = chunk_start + len(chunk) - 64
+        else:
+            page_num = page_numbers[-1]
+        result.append(page_num)
+    return result
+
+
+def build_corpus(dataset_path, scale):
+    """按 initialize_knowledge_base 的方式拼接语料，并将文件列表重复 scale 次"""
+    pdf_files = sorted(f for f in os.listdir(dataset_path) if f.lower().endswith(".pdf"))
+    extracted = extract_pdf_files([os.path.join(dataset_path, f) for f in pdf_files])
+    parts, all_page_numbers, all_line_ranges = [], [], []
+    position = 0
+    for copy in range(scale):
+        for pdf_file, (text, page_numbers, line_ranges) in zip(pdf_files, extracted):
+            marker = f"\n\n[文档: {copy}-{pdf_file}]\n\n"
+            offset = position + len(marker)
+            parts.append(marker + text)
+            all_line_ranges.extend((s + offset, e + offset) for s, e in line_ranges)
+            all_page_numbers.extend(f"{copy}-{pdf_file}:{p}" for p in page_numbers)
+            position += len(marker) + len(text)
+    return "".join(parts), all_page_numbers, all_line_ranges
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文本块页码映射基准测试")
+    parser.add_argument("--dataset", type=str, default="./dataset", help="PDF 数据集目录")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 16, 64], help="语料放大倍数")
+    args = parser.parse_args()
+
+    splitter = create_text_splitter()
+    print(f"{'倍数':>4} | {'字符数':>10} | {'块数':>6} | {'旧做法(s)':>10} | {'新做法(s)':>10} | 页码一致")
+    print("-" * 66)
+    for scale in args.scales:
+        text, page_numbers, line_ranges = build_corpus(args.dataset, scale)
+
+        start = time.perf_counter()
+        chunks = splitter.split_text(text)
+        legacy = legacy_page_mapping(text, chunks, page_numbers, line_ranges)
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        records = chunk_text_with_pages(text, page_numbers, line_ranges, splitter)
+        new_time = time.perf_counter() - start
+
+        same = legacy == [page for _, page, _, _ in records]
+        print(f"{scale:>4} | {len(text):>10} | {len(records):>6} | {legacy_time:>10.3f} | {new_time:>10.3f} | {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+上下文构建基准测试：用 dataset/ 中真实的文本块模拟检索结果，统计合并重叠块、去重和 token 预算
+相对直接拼接节省的字符数和 token 数，以及构建耗时
+
+检索结果的组成：一部分查询命中同一文档中连续的几个文本块（相邻块重叠 chunk_overlap 个字符），
+一部分随机命中互不相邻的文本块，另有一部分重复命中内容相同的文本块（同一份 PDF 的副本）
+
+使用方法:
+    python benchmarks/bench_context_builder.py --dataset ./dataset --k 4 8 --budget 3000 1000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document  # noqa: E402
+
+from chunking import chunk_metadata, chunk_text_with_pages, create_text_splitter  # noqa: E402
+from context_builder import build_context  # noqa: E402
+from data_process import extract_pdf_files  # noqa: E402
+
+
+def load_chunks(dataset_path):
+    """按构建知识库的方式分块，返回每个文档的文本块列表"""
+    pdf_files = sorted(f for f in os.listdir(dataset_path) if f.lower().endswith(".pdf"))
+    extracted = extract_pdf_files([os.path.join(dataset_path, f) for f in pdf_files])
+    splitter = create_text_splitter()
+    documents = []
+    for pdf_file, (text, page_numbers, line_ranges) in zip(pdf_files, extracted):
+        records = chunk_text_with_pages(text, page_numbers, line_ranges, splitter)
+        documents.append([
+            Document(page_content=chunk, metadata=chunk_metadata(f"{pdf_file}:{page}", start, end))
+            for chunk, page, start, end in records
+        ])
+    return documents
+
+
+def make_retrievals(documents, k, count, seed=0):
+    """生成 count 组检索结果（每组 k 个文本块）"""
+    rng = random.Random(seed)
+    all_chunks = [doc for chunks in documents for doc in chunks]
+    retrievals = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            # 同一文档中连续的文本块，打乱排名
+            chunks = rng.choice([chunks for chunks in documents if len(chunks) >= k])
+            first = rng.randrange(len(chunks) - k + 1)
+            docs = chunks[first:first + k]
+            rng.shuffle(docs)
+        elif kind == 1:
+            docs = rng.sample(all_chunks, k)
+        else:
+            # 同一文本块出现在两份副本中
+            docs = rng.sample(all_chunks, k - k // 2)
+            docs += [Document(page_content=d.page_content, metadata=dict(d.metadata, source="副本-" + d.metadata["source"]))
+                     for d in docs[:k // 2]]
+        retrievals.append(docs)
+    return retrievals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上下文构建基准测试")
+    parser.add_argument("--dataset", type=str, default="./dataset", help="PDF 数据集目录")
+    parser.add_argument("--k", type=int, nargs="+", default=[4, 8], help="每次检索返回的文本块数量")
+    parser.add_argument("--budget", type=int, nargs="+", default=[3000, 1000], help="上下文 token 预算")
+    parser.add_argument("--queries", type=int, default=300, help="模拟查询次数")
+    args = parser.parse_args()
+
+    documents = load_chunks(args.dataset)
+    print(f"{'k':>3} | {'预算':>6} | {'拼接字符':>8} | {'构建后字符':>10} | {'节省字符':>8} | {'节省tokens':>10} | {'合并':>5} | {'去重':>5} | {'耗时(ms)':>8}")
+    print("-" * 96)
+    for k in args.k:
+        retrievals = make_retrievals(documents, k, args.queries)
+        for budget in args.budget:
+            results = []
+            start = time.perf_counter()
+            for docs in retrievals:
+                results.append(build_context(docs, budget))
+            elapsed = (time.perf_counter() - start) * 1000 / len(retrievals)
+            print(f"{k:>3} | {budget:>6} | {statistics.mean(r.naive_chars for r in results):>8.0f} | "
+                  f"{statistics.mean(r.chars for r in results):>10.0f} | {statistics.mean(r.saved_chars for r in results):>8.0f} | "
+                  f"{statistics.mean(r.saved_tokens for r in results):>10.0f} | {sum(r.merged for r in results):>5} | "
+                  f"{sum(r.duplicates for r in results):>5} | {elapsed:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+构建时文本块去重基准测试：由 dataset/ 的页面文本合成含完全重复副本和近似重复副本（每隔若干字符改动一个字符）的语料，
+分别以不去重、只合并完全重复和不同近似重复阈值流式构建知识库，报告文本块数、去除的重复文本块、
+嵌入调用次数、索引大小和构建耗时，并校验去重后每个原始文本块的（来源文件，页码）仍能从保留的向量中找到
+
+使用方法:
+    python benchmarks/bench_dedup.py --exact-copies 2 --near-copies 2
+    python benchmarks/bench_dedup.py --thresholds 1.0 0.9 0.8 0.7 --edit-every 100
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_suite import directory_bytes  # noqa: E402
+from benchmarks.fakes import FakeEmbeddings  # noqa: E402
+from data_process import ingest_documents, iter_pdf_pages  # noqa: E402
+from dedup import make_dedup_config  # noqa: E402
+from docstore import chunk_locations  # noqa: E402
+
+
+def near_copy(pages: list, copy: int, edit_every: int) -> list:
+    """每隔 edit_every 个非空白字符把一个字符换成副本编号对应的字符，模拟只有少量改动的近似重复文档"""
+    marker = chr(ord("Ａ") + copy % 26)
+    varied = []
+    for page_number, text in pages:
+        chars = list(text or "")
+        seen = 0
+        for i, char in enumerate(chars):
+            if not char.isspace():
+                seen += 1
+                if seen % edit_every == 0:
+                    chars[i] = marker
+        varied.append((page_number, "".join(chars)))
+    return varied
+
+
+def build_documents(args) -> list:
+    """原始文档 + 完全重复副本 + 近似重复副本"""
+    file_paths = sorted(os.path.join(args.dataset, f) for f in os.listdir(args.dataset) if f.lower().endswith(".pdf"))
+    pages_by_file = [[] for _ in file_paths]
+    for file_index, page_number, page_text in iter_pdf_pages(file_paths):
+        pages_by_file[file_index].append((page_number, page_text))
+    documents = []
+    for path, pages in zip(file_paths, pages_by_file):
+        name = os.path.basename(path)
+        documents.append((name, pages))
+        documents += [(f"exact{copy}_{name}", pages) for copy in range(args.exact_copies)]
+        documents += [(f"near{copy}_{name}", near_copy(pages, copy, args.edit_every)) for copy in range(args.near_copies)]
+    return documents
+
+
+def run(args, documents: list, tmp: str, threshold) -> dict:
+    """以一个去重阈值（None 表示不去重）构建一次知识库，返回指标"""
+    store_path = os.path.join(tmp, f"store-{threshold}")
+    embeddings = FakeEmbeddings(args.dim)
+    config = None if threshold is None else make_dedup_config(threshold, num_perm=args.num_perm)
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        knowledge_base = ingest_documents(documents, save_path=store_path, embeddings=embeddings, dedup_config=config)
+    seconds = time.perf_counter() - start
+    locations = {(source, page) for _, source, page in chunk_locations(knowledge_base)}
+    summary = next((line for line in output.getvalue().splitlines() if line.startswith("去重：")), "")
+    return {
+        "vectors": knowledge_base.index.ntotal,
+        "calls": embeddings.calls,
+        "texts": embeddings.texts_embedded,
+        "index_bytes": knowledge_base.index.ntotal * knowledge_base.index.d * 4,
+        "store_bytes": directory_bytes(store_path),
+        "seconds": seconds,
+        "locations": locations,
+        "summary": summary,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建时文本块去重基准测试")
+    parser.add_argument("--dataset", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dataset"),
+                        help="PDF 数据集目录")
+    parser.add_argument("--exact-copies", type=int, default=2, help="每个 PDF 的完全重复副本数")
+    parser.add_argument("--near-copies", type=int, default=2, help="每个 PDF 的近似重复副本数")
+    parser.add_argument("--edit-every", type=int, default=200, help="近似重复副本每隔多少个字符改动一个字符")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[1.0, 0.9, 0.8], help="要对比的去重阈值")
+    parser.add_argument("--num-perm", type=int, default=64, help="MinHash 签名长度")
+    parser.add_argument("--dim", type=int, default=256, help="替身嵌入模型的向量维度")
+    args = parser.parse_args()
+
+    documents = build_documents(args)
+    print(f"{len(documents)} 个文档（每个 PDF 含 {args.exact_copies} 个完全重复副本、{args.near_copies} 个近似重复副本，"
+          f"近似副本每 {args.edit_every} 个字符改动一个字符）")
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {None: run(args, documents, tmp, None)}
+        for threshold in args.thresholds:
+            results[threshold] = run(args, documents, tmp, threshold)
+
+    base = results[None]
+    print(f"{'去重阈值':<8} | {'向量数':>6} | {'减少':>6} | {'嵌入调用':>8} | {'嵌入文本块':>10} | "
+          f"{'索引(KB)':>9} | {'知识库(KB)':>10} | {'构建(s)':>7} | 出处完整")
+    print("-" * 104)
+    for threshold, r in results.items():
+        label = "不去重" if threshold is None else f"{threshold:g}"
+        reduction = (1 - r["vectors"] / base["vectors"]) * 100
+        print(f"{label:<8} | {r['vectors']:>6} | {reduction:>5.1f}% | {r['calls']:>8} | {r['texts']:>10} | "
+              f"{r['index_bytes'] / 1024:>9.1f} | {r['store_bytes'] / 1024:>10.1f} | {r['seconds']:>7.2f} | "
+              f"{r['locations'] == base['locations']}")
+    for threshold, r in results.items():
+        if r["summary"]:
+            print(f"  {threshold:g}：{r['summary']}")
+
+
+if __name__ == "__main__":
+    main()
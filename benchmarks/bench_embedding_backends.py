@@ -0,0 +1,106 @@
+"""
+嵌入后端基准测试：在数据集的文本块上对比各嵌入后端的拟合耗时、文档嵌入吞吐量、单条查询延迟，
+以及检索质量（从每个文本块中截取一段作为查询，统计 top-1 / top-5 命中原文本块的比例）
+
+本地后端（local-tfidf）不需要网络；FakeEmbeddings 按 --remote-latency 模拟远程请求延迟作为对照；
+设置了 DASHSCOPE_API_KEY 时同时测试 DashScope
+
+使用方法:
+    python benchmarks/bench_embedding_backends.py --copies 20 --dimension 128 256
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_context_builder import load_chunks  # noqa: E402
+from benchmarks.fakes import FakeEmbeddings  # noqa: E402
+from data_process import create_embeddings  # noqa: E402
+from embedding_backends import fit_embeddings, requires_fit  # noqa: E402
+
+
+def make_queries(chunks, length):
+    """从每个文本块中间截取 length 个字符作为查询"""
+    queries = []
+    for chunk in chunks:
+        start = max(0, (len(chunk) - length) // 2)
+        queries.append(chunk[start:start + length])
+    return queries
+
+
+def retrieval_hit_rate(embeddings, chunks, queries, k=5):
+    """返回 (top-1 命中率, top-k 命中率)：查询的最近邻中包含其来源文本块的比例"""
+    vectors = np.asarray(embeddings.embed_documents(chunks), dtype=np.float32)
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    query_vectors = np.asarray(embeddings.embed_documents(queries), dtype=np.float32)
+    _, ids = index.search(query_vectors, k)
+    expected = np.arange(len(queries))[:, None]
+    return float(np.mean(ids[:, 0] == expected[:, 0])), float(np.mean((ids == expected).any(axis=1)))
+
+
+def bench_backend(label, embeddings, chunks, corpus, queries, query_runs):
+    fit_seconds = 0.0
+    if requires_fit(embeddings):
+        start = time.perf_counter()
+        fit_embeddings(embeddings, corpus)
+        fit_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectors = embeddings.embed_documents(corpus)
+    embed_seconds = time.perf_counter() - start
+
+    latencies = []
+    for query in queries[:query_runs]:
+        query_start = time.perf_counter()
+        embeddings.embed_query(query)
+        latencies.append(time.perf_counter() - query_start)
+
+    top1, top5 = retrieval_hit_rate(embeddings, chunks, queries)
+    print(f"{label:<24} | {len(vectors[0]):>5} | {fit_seconds:>8.2f} | {len(corpus) / embed_seconds:>10.0f} | "
+          f"{statistics.median(latencies) * 1000:>10.3f} | {top1:>6.1%} | {top5:>6.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="嵌入后端基准测试")
+    parser.add_argument("--dataset", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dataset"),
+                        help="PDF 数据集目录")
+    parser.add_argument("--copies", type=int, default=20, help="吞吐量测试时将文本块复制的份数（每份追加编号以免完全相同）")
+    parser.add_argument("--dimension", type=int, nargs="+", default=[128, 256], help="本地嵌入模型的向量维度")
+    parser.add_argument("--query-length", type=int, default=40, help="从文本块中截取的查询长度（字符）")
+    parser.add_argument("--query-runs", type=int, default=30, help="单条查询延迟的测量次数")
+    parser.add_argument("--remote-latency", type=float, default=0.1, help="模拟远程嵌入请求的延迟（秒）")
+    args = parser.parse_args()
+
+    chunks = [doc.page_content for docs in load_chunks(args.dataset) for doc in docs]
+    corpus = [f"{chunk} #{copy}" for copy in range(args.copies) for chunk in chunks]
+    queries = make_queries(chunks, args.query_length)
+    print(f"文本块 {len(chunks)} 个，吞吐量测试 {len(corpus)} 个，查询长度 {args.query_length} 字符")
+    print(f"{'后端':<24} | {'维度':>5} | {'拟合(s)':>8} | {'文档/秒':>10} | {'查询p50(ms)':>10} | {'top-1':>6} | {'top-5':>6}")
+    print("-" * 92)
+
+    for dimension in args.dimension:
+        # 与构建知识库时一样不带缓存和批处理包装
+        embeddings = create_embeddings(backend="local-tfidf", dimension=dimension)
+        bench_backend(f"local-tfidf {dimension}维", embeddings, chunks, corpus, queries, args.query_runs)
+
+    # 远程模型的对照：每次请求固定延迟，向量与文本内容无语义关系（检索质量仅作下限参考）
+    remote = FakeEmbeddings(latency=args.remote_latency)
+    remote_corpus = corpus[:len(chunks)]
+    bench_backend(f"模拟远程 {args.remote_latency * 1000:.0f}ms", remote, chunks, remote_corpus, queries, 5)
+
+    if os.getenv("DASHSCOPE_API_KEY"):
+        embeddings = create_embeddings(backend="dashscope")
+        bench_backend("dashscope", embeddings, chunks, chunks, queries, 5)
+    else:
+        print("未设置 DASHSCOPE_API_KEY，跳过 DashScope")
+
+
+if __name__ == "__main__":
+    main()
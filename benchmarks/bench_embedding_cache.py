@@ -0,0 +1,46 @@
+"""
+嵌入缓存基准测试：使用本地替身嵌入模型离线重建知识库两次，
+对比冷缓存与热缓存下的嵌入调用次数和重建耗时
+
+使用方法:
+    python benchmarks/bench_embedding_cache.py --dataset ./dataset --latency 0.05
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import FakeEmbeddings  # noqa: E402
+from embedding_cache import CachedEmbeddings, EmbeddingCache  # noqa: E402
+from knowledge_base_manager import initialize_knowledge_base  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="嵌入缓存冷/热重建基准测试")
+    parser.add_argument("--dataset", type=str, default="./dataset", help="PDF 数据集目录")
+    parser.add_argument("--latency", type=float, default=0.05, help="替身嵌入模型每次调用的延迟（秒）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        cache = EmbeddingCache(os.path.join(work_dir, "embeddings.sqlite"))
+        store_path = os.path.join(work_dir, "vector_store")
+
+        for label in ("冷缓存", "热缓存"):
+            base = FakeEmbeddings(latency=args.latency)
+            embeddings = CachedEmbeddings(base, cache, model_name="fake")
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                initialize_knowledge_base(args.dataset, store_path, force_rebuild=True, embeddings=embeddings)
+            elapsed = time.perf_counter() - start
+            print(f"{label}: 耗时 {elapsed:.2f}s，远程调用 {base.calls} 次，{embeddings.summary()}")
+
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+嵌入流水线吞吐量基准测试：对本地替身嵌入服务（注入延迟和失败）
+对比串行逐批请求与不同并发度下的 BatchedEmbeddings 吞吐量
+
+使用方法:
+    python benchmarks/bench_embedding_pipeline.py --chunks 2000 --latency 0.05 --failure-rate 0.02
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import FakeEmbeddingServer, HttpEmbeddings  # noqa: E402
+from embedding_pipeline import BatchedEmbeddings  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="嵌入流水线吞吐量基准测试")
+    parser.add_argument("--chunks", type=int, default=2000, help="文本块数量")
+    parser.add_argument("--batch-size", type=int, default=25, help="每批文本块数量")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16], help="要测试的并发度")
+    parser.add_argument("--rate", type=float, default=None, help="每秒请求数上限")
+    parser.add_argument("--latency", type=float, default=0.05, help="替身服务每个请求的延迟（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="替身服务返回 503 的概率")
+    parser.add_argument("--dimension", type=int, default=256, help="替身向量维度")
+    args = parser.parse_args()
+    # 重试日志会打乱表格输出
+    logging.getLogger().setLevel(logging.ERROR)
+
+    texts = [f"合成文本块 {i}：客户经理考核办法第{i % 50}条。" for i in range(args.chunks)]
+
+    with FakeEmbeddingServer(latency=args.latency, failure_rate=args.failure_rate, dimension=args.dimension) as server:
+        client = HttpEmbeddings(server.url)
+        print(f"{'并发度':>6} | {'耗时(s)':>8} | {'吞吐量(块/s)':>12} | {'重试次数':>8} | 顺序正确")
+        print("-" * 60)
+        expected = None
+        for workers in args.workers:
+            pipeline = BatchedEmbeddings(
+                client,
+                batch_size=args.batch_size,
+                max_workers=workers,
+                requests_per_second=args.rate,
+                backoff=0.05,
+            )
+            start = time.perf_counter()
+            vectors = pipeline.embed_documents(texts)
+            elapsed = time.perf_counter() - start
+            if expected is None:
+                expected = vectors
+            print(f"{workers:>6} | {elapsed:>8.2f} | {len(texts) / elapsed:>12.1f} | {pipeline.retries:>8} | {vectors == expected}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+PDF 文本提取缓存基准测试：在 dataset/ 上对比不使用缓存、冷缓存（空缓存，边提取边写入）和热缓存（全部命中）时
+文本提取本身以及强制全量重建（--force）的耗时，校验读取缓存得到的文本与直接解析 PDF 完全一致，
+并报告缓存文件的大小。重建使用本地替身嵌入模型，只衡量提取缓存的效果
+
+使用方法:
+    python benchmarks/bench_extraction_cache.py --dataset ./dataset --repeat 3
+    python benchmarks/bench_extraction_cache.py --workers 2 --copies 4
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_suite import build_corpus  # noqa: E402
+from benchmarks.fakes import FakeEmbeddings  # noqa: E402
+from data_process import extract_pdf_files  # noqa: E402
+from extraction_cache import ExtractionCache  # noqa: E402
+from knowledge_base_manager import initialize_knowledge_base  # noqa: E402
+
+
+def timed(function) -> tuple:
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def run(args, corpus_path: str, tmp: str, mode: str) -> dict:
+    """按模式（none / cold / warm）测量一次提取和一次强制重建，返回耗时和提取结果"""
+    file_paths = sorted(os.path.join(corpus_path, f) for f in os.listdir(corpus_path))
+    store_path = os.path.join(tmp, "store")
+    cache_path = os.path.join(tmp, f"extraction-{mode}.sqlite")
+    if mode == "warm":
+        # 先完整提取一遍写入缓存
+        if not os.path.exists(cache_path):
+            extract_pdf_files(file_paths, workers=args.workers, cache=ExtractionCache(cache_path))
+    elif os.path.exists(cache_path):
+        os.remove(cache_path)
+
+    def make_cache():
+        return None if mode == "none" else ExtractionCache(cache_path)
+
+    extract_s, extracted = timed(lambda: extract_pdf_files(file_paths, workers=args.workers, cache=make_cache()))
+    if mode == "cold":
+        os.remove(cache_path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        rebuild_s, _ = timed(lambda: initialize_knowledge_base(
+            corpus_path, store_path, force_rebuild=True, embeddings=FakeEmbeddings(args.dim),
+            workers=args.workers, extraction_cache=make_cache()
+        ))
+    # 缓存以 WAL 模式写入，未合并的页面在 -wal 文件中
+    size = sum(os.path.getsize(path) for path in (cache_path, cache_path + "-wal") if os.path.exists(path))
+    return {"extract": extract_s, "rebuild": rebuild_s, "extracted": extracted, "size": size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF 文本提取缓存基准测试")
+    parser.add_argument("--dataset", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dataset"),
+                        help="PDF 数据集目录")
+    parser.add_argument("--copies", type=int, default=1, help="每个 PDF 复制的份数（默认只用 dataset/ 本身）")
+    parser.add_argument("--workers", type=int, default=1, help="PDF 文本提取的并行进程数")
+    parser.add_argument("--repeat", type=int, default=3, help="每种模式重复的次数（取最快的一次）")
+    parser.add_argument("--dim", type=int, default=256, help="替身嵌入模型的向量维度")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_path = os.path.join(tmp, "dataset")
+        file_paths = build_corpus(args.dataset, corpus_path, args.copies)
+        pdf_bytes = sum(os.path.getsize(path) for path in file_paths)
+        print(f"{len(file_paths)} 个 PDF（{pdf_bytes / 1e6:.2f} MB），提取进程数 {args.workers}，每种模式重复 {args.repeat} 次取最快")
+
+        results = {}
+        for mode in ("none", "cold", "warm"):
+            runs = [run(args, corpus_path, tmp, mode) for _ in range(args.repeat)]
+            results[mode] = {
+                "extract": min(r["extract"] for r in runs),
+                "rebuild": min(r["rebuild"] for r in runs),
+                "extracted": runs[0]["extracted"],
+                "size": runs[-1]["size"],
+            }
+
+    base = results["none"]
+    labels = {"none": "不使用缓存", "cold": "冷缓存", "warm": "热缓存"}
+    print(f"{'模式':<8} | {'提取(s)':>8} | {'加速比':>6} | {'强制重建(s)':>10} | {'加速比':>6} | {'缓存大小(KB)':>11} | 结果一致")
+    print("-" * 84)
+    for mode, r in results.items():
+        print(f"{labels[mode]:<8} | {r['extract']:>8.3f} | {base['extract'] / r['extract']:>6.1f} | "
+              f"{r['rebuild']:>10.3f} | {base['rebuild'] / r['rebuild']:>6.1f} | {r['size'] / 1024:>11.1f} | "
+              f"{r['extracted'] == base['extracted']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+命令行启动导入耗时基准测试：用 python -X importtime 在子进程中运行 main.py 的各个命令，
+汇总每个命令导入模块的总耗时和耗时最多的顶层导入，检查是否超出该命令的导入耗时预算，
+以及是否加载了该命令不需要的依赖（--help 不应加载 faiss 和 LangChain，查询不应加载 PDF 解析和文本分割，
+构建知识库不应加载大模型客户端）
+
+构建知识库使用本地嵌入模型，查询命令以空问题文件运行批量问答（创建完整的查询引擎，但不调用大模型），
+不访问网络；每个命令运行多次取导入总耗时最少的一次。超出预算或加载了禁止的模块时退出码为 1
+
+使用方法:
+    python benchmarks/bench_import_time.py
+    python benchmarks/bench_import_time.py --commands help query --repeats 5 --top 10
+    python benchmarks/bench_import_time.py --budget-scale 2   # 较慢的机器上放宽预算
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_suite import build_corpus  # noqa: E402
+
+# 命令名称 → (导入总耗时预算（毫秒）, 不允许加载的模块)
+# 预算比延迟导入后的常见实测值（7 次中最少：help 约 50ms、init 约 750ms、query 约 1100ms）高 15% 左右，
+# 低于延迟导入之前的常见实测值（约 850ms、950ms、1350ms）。init 和 query 前后只差 100～300ms，
+# 与机器负载造成的波动相当，重新在顶层导入不需要的依赖主要由禁止的模块列表发现
+BUDGETS = {
+    "help": (150, ("faiss", "langchain_community.vectorstores", "PyPDF2", "langchain_text_splitters.character",
+                   "knowledge_base_manager", "user_query", "langchain_community.llms", "dashscope")),
+    "init": (900, ("user_query", "langchain_community.llms", "dashscope")),
+    "query": (1300, ("PyPDF2", "langchain_text_splitters.character", "knowledge_base_manager")),
+}
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def command_args(command: str, corpus_path: str, store_path: str, questions_path: str, output_path: str) -> list:
+    if command == "help":
+        return ["--help"]
+    if command == "init":
+        return ["--init", "--dataset", corpus_path, "--vector-store", store_path,
+                "--embedding-backend", "local-tfidf", "--no-embedding-cache"]
+    return ["--batch", questions_path, "--output", output_path, "--vector-store", store_path]
+
+
+def parse_importtime(stderr: str) -> tuple:
+    """
+    解析 -X importtime 的输出
+
+    返回:
+        (导入总耗时（秒）, 已导入模块名集合, [(顶层导入的累计耗时（秒）, 模块名), ...])
+    """
+    total, modules, top_level = 0, set(), []
+    for line in stderr.splitlines():
+        match = _LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        total += int(self_us)
+        modules.add(name)
+        if not indent:
+            top_level.append((int(cumulative_us) / 1e6, name))
+    return total / 1e6, modules, sorted(top_level, reverse=True)
+
+
+def run_command(args: list, env: dict) -> dict:
+    """以 -X importtime 运行一次 main.py，返回导入耗时、模块集合和进程耗时"""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", os.path.join(ROOT, "main.py"), *args],
+                            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"main.py {' '.join(args)} 退出码 {result.returncode}")
+    imports, modules, top_level = parse_importtime(result.stderr)
+    return {"imports": imports, "wall": wall, "modules": modules, "top": top_level}
+
+
+def loaded(modules: set, name: str) -> bool:
+    """模块或其子模块是否已加载"""
+    return name in modules or any(module.startswith(name + ".") for module in modules)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="命令行启动导入耗时基准测试")
+    parser.add_argument("--dataset", default=os.path.join(ROOT, "dataset"), help="PDF 数据集目录")
+    parser.add_argument("--commands", nargs="+", choices=list(BUDGETS), default=list(BUDGETS), help="要测量的命令")
+    parser.add_argument("--repeats", type=int, default=7, help="每个命令运行的次数（取导入总耗时最少的一次）")
+    parser.add_argument("--top", type=int, default=5, help="列出耗时最多的顶层导入数量")
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="预算的缩放系数")
+    args = parser.parse_args()
+
+    # 查询引擎创建大模型客户端时需要 API Key（空问题文件不会发出请求）
+    env = dict(os.environ, DASHSCOPE_API_KEY=os.environ.get("DASHSCOPE_API_KEY") or "sk-bench")
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_path = os.path.join(tmp, "dataset")
+        store_path = os.path.join(tmp, "store")
+        questions_path = os.path.join(tmp, "questions.jsonl")
+        output_path = os.path.join(tmp, "answers.jsonl")
+        build_corpus(args.dataset, corpus_path, 1)
+        open(questions_path, "w").close()
+        # 先构建一次知识库并写入字节码缓存，之后的运行都是热启动
+        subprocess.run([sys.executable, os.path.join(ROOT, "main.py"),
+                        *command_args("init", corpus_path, store_path, questions_path, output_path)],
+                       cwd=ROOT, env=env, stdout=subprocess.DEVNULL, check=True)
+
+        print(f"{'命令':<6} | {'导入(ms)':>9} | {'预算(ms)':>9} | {'进程(ms)':>9} | {'模块数':>6} | 禁止的模块")
+        print("-" * 80)
+        results = {}
+        for command in args.commands:
+            runs = [run_command(command_args(command, corpus_path, store_path, questions_path, output_path), env)
+                    for _ in range(args.repeats)]
+            best = min(runs, key=lambda run: run["imports"])
+            budget = BUDGETS[command][0] * args.budget_scale
+            forbidden = [name for name in BUDGETS[command][1] if loaded(best["modules"], name)]
+            over = best["imports"] * 1000 > budget
+            flag = ("  ⚠️ 超出预算" if over else "") + ("  ⚠️ 加载了禁止的模块" if forbidden else "")
+            print(f"{command:<6} | {best['imports'] * 1000:>9.0f} | {budget:>9.0f} | "
+                  f"{min(run['wall'] for run in runs) * 1000:>9.0f} | {len(best['modules']):>6} | "
+                  f"{', '.join(forbidden) or '-'}{flag}")
+            if over or forbidden:
+                failures.append(command)
+            results[command] = best
+
+    for command, best in results.items():
+        print(f"\n{command}：耗时最多的顶层导入")
+        for seconds, name in best["top"][:args.top]:
+            print(f"  {seconds * 1000:>8.1f} ms  {name}")
+
+    if failures:
+        print(f"\n{len(failures)} 个命令未通过：{', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
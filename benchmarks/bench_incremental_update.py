@@ -0,0 +1,65 @@
+"""
+增量更新基准测试：由 dataset/ 中的 PDF 复制出 N 个文件组成文档库，
+修改其中一个文件后对比增量更新与全量重建的耗时
+
+使用方法:
+    python benchmarks/bench_incremental_update.py --copies 10 40 --latency 0.02
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import FakeEmbeddings  # noqa: E402
+from embedding_pipeline import BatchedEmbeddings  # noqa: E402
+from knowledge_base_manager import initialize_knowledge_base  # noqa: E402
+
+
+def timed_init(dataset_path, store_path, embeddings, force=False):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        initialize_knowledge_base(dataset_path, store_path, force_rebuild=force, embeddings=embeddings)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="增量更新与全量重建耗时对比")
+    parser.add_argument("--dataset", type=str, default="./dataset", help="PDF 数据集目录")
+    parser.add_argument("--copies", type=int, nargs="+", default=[10, 40], help="文档库中的文件数量")
+    parser.add_argument("--latency", type=float, default=0.02, help="替身嵌入模型每个批次的延迟（秒）")
+    args = parser.parse_args()
+
+    sources = sorted(os.path.join(args.dataset, f) for f in os.listdir(args.dataset) if f.lower().endswith(".pdf"))
+    embeddings = BatchedEmbeddings(FakeEmbeddings(dimension=256, latency=args.latency), max_workers=1)
+
+    print(f"{'文件数':>6} | {'全量重建(s)':>10} | {'修改1个文件后增量更新(s)':>22} | {'删除1个文件后增量更新(s)':>22}")
+    print("-" * 72)
+    for copies in args.copies:
+        with tempfile.TemporaryDirectory() as work_dir:
+            dataset_path = os.path.join(work_dir, "dataset")
+            store_path = os.path.join(work_dir, "vector_store")
+            os.makedirs(dataset_path)
+            for i in range(copies):
+                shutil.copy(sources[i % len(sources)], os.path.join(dataset_path, f"doc_{i:04d}.pdf"))
+
+            full_time = timed_init(dataset_path, store_path, embeddings, force=True)
+
+            # 用另一份PDF覆盖第一个文件，模拟原地修改
+            shutil.copy(sources[1 % len(sources)], os.path.join(dataset_path, "doc_0000.pdf"))
+            os.utime(os.path.join(dataset_path, "doc_0000.pdf"), (time.time() + 1, time.time() + 1))
+            modify_time = timed_init(dataset_path, store_path, embeddings)
+
+            os.remove(os.path.join(dataset_path, "doc_0001.pdf"))
+            delete_time = timed_init(dataset_path, store_path, embeddings)
+
+        print(f"{copies:>6} | {full_time:>10.2f} | {modify_time:>22.2f} | {delete_time:>22.2f}")
+
+
+if __name__ == "__main__":
+    main()
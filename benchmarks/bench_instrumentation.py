@@ -0,0 +1,87 @@
+"""
+性能剖析开销基准测试：测量剖析关闭和开启时单个 span / count 调用的耗时，
+以及关闭和开启剖析时 QueryEngine 单次查询的 p50 延迟
+
+使用方法:
+    python benchmarks/bench_instrumentation.py --calls 1000000 --chunks 10000 --queries 200
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import instrumentation  # noqa: E402
+from benchmarks.bench_query_engine import build_store  # noqa: E402
+from benchmarks.fakes import FakeEmbeddings, FakeLLM  # noqa: E402
+from instrumentation import count, span  # noqa: E402
+from user_query import QueryEngine  # noqa: E402
+
+
+def per_call_ns(calls: int) -> tuple:
+    """返回扣除空循环耗时后 (with span, count) 每次调用的纳秒数"""
+    start = time.perf_counter()
+    for _ in range(calls):
+        pass
+    baseline = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        with span("bench"):
+            pass
+    span_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        count("bench")
+    count_seconds = time.perf_counter() - start
+    return tuple((seconds - baseline) / calls * 1e9 for seconds in (span_seconds, count_seconds))
+
+
+def query_p50_ms(store_path: str, queries: list) -> float:
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine = QueryEngine(store_path, embeddings=FakeEmbeddings(), llm=FakeLLM(),
+                             query_cache_size=0, answer_cache_threshold=None)
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        engine.answer(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return statistics.median(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="性能剖析开销基准测试")
+    parser.add_argument("--calls", type=int, default=1_000_000, help="测量单次调用开销的循环次数")
+    parser.add_argument("--chunks", type=int, default=10000, help="查询测试的索引文本块数量")
+    parser.add_argument("--queries", type=int, default=200, help="查询次数")
+    args = parser.parse_args()
+
+    print(f"{'状态':<6} | {'span(ns/次)':>12} | {'count(ns/次)':>13}")
+    print("-" * 38)
+    instrumentation.disable()
+    span_ns, count_ns = per_call_ns(args.calls)
+    print(f"{'关闭':<6} | {span_ns:>12.0f} | {count_ns:>13.0f}")
+    instrumentation.enable()
+    span_ns, count_ns = per_call_ns(args.calls)
+    print(f"{'开启':<6} | {span_ns:>12.0f} | {count_ns:>13.0f}")
+    instrumentation.disable()
+
+    queries = [f"客户经理被投诉{i}次扣多少分？" for i in range(args.queries)]
+    with tempfile.TemporaryDirectory() as store_path:
+        build_store(store_path, args.chunks, FakeEmbeddings())
+        disabled = query_p50_ms(store_path, queries)
+        instrumentation.enable()
+        enabled = query_p50_ms(store_path, queries)
+        instrumentation.disable()
+    print(f"\nQueryEngine.answer p50（{args.chunks} 个文本块）：关闭 {disabled:.3f}ms，开启 {enabled:.3f}ms，"
+          f"差值 {enabled - disabled:+.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
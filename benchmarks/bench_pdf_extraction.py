@@ -0,0 +1,44 @@
+"""
+PDF 文本提取基准测试：对比 1 个进程与 N 个进程提取 dataset/ 下 PDF 的耗时，
+并校验并行结果与串行结果完全一致
+
+使用方法:
+    python benchmarks/bench_pdf_extraction.py --dataset ./dataset --workers 1 2 4 --repeat 4
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_process import extract_pdf_files  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF 并行提取基准测试")
+    parser.add_argument("--dataset", type=str, default="./dataset", help="PDF 数据集目录")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1], help="要测试的进程数")
+    parser.add_argument("--repeat", type=int, default=4, help="将文件列表重复的次数，用于放大语料规模")
+    parser.add_argument("--pages-per-task", type=int, default=16, help="每个任务提取的页数")
+    args = parser.parse_args()
+
+    pdf_files = sorted(f for f in os.listdir(args.dataset) if f.lower().endswith(".pdf"))
+    file_paths = [os.path.join(args.dataset, f) for f in pdf_files] * args.repeat
+    print(f"共 {len(file_paths)} 个文件（{len(pdf_files)} 个PDF × {args.repeat}）")
+
+    baseline = None
+    baseline_time = None
+    print(f"{'进程数':>6} | {'耗时(s)':>8} | {'加速比':>6} | 结果一致")
+    print("-" * 40)
+    for workers in sorted(set(args.workers)):
+        start = time.perf_counter()
+        extracted = extract_pdf_files(file_paths, workers=workers, pages_per_task=args.pages_per_task)
+        elapsed = time.perf_counter() - start
+        if baseline is None:
+            baseline, baseline_time = extracted, elapsed
+        print(f"{workers:>6} | {elapsed:>8.2f} | {baseline_time / elapsed:>6.2f} | {extracted == baseline}")
+
+
+if __name__ == "__main__":
+    main()
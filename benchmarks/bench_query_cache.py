@@ -0,0 +1,74 @@
+"""
+查询缓存基准测试：模拟交互式使用中反复出现的问题（含标点、空白、全角半角不同的写法），
+对比关闭与开启查询向量缓存和语义答案缓存时的平均延迟和命中率
+
+使用方法:
+    python benchmarks/bench_query_cache.py --queries 200 --distinct 20 --embed-latency 0.05 --llm-latency 0.5
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_query_engine import build_store  # noqa: E402
+from benchmarks.fakes import FakeEmbeddings, FakeLLM  # noqa: E402
+from user_query import QueryEngine  # noqa: E402
+
+# 同一个问题的不同写法
+VARIANTS = ["{}？", "{}", " {} ?", "{}?", "{}。"]
+
+
+def make_workload(count, distinct, seed=0):
+    """从 distinct 个问题中随机抽取 count 次，每次随机选择一种写法"""
+    rng = random.Random(seed)
+    questions = [f"客户经理被投诉{i}次扣多少分" for i in range(distinct)]
+    return [rng.choice(VARIANTS).format(rng.choice(questions)) for _ in range(count)]
+
+
+def run(engine, workload):
+    latencies = []
+    for query in workload:
+        start = time.perf_counter()
+        engine.answer(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询缓存基准测试")
+    parser.add_argument("--chunks", type=int, default=5000, help="索引中的文本块数量")
+    parser.add_argument("--queries", type=int, default=200, help="查询次数")
+    parser.add_argument("--distinct", type=int, default=20, help="不同问题的数量")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="查询嵌入的模拟延迟（秒）")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="大模型调用的模拟延迟（秒）")
+    args = parser.parse_args()
+
+    workload = make_workload(args.queries, args.distinct)
+    with tempfile.TemporaryDirectory() as store_path:
+        build_store(store_path, args.chunks, FakeEmbeddings())
+        embeddings = FakeEmbeddings(latency=args.embed_latency)
+        llm = FakeLLM(latency=args.llm_latency)
+
+        print(f"{'配置':<12} | {'平均(ms)':>9} | {'p50(ms)':>9} | {'p99(ms)':>9} | {'总耗时(s)':>9}")
+        print("-" * 62)
+        for label, cache_size, threshold in [("关闭缓存", 0, None), ("开启缓存", 1024, 0.95)]:
+            with contextlib.redirect_stdout(io.StringIO()):
+                engine = QueryEngine(store_path, embeddings=embeddings, llm=llm,
+                                     query_cache_size=cache_size, answer_cache_threshold=threshold)
+            latencies = run(engine, workload)
+            p99 = statistics.quantiles(latencies, n=100)[98]
+            print(f"{label:<12} | {statistics.mean(latencies):>9.1f} | {statistics.median(latencies):>9.1f} | "
+                  f"{p99:>9.1f} | {sum(latencies) / 1000:>9.2f}")
+            for line in engine.cache_summary():
+                print(f"  {line}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+QueryEngine 基准测试：对比每次查询都重新加载知识库与常驻查询引擎的单次查询延迟
+
+使用方法:
+    python benchmarks/bench_query_engine.py --sizes 1000 10000 50000 --queries 20
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_community.vectorstores import FAISS  # noqa: E402
+
+from benchmarks.fakes import FakeEmbeddings, FakeLLM  # noqa: E402
+from user_query import QueryEngine, user_query  # noqa: E402
+
+
+def build_store(path: str, size: int, embeddings: FakeEmbeddings):
+    """生成 size 个合成文本块并保存为向量数据库"""
+    import pickle
+
+    chunks = [f"第{i}条 合成条款内容，用于基准测试。编号 {i}" for i in range(size)]
+    knowledge_base = FAISS.from_texts(chunks, embeddings)
+    knowledge_base.save_local(path)
+    page_info = {chunk: f"synthetic.pdf:{i // 20 + 1}" for i, chunk in enumerate(chunks)}
+    with open(os.path.join(path, "page_info.pkl"), "wb") as f:
+        pickle.dump(page_info, f)
+
+
+def measure(fn, queries):
+    """返回每次查询的延迟（毫秒）"""
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="QueryEngine 单次查询延迟基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000], help="索引中的文本块数量")
+    parser.add_argument("--queries", type=int, default=20, help="每种规模执行的查询次数")
+    args = parser.parse_args()
+
+    embeddings = FakeEmbeddings()
+    llm = FakeLLM()
+    queries = [f"客户经理被投诉{i}次扣多少分？" for i in range(args.queries)]
+
+    print(f"{'块数':>8} | {'每次重新加载 p50(ms)':>20} | {'QueryEngine p50(ms)':>20}")
+    print("-" * 56)
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as store_path:
+            build_store(store_path, size, embeddings)
+
+            def reload_each_time(query):
+                engine = QueryEngine(store_path, embeddings=embeddings, llm=llm)
+                user_query(query, store_path, engine=engine)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                engine = QueryEngine(store_path, embeddings=embeddings, llm=llm)
+            reload_latencies = measure(reload_each_time, queries)
+            engine_latencies = measure(lambda q: user_query(q, store_path, engine=engine), queries)
+
+        print(f"{size:>8} | {statistics.median(reload_latencies):>20.2f} | {statistics.median(engine_latencies):>20.2f}")
+
+
+if __name__ == "__main__":
+    main()
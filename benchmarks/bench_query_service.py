@@ -0,0 +1,185 @@
+"""
+HTTP 查询服务压测：用本地替身嵌入模型和大模型（可配置每次调用的延迟）在子进程中启动查询服务，
+以不同并发数发送问题（从 --distinct 个问题中随机抽取，会有重复问题同时在途），
+对比逐条处理（不组微批、不合并重复问题）和微批 + 合并重复问题两种模式的吞吐量、延迟 p50 / p99、
+平均微批大小、合并的重复问题数和大模型调用次数
+
+为了只衡量微批和合并的效果，服务端关闭了查询向量缓存和语义答案缓存；
+压测客户端的每个并发连接都是 HTTP/1.1 长连接
+
+使用方法:
+    python benchmarks/bench_query_service.py --concurrency 1 8 32 64 --requests 400
+    python benchmarks/bench_query_service.py --embed-latency 0.05 --llm-latency 0.5 --llm-concurrency 32
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_suite import build_corpus, percentile_ms  # noqa: E402
+from benchmarks.fakes import FakeEmbeddings, FakeLLM  # noqa: E402
+
+# 模式名称 → 服务参数
+MODES = {
+    "逐条": {"batch_window_ms": 0.0, "max_batch": 1, "coalesce": False},
+    "微批+合并": {"batch_window_ms": None, "max_batch": 64, "coalesce": True},
+}
+
+
+def run_child_server(args):
+    """子进程：加载知识库并启动查询服务，把分配到的端口写到标准输出"""
+    from query_service import QueryService
+    from user_query import QueryEngine
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine = QueryEngine(args.store, embeddings=FakeEmbeddings(args.dim, latency=args.embed_latency),
+                             llm=FakeLLM(latency=args.llm_latency), query_cache_size=0, answer_cache_threshold=None)
+    service = QueryService(engine, args.batch_window_ms / 1000, args.max_batch, args.llm_concurrency,
+                           coalesce=not args.no_coalesce)
+
+    async def serve():
+        server = await service.start_server("127.0.0.1", 0)
+        print(server.sockets[0].getsockname()[1], flush=True)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+def start_server(args, store_path: str, mode: dict) -> tuple:
+    """启动查询服务子进程，返回 (进程, 端口)"""
+    command = [
+        sys.executable, os.path.abspath(__file__), "--child-server", "--store", store_path,
+        "--dim", str(args.dim), "--embed-latency", str(args.embed_latency), "--llm-latency", str(args.llm_latency),
+        "--llm-concurrency", str(args.llm_concurrency), "--max-batch", str(mode["max_batch"]),
+        "--batch-window-ms", str(args.batch_window_ms if mode["batch_window_ms"] is None else mode["batch_window_ms"]),
+    ]
+    if not mode["coalesce"]:
+        command.append("--no-coalesce")
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    port = int(process.stdout.readline())
+    return process, port
+
+
+def get_stats(port: int) -> dict:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats") as response:
+        return json.loads(response.read())
+
+
+async def post_query(reader, writer, query: str) -> int:
+    """在长连接上发送一个 POST /query，读完响应后返回状态码"""
+    body = json.dumps({"query": query}, ensure_ascii=False).encode("utf-8")
+    writer.write(
+        b"POST /query HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+        + f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def run_load(port: int, queries: list, concurrency: int) -> tuple:
+    """以 concurrency 个长连接并发发送全部问题，返回 (每个请求的耗时列表, 失败数, 总耗时)"""
+    pending = list(reversed(queries))
+    latencies, failures = [], 0
+
+    async def worker():
+        nonlocal failures
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            while pending:
+                query = pending.pop()
+                start = time.perf_counter()
+                status = await post_query(reader, writer, query)
+                latencies.append(time.perf_counter() - start)
+                failures += status != 200
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, failures, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP 查询服务压测")
+    parser.add_argument("--dataset", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dataset"),
+                        help="PDF 数据集目录")
+    parser.add_argument("--copies", type=int, default=10, help="语料规模：每个 PDF 复制的份数")
+    parser.add_argument("--dim", type=int, default=256, help="替身嵌入模型的向量维度")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64], help="并发连接数")
+    parser.add_argument("--requests", type=int, default=400, help="每个并发数发送的请求数")
+    parser.add_argument("--distinct", type=int, default=100, help="不同问题的数量（请求从中随机抽取）")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="每次嵌入请求模拟的延迟（秒）")
+    parser.add_argument("--llm-latency", type=float, default=0.1, help="每次大模型调用模拟的延迟（秒）")
+    parser.add_argument("--llm-concurrency", type=int, default=16, help="服务端同时进行的大模型请求数上限")
+    parser.add_argument("--batch-window-ms", type=float, default=5.0, help="微批的收集窗口（毫秒）")
+    parser.add_argument("--seed", type=int, default=0, help="抽取问题的随机种子")
+    # 以下参数由压测进程传给服务子进程
+    parser.add_argument("--child-server", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--store", help=argparse.SUPPRESS)
+    parser.add_argument("--max-batch", type=int, default=64, help=argparse.SUPPRESS)
+    parser.add_argument("--no-coalesce", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_server:
+        run_child_server(args)
+        return
+
+    from knowledge_base_manager import initialize_knowledge_base
+
+    rng = random.Random(args.seed)
+    questions = [f"客户经理被投诉{i}次扣多少分？" for i in range(args.distinct)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_path = os.path.join(tmp, "dataset")
+        store_path = os.path.join(tmp, "store")
+        file_paths = build_corpus(args.dataset, corpus_path, args.copies)
+        with contextlib.redirect_stdout(io.StringIO()):
+            initialize_knowledge_base(corpus_path, store_path, embeddings=FakeEmbeddings(args.dim))
+
+        print(f"{len(file_paths)} 个 PDF，嵌入延迟 {args.embed_latency * 1000:g}ms，大模型延迟 {args.llm_latency * 1000:g}ms，"
+              f"大模型并发 {args.llm_concurrency}，{args.distinct} 个不同问题")
+        print(f"{'模式':<10} | {'并发':>4} | {'请求数':>6} | {'吞吐(req/s)':>11} | {'p50(ms)':>8} | {'p99(ms)':>8} | "
+              f"{'平均批大小':>9} | {'合并':>5} | {'大模型调用':>9} | {'失败':>4}")
+        print("-" * 110)
+        for mode_name, mode in MODES.items():
+            process, port = start_server(args, store_path, mode)
+            try:
+                for concurrency in args.concurrency:
+                    queries = [rng.choice(questions) for _ in range(args.requests)]
+                    before = get_stats(port)
+                    latencies, failures, seconds = asyncio.run(run_load(port, queries, concurrency))
+                    after = get_stats(port)
+                    batches = after["batches"] - before["batches"]
+                    batch_size = (after["batched_queries"] - before["batched_queries"]) / batches if batches else 0.0
+                    print(f"{mode_name:<10} | {concurrency:>4} | {len(queries):>6} | {len(queries) / seconds:>11.1f} | "
+                          f"{percentile_ms(latencies, 50):>8.1f} | {percentile_ms(latencies, 99):>8.1f} | "
+                          f"{batch_size:>9.2f} | {after['coalesced'] - before['coalesced']:>5} | "
+                          f"{after['llm_calls'] - before['llm_calls']:>9} | {failures:>4}")
+            finally:
+                process.terminate()
+                process.wait()
+
+
+if __name__ == "__main__":
+    main()
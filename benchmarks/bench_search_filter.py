@@ -0,0 +1,121 @@
+"""
+检索过滤基准测试：在合成的多文档向量库上对比各索引类型的
+不过滤检索、按文档 / 页码过滤（FAISS 选择器在搜索时跳过其余向量）和多取结果后再过滤（post-filter）
+三种方式的单条查询延迟 p50 / p99，以及过滤检索相对“过滤范围内精确 top-k”的 recall@k
+
+post-filter 取 k × --overfetch 个结果后丢弃范围外的文档块，过滤范围越小越容易凑不满 k 个
+
+使用方法:
+    python benchmarks/bench_search_filter.py --size 50000 --docs 100 --pages 20
+    python benchmarks/bench_search_filter.py --indexes flat ivf hnsw flat+sq8 ivf+pq --overfetch 10
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_ann_index import make_queries, synthetic_vectors  # noqa: E402
+from benchmarks.fakes import FakeEmbeddings  # noqa: E402
+from chunking import chunk_metadata  # noqa: E402
+from data_process import create_knowledge_base  # noqa: E402
+from search_filter import make_search_filter, position_table  # noqa: E402
+from sharded_store import search_many  # noqa: E402
+from vector_index import make_index_config  # noqa: E402
+
+
+def build_store(vectors, docs, pages, index):
+    """第 i 个向量属于 doc{i % docs}.pdf 的第 (i // docs) % pages + 1 页，文本块内容为其编号"""
+    index_type, _, compression = index.partition("+")
+    records = [
+        (str(i), vector.tolist(), chunk_metadata(f"doc{i % docs}.pdf:{(i // docs) % pages + 1}", 0, 0), f"id{i}")
+        for i, vector in enumerate(vectors)
+    ]
+    with contextlib.redirect_stdout(io.StringIO()):
+        return create_knowledge_base(records, FakeEmbeddings(vectors.shape[1]),
+                                     make_index_config(index_type, compression=compression or "none"))
+
+
+def post_filter_search(knowledge_base, query, k, search_filter, overfetch):
+    """不使用选择器：多取 k × overfetch 个结果，再丢弃范围外的文档块"""
+    docs = search_many(knowledge_base, [query], k * overfetch)[0]
+    matched = [
+        doc for doc in docs
+        if search_filter.match_source(doc.metadata["source"])
+        and (not search_filter.pages or any(first <= doc.metadata["page"] <= last for first, last in search_filter.pages))
+    ]
+    return matched[:k]
+
+
+def measure(search, queries):
+    """逐条查询，返回 (每条查询的结果编号列表, p50毫秒, p99毫秒)"""
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        docs = search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append([int(doc.page_content) for doc in docs])
+    return results, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def exact_top_k(vectors, queries, positions, k):
+    """过滤范围内的精确 top-k（L2 距离）"""
+    subset = vectors[positions]
+    distances = (subset ** 2).sum(axis=1)[None, :] - 2 * queries @ subset.T
+    return positions[np.argsort(distances, axis=1)[:, :k]]
+
+
+def recall_at_k(results, ground_truth):
+    hits = sum(len(set(r) & set(g)) for r, g in zip(results, ground_truth))
+    return hits / ground_truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检索过滤基准测试")
+    parser.add_argument("--size", type=int, default=50_000, help="向量库规模")
+    parser.add_argument("--dim", type=int, default=128, help="向量维度")
+    parser.add_argument("--docs", type=int, default=100, help="文档数量")
+    parser.add_argument("--pages", type=int, default=20, help="每个文档的页数")
+    parser.add_argument("--k", type=int, default=4, help="每次检索返回的数量")
+    parser.add_argument("--queries", type=int, default=200, help="查询数量")
+    parser.add_argument("--indexes", nargs="+", default=["flat", "ivf", "hnsw", "flat+sq8", "ivf+pq"],
+                        help="索引类型，<类型>+<压缩方式> 表示压缩索引")
+    parser.add_argument("--overfetch", type=int, default=10, help="post-filter 多取结果的倍数")
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.size, args.dim)
+    queries = make_queries(vectors, args.queries)
+    half = max(1, args.pages // 2)
+    filters = {
+        "一个文档": make_search_filter("doc7.pdf"),
+        "一个文档+3页": make_search_filter("doc7.pdf", "1-3"),
+        f"前 {half} 页": make_search_filter(None, f"1-{half}"),
+    }
+
+    print(f"规模 {args.size}，{args.docs} 个文档 × {args.pages} 页，k={args.k}，post-filter 多取 {args.overfetch} 倍")
+    print(f"{'索引':<10} | {'过滤范围':<12} | {'候选数':>7} | {'方式':<12} | {'p50(ms)':>8} | {'p99(ms)':>8} | {'recall@' + str(args.k):>9}")
+    print("-" * 88)
+    for index in args.indexes:
+        knowledge_base = build_store(vectors, args.docs, args.pages, index)
+        _, p50, p99 = measure(lambda q: search_many(knowledge_base, [q], args.k)[0], queries)
+        print(f"{index:<10} | {'不过滤':<12} | {args.size:>7} | {'-':<12} | {p50:>8.3f} | {p99:>8.3f} | {'-':>9}")
+        for label, search_filter in filters.items():
+            positions, _ = position_table(knowledge_base).select(search_filter)
+            ground_truth = exact_top_k(vectors, queries, positions, args.k)
+            methods = {
+                "选择器": lambda q: search_many(knowledge_base, [q], args.k, search_filter)[0],
+                "post-filter": lambda q: post_filter_search(knowledge_base, q, args.k, search_filter, args.overfetch),
+            }
+            for method, search in methods.items():
+                results, p50, p99 = measure(search, queries)
+                recall = recall_at_k(results, ground_truth)
+                print(f"{index:<10} | {label:<12} | {len(positions):>7} | {method:<12} | {p50:>8.3f} | {p99:>8.3f} | {recall:>9.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+分片知识库基准测试：由 dataset/ 中的 PDF 复制出不同规模的语料，对比不分片、按大小分片和每个 PDF 一个分片时的
+全量构建耗时、首次查询耗时（含分片按需加载）、查询延迟 p50/p99（不同并行搜索线程数），
+以及修改一个 PDF 后增量更新的耗时（不分片时删除并重新嵌入该文件，分片时只重建该文件所在的分片）
+
+使用方法:
+    python benchmarks/bench_sharding.py --copies 10 50 --layouts none size=2 file --search-workers 1 4
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_suite import build_corpus, percentile_ms  # noqa: E402
+from benchmarks.fakes import FakeEmbeddings, FakeLLM  # noqa: E402
+from knowledge_base_manager import initialize_knowledge_base  # noqa: E402
+from sharded_store import make_shard_config  # noqa: E402
+from user_query import QueryEngine  # noqa: E402
+
+
+def parse_layout(layout: str) -> dict:
+    """none / file / size=<MB> → 分片配置"""
+    mode, _, size = layout.partition("=")
+    return make_shard_config(mode, float(size) if size else None)
+
+
+def modify_one_file(file_paths: list, dataset_path: str):
+    """用另一份源文件替换第一个 PDF 的内容，模拟修改单个文档"""
+    sources = sorted(f for f in os.listdir(dataset_path) if f.lower().endswith(".pdf"))
+    target = file_paths[0]
+    replacement = next(os.path.join(dataset_path, f) for f in sources if not target.endswith(f))
+    os.remove(target)
+    shutil.copy(replacement, target)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分片知识库基准测试")
+    parser.add_argument("--dataset", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dataset"),
+                        help="PDF 数据集目录")
+    parser.add_argument("--copies", type=int, nargs="+", default=[10, 50], help="语料规模：每个 PDF 复制的份数")
+    parser.add_argument("--layouts", nargs="+", default=["none", "size=2", "file"],
+                        help="分片方式：none 不分片、file 每个 PDF 一个分片、size=<MB> 按大小分片")
+    parser.add_argument("--search-workers", type=int, nargs="+", default=[1, 4], help="并行搜索分片的线程数")
+    parser.add_argument("--dim", type=int, default=256, help="替身嵌入模型的向量维度")
+    parser.add_argument("--queries", type=int, default=200, help="测量查询延迟的查询次数")
+    args = parser.parse_args()
+
+    embeddings = FakeEmbeddings(args.dim)
+    queries = [f"客户经理被投诉{i}次扣多少分？" for i in range(args.queries)]
+    vectors = embeddings.embed_documents(queries)
+    quiet = contextlib.redirect_stdout(io.StringIO())
+
+    print(f"{'文件数':>6} | {'分片方式':<8} | {'分片数':>6} | {'构建(s)':>8} | {'线程':>4} | {'首次查询(ms)':>12} | "
+          f"{'p50(ms)':>8} | {'p99(ms)':>8} | {'增量更新(s)':>10}")
+    print("-" * 104)
+    for copies in args.copies:
+        for layout in args.layouts:
+            with tempfile.TemporaryDirectory() as tmp:
+                corpus_path = os.path.join(tmp, "dataset")
+                store_path = os.path.join(tmp, "store")
+                file_paths = build_corpus(args.dataset, corpus_path, copies)
+                shard_config = parse_layout(layout)
+
+                start = time.perf_counter()
+                with quiet:
+                    knowledge_base = initialize_knowledge_base(corpus_path, store_path, embeddings=embeddings, shard_config=shard_config)
+                build_seconds = time.perf_counter() - start
+                shards = len(knowledge_base.shards) if hasattr(knowledge_base, "shards") else 1
+
+                rows = []
+                for workers in args.search_workers:
+                    with quiet:
+                        engine = QueryEngine(store_path, embeddings=embeddings, llm=FakeLLM(), query_cache_size=0,
+                                             answer_cache_threshold=None, search_workers=workers)
+                    # 首次查询包含分片的按需加载
+                    start = time.perf_counter()
+                    engine.retrieve_many(vectors[:1])
+                    first_ms = (time.perf_counter() - start) * 1000
+                    latencies = []
+                    for vector in vectors:
+                        start = time.perf_counter()
+                        engine.retrieve_many([vector])
+                        latencies.append(time.perf_counter() - start)
+                    rows.append((workers, first_ms, percentile_ms(latencies, 50), percentile_ms(latencies, 99)))
+                    close = getattr(engine.knowledge_base, "close", None)
+                    if close is not None:
+                        close()
+
+                modify_one_file(file_paths, args.dataset)
+                start = time.perf_counter()
+                with quiet:
+                    initialize_knowledge_base(corpus_path, store_path, embeddings=embeddings)
+                update_seconds = time.perf_counter() - start
+
+                for i, (workers, first_ms, p50, p99) in enumerate(rows):
+                    prefix = (f"{len(file_paths):>6} | {layout:<8} | {shards:>6} | {build_seconds:>8.2f}" if i == 0
+                              else f"{'':>6} | {'':<8} | {'':>6} | {'':>8}")
+                    suffix = f"{update_seconds:>10.2f}" if i == 0 else f"{'':>10}"
+                    print(f"{prefix} | {workers:>4} | {first_ms:>12.2f} | {p50:>8.3f} | {p99:>8.3f} | {suffix}")
+
+
+if __name__ == "__main__":
+    main()
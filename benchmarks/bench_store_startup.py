@@ -0,0 +1,125 @@
+"""
+启动延迟基准测试：对比旧版 pickle 文档存储（index.pkl + page_info.pkl）与 SQLite 文档存储，
+以及完整读入与内存映射两种方式打开向量数据库的耗时、首次查询延迟（含读取命中文本块）、
+查询 p50 和常驻内存（每种组合在独立子进程中测量）
+
+使用方法:
+    python benchmarks/bench_store_startup.py --chunks 100000 --dimension 1536 --chunk-chars 500
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def rss_mb() -> float:
+    """当前进程的常驻内存（MB，仅 Linux）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return float("nan")
+
+
+def build_stores(legacy_path: str, store_path: str, chunks: int, dimension: int, chunk_chars: int):
+    """生成同一份合成数据的旧版 pickle 布局和 SQLite 文档存储快照"""
+    import pickle
+
+    import numpy as np
+    from langchain_community.vectorstores import FAISS
+
+    from benchmarks.fakes import FakeEmbeddings
+    from chunking import chunk_metadata
+    from data_process import save_knowledge_base
+
+    rng = np.random.default_rng(0)
+    filler = "合成条款内容" * (chunk_chars // 6 + 1)
+    texts = [f"第{i}条 {filler}"[:chunk_chars] for i in range(chunks)]
+    vectors = rng.standard_normal((chunks, dimension), dtype=np.float32)
+    metadatas = [chunk_metadata(f"synthetic.pdf:{i // 20 + 1}", 0, chunk_chars) for i in range(chunks)]
+    knowledge_base = FAISS.from_embeddings(zip(texts, vectors), FakeEmbeddings(dimension), metadatas=metadatas,
+                                           ids=[str(i) for i in range(chunks)])
+    # 旧版布局：pickle 文档存储和以文本为键的页码信息直接保存在根目录
+    knowledge_base.save_local(legacy_path)
+    with open(os.path.join(legacy_path, "page_info.pkl"), "wb") as f:
+        pickle.dump({text: f"synthetic.pdf:{i // 20 + 1}" for i, text in enumerate(texts)}, f)
+    with contextlib.redirect_stdout(io.StringIO()):
+        save_knowledge_base(knowledge_base, store_path)
+
+
+def child(store_path: str, dimension: int, mmap: bool, queries: int):
+    """子进程：测量加载耗时、首次查询延迟（含读取命中的文本块）、查询 p50 和内存"""
+    import numpy as np
+
+    from benchmarks.fakes import FakeEmbeddings
+    from data_process import load_knowledge_base
+    from sharded_store import search_many
+
+    embeddings = FakeEmbeddings(dimension)
+    before = rss_mb()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        knowledge_base = load_knowledge_base(store_path, embeddings, mmap=mmap)
+    load_time = time.perf_counter() - start
+    after_load = rss_mb()
+
+    vectors = np.random.default_rng(1).standard_normal((queries + 1, dimension), dtype=np.float32)
+    start = time.perf_counter()
+    search_many(knowledge_base, vectors[:1], 4)
+    first_query = time.perf_counter() - start
+    latencies = []
+    for vector in vectors[1:]:
+        start = time.perf_counter()
+        search_many(knowledge_base, [vector], 4)
+        latencies.append(time.perf_counter() - start)
+    print(json.dumps({
+        "load_s": load_time,
+        "first_query_ms": first_query * 1000,
+        "p50_ms": float(np.percentile(latencies, 50)) * 1000,
+        "rss_after_load_mb": after_load - before,
+        "rss_after_query_mb": rss_mb() - before,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文档存储格式与加载方式的启动延迟和内存对比")
+    parser.add_argument("--chunks", type=int, default=100000, help="向量数量")
+    parser.add_argument("--dimension", type=int, default=1536, help="向量维度")
+    parser.add_argument("--chunk-chars", type=int, default=500, help="每个文本块的字符数")
+    parser.add_argument("--queries", type=int, default=200, help="测量查询 p50 的查询次数")
+    parser.add_argument("--child", choices=["full", "mmap"], help=argparse.SUPPRESS)
+    parser.add_argument("--store", type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.store, args.dimension, mmap=args.child == "mmap", queries=args.queries)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stores = {"pickle": os.path.join(tmp, "legacy"), "sqlite": os.path.join(tmp, "store")}
+        build_stores(stores["pickle"], stores["sqlite"], args.chunks, args.dimension, args.chunk_chars)
+        print(f"{args.chunks} 个向量，维度 {args.dimension}，每个文本块 {args.chunk_chars} 字符")
+        print(f"{'文档存储':<8} | {'方式':<6} | {'加载(s)':>8} | {'首次查询(ms)':>12} | {'p50(ms)':>8} | "
+              f"{'加载后内存(MB)':>14} | {'查询后内存(MB)':>14}")
+        print("-" * 91)
+        for store_format, store_path in stores.items():
+            for mode in ("full", "mmap"):
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", mode, "--store", store_path,
+                     "--dimension", str(args.dimension), "--queries", str(args.queries)],
+                    capture_output=True, text=True, check=True,
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                print(f"{store_format:<8} | {mode:<6} | {result['load_s']:>8.3f} | {result['first_query_ms']:>12.1f} | "
+                      f"{result['p50_ms']:>8.3f} | {result['rss_after_load_mb']:>14.1f} | {result['rss_after_query_mb']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
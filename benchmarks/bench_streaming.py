@@ -0,0 +1,87 @@
+"""
+流式回答基准测试：用本地流式替身大模型对比一次性返回（invoke）与流式输出（stream / astream）
+的首字延迟和总耗时
+
+使用方法:
+    python benchmarks/bench_streaming.py --queries 10 --first-token 0.5 --token-latency 0.02 --tokens 100
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_query_engine import build_store  # noqa: E402
+from benchmarks.fakes import FakeEmbeddings, FakeStreamingLLM  # noqa: E402
+from user_query import QueryEngine  # noqa: E402
+
+
+def run_invoke(engine, queries):
+    """一次性返回：首字延迟等于总耗时"""
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        engine.answer(query)
+        elapsed = time.perf_counter() - start
+        results.append((elapsed, elapsed))
+    return results
+
+
+def run_stream(engine, queries):
+    results = []
+    for query in queries:
+        answer = engine.stream_answer(query)
+        for _ in answer:
+            pass
+        results.append((answer.first_token_seconds, answer.total_seconds))
+    return results
+
+
+def run_astream(engine, queries):
+    async def consume():
+        results = []
+        for query in queries:
+            answer = await engine.astream_answer(query)
+            async for _ in answer:
+                pass
+            results.append((answer.first_token_seconds, answer.total_seconds))
+        return results
+
+    return asyncio.run(consume())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式回答基准测试")
+    parser.add_argument("--chunks", type=int, default=5000, help="索引中的文本块数量")
+    parser.add_argument("--queries", type=int, default=10, help="查询次数")
+    parser.add_argument("--first-token", type=float, default=0.5, help="大模型首个片段的模拟延迟（秒）")
+    parser.add_argument("--token-latency", type=float, default=0.02, help="片段之间的模拟间隔（秒）")
+    parser.add_argument("--tokens", type=int, default=100, help="每个回答的片段数")
+    args = parser.parse_args()
+
+    llm = FakeStreamingLLM(first_token_latency=args.first_token, token_latency=args.token_latency, tokens=args.tokens)
+    with tempfile.TemporaryDirectory() as store_path:
+        embeddings = FakeEmbeddings()
+        build_store(store_path, args.chunks, embeddings)
+        with contextlib.redirect_stdout(io.StringIO()):
+            # 每个问题都不同，关闭答案缓存以免影响结果
+            engine = QueryEngine(store_path, embeddings=embeddings, llm=llm, answer_cache_threshold=None)
+
+        print(f"{'方式':<10} | {'首字延迟 p50(s)':>15} | {'总耗时 p50(s)':>13}")
+        print("-" * 46)
+        for label, runner in [("invoke", run_invoke), ("stream", run_stream), ("astream", run_astream)]:
+            queries = [f"{label} 客户经理被投诉{i}次扣多少分？" for i in range(args.queries)]
+            results = runner(engine, queries)
+            ttft = statistics.median(first for first, _ in results)
+            total = statistics.median(total for _, total in results)
+            print(f"{label:<10} | {ttft:>15.3f} | {total:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+流式构建内存基准测试：用 tracemalloc 对比整体拼接后一次性分块嵌入的旧做法
+与逐页流式构建（页面 → 文本块 → 嵌入批次 → 追加到索引）的峰值内存
+
+语料由 dataset/ 中 PDF 的页面文本循环拼接而成，可放大到数百MB。
+
+使用方法:
+    python benchmarks/bench_streaming_memory.py --mb 200
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import FakeEmbeddings  # noqa: E402
+from data_process import extract_pages, ingest_documents, process_text_with_splitter  # noqa: E402
+
+PAGES_PER_DOCUMENT = 200
+
+
+def load_source_pages(dataset_path):
+    pages = []
+    for pdf_file in sorted(os.listdir(dataset_path)):
+        if pdf_file.lower().endswith(".pdf"):
+            pages.extend(text for _, text in extract_pages(os.path.join(dataset_path, pdf_file)) if text)
+    return pages
+
+
+def iter_synthetic_documents(source_pages, total_bytes):
+    """生成合成文档：每个文档 PAGES_PER_DOCUMENT 页，直到 UTF-8 总字节数达到 total_bytes"""
+    produced = 0
+    doc_index = 0
+    while produced < total_bytes:
+        def pages(doc_index=doc_index):
+            nonlocal produced
+            for page_number in range(1, PAGES_PER_DOCUMENT + 1):
+                if produced >= total_bytes:
+                    return
+                text = source_pages[(doc_index * PAGES_PER_DOCUMENT + page_number) % len(source_pages)]
+                produced += len(text.encode("utf-8"))
+                yield page_number, text
+        yield f"synthetic_{doc_index:05d}.pdf", pages()
+        doc_index += 1
+
+
+def legacy_build(documents, embeddings):
+    """重构前的全量构建方式：拼接全部文本后一次性分块和嵌入"""
+    all_text = ""
+    all_page_numbers = []
+    all_line_ranges = []
+    for file_name, pages in documents:
+        doc_marker = f"\n\n[文档: {file_name}]\n\n"
+        all_text += doc_marker
+        for page_number, text in pages:
+            position = len(all_text)
+            all_text += text
+            for line in text.split("\n"):
+                all_line_ranges.append((position, position + len(line)))
+                all_page_numbers.append(f"{file_name}:{page_number}")
+                position += len(line) + 1
+    return process_text_with_splitter(all_text, all_page_numbers, all_line_ranges, embeddings=embeddings)
+
+
+def run(label, build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        knowledge_base = build()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    chunks = knowledge_base.index.ntotal
+    print(f"{label:<6} | {elapsed:>8.1f} | {chunks:>8} | {peak / 2**20:>12.1f} | {current / 2**20:>12.1f}")
+    del knowledge_base
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式构建峰值内存基准测试")
+    parser.add_argument("--dataset", type=str, default="./dataset", help="PDF 数据集目录（用作合成语料的页面来源）")
+    parser.add_argument("--mb", type=float, default=200, help="合成语料的 UTF-8 大小（MB）")
+    parser.add_argument("--window", type=int, default=1_000_000, help="流式构建的文本窗口（字符数）")
+    parser.add_argument("--batch", type=int, default=256, help="流式构建每批嵌入的文本块数量")
+    args = parser.parse_args()
+
+    source_pages = load_source_pages(args.dataset)
+    total_bytes = int(args.mb * 2**20)
+    embeddings = FakeEmbeddings(dimension=64)
+
+    print(f"合成语料：{args.mb} MB")
+    print(f"{'方式':<6} | {'耗时(s)':>8} | {'块数':>8} | {'峰值内存(MB)':>12} | {'结束时内存(MB)':>12}")
+    print("-" * 62)
+    run("旧做法", lambda: legacy_build(iter_synthetic_documents(source_pages, total_bytes), embeddings))
+    run("流式", lambda: ingest_documents(
+        iter_synthetic_documents(source_pages, total_bytes),
+        embeddings=embeddings,
+        window_chars=args.window,
+        batch_size=args.batch,
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+端到端离线基准测试套件：用确定性的本地替身嵌入模型和大模型（可配置延迟）替代 DashScope，
+由 dataset/ 中的 PDF 复制出 10×/100×/1000× 规模的合成语料，逐阶段记录
+PDF 提取、文本分割、页码映射、流式构建索引、保存、加载、检索 p50/p99、问答 p50/p99、峰值内存和索引大小
+
+每个规模在独立子进程中运行，峰值内存互不影响；结果写入 JSON 文件，
+--compare 对比两次运行的结果并标记退化的指标（存在退化时退出码为 1）
+
+使用方法:
+    python benchmarks/bench_suite.py --scales 10 100 1000 --output bench_results.json
+    python benchmarks/bench_suite.py --scales 10 100 --output new.json --baseline bench_results.json
+    python benchmarks/bench_suite.py --compare bench_results.json new.json --threshold 0.1
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 指标名称 → (单位, 是否参与退化比较)；所有参与比较的指标都是越小越好
+METRICS = {
+    "files": ("个", False),
+    "pages": ("页", False),
+    "chars": ("字符", False),
+    "chunks": ("块", False),
+    "extract_s": ("s", True),
+    "split_s": ("s", True),
+    "page_map_s": ("s", True),
+    "ingest_s": ("s", True),
+    "save_s": ("s", True),
+    "load_s": ("s", True),
+    "load_mmap_s": ("s", True),
+    "search_p50_ms": ("ms", True),
+    "search_p99_ms": ("ms", True),
+    "query_p50_ms": ("ms", True),
+    "query_p99_ms": ("ms", True),
+    "peak_rss_mb": ("MB", True),
+    "index_bytes": ("B", True),
+}
+
+# 耗时差异低于该值（秒）时视为测量噪声，不判定为退化
+NOISE_SECONDS = 0.001
+
+
+def percentile_ms(samples: list, q: float) -> float:
+    import numpy as np
+
+    return float(np.percentile(np.asarray(samples) * 1000, q))
+
+
+def peak_rss_mb() -> float:
+    """当前进程及其已结束子进程（并行提取的工作进程）中的最大峰值常驻内存（MB）"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # Linux 上单位为 KB，macOS 上为字节
+    scale = 1 if sys.platform == "darwin" else 1024
+    return max(own, children) * scale / 2**20
+
+
+def directory_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def build_corpus(dataset_path: str, corpus_path: str, scale: int) -> list:
+    """将 dataset/ 中的每个 PDF 复制 scale 份（优先使用硬链接），返回文件路径列表"""
+    sources = sorted(os.path.join(dataset_path, f) for f in os.listdir(dataset_path) if f.lower().endswith(".pdf"))
+    if not sources:
+        raise FileNotFoundError(f"{dataset_path} 中没有 PDF 文件")
+    os.makedirs(corpus_path, exist_ok=True)
+    file_paths = []
+    for copy in range(scale):
+        for source in sources:
+            target = os.path.join(corpus_path, f"c{copy:04d}_{os.path.basename(source)}")
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copy(source, target)
+            file_paths.append(target)
+    return file_paths
+
+
+def vary_copy(pages: list, copy: int) -> list:
+    """
+    在每行末尾加入副本编号，使不同副本的文本块互不相同
+    （替身嵌入模型按文本哈希生成向量，完全相同的文本块会得到相同的向量）
+    """
+    tag = f" #{copy}"
+    return [(page_number, "\n".join(line + tag for line in (text or "").split("\n")) if text else text)
+            for page_number, text in pages]
+
+
+def run_scale(args, work_dir: str) -> dict:
+    """子进程：在一个规模上依次测量各阶段，返回指标字典"""
+    import numpy as np
+
+    from benchmarks.fakes import FakeEmbeddings, FakeLLM
+    from chunking import PageMapper, split_text_with_offsets
+    from data_process import assemble_pages, ingest_documents, iter_pdf_pages, load_knowledge_base, save_knowledge_base
+    from embedding_pipeline import BatchedEmbeddings
+    from snapshot_store import resolve_snapshot_path
+    from user_query import QueryEngine
+    from vector_index import make_index_config
+
+    metrics = {}
+    quiet = contextlib.redirect_stdout(io.StringIO())
+
+    # 阶段一：PDF 提取
+    file_paths = build_corpus(args.dataset, os.path.join(work_dir, "dataset"), args.child_scale)
+    sources_per_copy = len(file_paths) // args.child_scale
+    start = time.perf_counter()
+    pages_by_file = [[] for _ in file_paths]
+    for file_index, page_number, page_text in iter_pdf_pages(file_paths, workers=args.workers):
+        pages_by_file[file_index].append((page_number, page_text))
+    metrics["extract_s"] = time.perf_counter() - start
+    documents = [(os.path.basename(path), vary_copy(pages, i // sources_per_copy))
+                 for i, (path, pages) in enumerate(zip(file_paths, pages_by_file))]
+    metrics["files"] = len(documents)
+    metrics["pages"] = sum(len(pages) for _, pages in documents)
+    metrics["chars"] = sum(len(text or "") for _, pages in documents for _, text in pages)
+
+    # 阶段二：文本分割与页码映射（分别计时）
+    split_seconds = 0.0
+    map_seconds = 0.0
+    chunk_count = 0
+    for _, pages in documents:
+        text, page_numbers, line_ranges = assemble_pages(pages)
+        start = time.perf_counter()
+        chunks = split_text_with_offsets(text)
+        split_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        page_mapper = PageMapper.from_line_ranges(line_ranges, page_numbers)
+        for _, chunk_start, _ in chunks:
+            page_mapper.page_at(chunk_start)
+        map_seconds += time.perf_counter() - start
+        chunk_count += len(chunks)
+    metrics["split_s"] = split_seconds
+    metrics["page_map_s"] = map_seconds
+    metrics["chunks"] = chunk_count
+
+    # 阶段三：流式构建索引（分块 + 批量并发嵌入 + 写入 FAISS），再保存快照
+    store_path = os.path.join(work_dir, "vector_store")
+    embeddings = BatchedEmbeddings(FakeEmbeddings(args.dimension, latency=args.embed_latency),
+                                   batch_size=25, max_workers=args.embed_workers)
+    index_config = make_index_config(args.index_type)
+    start = time.perf_counter()
+    with quiet:
+        knowledge_base = ingest_documents(iter(documents), embeddings=embeddings, index_config=index_config)
+    metrics["ingest_s"] = time.perf_counter() - start
+    start = time.perf_counter()
+    with quiet:
+        save_knowledge_base(knowledge_base, store_path)
+    metrics["save_s"] = time.perf_counter() - start
+    metrics["index_bytes"] = directory_bytes(resolve_snapshot_path(store_path))
+    del knowledge_base, documents, pages_by_file
+
+    # 阶段四：加载（完整读入 / 内存映射）
+    query_embeddings = FakeEmbeddings(args.dimension)
+    for key, mmap in (("load_s", False), ("load_mmap_s", True)):
+        start = time.perf_counter()
+        with quiet:
+            knowledge_base = load_knowledge_base(store_path, query_embeddings, mmap=mmap)
+        metrics[key] = time.perf_counter() - start
+
+    # 阶段五：检索延迟（查询向量预先算好，只测 FAISS 搜索和文档查找）
+    rng = random.Random(0)
+    queries = [f"客户经理考核第{rng.randrange(100)}条 劳动合同 工作时间 {i}" for i in range(args.queries)]
+    vectors = np.asarray(query_embeddings.embed_documents(queries), dtype=np.float32)
+    samples = []
+    for vector in vectors:
+        start = time.perf_counter()
+        knowledge_base.similarity_search_by_vector(vector.tolist(), k=4)
+        samples.append(time.perf_counter() - start)
+    metrics["search_p50_ms"] = percentile_ms(samples, 50)
+    metrics["search_p99_ms"] = percentile_ms(samples, 99)
+    del knowledge_base
+
+    # 阶段六：端到端问答延迟（嵌入 + 检索 + 上下文构建 + 大模型，关闭缓存）
+    with quiet:
+        engine = QueryEngine(store_path, embeddings=FakeEmbeddings(args.dimension, latency=args.embed_latency),
+                             llm=FakeLLM(latency=args.llm_latency), query_cache_size=0, answer_cache_threshold=None)
+    samples = []
+    for query in queries[:args.answer_queries]:
+        start = time.perf_counter()
+        engine.answer(query)
+        samples.append(time.perf_counter() - start)
+    metrics["query_p50_ms"] = percentile_ms(samples, 50)
+    metrics["query_p99_ms"] = percentile_ms(samples, 99)
+
+    metrics["peak_rss_mb"] = peak_rss_mb()
+    return metrics
+
+
+def run_suite(args) -> dict:
+    """逐个规模启动子进程运行测量，汇总为结果字典"""
+    import faiss
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "faiss": getattr(faiss, "__version__", "unknown"),
+            "config": {key: getattr(args, key) for key in (
+                "dimension", "embed_latency", "embed_workers", "llm_latency",
+                "index_type", "workers", "queries", "answer_queries")},
+        },
+        "scales": {},
+    }
+    forwarded = ["--dataset", args.dataset, "--dimension", str(args.dimension),
+                 "--embed-latency", str(args.embed_latency), "--embed-workers", str(args.embed_workers),
+                 "--llm-latency", str(args.llm_latency), "--index-type", args.index_type,
+                 "--workers", str(args.workers), "--queries", str(args.queries),
+                 "--answer-queries", str(args.answer_queries)]
+    for scale in args.scales:
+        print(f"运行 {scale}× 规模...", flush=True)
+        with tempfile.TemporaryDirectory() as work_dir:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child-scale", str(scale), "--work-dir", work_dir] + forwarded,
+                capture_output=True, text=True, check=True,
+            ).stdout
+        results["scales"][str(scale)] = json.loads(output.strip().splitlines()[-1])
+    return results
+
+
+def format_value(name: str, value) -> str:
+    if value is None:
+        return "-"
+    unit = METRICS[name][0]
+    if unit == "B":
+        return f"{value / 2**20:.1f}MB"
+    if isinstance(value, float):
+        return f"{value:.3f}{unit}" if unit == "s" else f"{value:.1f}{unit}"
+    return f"{value}{unit}"
+
+
+def print_results(results: dict):
+    scales = list(results["scales"])
+    print(f"\n{'指标':<14} | " + " | ".join(f"{scale + '×':>12}" for scale in scales))
+    print("-" * (17 + 15 * len(scales)))
+    for name in METRICS:
+        values = [results["scales"][scale].get(name) for scale in scales]
+        print(f"{name:<14} | " + " | ".join(f"{format_value(name, value):>12}" for value in values))
+
+
+def compare_results(baseline: dict, current: dict, threshold: float) -> list:
+    """
+    对比两次运行中共同规模的各项指标，打印变化比例
+
+    参数:
+        baseline: 基线结果
+        current: 当前结果
+        threshold: 相对增幅超过该比例（如 0.1 表示 10%）时判定为退化
+
+    返回:
+        退化列表 [(规模, 指标, 基线值, 当前值, 变化比例), ...]
+    """
+    regressions = []
+    print(f"\n{'规模':>6} | {'指标':<14} | {'基线':>12} | {'当前':>12} | {'变化':>8}")
+    print("-" * 66)
+    for scale in baseline["scales"]:
+        if scale not in current["scales"]:
+            print(f"{scale + '×':>6} | 当前结果中没有该规模，跳过")
+            continue
+        old_metrics, new_metrics = baseline["scales"][scale], current["scales"][scale]
+        if old_metrics.get("chunks") != new_metrics.get("chunks"):
+            print(f"{scale + '×':>6} | 注意：文本块数不同（{old_metrics.get('chunks')} → {new_metrics.get('chunks')}），语料或分块参数已改变")
+        for name, (unit, comparable) in METRICS.items():
+            old, new = old_metrics.get(name), new_metrics.get(name)
+            if not comparable or old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            noise = NOISE_SECONDS * (1000 if unit == "ms" else 1) if unit in ("s", "ms") else 0
+            regressed = change > threshold and new - old > noise
+            flag = "  ⚠️ 退化" if regressed else ""
+            print(f"{scale + '×':>6} | {name:<14} | {format_value(name, old):>12} | {format_value(name, new):>12} | {change:>+7.1%}{flag}")
+            if regressed:
+                regressions.append((scale, name, old, new, change))
+    if regressions:
+        print(f"\n发现 {len(regressions)} 项退化（阈值 {threshold:.0%}）")
+    else:
+        print(f"\n没有超过阈值（{threshold:.0%}）的退化")
+    return regressions
+
+
+def load_results(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端离线基准测试套件")
+    parser.add_argument("--dataset", type=str, default="./dataset", help="PDF 数据集目录")
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 100, 1000], help="语料规模（dataset/ 的倍数）")
+    parser.add_argument("--output", type=str, default="bench_results.json", help="结果 JSON 文件路径")
+    parser.add_argument("--baseline", type=str, help="运行结束后与该基线结果对比")
+    parser.add_argument("--compare", type=str, nargs=2, metavar=("BASELINE", "CURRENT"), help="只对比两个已有的结果文件")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定为退化的相对增幅")
+    parser.add_argument("--dimension", type=int, default=1536, help="替身嵌入模型的向量维度")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="替身嵌入模型每次请求的延迟（秒）")
+    parser.add_argument("--embed-workers", type=int, default=4, help="并发嵌入请求数")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="替身大模型每次调用的延迟（秒）")
+    parser.add_argument("--index-type", type=str, default="flat", help="向量索引类型（flat / ivf / hnsw）")
+    parser.add_argument("--workers", type=int, default=1, help="PDF 提取的并行进程数")
+    parser.add_argument("--queries", type=int, default=200, help="检索延迟的查询次数")
+    parser.add_argument("--answer-queries", type=int, default=50, help="问答延迟的查询次数")
+    parser.add_argument("--child-scale", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_scale:
+        print(json.dumps(run_scale(args, args.work_dir)))
+        return 0
+
+    if args.compare:
+        return 1 if compare_results(load_results(args.compare[0]), load_results(args.compare[1]), args.threshold) else 0
+
+    results = run_suite(args)
+    print_results(results)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存到: {args.output}")
+    if args.baseline:
+        return 1 if compare_results(load_results(args.baseline), results, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
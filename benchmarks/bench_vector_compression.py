@@ -0,0 +1,77 @@
+"""
+向量压缩基准测试：在合成向量上对比不压缩、float16、8 位标量量化和乘积量化，
+报告每个向量占用的索引字节数、相对精确搜索的 recall@k 以及单条查询延迟 p50 / p99，
+并对比是否用磁盘上的原始向量精确重排序
+
+使用方法:
+    python benchmarks/bench_vector_compression.py --size 20000 --dim 1536 --rerank 0 4
+    python benchmarks/bench_vector_compression.py --index-type hnsw --pq-m 48
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import faiss
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_ann_index import make_queries, measure, recall_at_k, synthetic_vectors  # noqa: E402
+from vector_index import (  # noqa: E402
+    COMPRESSION_TYPES,
+    INDEX_TYPES,
+    ExactVectors,
+    RerankIndex,
+    apply_search_params,
+    create_index,
+    describe_index,
+    make_index_config,
+    training_size,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量压缩基准测试")
+    parser.add_argument("--size", type=int, default=20_000, help="向量库规模")
+    parser.add_argument("--dim", type=int, default=1536, help="向量维度（text-embedding-v2 为 1536）")
+    parser.add_argument("--k", type=int, default=4, help="每次检索返回的数量")
+    parser.add_argument("--queries", type=int, default=300, help="查询数量")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat", help="索引类型")
+    parser.add_argument("--pq-m", type=int, default=None, help="乘积量化的子量化器数量（默认：维度/16）")
+    parser.add_argument("--rerank", type=int, nargs="+", default=[0, 4], help="重排序候选倍数，0 表示不重排序")
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.size, args.dim)
+    queries = make_queries(vectors, args.queries)
+    exact_index = faiss.IndexFlatL2(args.dim)
+    exact_index.add(vectors)
+    ground_truth, _, _ = measure(exact_index, queries, args.k)
+
+    # 原始向量写入磁盘后以内存映射方式读取，与查询进程加载快照时一致
+    with tempfile.TemporaryDirectory() as tmp:
+        vectors_path = os.path.join(tmp, "vectors.f32")
+        with open(vectors_path, "wb") as f:
+            f.write(vectors.tobytes())
+        exact_vectors = ExactVectors(args.dim, vectors_path)
+
+        print(f"原始向量: {args.size} × {args.dim} 维，float32 每个向量 {args.dim * 4} 字节")
+        print(f"{'索引':<64} | {'字节/向量':>9} | {'重排':>4} | {'recall@' + str(args.k):>9} | {'p50(ms)':>8} | {'p99(ms)':>8}")
+        print("-" * 118)
+        for compression in COMPRESSION_TYPES:
+            config = make_index_config(args.index_type, compression, nlist=min(1024, args.size // 39), pq_m=args.pq_m)
+            index = create_index(args.dim, config, training_vectors=vectors[:training_size(config)])
+            index.add(vectors)
+            bytes_per_vector = len(faiss.serialize_index(index)) / args.size
+
+            for rerank in (args.rerank if compression != "none" else [0]):
+                searcher = RerankIndex(index, exact_vectors, rerank) if rerank else index
+                config = dict(config, rerank=rerank) if compression != "none" else config
+                apply_search_params(searcher, config)
+                results, p50, p99 = measure(searcher, queries, args.k)
+                recall = recall_at_k(results, ground_truth)
+                label = describe_index({k: v for k, v in config.items() if k != "rerank"})
+                print(f"{label:<64} | {bytes_per_vector:>9.1f} | {rerank:>4} | {recall:>9.3f} | {p50:>8.3f} | {p99:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+数据集监视基准测试：在同一进程中运行常驻查询引擎和数据集监视器，
+后台线程持续发出查询的同时向数据集目录逐个放入新的 PDF，测量每个文件从落盘到可检索的延迟
+（在新文件范围内过滤检索，直到能检索到该文件的文本块），以及增量更新和切换期间的查询延迟 p50 / p99 / 最大值，
+与没有更新时对比（切换不应让查询停顿）；分别测试 inotify 和轮询两种监视方式
+
+使用方法:
+    python benchmarks/bench_watcher.py --copies 10 --files 5 --modes inotify poll
+    python benchmarks/bench_watcher.py --debounce 0.2 --poll-interval 0.5 --shard-by file
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_suite import build_corpus, percentile_ms  # noqa: E402
+from benchmarks.fakes import FakeEmbeddings, FakeLLM  # noqa: E402
+from dataset_watcher import DatasetWatcher  # noqa: E402
+from knowledge_base_manager import initialize_knowledge_base  # noqa: E402
+from sharded_store import make_shard_config  # noqa: E402
+from user_query import QueryEngine  # noqa: E402
+
+
+class QueryLoad:
+    """后台线程不断检索，按时间记录每次检索的耗时"""
+
+    def __init__(self, engine, vectors):
+        self.engine = engine
+        self.vectors = vectors
+        self.samples = []  # (开始时间, 耗时)
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        i = 0
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            try:
+                self.engine.retrieve_many([self.vectors[i % len(self.vectors)]])
+            except Exception:
+                self.errors += 1
+            self.samples.append((start, time.perf_counter() - start))
+            i += 1
+            time.sleep(0.001)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def latencies(self, since: float = None, until: float = None) -> list:
+        return [seconds for start, seconds in self.samples
+                if (since is None or start >= since) and (until is None or start < until)]
+
+
+def wait_searchable(engine, file_name: str, timeout: float) -> float:
+    """轮询直到能在该文件范围内检索到文本块，返回可检索的时间（超时返回None）"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if engine.search("新文件", docs=file_name):
+            return time.time()
+        time.sleep(0.01)
+    return None
+
+
+def run_mode(args, mode: str) -> dict:
+    embeddings = FakeEmbeddings(args.dim, latency=args.embed_latency)
+    quiet = contextlib.redirect_stdout(io.StringIO())
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_path = os.path.join(tmp, "dataset")
+        store_path = os.path.join(tmp, "store")
+        file_paths = build_corpus(args.dataset, corpus_path, args.copies)
+        shard_config = make_shard_config(args.shard_by) if args.shard_by else None
+        with quiet:
+            initialize_knowledge_base(corpus_path, store_path, embeddings=embeddings, shard_config=shard_config)
+            engine = QueryEngine(store_path, embeddings=embeddings, llm=FakeLLM(), query_cache_size=0,
+                                 answer_cache_threshold=None)
+        watcher = DatasetWatcher(corpus_path, store_path, engine=engine, debounce=args.debounce, mode=mode,
+                                 poll_interval=args.poll_interval, ingest_options={"embeddings": embeddings})
+        load = QueryLoad(engine, embeddings.embed_documents([f"客户经理被投诉{i}次扣多少分？" for i in range(100)]))
+
+        with quiet:
+            watcher.start()
+            load.start()
+            time.sleep(1.0)
+            idle_until = time.perf_counter()
+            landed, searchable = [], []
+            for i in range(args.files):
+                source = file_paths[i % len(file_paths)]
+                name = f"new{i:03d}_{os.path.basename(source)[6:]}"
+                # 先写到目录外再移入，模拟文件一次性落盘
+                staging = os.path.join(tmp, name)
+                shutil.copy(source, staging)
+                landed.append(time.time())
+                os.rename(staging, os.path.join(corpus_path, name))
+                searchable.append(wait_searchable(engine, name, args.timeout))
+                time.sleep(args.debounce)
+            load.stop()
+            watcher.stop()
+
+        delays = [s - l for l, s in zip(landed, searchable) if s is not None]
+        idle = load.latencies(until=idle_until)
+        busy = load.latencies(since=idle_until)
+        return {
+            "mode": mode,
+            "files": args.files,
+            "missed": sum(s is None for s in searchable),
+            "delay_p50": percentile_ms(delays, 50) / 1000 if delays else float("nan"),
+            "delay_max": max(delays) if delays else float("nan"),
+            "ingest": sum(u["ingest_s"] for u in watcher.updates) / max(1, len(watcher.updates)),
+            "swap": sum(u["swap_s"] for u in watcher.updates) / max(1, len(watcher.updates)),
+            "idle_p99": percentile_ms(idle, 99),
+            "busy_p50": percentile_ms(busy, 50),
+            "busy_p99": percentile_ms(busy, 99),
+            "busy_max": max(busy) * 1000,
+            "errors": load.errors,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="数据集监视基准测试")
+    parser.add_argument("--dataset", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dataset"),
+                        help="PDF 数据集目录")
+    parser.add_argument("--copies", type=int, default=10, help="初始语料规模：每个 PDF 复制的份数")
+    parser.add_argument("--files", type=int, default=5, help="依次放入的新 PDF 数量")
+    parser.add_argument("--modes", nargs="+", default=["inotify", "poll"], help="监视方式")
+    parser.add_argument("--debounce", type=float, default=0.5, help="变化平静多少秒后开始增量更新")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="轮询间隔（秒）")
+    parser.add_argument("--shard-by", choices=["file", "size"], default=None, help="构建分片知识库")
+    parser.add_argument("--dim", type=int, default=256, help="替身嵌入模型的向量维度")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="每次嵌入请求模拟的延迟（秒）")
+    parser.add_argument("--timeout", type=float, default=60.0, help="等待单个文件可检索的超时（秒）")
+    args = parser.parse_args()
+
+    print(f"初始语料 {args.copies} 份，依次放入 {args.files} 个新 PDF，去抖 {args.debounce:g}s，轮询间隔 {args.poll_interval:g}s")
+    print(f"{'监视方式':<8} | {'落盘→可检索 p50(s)':>16} | {'最大(s)':>7} | {'增量更新(s)':>10} | {'切换(s)':>7} | "
+          f"{'空闲查询p99(ms)':>14} | {'更新期间 p50/p99/最大(ms)':>24} | {'未检索到':>6} | {'查询失败':>6}")
+    print("-" * 140)
+    for mode in args.modes:
+        r = run_mode(args, mode)
+        print(f"{mode:<8} | {r['delay_p50']:>16.2f} | {r['delay_max']:>7.2f} | {r['ingest']:>10.2f} | {r['swap']:>7.3f} | "
+              f"{r['idle_p99']:>14.2f} | {r['busy_p50']:>8.2f} / {r['busy_p99']:>6.2f} / {r['busy_max']:>6.1f} | "
+              f"{r['missed']:>6} | {r['errors']:>6}")
+
+
+if __name__ == "__main__":
+    main()
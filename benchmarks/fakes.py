@@ -0,0 +1,180 @@
+"""
+离线基准测试使用的本地替身（不访问 DashScope）
+"""
+import hashlib
+import random
+import time
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    确定性的本地嵌入模型：以文本哈希为随机种子生成单位向量
+
+    参数:
+        dimension: 向量维度（默认1536，与 text-embedding-v2 一致）
+        latency: 每次调用模拟的网络延迟（秒）
+    """
+
+    def __init__(self, dimension: int = 1536, latency: float = 0.0):
+        self.dimension = dimension
+        self.latency = latency
+        self.calls = 0
+        self.texts_embedded = 0
+
+    def _embed(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dimension).astype(np.float32)
+        vector /= np.linalg.norm(vector)
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """与 DashScope 一样用一次请求嵌入整批查询"""
+        return self.embed_documents(texts)
+
+
+class FakeLLM(LLM):
+    """确定性的本地大模型：等待固定延迟后返回固定格式的回答，可按 failure_rate 随机抛出异常"""
+
+    latency: float = 0.0
+    failure_rate: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-rag-llm"
+
+    def _call(self, prompt: str, stop=None, run_manager=None, **kwargs) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise RuntimeError("模拟的大模型调用失败")
+        return f"（离线回答，提示词共 {len(prompt)} 个字符）"
+
+
+class FakeStreamingLLM(LLM):
+    """
+    支持流式输出的本地大模型：等待 first_token_latency 秒后逐个产出回答片段，
+    片段之间间隔 token_latency 秒；同时实现同步 stream 和异步 astream
+    """
+
+    first_token_latency: float = 0.0
+    token_latency: float = 0.0
+    tokens: int = 50
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming-rag-llm"
+
+    def _tokens(self, prompt: str) -> List[str]:
+        return [f"片段{i}（提示词 {len(prompt)} 字符）" if i == 0 else f" 片段{i}" for i in range(self.tokens)]
+
+    def _call(self, prompt: str, stop=None, run_manager=None, **kwargs) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+    def _stream(self, prompt: str, stop=None, run_manager=None, **kwargs):
+        from langchain_core.outputs import GenerationChunk
+
+        time.sleep(self.first_token_latency)
+        for i, token in enumerate(self._tokens(prompt)):
+            if i:
+                time.sleep(self.token_latency)
+            yield GenerationChunk(text=token)
+
+    async def _astream(self, prompt: str, stop=None, run_manager=None, **kwargs):
+        import asyncio
+        from langchain_core.outputs import GenerationChunk
+
+        await asyncio.sleep(self.first_token_latency)
+        for i, token in enumerate(self._tokens(prompt)):
+            if i:
+                await asyncio.sleep(self.token_latency)
+            yield GenerationChunk(text=token)
+
+
+class FakeEmbeddingServer:
+    """
+    本地 HTTP 替身嵌入服务：POST /embed，请求体为 {"texts": [...]}，
+    返回 {"embeddings": [...]}。可注入固定延迟和随机失败率
+
+    参数:
+        latency: 每个请求的处理延迟（秒）
+        failure_rate: 返回 503 的概率
+        dimension: 向量维度
+    """
+
+    def __init__(self, latency: float = 0.05, failure_rate: float = 0.0, dimension: int = 1536):
+        import json
+        import random
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        embedder = FakeEmbeddings(dimension=dimension)
+        server_self = self
+        self.requests = 0
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                server_self.requests += 1
+                time.sleep(latency)
+                if random.random() < failure_rate:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                payload = json.dumps({"embeddings": [embedder._embed(t) for t in body["texts"]]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}/embed"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class HttpEmbeddings(Embeddings):
+    """调用 FakeEmbeddingServer 的嵌入模型客户端"""
+
+    def __init__(self, url: str):
+        self.url = url
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        import json
+        import urllib.request
+
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps({"texts": texts}).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return json.loads(response.read())["embeddings"]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
@@ -0,0 +1,206 @@
+"""
+文本分块模块
+封装文本分割器，直接输出每个文本块在原始文本中的起止位置，
+并通过对行起始位置数组的二分查找将文本块映射到页码
+"""
+import logging
+from array import array
+from bisect import bisect_right
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Tuple
+
+if TYPE_CHECKING:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# 文本分割参数
+CHUNK_SIZE = 512
+CHUNK_OVERLAP = 128
+SEPARATORS = ["\n\n", "\n", ".", " ", ""]
+# 流式分块时单个文档驻留在内存中的默认文本窗口大小（字符数）
+DEFAULT_WINDOW_CHARS = 1_000_000
+
+
+def create_text_splitter(chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> "RecursiveCharacterTextSplitter":
+    """创建文本分割器，用于将长文本分割成小块"""
+    # 分割器依赖较重，只在构建知识库时导入
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(
+        separators=SEPARATORS,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+    )
+
+
+def split_text_with_offsets(text: str, text_splitter: "RecursiveCharacterTextSplitter" = None) -> List[Tuple[str, int, int]]:
+    """
+    分割文本并返回每个文本块的起止位置
+    
+    分割器按顺序输出文本块，每个文本块的起点一定在上一个文本块起点之后，
+    因此只需从上一个起点向后查找，整体代价与文本长度成线性关系。
+    
+    参数:
+        text: 原始文本
+        text_splitter: 可选，文本分割器。为None时使用默认参数创建
+    
+    返回:
+        [(chunk, start, end), ...]，满足 text[start:end] == chunk
+    """
+    if text_splitter is None:
+        text_splitter = create_text_splitter()
+
+    results = []
+    previous_start = -1
+    for chunk in text_splitter.split_text(text):
+        start = text.find(chunk, previous_start + 1)
+        if start == -1:
+            # 理论上不会发生，兜底使用全局查找
+            start = text.find(chunk)
+        if start == -1:
+            start = max(previous_start, 0)
+        results.append((chunk, start, start + len(chunk)))
+        previous_start = start
+    return results
+
+
+class PageMapper:
+    """
+    字符位置到页码的映射：行起始位置保存在紧凑的整数数组中，查找时使用二分查找
+
+    参数:
+        line_starts: 每行在原始文本中的起始位置（升序）
+        page_numbers: 每行对应的页码（整数或"file.pdf:1"格式的字符串）
+    """
+
+    def __init__(self, line_starts, page_numbers: List):
+        self.line_starts = array("q", line_starts)
+        self.page_numbers = page_numbers
+
+    @classmethod
+    def from_line_ranges(cls, line_ranges: List[Tuple[int, int]], page_numbers: List) -> "PageMapper":
+        """根据每行的字符位置范围创建映射"""
+        return cls((start for start, _ in line_ranges), page_numbers)
+
+    @classmethod
+    def from_text(cls, text: str, page_numbers: List) -> "PageMapper":
+        """没有行位置信息时，按换行符推算每行的起始位置"""
+        line_starts = array("q", [0])
+        position = text.find("\n")
+        while position != -1:
+            line_starts.append(position + 1)
+            position = text.find("\n", position + 1)
+        return cls(line_starts[:len(page_numbers)], page_numbers)
+
+    def page_at(self, offset: int):
+        """
+        返回包含指定字符位置的行所在的页码
+        
+        位置落在两行之间（换行符或文档标记）时归属前一行，
+        位于第一行之前时归属第一行。
+        """
+        if not self.page_numbers:
+            return 1
+        line_idx = bisect_right(self.line_starts, offset) - 1
+        return self.page_numbers[max(0, min(line_idx, len(self.page_numbers) - 1))]
+
+
+def chunk_text_with_pages(text: str, page_numbers: List, line_ranges: List[Tuple[int, int]] = None, text_splitter: "RecursiveCharacterTextSplitter" = None) -> List[Tuple[str, object, int, int]]:
+    """
+    分割文本，并为每个文本块找到其起始位置所在的页码
+    
+    参数:
+        text: 原始文本
+        page_numbers: 每行文本对应的页码列表
+        line_ranges: 可选，每行文本在原始文本中的字符位置范围列表
+        text_splitter: 可选，文本分割器
+    
+    返回:
+        [(chunk, page_num, start, end), ...]
+    """
+    if line_ranges and len(line_ranges) == len(page_numbers):
+        page_mapper = PageMapper.from_line_ranges(line_ranges, page_numbers)
+    else:
+        page_mapper = PageMapper.from_text(text, page_numbers)
+
+    return [
+        (chunk, page_mapper.page_at(start), start, end)
+        for chunk, start, end in split_text_with_offsets(text, text_splitter)
+    ]
+
+
+def iter_chunks_streaming(pages: Iterable[Tuple[int, str]], text_splitter: "RecursiveCharacterTextSplitter" = None, window_chars: int = DEFAULT_WINDOW_CHARS) -> Iterator[Tuple[str, object, int, int]]:
+    """
+    流式分割单个文档：逐页累积文本，窗口满后分块并只保留尾部未定型的文本
+    
+    窗口末尾附近的文本块可能因后续页面的到来而改变，因此每次只输出起点距窗口末尾
+    超过两个块长度的文本块，下一个窗口从第一个未输出文本块的起点开始，
+    相邻文本块之间的重叠得以保留。
+    
+    参数:
+        pages: 按顺序排列的 (页码, 页面文本) 迭代器
+        text_splitter: 可选，文本分割器
+        window_chars: 窗口最大字符数（至少为块大小的4倍）
+    
+    返回:
+        (chunk, page_num, start, end) 迭代器，start/end 为文本块在整个文档中的字符位置
+    """
+    if text_splitter is None:
+        text_splitter = create_text_splitter()
+    chunk_size = text_splitter._chunk_size
+    tail_chars = chunk_size * 2
+    window_chars = max(window_chars, chunk_size * 4)
+
+    parts = []
+    buffer_len = 0
+    base = 0  # 当前窗口在文档中的起始位置
+    page_starts = []  # 窗口内各页在文档中的起始位置
+    page_labels = []
+
+    def flush(final: bool):
+        nonlocal parts, buffer_len, base, page_starts, page_labels
+        text = "".join(parts)
+        page_mapper = PageMapper(page_starts, page_labels)
+        cut = len(text)
+        for chunk, start, end in split_text_with_offsets(text, text_splitter):
+            if not final and start >= len(text) - tail_chars:
+                cut = start
+                break
+            yield chunk, page_mapper.page_at(base + start), base + start, base + end
+
+        # 保留未输出的尾部文本，以及覆盖该位置的页信息
+        parts = [text[cut:]] if cut < len(text) else []
+        buffer_len = len(text) - cut
+        base += cut
+        keep = max(0, bisect_right(page_starts, base) - 1)
+        page_starts = page_starts[keep:]
+        page_labels = page_labels[keep:]
+
+    for page_number, page_text in pages:
+        if not page_text:
+            logging.warning(f"No text found on page {page_number}.")
+            continue
+        page_starts.append(base + buffer_len)
+        page_labels.append(page_number)
+        parts.append(page_text)
+        buffer_len += len(page_text)
+        if buffer_len >= window_chars:
+            yield from flush(final=False)
+
+    if buffer_len:
+        yield from flush(final=True)
+
+
+def chunk_metadata(page_num, start: int, end: int) -> dict:
+    """
+    构建文本块的元数据
+    
+    参数:
+        page_num: 页码（整数或"file.pdf:1"格式的字符串）
+        start: 文本块在原始文本中的起始位置
+        end: 文本块在原始文本中的结束位置
+    """
+    source, page = None, page_num
+    if isinstance(page_num, str) and ":" in page_num:
+        source, page = page_num.rsplit(":", 1)
+        page = int(page) if page.isdigit() else page
+    return {"source": source, "page": page, "start": start, "end": end}
@@ -0,0 +1,197 @@
+"""
+上下文构建模块
+根据文本块元数据中的来源和起止位置（source / start / end），将检索结果中相互重叠或相邻的文本块
+合并为连续片段，去掉内容完全相同的文本块，再按检索排名在 token 预算内装入提示词
+"""
+import hashlib
+import math
+import re
+
+# 默认上下文 token 预算
+DEFAULT_CONTEXT_BUDGET = 3000
+
+# 起止位置相差不超过该字符数的文本块视为相邻（分割器会去掉块边界处的空白）
+ADJACENT_GAP = 2
+
+# 片段之间的分隔符
+SEPARATOR = "\n\n"
+
+_CJK = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的 token 数：中日韩字符和全角标点按每字 1 个 token，其余字符按每 4 个字符 1 个 token
+
+    对中文偏保守（实际分词通常更少），保证按估算值装入的上下文不会超出预算
+    """
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+class ContextSegment:
+    """
+    合并后的连续片段
+
+    参数:
+        text: 片段文本
+        rank: 片段中排名最靠前的文本块的检索排名（0 为最相关）
+        docs: 合并进该片段的文本块（包括内容与其中某个文本块完全相同而被去重的文本块，用于显示来源）
+    """
+
+    def __init__(self, text: str, rank: int, docs: list):
+        self.text = text
+        self.rank = rank
+        self.docs = docs
+
+
+class ContextResult:
+    """
+    上下文构建结果
+
+    属性:
+        text: 装入提示词的上下文
+        docs: 上下文中实际包含的文本块（用于显示来源，包括内容与已包含的文本块完全相同的文本块）
+        naive_chars / naive_tokens: 直接拼接全部文本块时的字符数 / 估算 token 数
+        chars / tokens: 构建后的字符数 / 估算 token 数
+        merged: 被合并进其他片段的文本块数
+        duplicates: 因内容完全相同被丢弃的文本块数
+        truncated: 因超出预算被丢弃或截断的片段数
+    """
+
+    def __init__(self, text: str, docs: list, naive_text: str, merged: int, duplicates: int, truncated: int):
+        self.text = text
+        self.docs = docs
+        self.naive_chars = len(naive_text)
+        self.naive_tokens = estimate_tokens(naive_text)
+        self.chars = len(text)
+        self.tokens = estimate_tokens(text)
+        self.merged = merged
+        self.duplicates = duplicates
+        self.truncated = truncated
+
+    @property
+    def saved_chars(self) -> int:
+        return self.naive_chars - self.chars
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.naive_tokens - self.tokens
+
+    def summary(self) -> str:
+        """返回本次构建节省的字符数和 token 数"""
+        return (f"上下文：合并 {self.merged} 个重叠块，去重 {self.duplicates} 个，预算外 {self.truncated} 个，"
+                f"{self.naive_chars} → {self.chars} 字符（节省 {self.saved_chars} 字符，约 {self.saved_tokens} tokens）")
+
+
+def _offsets(doc):
+    """返回文本块的 (来源, 起点, 终点)，缺少位置信息（旧版知识库）时返回None"""
+    metadata = getattr(doc, "metadata", None) or {}
+    start, end = metadata.get("start"), metadata.get("end")
+    if start is None or end is None:
+        return None
+    return metadata.get("source"), start, end
+
+
+def merge_chunks(docs: list) -> tuple:
+    """
+    去重并合并重叠或相邻的文本块
+
+    参数:
+        docs: 按检索排名排列的文本块
+
+    返回:
+        (segments, merged, duplicates): 按排名排列的片段列表、被合并的文本块数、被去重的文本块数
+    """
+    seen = {}  # 文本哈希 → 第一个该内容的文本块
+    duplicates_of = {}  # 第一个文本块的 id → 内容相同的其余文本块（文本不再装入上下文，来源仍保留）
+    duplicates = 0
+    by_source = {}
+    segments = []
+    for rank, doc in enumerate(docs):
+        digest = hashlib.sha256(doc.page_content.encode("utf-8")).digest()
+        if digest in seen:
+            duplicates += 1
+            duplicates_of.setdefault(id(seen[digest]), []).append(doc)
+            continue
+        seen[digest] = doc
+        offsets = _offsets(doc)
+        if offsets is None:
+            segments.append(ContextSegment(doc.page_content, rank, [doc]))
+        else:
+            by_source.setdefault(offsets[0], []).append((offsets[1], offsets[2], rank, doc))
+
+    # 同一来源的文本块按起点排序，依次合并区间
+    merged = 0
+    for chunks in by_source.values():
+        chunks.sort(key=lambda item: item[0])
+        current = None
+        for start, end, rank, doc in chunks:
+            if current is not None and start <= current["end"] + ADJACENT_GAP:
+                merged += 1
+                if end > current["end"]:
+                    if start < current["end"]:
+                        current["text"] += doc.page_content[current["end"] - start:]
+                    else:
+                        current["text"] += "\n" * (start - current["end"]) + doc.page_content
+                    current["end"] = end
+                current["rank"] = min(current["rank"], rank)
+                current["docs"].append(doc)
+                continue
+            if current is not None:
+                segments.append(ContextSegment(current["text"], current["rank"], current["docs"]))
+            current = {"text": doc.page_content, "end": end, "rank": rank, "docs": [doc]}
+        if current is not None:
+            segments.append(ContextSegment(current["text"], current["rank"], current["docs"]))
+
+    if duplicates_of:
+        for segment in segments:
+            segment.docs = [item for doc in segment.docs for item in [doc] + duplicates_of.get(id(doc), [])]
+    segments.sort(key=lambda segment: segment.rank)
+    return segments, merged, duplicates
+
+
+def build_context(docs: list, budget: int = DEFAULT_CONTEXT_BUDGET) -> ContextResult:
+    """
+    构建提示词上下文：合并重叠文本块、去重，并按检索排名在 token 预算内装入片段
+
+    预算不足以装下某个片段时跳过它继续尝试排名更靠后的片段；
+    排名最靠前的片段本身就超出预算时截断该片段，保证上下文不为空
+
+    参数:
+        docs: 按检索排名排列的文本块
+        budget: 上下文 token 预算，None 表示不限制
+
+    返回:
+        ContextResult: 上下文文本、包含的文本块及节省统计
+    """
+    naive_text = SEPARATOR.join(doc.page_content for doc in docs)
+    segments, merged, duplicates = merge_chunks(docs)
+
+    packed = []
+    used = 0
+    truncated = 0
+    separator_tokens = estimate_tokens(SEPARATOR)
+    for segment in segments:
+        cost = estimate_tokens(segment.text) + (separator_tokens if packed else 0)
+        if budget is None or used + cost <= budget:
+            packed.append(segment)
+            used += cost
+            continue
+        truncated += 1
+        if not packed:
+            # 按比例截断排名第一的片段
+            keep = max(1, int(len(segment.text) * budget / cost))
+            while keep > 1 and estimate_tokens(segment.text[:keep]) > budget:
+                keep = int(keep * 0.9)
+            packed.append(ContextSegment(segment.text[:keep], segment.rank, segment.docs))
+            used += estimate_tokens(segment.text[:keep])
+
+    text = SEPARATOR.join(segment.text for segment in packed)
+    included = [doc for segment in packed for doc in segment.docs]
+    # 来源按检索排名显示
+    rank_of = {}
+    for rank, doc in enumerate(docs):
+        rank_of.setdefault(id(doc), rank)
+    included.sort(key=lambda doc: rank_of[id(doc)])
+    return ContextResult(text, included, naive_text, merged, duplicates, truncated)
@@ -1,45 +1,142 @@
 import os
+import json
 import logging
 import pickle
-from PyPDF2 import PdfReader
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
 # 以下导入为预留，用于后续问答功能（当前未使用）
 # from langchain.chains.question_answering import load_qa_chain
 # from langchain_openai import OpenAI, ChatOpenAI
 # from langchain_openai import OpenAIEmbeddings
 # from langchain_community.callbacks.manager import get_openai_callback
-from langchain_community.embeddings import DashScopeEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Tuple
+import faiss
+import numpy as np
+from embedding_backends import (
+    DASHSCOPE_MODEL,
+    EMBEDDING_BACKENDS,
+    base_embeddings,
+    check_embeddings,
+    create_embedding_backend,
+    describe_embeddings,
+    fit_embeddings,
+    is_remote_backend,
+    load_embedder_state,
+    requires_fit,
+    save_embedder_state,
+)
+from dedup import ChunkDeduplicator, attach_duplicates, dedup_chunks, origin
+from docstore import DOCSTORE_FILE, attach_docstore, load_docstore, write_docstore
+from embedding_cache import EmbeddingCache, CachedEmbeddings
+from embedding_pipeline import BatchedEmbeddings
+from extraction_cache import ExtractionCache, file_sha256
+from instrumentation import count, is_enabled, span, traced
+from snapshot_store import SNAPSHOTS_DIR, resolve_snapshot, resolve_snapshot_path, write_snapshot
+from vector_index import (
+    ExactVectors,
+    RerankIndex,
+    apply_search_params,
+    create_index,
+    describe_index,
+    is_compressed,
+    make_index_config,
+    training_size,
+    unwrap_index,
+)
+from chunking import (
+    DEFAULT_WINDOW_CHARS,
+    chunk_metadata,
+    chunk_text_with_pages,
+    create_text_splitter,
+    iter_chunks_streaming,
+)
 
-def extract_text_with_page_numbers(pdf) -> Tuple[str, List[int], List[Tuple[int, int]]]:
+# 默认嵌入模型（阿里百炼平台）
+EMBEDDING_MODEL = DASHSCOPE_MODEL
+
+# 以内存映射方式只读打开索引（不支持 IO_FLAG_MMAP_IFC 的旧版 FAISS 退回 IO_FLAG_MMAP）
+MMAP_IO_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+# 快照中记录索引类型等构建参数的文件
+STORE_META_FILE = "store_meta.json"
+
+# 压缩索引在快照中另存的原始 float32 向量（按索引位置排列）
+VECTORS_FILE = "vectors.f32"
+
+
+def create_embeddings(cache_path: str = None, batch_size: int = 25, max_workers: int = 4, requests_per_second: float = None, backend: str = None, **backend_options):
     """
-    从PDF中提取文本并记录每行文本对应的页码和字符位置
+    创建嵌入模型：远程后端批量并发调用，可选地包装一层持久化嵌入缓存；本地后端直接返回
     
     参数:
-        pdf: PDF文件对象
+        cache_path: 可选，嵌入缓存数据库路径。如果为None，则不使用缓存
+        batch_size: 每个嵌入请求包含的文本块数量
+        max_workers: 并发嵌入请求数
+        requests_per_second: 可选，每秒最多发出的嵌入请求数（令牌桶限速）
+        backend: 嵌入后端名称（见 embedding_backends.EMBEDDING_BACKENDS），None 表示默认的 dashscope
+        backend_options: 传给后端的参数，如本地模型的 dimension
     
     返回:
-        text: 提取的文本内容
+        embeddings: 嵌入模型对象
+    """
+    embeddings = create_embedding_backend(backend, **backend_options)
+    if not is_remote_backend(describe_embeddings(embeddings)["backend"]):
+        # 本地模型无需并发和限速；拟合结果随快照变化，也不写入持久化缓存
+        return embeddings
+    # 分批并发请求，失败的批次自动重试
+    embeddings = BatchedEmbeddings(
+        embeddings,
+        batch_size=batch_size,
+        max_workers=max_workers,
+        requests_per_second=requests_per_second
+    )
+    # 缓存位于最外层，只有未命中的文本块才进入并发流水线
+    if cache_path:
+        embeddings = CachedEmbeddings(embeddings, EmbeddingCache(cache_path), model_name=describe_embeddings(embeddings)["model"])
+    return embeddings
+
+
+def stored_embedding_backend(store_path: str) -> str:
+    """返回知识库构建时记录的嵌入后端名称，知识库不存在、为旧版本或后端未注册时返回None"""
+    snapshot_path = resolve_snapshot_path(store_path)
+    if snapshot_path is None:
+        return None
+    backend = (load_store_meta(snapshot_path).get("embedding") or {}).get("backend")
+    return backend if backend in EMBEDDING_BACKENDS else None
+
+
+def assemble_pages(pages: List[Tuple[int, str]]) -> Tuple[str, List[int], List[Tuple[int, int]]]:
+    """
+    将逐页提取的文本拼接为完整文本，并记录每行文本对应的页码和字符位置
+    
+    参数:
+        pages: 按页顺序排列的 (页码, 页面文本) 列表
+    
+    返回:
+        text: 拼接后的文本内容
         page_numbers: 每行文本对应的页码列表
         line_ranges: 每行文本在原始文本中的字符位置范围列表，格式为[(start, end), ...]
     """
-    text = ""
+    parts = []
     page_numbers = []
     line_ranges = []
+    text_length = 0
 
-    for page_number, page in enumerate(pdf.pages, start=1):
-        extracted_text = page.extract_text()
+    for page_number, extracted_text in pages:
         if extracted_text:
             # 记录添加文本前的起始位置
-            text_start_pos = len(text)
+            text_start_pos = text_length
             # 添加当前页的文本
-            text += extracted_text
+            parts.append(extracted_text)
+            text_length += len(extracted_text)
             # 按行分割并计算每行的位置
             lines = extracted_text.split("\n")
             current_line_start = text_start_pos
             
-            for i, line in enumerate(lines):
+            for line in lines:
                 line_start = current_line_start
                 line_end = line_start + len(line)
                 line_ranges.append((line_start, line_end))
@@ -49,9 +146,172 @@ def extract_text_with_page_numbers(pdf) -> Tuple[str, List[int], List[Tuple[int,
         else:
             logging.warning(f"No text found on page {page_number}.")
 
-    return text, page_numbers, line_ranges
+    return "".join(parts), page_numbers, line_ranges
 
-def process_text_with_splitter(text: str, page_numbers: List, line_ranges: List[Tuple[int, int]] = None, save_path: str = None) -> FAISS:
+
+def extract_text_with_page_numbers(pdf) -> Tuple[str, List[int], List[Tuple[int, int]]]:
+    """
+    从PDF中提取文本并记录每行文本对应的页码和字符位置
+    
+    参数:
+        pdf: PDF文件对象
+    
+    返回:
+        text: 提取的文本内容
+        page_numbers: 每行文本对应的页码列表
+        line_ranges: 每行文本在原始文本中的字符位置范围列表，格式为[(start, end), ...]
+    """
+    pages = [(page_number, page.extract_text()) for page_number, page in enumerate(pdf.pages, start=1)]
+    return assemble_pages(pages)
+
+
+def extract_pages(file_path: str, start_page: int = 0, end_page: int = None) -> List[Tuple[int, str]]:
+    """
+    提取PDF文件中指定页范围的文本（模块级函数，可在子进程中执行）
+    
+    参数:
+        file_path: PDF文件路径
+        start_page: 起始页索引（从0开始，包含）
+        end_page: 结束页索引（不包含），为None时提取到最后一页
+    
+    返回:
+        (页码, 页面文本) 列表，页码从1开始
+    """
+    from PyPDF2 import PdfReader
+
+    pdf_reader = PdfReader(file_path)
+    pages = pdf_reader.pages[start_page:end_page]
+    return [(start_page + i + 1, page.extract_text()) for i, page in enumerate(pages)]
+
+
+def _extract_pages_task(task: Tuple[str, int, int]) -> List[Tuple[int, str]]:
+    return extract_pages(*task)
+
+
+def iter_pdf_pages(file_paths: List[str], workers: int = 1, pages_per_task: int = 16, cache: ExtractionCache = None) -> Iterator[Tuple[int, int, str]]:
+    """
+    按文件和页码顺序逐页产出PDF文本，workers大于1时在进程池中并行提取
+    
+    大文件会按 pages_per_task 页切分为多个任务，与其他文件的任务一起分发到进程池。
+    同时在途的任务数不超过 workers 的两倍，已提取但尚未被消费的页面数量有上限。
+    提供提取缓存时，内容已缓存的文件直接读取缓存的页面，只有其余文件交给 PDF 解析，
+    完整提取的文件写入缓存。
+    
+    参数:
+        file_paths: PDF文件路径列表
+        workers: 并行进程数，1表示串行提取
+        pages_per_task: 每个任务提取的页数
+        cache: 可选，ExtractionCache 实例
+    
+    返回:
+        (文件索引, 页码, 页面文本) 迭代器
+    """
+    if cache is None:
+        yield from _extract_pdf_pages(file_paths, workers, pages_per_task)
+        return
+
+    with span("extract.hash", files=len(file_paths)):
+        hashes = [file_sha256(file_path) for file_path in file_paths]
+    missing = [file_index for file_index, file_hash in enumerate(hashes) if not cache.contains(file_hash)]
+    # 未缓存的文件按原顺序提取，与已缓存的文件按文件顺序交替产出
+    extracted = _extract_pdf_pages([file_paths[file_index] for file_index in missing], workers, pages_per_task)
+    positions = {file_index: position for position, file_index in enumerate(missing)}
+    try:
+        item = next(extracted, None) if missing else None
+        for file_index, file_hash in enumerate(hashes):
+            position = positions.get(file_index)
+            if position is not None:
+                pages = []
+                while item is not None and item[0] == position:
+                    _, page_number, page_text = item
+                    pages.append((page_number, page_text))
+                    yield file_index, page_number, page_text
+                    item = next(extracted, None)
+                cache.put(file_hash, pages)
+                continue
+            pages = cache.get(file_hash)
+            if pages is None:
+                # 检查后被其他进程淘汰，直接提取
+                pages = extract_pages(file_paths[file_index])
+                cache.put(file_hash, pages)
+            for page_number, page_text in pages:
+                count("pages")
+                yield file_index, page_number, page_text
+    finally:
+        # 提前停止读取时关闭提取进程池
+        extracted.close()
+
+
+def _extract_pdf_pages(file_paths: List[str], workers: int = 1, pages_per_task: int = 16) -> Iterator[Tuple[int, int, str]]:
+    """解析PDF并按文件和页码顺序逐页产出文本（iter_pdf_pages 的提取部分，不使用缓存）"""
+    # PDF 解析库只在构建知识库时需要，查询进程不导入
+    from PyPDF2 import PdfReader
+
+    if workers <= 1:
+        for file_index, file_path in enumerate(file_paths):
+            count("pdf_bytes", os.path.getsize(file_path))
+            pdf_reader = PdfReader(file_path)
+            for page_number, page in enumerate(pdf_reader.pages, start=1):
+                count("pages")
+                yield file_index, page_number, page.extract_text()
+        return
+
+    def iter_tasks():
+        # 按页范围切分任务，记录每个任务属于哪个文件
+        for file_index, file_path in enumerate(file_paths):
+            count("pdf_bytes", os.path.getsize(file_path))
+            page_count = len(PdfReader(file_path).pages)
+            for start in range(0, page_count, pages_per_task):
+                yield file_index, (file_path, start, min(start + pages_per_task, page_count))
+
+    tasks = iter_tasks()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for file_index, task in islice(tasks, workers * 2):
+            pending.append((file_index, executor.submit(_extract_pages_task, task)))
+        # 按提交顺序取回结果，保证页码顺序确定
+        while pending:
+            file_index, future = pending.popleft()
+            next_task = next(tasks, None)
+            if next_task is not None:
+                pending.append((next_task[0], executor.submit(_extract_pages_task, next_task[1])))
+            for page_number, page_text in future.result():
+                count("pages")
+                yield file_index, page_number, page_text
+
+
+def extract_pdf_files(file_paths: List[str], workers: int = 1, pages_per_task: int = 16, cache: ExtractionCache = None) -> List[Tuple[str, List[int], List[Tuple[int, int]]]]:
+    """
+    提取多个PDF文件的文本，workers大于1时在进程池中并行提取
+    
+    最后按文件和页码顺序重新组装，结果与串行提取完全一致。
+    
+    参数:
+        file_paths: PDF文件路径列表
+        workers: 并行进程数，1表示串行提取
+        pages_per_task: 每个任务提取的页数
+        cache: 可选，ExtractionCache 实例
+    
+    返回:
+        与 file_paths 顺序一致的 (text, page_numbers, line_ranges) 列表
+    """
+    pages_by_file = [[] for _ in file_paths]
+    for file_index, page_number, page_text in iter_pdf_pages(file_paths, workers, pages_per_task, cache):
+        pages_by_file[file_index].append((page_number, page_text))
+    return [assemble_pages(pages) for pages in pages_by_file]
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    """将迭代器按固定大小分批"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def process_text_with_splitter(text: str, page_numbers: List, line_ranges: List[Tuple[int, int]] = None, save_path: str = None, embeddings = None, dedup_config: dict = None) -> FAISS:
     """
     处理文本并创建向量存储
     
@@ -60,130 +320,375 @@ def process_text_with_splitter(text: str, page_numbers: List, line_ranges: List[
         page_numbers: 每行文本对应的页码列表（可以是整数或带文件名的字符串，如"file.pdf:1"）
         line_ranges: 每行文本在原始文本中的字符位置范围列表，格式为[(start, end), ...]
         save_path: 可选，保存向量数据库的路径
+        embeddings: 可选，嵌入模型。如果为None，将创建一个新的DashScopeEmbeddings实例
+        dedup_config: 可选，去重配置（见 dedup.make_dedup_config），重复的文本块只嵌入一次
     
     返回:
         knowledgeBase: 基于FAISS的向量存储对象
     """
-    # 创建文本分割器，用于将长文本分割成小块
-    text_splitter = RecursiveCharacterTextSplitter(
-        separators = ["\n\n", "\n", ".", " ", ""],
-        chunk_size = 512,
-        chunk_overlap = 128,
-        length_function = len,
-    )
-
-    # 分割文本
-    chunks = text_splitter.split_text(text)
+    # 分割文本，同时得到每个文本块的起止位置和页码
+    with span("split", chars=len(text)):
+        chunk_records = chunk_text_with_pages(text, page_numbers, line_ranges)
+    chunks = [chunk for chunk, _, _, _ in chunk_records]
+    count("chunks", len(chunks))
     # logging.debug(f"Text split into {len(chunks)} chunks.")
     print(f"文本被分割成 {len(chunks)} 个块。")
 
-    # 调用阿里百炼平台文本嵌入模型，配置环境变量 DASHSCOPE_API_KEY
-    embeddings = DashScopeEmbeddings(
-        model = "text-embedding-v2"
-    )
-    # 从文本块创建知识库
-    knowledgeBase = FAISS.from_texts(chunks, embeddings)
+    if embeddings is None:
+        embeddings = create_embeddings()
+    if requires_fit(embeddings):
+        with span("embedding.fit", chunks=len(chunks)):
+            fit_embeddings(embeddings, chunks)
+    # 从文本块创建知识库，元数据中记录来源文件、页码和字符位置（重复文本块的出处合并到保留的文本块）
+    metadatas = [chunk_metadata(page_num, start, end) for _, page_num, start, end in chunk_records]
+    chunks, metadatas, _ = dedup_chunks(chunks, metadatas, dedup_config)
+    with span("embed_index", chunks=len(chunks)):
+        knowledgeBase = FAISS.from_texts(chunks, embeddings, metadatas=metadatas)
     print("已从文本块创建知识库...")
+
+    # 如果提供了保存路径，则保存向量数据库（来源和页码记录在文本块元数据中）
+    if save_path:
+        save_knowledge_base(knowledgeBase, save_path)
     
-    # 根据chunk在原始文本中的位置找到对应的页码
-    page_info = {}
-    search_start = 0  # 用于跟踪查找位置，考虑chunk overlap
+    return knowledgeBase
+
+
+def create_knowledge_base(records: List[Tuple[str, List[float], dict, str]], embeddings, index_config: dict = None) -> FAISS:
+    """
+    按索引配置创建向量数据库，并写入第一批文本块（IVF 索引用这批向量训练聚类中心）
     
-    # 如果line_ranges可用，使用精确的位置映射
-    if line_ranges and len(line_ranges) == len(page_numbers):
-        for chunk in chunks:
-            # 从search_start开始查找chunk（考虑overlap，向前搜索一些位置）
-            search_from = max(0, search_start - 128)  # 128是chunk_overlap大小
-            chunk_start = text.find(chunk, search_from)
-            
-            if chunk_start == -1:
-                # 如果找不到，尝试全局查找
-                chunk_start = text.find(chunk)
-            
-            if chunk_start != -1:
-                # 找到包含chunk起始位置的行
-                page_num = page_numbers[0] if page_numbers else ("未知:1" if page_numbers and isinstance(page_numbers[0], str) else 1)
-                
-                # 二分查找或线性查找包含chunk_start的行
-                for line_idx, (line_start, line_end) in enumerate(line_ranges):
-                    if line_start <= chunk_start <= line_end:
-                        # chunk起始位置在这一行内
-                        page_num = page_numbers[line_idx]
-                        break
-                    elif chunk_start < line_start:
-                        # chunk起始位置在行之前，使用前一行（如果存在）
-                        if line_idx > 0:
-                            page_num = page_numbers[line_idx - 1]
-                        break
+    参数:
+        records: (文本块, 向量, 元数据, 向量ID) 列表
+        embeddings: 嵌入模型
+        index_config: 索引配置，默认为 Flat 精确搜索
+    
+    返回:
+        knowledgeBase: 基于FAISS的向量存储对象
+    """
+    if index_config is None:
+        index_config = make_index_config()
+    vectors = np.asarray([vector for _, vector, _, _ in records], dtype=np.float32)
+    index = create_index(vectors.shape[1], index_config, training_vectors=vectors)
+    knowledgeBase = FAISS(embeddings, index, InMemoryDocstore(), {})
+    # 压缩索引另存原始向量，用于精确重排序和删除后重建
+    knowledgeBase.exact_vectors = ExactVectors(vectors.shape[1]) if is_compressed(index_config) else None
+    add_records(knowledgeBase, records)
+    knowledgeBase.store_meta = {"index": index_config}
+    return knowledgeBase
+
+
+def add_records(knowledgeBase: FAISS, records: List[Tuple[str, List[float], dict, str]]):
+    """
+    将 (文本块, 向量, 元数据, 向量ID) 列表追加到向量数据库，压缩索引同时追加原始向量
+    
+    返回:
+        写入的向量ID列表
+    """
+    ids = knowledgeBase.add_embeddings(
+        [(chunk, vector) for chunk, vector, _, _ in records],
+        metadatas=[metadata for _, _, metadata, _ in records],
+        ids=[id_ for _, _, _, id_ in records],
+    )
+    exact_vectors = getattr(knowledgeBase, "exact_vectors", None)
+    if exact_vectors is not None:
+        exact_vectors.append([vector for _, vector, _, _ in records])
+    return ids
+
+
+def ingest_documents(documents: Iterable[Tuple[str, Iterable[Tuple[int, str]]]], save_path: str = None, embeddings = None, window_chars: int = DEFAULT_WINDOW_CHARS, batch_size: int = 256, start_id: int = 0, ids_by_file: dict = None, index_config: dict = None, dedup_config: dict = None, deduplicator: ChunkDeduplicator = None, external_duplicates: dict = None) -> FAISS:
+    """
+    流式构建向量数据库：页面 → 文本块 → 去重 → 嵌入批次 → 追加到索引
+    
+    每个文档的文本只在不超过 window_chars 个字符的窗口内分块，
+    每凑满 batch_size 个文本块就嵌入并追加到FAISS索引，内存占用不随语料总量增长。
+    启用去重时，与之前的文本块重复的文本块不嵌入，其出处记录在代表文本块的元数据中
+    （去重状态为每个不重复的文本块保留一个哈希和一个 MinHash 签名）。
+    
+    参数:
+        documents: (文件名, (页码, 页面文本) 迭代器) 的迭代器
+        save_path: 可选，保存向量数据库的路径
+        embeddings: 可选，嵌入模型。如果为None，将创建默认的DashScope嵌入模型
+        window_chars: 每个文档同时驻留在内存中的最大文本字符数
+        batch_size: 每个嵌入批次的文本块数量
+        start_id: 第一个文本块的向量ID，后续文本块依次递增
+        ids_by_file: 可选，传入字典时记录每个文件贡献的向量ID列表（包括该文件的文本块被合并到的代表文本块）
+        index_config: 索引配置（见 vector_index.make_index_config），默认为 Flat 精确搜索。
+                      IVF 索引会先缓冲足够的向量用于训练，再创建索引
+        dedup_config: 可选，去重配置（见 dedup.make_dedup_config），None 表示不去重
+        deduplicator: 可选，多次构建共用的去重器（分片知识库的各分片之间去重），传入时忽略 dedup_config
+        external_duplicates: 可选，传入字典时记录代表文本块不在本次构建中的重复出处（{向量ID: [出处, ...]}），
+                             由调用方写回代表文本块所在的分片
+    
+    返回:
+        knowledgeBase: 基于FAISS的向量存储对象，没有写入任何向量时返回None
+    """
+    if embeddings is None:
+        embeddings = create_embeddings()
+    if index_config is None:
+        index_config = make_index_config()
+    text_splitter = create_text_splitter()
+
+    def iter_records():
+        for file_name, pages in documents:
+            print(f"\n正在处理: {file_name}")
+            stats = {"chars": 0, "chunks": 0}
+
+            def counted_pages():
+                for page_number, page_text in pages:
+                    stats["chars"] += len(page_text or "")
+                    yield page_number, page_text
+                count("text_chars", stats["chars"])
+
+            for chunk, page_num, start, end in iter_chunks_streaming(counted_pages(), text_splitter, window_chars):
+                stats["chunks"] += 1
+                yield file_name, chunk, f"{file_name}:{page_num}", start, end
+            print(f"  - 提取了 {stats['chars']} 个字符，分割成 {stats['chunks']} 个块")
+
+    knowledgeBase = None
+    pending = []  # 创建索引之前缓冲的记录（IVF 训练样本）
+    next_id = start_id
+    if deduplicator is None and dedup_config is not None:
+        deduplicator = ChunkDeduplicator(dedup_config)
+    dedup_counts = (deduplicator.exact, deduplicator.near) if deduplicator is not None else None
+    duplicates = {}  # 代表文本块的向量ID → 重复文本块的出处
+    total_chunks = 0
+    file_ids = {}  # 文件名 → 已记录的向量ID集合
+    batches = batched(iter_records(), batch_size)
+    if requires_fit(embeddings):
+        # 本地嵌入模型：先读入最多 fit_size 个文本块拟合，再依次嵌入这些文本块
+        fit_size = base_embeddings(embeddings).fit_size
+        buffered = []
+        buffered_chunks = 0
+        with span("embedding.fit"):
+            while buffered_chunks < fit_size:
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                buffered.append(batch)
+                buffered_chunks += len(batch)
+            if buffered:
+                fit_embeddings(embeddings, [chunk for batch in buffered for _, chunk, _, _, _ in batch])
+        batches = chain(buffered, batches)
+    while True:
+        # 取下一批文本块（包含按需进行的 PDF 提取和分块）
+        with span("ingest.read"):
+            batch = next(batches, None)
+        if batch is None:
+            break
+        count("chunks", len(batch))
+        total_chunks += len(batch)
+        chunks, metadatas, ids, batch_files = [], [], [], []
+        with span("ingest.dedup", chunks=len(batch)):
+            for file_name, chunk, page_num, start, end in batch:
+                metadata = chunk_metadata(page_num, start, end)
+                id_ = str(next_id)
+                representative = deduplicator.check(chunk, id_) if deduplicator is not None else None
+                if representative is not None:
+                    duplicates.setdefault(representative, []).append(origin(metadata))
+                    id_ = representative
                 else:
-                    # chunk超出所有行范围，使用最后一个页码
-                    page_num = page_numbers[-1] if page_numbers else page_num
-                
-                # 更新search_start为当前chunk结束位置（考虑overlap）
-                search_start = chunk_start + len(chunk) - 64  # 减去部分overlap
+                    next_id += 1
+                    chunks.append(chunk)
+                    metadatas.append(metadata)
+                    ids.append(id_)
+                batch_files.append((file_name, id_))
+        if ids_by_file is not None:
+            for file_name, id_ in batch_files:
+                if id_ not in file_ids.setdefault(file_name, set()):
+                    file_ids[file_name].add(id_)
+                    ids_by_file.setdefault(file_name, []).append(id_)
+        if not chunks:
+            continue
+        with span("ingest.embed", chunks=len(chunks)):
+            vectors = embeddings.embed_documents(chunks)
+        records = list(zip(chunks, vectors, metadatas, ids))
+        with span("ingest.index", chunks=len(records)):
+            if knowledgeBase is not None:
+                add_records(knowledgeBase, records)
             else:
-                # 如果找不到chunk位置，使用默认值
-                page_num = page_numbers[-1] if page_numbers else ("未知:1" if page_numbers and isinstance(page_numbers[0], str) else 1)
-            
-            page_info[chunk] = page_num
-    else:
-        # 回退到旧方法：使用chunk索引映射（不准确，但兼容）
-        for i, chunk in enumerate(chunks):
-            if page_numbers and i < len(page_numbers):
-                page_num = page_numbers[i]
-            elif page_numbers:
-                page_num = page_numbers[-1]
-            else:
-                page_num = "未知:1" if isinstance(page_numbers, list) and page_numbers and isinstance(page_numbers[0], str) else 1
-            page_info[chunk] = page_num
-    
-    knowledgeBase.page_info = page_info
+                pending.extend(records)
+                if len(pending) >= training_size(index_config):
+                    knowledgeBase = create_knowledge_base(pending, embeddings, index_config)
+                    pending = []
+
+    if knowledgeBase is None and pending:
+        with span("ingest.index", chunks=len(pending)):
+            knowledgeBase = create_knowledge_base(pending, embeddings, index_config)
+    # 代表文本块不在本次构建中（在另一个分片中）的出处交给调用方
+    external = attach_duplicates(knowledgeBase, duplicates) if knowledgeBase is not None else duplicates
+    if external_duplicates is not None:
+        for doc_id, origins in external.items():
+            external_duplicates.setdefault(doc_id, []).extend(origins)
+    if knowledgeBase is None:
+        print("文本块均与已有的文本块重复，没有需要写入的向量" if total_chunks else "没有提取到任何文本块")
+        return None
+
+    knowledgeBase.deduplicator = deduplicator
+    print(f"\n共写入 {next_id - start_id} 个文本块到知识库（索引类型：{describe_index(index_config)}）。")
+    if deduplicator is not None and deduplicator.removed > sum(dedup_counts):
+        print(deduplicator.summary(total_chunks, since=dedup_counts))
 
-    # 如果提供了保存路径，则保存向量数据库和页码信息
     if save_path:
-        # 确保目录存在
-        os.makedirs(save_path, exist_ok=True)
+        save_knowledge_base(knowledgeBase, save_path)
+    return knowledgeBase
+
+
+def write_knowledge_base_files(knowledgeBase: FAISS, directory: str, embedder_state: bool = True):
+    """
+    将向量索引和文档存储写入指定目录（文档存储为 SQLite 文件，不使用 pickle）
+    
+    参数:
+        knowledgeBase: FAISS向量数据库对象（旧版知识库的 page_info 会合并到文档存储的来源和页码中）
+        directory: 目标目录
+        embedder_state: 是否同时写入本地嵌入模型的拟合结果（分片知识库只在顶层快照中保存一份）
+    """
+    with span("store.write", vectors=knowledgeBase.index.ntotal):
+        # 保存FAISS索引（重排序包装器只存在于内存中，保存其内部的索引）
+        with span("store.write_index"):
+            faiss.write_index(unwrap_index(knowledgeBase.index), os.path.join(directory, "index.faiss"))
+
+        # 文本块的文本、来源、页码和字符位置按向量ID写入文档存储
+        with span("store.write_docstore"):
+            write_docstore(knowledgeBase, os.path.join(directory, DOCSTORE_FILE))
+        
+        # 压缩索引另存原始向量
+        exact_vectors = getattr(knowledgeBase, "exact_vectors", None)
+        if exact_vectors is not None:
+            exact_vectors.write(os.path.join(directory, VECTORS_FILE))
         
-        # 保存FAISS向量数据库
-        knowledgeBase.save_local(save_path)
-        print(f"向量数据库已保存到: {save_path}")
+        # 本地嵌入模型的拟合结果随快照保存
+        if embedder_state:
+            save_embedder_state(knowledgeBase.embedding_function, directory)
         
-        # 保存页码信息到同一目录
-        with open(os.path.join(save_path, "page_info.pkl"), "wb") as f:
-            pickle.dump(page_info, f)
-        print(f"页码信息已保存到: {os.path.join(save_path, 'page_info.pkl')}")
+        # 保存索引类型、嵌入后端和向量维度等构建参数
+        store_meta = dict(getattr(knowledgeBase, "store_meta", None) or default_store_meta())
+        store_meta["embedding"] = describe_embeddings(knowledgeBase.embedding_function)
+        store_meta["embedding"]["dimension"] = knowledgeBase.index.d
+        with open(os.path.join(directory, STORE_META_FILE), "w", encoding="utf-8") as f:
+            json.dump(store_meta, f, ensure_ascii=False, indent=2)
+    if is_enabled():
+        count("snapshot_bytes_written", sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file()))
+
+
+def default_store_meta() -> dict:
+    """没有 store_meta.json 的旧版知识库使用 Flat 精确搜索"""
+    return {"index": make_index_config()}
+
+
+def load_store_meta(snapshot_path: str) -> dict:
+    """读取快照中的构建参数，旧版知识库返回默认值"""
+    meta_path = os.path.join(snapshot_path, STORE_META_FILE)
+    if not os.path.exists(meta_path):
+        return default_store_meta()
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_knowledge_base(knowledgeBase: FAISS, save_path: str):
+    """
+    保存向量数据库：写入新的版本化快照并原子切换 CURRENT 指针
     
-    return knowledgeBase
+    参数:
+        knowledgeBase: FAISS向量数据库对象
+        save_path: 向量数据库路径
+    """
+    with span("store.save"), write_snapshot(save_path) as snapshot_dir:
+        write_knowledge_base_files(knowledgeBase, snapshot_dir)
+    attach_docstore(knowledgeBase, os.path.join(save_path, SNAPSHOTS_DIR, snapshot_dir.version))
+    print(f"向量数据库已保存到: {save_path}（快照 {snapshot_dir.version}）")
 
-def load_knowledge_base(load_path: str, embeddings = None) -> FAISS:
+
+@traced("load", "mmap")
+def load_knowledge_base(load_path: str, embeddings = None, mmap: bool = False, search_params: dict = None, verbose: bool = True) -> FAISS:
     """
-    从磁盘加载向量数据库和页码信息
+    从磁盘加载向量数据库（读取 CURRENT 指针指向的快照）
     
     参数:
         load_path: 向量数据库的保存路径
-        embeddings: 可选，嵌入模型。如果为None，将创建一个新的DashScopeEmbeddings实例
+        embeddings: 可选，嵌入模型。如果为None，按快照记录的嵌入后端创建
+        mmap: 是否以内存映射方式只读打开向量索引。启动几乎不需要读取索引数据，
+              向量按需从磁盘换入；以这种方式打开的索引不能再添加或删除向量
+        search_params: 可选，覆盖构建时保存的搜索参数，如 {"nprobe": 32}、{"ef_search": 128} 或 {"rerank": 4}
+        verbose: 是否打印加载信息
     
     返回:
         knowledgeBase: 加载的FAISS向量数据库对象
     """
-    # 如果没有提供嵌入模型，则创建一个新的
+    version, snapshot_path = resolve_snapshot(load_path)
+    if snapshot_path is None:
+        raise FileNotFoundError(f"向量数据库不存在: {load_path}")
     if embeddings is None:
-        embeddings = DashScopeEmbeddings(
-            model="text-embedding-v2"
-        )
-    
-    # 加载FAISS向量数据库，添加allow_dangerous_deserialization=True参数以允许反序列化
-    knowledgeBase = FAISS.load_local(load_path, embeddings, allow_dangerous_deserialization=True)
-    print(f"向量数据库已从 {load_path} 加载。")
-    
-    # 加载页码信息
-    page_info_path = os.path.join(load_path, "page_info.pkl")
-    if os.path.exists(page_info_path):
-        with open(page_info_path, "rb") as f:
-            page_info = pickle.load(f)
-        knowledgeBase.page_info = page_info
-        print("页码信息已加载。")
+        embeddings = create_embeddings(backend=stored_embedding_backend(load_path))
+    knowledgeBase = load_snapshot(snapshot_path, embeddings, mmap=mmap, search_params=search_params, verbose=verbose)
+    knowledgeBase.snapshot_version = version
+    return knowledgeBase
+
+
+def load_snapshot(snapshot_path: str, embeddings, mmap: bool = False, search_params: dict = None, embedder_state: bool = True, verbose: bool = True) -> FAISS:
+    """
+    加载一个快照目录中的向量索引、文档存储和构建参数（load_knowledge_base 和分片知识库共用）
+
+    文档存储以只读方式打开 docstore.sqlite，只读入“索引位置 → 向量ID”数组，文本在检索命中时读取；
+    旧版快照（index.pkl + page_info.pkl）仍按 pickle 格式加载，下次保存时转换为新格式
+    
+    参数:
+        snapshot_path: 快照目录
+        embeddings: 嵌入模型，加载前检查与快照记录的后端和向量维度一致
+        mmap: 是否以内存映射方式只读打开向量索引
+        search_params: 可选，覆盖构建时保存的搜索参数
+        embedder_state: 是否从快照读取本地嵌入模型的拟合结果（分片由顶层快照统一读取）
+        verbose: 是否打印加载信息
+    
+    返回:
+        knowledgeBase: 加载的FAISS向量数据库对象
+    """
+    # 检查嵌入后端和向量维度与构建时一致
+    store_meta = load_store_meta(snapshot_path)
+    check_embeddings(store_meta.get("embedding"), embeddings)
+    if embedder_state:
+        load_embedder_state(embeddings, snapshot_path)
+
+    io_flags = MMAP_IO_FLAGS if mmap else 0
+    legacy = not os.path.exists(os.path.join(snapshot_path, DOCSTORE_FILE))
+    if legacy:
+        # 旧版快照：文档存储以 pickle 保存，需要 allow_dangerous_deserialization=True
+        with span("load.faiss", mmap=mmap):
+            knowledgeBase = FAISS.load_local(snapshot_path, embeddings, allow_dangerous_deserialization=True, io_flags=io_flags)
     else:
+        with span("load.faiss", mmap=mmap):
+            index = faiss.read_index(os.path.join(snapshot_path, "index.faiss"), io_flags)
+        with span("load.docstore"):
+            docstore, index_to_docstore_id = load_docstore(snapshot_path)
+        knowledgeBase = FAISS(embeddings, index, docstore, index_to_docstore_id)
+    if is_enabled():
+        count("snapshot_bytes_read", sum(entry.stat().st_size for entry in os.scandir(snapshot_path) if entry.is_file()))
+    knowledgeBase.snapshot_version = None
+    knowledgeBase.read_only = mmap
+
+    # 按保存的索引配置设置搜索参数（nprobe / efSearch）
+    knowledgeBase.store_meta = store_meta
+    index_config = knowledgeBase.store_meta["index"]
+    index_config.update({k: v for k, v in (search_params or {}).items() if v is not None and k in index_config})
+
+    # 压缩索引：以内存映射方式打开原始向量，需要时用它对候选结果精确重排序
+    vectors_path = os.path.join(snapshot_path, VECTORS_FILE)
+    knowledgeBase.exact_vectors = None
+    if is_compressed(index_config) and os.path.exists(vectors_path):
+        knowledgeBase.exact_vectors = ExactVectors(knowledgeBase.index.d, vectors_path)
+        if index_config.get("rerank"):
+            knowledgeBase.index = RerankIndex(knowledgeBase.index, knowledgeBase.exact_vectors, index_config["rerank"])
+    apply_search_params(knowledgeBase.index, index_config)
+    if verbose:
+        print(f"向量数据库已从 {snapshot_path} 加载（索引类型：{describe_index(index_config)}）。")
+
+    # 旧版快照的页码信息（以文本块为键）；新格式的来源和页码保存在文档存储中
+    page_info_path = os.path.join(snapshot_path, "page_info.pkl")
+    if legacy and os.path.exists(page_info_path):
+        with span("load.page_info"), open(page_info_path, "rb") as f:
+            knowledgeBase.page_info = pickle.load(f)
+        if verbose:
+            print("页码信息已加载（旧版格式，下次保存时合并到文档存储）。")
+    elif legacy and verbose:
         print("警告: 未找到页码信息文件。")
-    
+
     return knowledgeBase
@@ -0,0 +1,339 @@
+"""
+数据集监视模块
+监视数据集目录中 PDF 文件的新增、修改和删除（Linux 上通过 ctypes 调用 inotify，其他平台或 inotify 不可用时轮询目录），
+一批文件变化平静下来后在后台线程中执行增量更新，发布新快照后通知常驻的查询引擎整体切换，查询不中断，
+并记录每个文件从落盘到可检索的延迟
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from instrumentation import count, span
+from settings import DEFAULT_DEBOUNCE, DEFAULT_POLL_INTERVAL, WATCH_MODES
+from snapshot_store import current_version
+
+# inotify 事件掩码（linux/inotify.h）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+# 只关心写完（而不是开始写）、移入移出和删除；正在复制的文件要等关闭后才触发
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+# 事件队列溢出时无法得知哪些文件变化，用该名称表示“需要重新扫描”（增量更新本身会比对文件清单）
+OVERFLOW = "*"
+
+
+def is_pdf(name: str) -> bool:
+    return name.lower().endswith(".pdf")
+
+
+class InotifyWatcher:
+    """
+    通过 inotify 监视目录（只在 Linux 上可用）
+
+    参数:
+        path: 要监视的目录
+
+    异常:
+        OSError: 不是 Linux、libc 没有 inotify 或监视数量超过系统上限
+    """
+
+    name = "inotify"
+
+    def __init__(self, path: str):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify 只在 Linux 上可用")
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("libc 不支持 inotify")
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1 失败：{os.strerror(errno)}")
+        if libc.inotify_add_watch(fd, os.fsencode(path), ctypes.c_uint32(WATCH_MASK)) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, f"无法监视目录 {path}：{os.strerror(errno)}")
+        self._fd = fd
+
+    def poll(self, timeout: float) -> set:
+        """
+        等待最多 timeout 秒
+
+        返回:
+            发生变化的 PDF 文件名集合，超时为空集合
+
+        异常:
+            FileNotFoundError: 被监视的目录已被删除或移走
+        """
+        readable, _, _ = select.select([self._fd], [], [], max(0.0, timeout))
+        if not readable:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                name = os.fsdecode(data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length].rstrip(b"\0"))
+                offset += _EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW:
+                    changed.add(OVERFLOW)
+                elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    raise FileNotFoundError("被监视的数据集目录已被删除或移走")
+                elif is_pdf(name):
+                    changed.add(name)
+        return changed
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class PollingWatcher:
+    """
+    定期比较目录中 PDF 文件的大小和修改时间
+
+    参数:
+        path: 要监视的目录
+        interval: 两次扫描之间的间隔（秒）
+    """
+
+    name = "poll"
+
+    def __init__(self, path: str, interval: float = DEFAULT_POLL_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._state = self._scan()
+
+    def _scan(self) -> dict:
+        state = {}
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if is_pdf(entry.name) and entry.is_file():
+                    stat = entry.stat()
+                    state[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return state
+
+    def poll(self, timeout: float) -> set:
+        """等待最多 timeout 秒，返回大小或修改时间变化、新增和删除的 PDF 文件名集合"""
+        deadline = time.monotonic() + max(0.0, timeout)
+        while True:
+            state = self._scan()
+            changed = {name for name in state.keys() | self._state.keys() if state.get(name) != self._state.get(name)}
+            self._state = state
+            remaining = deadline - time.monotonic()
+            if changed or remaining <= 0:
+                return changed
+            time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+
+def make_watcher(path: str, mode: str = "auto", poll_interval: float = DEFAULT_POLL_INTERVAL):
+    """
+    创建目录监视器
+
+    参数:
+        path: 要监视的目录
+        mode: "inotify"、"poll"，或 "auto"（优先 inotify，不可用时轮询）
+        poll_interval: 轮询间隔（秒）
+
+    返回:
+        InotifyWatcher 或 PollingWatcher
+
+    异常:
+        ValueError: 未知的监视方式
+        OSError: mode 为 "inotify" 但 inotify 不可用
+    """
+    if mode not in WATCH_MODES:
+        raise ValueError(f"未知的监视方式: {mode}，可选：{', '.join(WATCH_MODES)}")
+    if mode != "poll":
+        try:
+            return InotifyWatcher(path)
+        except OSError as e:
+            if mode == "inotify":
+                raise
+            print(f"⚠️ inotify 不可用（{e}），改为每 {poll_interval:g}s 轮询一次目录")
+    return PollingWatcher(path, poll_interval)
+
+
+class DatasetWatcher:
+    """
+    监视数据集目录并在后台增量更新知识库
+
+    第一次发现文件变化后继续收集，直到 debounce 秒内没有新的变化（持续变化时最多等待 max_delay 秒），
+    然后对整批变化执行一次增量更新（只处理新增、修改和删除的文件）并发布新快照。
+    同一进程中的查询引擎在发布后立即切换；其他进程中的查询引擎在下一次查询时于后台切换
+
+    参数:
+        dataset_path: 数据集目录
+        vector_store_path: 向量数据库路径
+        engine: 可选，同一进程中的 QueryEngine
+        debounce: 最后一次文件变化后等待的平静时间（秒）
+        max_delay: 第一次文件变化后最多等待多少秒就开始更新
+        mode: 监视方式，见 make_watcher
+        poll_interval: 轮询间隔（秒）
+        ingest_options: 传给 initialize_knowledge_base 的其他参数，如 embeddings、workers
+        on_update: 可选，每次更新完成后以更新记录为参数调用
+    """
+
+    def __init__(self, dataset_path: str, vector_store_path: str, engine=None, debounce: float = DEFAULT_DEBOUNCE,
+                 max_delay: float = None, mode: str = "auto", poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 ingest_options: dict = None, on_update=None):
+        self.dataset_path = dataset_path
+        self.vector_store_path = vector_store_path
+        self.engine = engine
+        self.debounce = debounce
+        self.max_delay = max_delay if max_delay is not None else max(10 * debounce, 10.0)
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.ingest_options = ingest_options or {}
+        self.on_update = on_update
+        self.updates = []
+        self.error = None
+        self.ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        在后台线程中开始监视，目录监视器就绪后返回
+
+        异常:
+            OSError: 无法监视数据集目录
+        """
+        self._thread = threading.Thread(target=self.run, name="dataset-watcher", daemon=True)
+        self._thread.start()
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+
+    def stop(self):
+        """停止监视（正在进行的增量更新会先完成）"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run(self):
+        """监视目录直到 stop() 被调用"""
+        try:
+            watcher = make_watcher(self.dataset_path, self.mode, self.poll_interval)
+        except Exception as e:
+            self.error = e
+            raise
+        finally:
+            self.ready.set()
+        print(f"👀 正在监视 {self.dataset_path}（{watcher.name}，变化平静 {self.debounce:g}s 后增量更新）")
+        try:
+            while not self._stop.is_set():
+                changes = self._collect(watcher)
+                if changes:
+                    self.update(changes)
+        except FileNotFoundError as e:
+            self.error = e
+            print(f"❌ 停止监视：{e}")
+        finally:
+            watcher.close()
+
+    def _collect(self, watcher) -> dict:
+        """
+        等待一批文件变化
+
+        返回:
+            {文件名: 首次发现变化的时间（time.time()）}，停止或没有变化时为空字典
+        """
+        changed = watcher.poll(min(1.0, self.debounce))
+        if not changed:
+            return {}
+        changes = dict.fromkeys(changed, time.time())
+        deadline = time.monotonic() + self.max_delay
+        while not self._stop.is_set():
+            timeout = min(self.debounce, deadline - time.monotonic())
+            if timeout <= 0:
+                break
+            changed = watcher.poll(timeout)
+            if not changed:
+                break
+            now = time.time()
+            for name in changed:
+                changes.setdefault(name, now)
+        return changes
+
+    def _landed_at(self, name: str, seen: float) -> float:
+        """
+        估计文件落盘的时间：inotify 在写完时立即通知，轮询最多晚 poll_interval 秒发现；
+        用文件修改时间修正轮询的发现延迟（移入的旧文件修改时间很早，最多修正 poll_interval 秒）
+        """
+        try:
+            modified = os.stat(os.path.join(self.dataset_path, name)).st_mtime
+        except OSError:
+            return seen
+        return min(seen, max(modified, seen - self.poll_interval))
+
+    def update(self, changes: dict):
+        """
+        对一批文件变化执行增量更新并切换查询引擎
+
+        参数:
+            changes: {文件名: 首次发现变化的时间}
+
+        返回:
+            更新记录字典：version / files / ingest_s / swap_s / latency_s（{文件名: 从落盘到可检索的秒数}，
+            没有同进程的查询引擎时为到快照发布的秒数）；更新失败时返回None（等待下一次文件变化后重试）
+        """
+        from knowledge_base_manager import initialize_knowledge_base
+
+        names = sorted(name for name in changes if name != OVERFLOW)
+        preview = "、".join(names[:5]) + (f" 等 {len(names)} 个文件" if len(names) > 5 else "")
+        print(f"\n📂 检测到文件变化：{preview or '事件队列溢出，重新扫描目录'}，开始增量更新...")
+        start = time.time()
+        try:
+            with span("watch.update", files=len(names)):
+                initialize_knowledge_base(self.dataset_path, self.vector_store_path, **self.ingest_options)
+                ingested = time.time()
+                if self.engine is not None:
+                    self.engine.reload()
+        except Exception as e:
+            count("watch_failures")
+            print(f"❌ 增量更新失败：{e}（等待下一次文件变化后重试）")
+            return None
+        searchable = time.time()
+
+        record = {
+            "version": current_version(self.vector_store_path),
+            "files": names,
+            "ingest_s": ingested - start,
+            "swap_s": searchable - ingested,
+            "latency_s": {name: searchable - self._landed_at(name, changes[name]) for name in names},
+        }
+        self.updates.append(record)
+        count("watch_updates")
+        if record["latency_s"]:
+            latency = max(record["latency_s"].values())
+            if self.engine is not None:
+                print(f"⏱ 快照 {record['version']} 已发布：{len(names)} 个文件从落盘到可检索最长 {latency:.2f}s"
+                      f"（增量更新 {record['ingest_s']:.2f}s，查询引擎切换 {record['swap_s']:.2f}s）")
+            else:
+                print(f"⏱ 快照 {record['version']} 已发布：{len(names)} 个文件从落盘到快照发布最长 {latency:.2f}s"
+                      f"（增量更新 {record['ingest_s']:.2f}s；查询进程在下一次查询时切换）")
+        if self.on_update is not None:
+            self.on_update(record)
+        return record
@@ -0,0 +1,319 @@
+"""
+文本块去重模块
+构建知识库时先按规范化文本的哈希找出完全重复的文本块，再用 MinHash 签名 + LSH 分桶找出近似重复的文本块
+（估计的 Jaccard 相似度达到阈值），每组重复文本块只嵌入和存储第一个，其余出处记录在它的元数据 duplicates 中，
+检索结果的来源仍列出全部文件和页码。代表文本块的哈希和 MinHash 签名随文档存储保存，
+增量更新时新文本块也与知识库中已有的文本块比较
+"""
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from instrumentation import count
+from settings import DEFAULT_DEDUP_THRESHOLD
+
+# 元数据中记录其余出处的键
+DUPLICATES_KEY = "duplicates"
+
+_ORIGIN_FIELDS = ("source", "page", "start", "end")
+
+# 字符 shingle 的多项式滚动哈希基数
+_SHINGLE_BASE = np.uint64(1_000_003)
+
+
+def make_dedup_config(threshold: float = DEFAULT_DEDUP_THRESHOLD, num_perm: int = 64, shingle_size: int = 5) -> dict:
+    """
+    生成去重配置
+
+    参数:
+        threshold: 近似重复阈值，两个文本块字符 shingle 集合的估计 Jaccard 相似度达到该值即视为重复；
+                   1.0 表示只合并规范化后完全相同的文本块
+        num_perm: MinHash 签名长度（每个不重复的文本块在构建期间占用 num_perm × 4 字节）
+        shingle_size: 字符 shingle 的长度
+
+    返回:
+        去重配置字典
+
+    异常:
+        ValueError: 参数超出范围
+    """
+    if not 0 < threshold <= 1:
+        raise ValueError(f"去重阈值必须在 (0, 1] 范围内: {threshold}")
+    if num_perm < 8:
+        raise ValueError(f"MinHash 签名长度至少为 8: {num_perm}")
+    if shingle_size < 1:
+        raise ValueError(f"shingle 长度至少为 1: {shingle_size}")
+    return {"threshold": float(threshold), "num_perm": int(num_perm), "shingle_size": int(shingle_size)}
+
+
+def describe_dedup(config: dict) -> str:
+    if config is None:
+        return "不去重"
+    if config["threshold"] >= 1:
+        return "只合并完全重复的文本块"
+    return f"合并完全重复和相似度 ≥ {config['threshold']:g} 的文本块（MinHash {config['num_perm']}，shingle {config['shingle_size']}）"
+
+
+def normalize_text(text: str) -> str:
+    """合并空白字符，使只有空白差异的文本块视为完全重复"""
+    return " ".join(text.split())
+
+
+def text_digest(text: str) -> bytes:
+    """规范化文本的 SHA-1 哈希（完全重复的判定依据，保存在文档存储的 digest 列）"""
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).digest()
+
+
+def lsh_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    选择 LSH 的分段数和每段行数：在候选阈值 (1/b)^(1/r) 不超过去重阈值的分法中取行数最多的一种，
+    相似度达到阈值的文本块几乎都会落入同一个桶，再用完整签名确认
+
+    返回:
+        (分段数 b, 每段行数 r)
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if (1 / bands) ** (1 / rows) <= threshold:
+            best = (bands, rows)
+    return best
+
+
+class ChunkDeduplicator:
+    """
+    按出现顺序识别重复的文本块；增量更新前可用 register 登记知识库中已有的代表文本块
+
+    unsaved 记录签名还没有写入文档存储的代表文本块（本次新增的，以及已有但需要重新计算签名的）
+
+    参数:
+        config: 去重配置（见 make_dedup_config）
+    """
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.threshold = config["threshold"]
+        self.shingle_size = config["shingle_size"]
+        self.bands, self.rows = lsh_bands(config["num_perm"], self.threshold)
+        rng = np.random.default_rng(0)
+        # multiply-shift 哈希族：(a * x + b) mod 2^64 的高 32 位，a 为奇数
+        self._a = rng.integers(1, 2 ** 63, size=config["num_perm"], dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, size=config["num_perm"], dtype=np.uint64)
+        self._exact = {}  # 规范化文本哈希 → 代表文本块的键
+        self._signatures = {}  # 代表文本块的键 → MinHash 签名
+        self._buckets = [{} for _ in range(self.bands)]
+        self.unsaved = set()
+        self.exact = 0
+        self.near = 0
+
+    def signature(self, text: str) -> np.ndarray:
+        """计算文本字符 shingle 集合的 MinHash 签名"""
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        size = min(self.shingle_size, len(codes))
+        if size == 0:
+            return np.zeros(len(self._a), dtype=np.uint32)
+        count_ = len(codes) - size + 1
+        hashes = np.zeros(count_, dtype=np.uint64)
+        for offset in range(size):
+            hashes = hashes * _SHINGLE_BASE + codes[offset:offset + count_]
+        hashes = np.unique(hashes)
+        permuted = (hashes[:, None] * self._a[None, :] + self._b[None, :]) >> np.uint64(32)
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> list:
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    @property
+    def needs_signature(self) -> bool:
+        """是否需要 MinHash 签名（只合并完全重复时只比较哈希）"""
+        return self.threshold < 1
+
+    def stored_signature(self, minhash: bytes, shingle_size: int) -> Optional[np.ndarray]:
+        """文档存储中保存的签名与当前配置（签名长度、shingle 长度）一致时返回签名，否则返回None"""
+        if minhash is None or shingle_size != self.shingle_size or len(minhash) != len(self._a) * 4:
+            return None
+        return np.frombuffer(minhash, dtype=np.uint32)
+
+    def signature_of(self, key) -> Optional[np.ndarray]:
+        """代表文本块的 MinHash 签名（只合并完全重复时为None）"""
+        return self._signatures.get(key)
+
+    def register(self, key, digest: bytes, signature: np.ndarray = None, saved: bool = True):
+        """
+        登记一个代表文本块（不计入重复统计）
+
+        参数:
+            key: 代表文本块的键
+            digest: 规范化文本的哈希（见 text_digest）
+            signature: MinHash 签名，只合并完全重复时可省略
+            saved: 哈希和签名是否已保存在文档存储中
+        """
+        self._exact.setdefault(digest, key)
+        if not saved:
+            self.unsaved.add(key)
+        if signature is None or not self.needs_signature:
+            return
+        self._signatures[key] = signature
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            bucket.setdefault(band_key, []).append(key)
+
+    def register_text(self, key, text: str):
+        """从文本计算哈希和签名并登记代表文本块（文档存储中没有可用的签名时使用）"""
+        signature = self.signature(normalize_text(text)) if self.needs_signature else None
+        self.register(key, text_digest(text), signature, saved=False)
+
+    def check(self, text: str, key) -> Optional[object]:
+        """
+        检查文本块是否与之前的文本块重复
+
+        参数:
+            text: 文本块
+            key: 文本块不重复时用来登记它的键（通常是向量ID或列表下标）
+
+        返回:
+            重复时返回代表文本块的键；不重复时登记该文本块并返回None
+        """
+        normalized = normalize_text(text)
+        digest = hashlib.sha1(normalized.encode("utf-8")).digest()
+        representative = self._exact.get(digest)
+        if representative is not None:
+            self.exact += 1
+            count("dedup_exact")
+            return representative
+        if not self.needs_signature:
+            self.register(key, digest, saved=False)
+            return None
+
+        signature = self.signature(normalized)
+        candidates = []
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            for candidate in bucket.get(band_key, ()):
+                if candidate not in candidates:
+                    candidates.append(candidate)
+        for candidate in candidates:
+            if np.mean(self._signatures[candidate] == signature) >= self.threshold:
+                # 规范化文本相同的后续文本块直接归到同一个代表
+                self._exact[digest] = candidate
+                self.near += 1
+                count("dedup_near")
+                return candidate
+        self.register(key, digest, signature, saved=False)
+        return None
+
+    @property
+    def removed(self) -> int:
+        return self.exact + self.near
+
+    def summary(self, chunks: int, since: Tuple[int, int] = (0, 0)) -> str:
+        """
+        返回去重统计信息
+
+        参数:
+            chunks: 参与统计的文本块数
+            since: 多次构建共用一个去重器时，本次构建开始时的 (完全重复数, 近似重复数)
+        """
+        exact, near = self.exact - since[0], self.near - since[1]
+        kept = chunks - exact - near
+        rate = (exact + near) / chunks * 100 if chunks else 0.0
+        return (f"去重：{chunks} 个文本块中 {exact} 个完全重复、{near} 个近似重复，"
+                f"写入 {kept} 个向量（嵌入和索引减少 {rate:.1f}%）")
+
+
+def origin(metadata: dict) -> dict:
+    """文本块元数据中的出处字段（来源文件、页码、起止位置）"""
+    return {field: metadata.get(field) for field in _ORIGIN_FIELDS}
+
+
+def chunk_origins(metadata: dict) -> List[dict]:
+    """文本块的全部出处：自身的来源和页码，以及合并进来的重复文本块的出处"""
+    metadata = metadata or {}
+    return [origin(metadata)] + list(metadata.get(DUPLICATES_KEY) or ())
+
+
+def dedup_chunks(chunks: List[str], metadatas: List[dict], config: dict) -> Tuple[List[str], List[dict], List[int]]:
+    """
+    对一组文本块去重（非流式构建使用）
+
+    参数:
+        chunks: 文本块列表
+        metadatas: 与文本块一一对应的元数据（保留的文本块的元数据会加入重复文本块的出处）
+        config: 去重配置，None 表示不去重
+
+    返回:
+        (保留的文本块, 保留的元数据, 每个输入文本块对应的保留文本块下标)
+    """
+    if config is None:
+        return chunks, metadatas, list(range(len(chunks)))
+    deduplicator = ChunkDeduplicator(config)
+    kept_chunks, kept_metadatas, mapping = [], [], []
+    for chunk, metadata in zip(chunks, metadatas):
+        representative = deduplicator.check(chunk, len(kept_chunks))
+        if representative is None:
+            mapping.append(len(kept_chunks))
+            kept_chunks.append(chunk)
+            kept_metadatas.append(dict(metadata))
+        else:
+            mapping.append(representative)
+            kept_metadatas[representative].setdefault(DUPLICATES_KEY, []).append(origin(metadata))
+    if deduplicator.removed:
+        print(deduplicator.summary(len(chunks)))
+    return kept_chunks, kept_metadatas, mapping
+
+
+def attach_duplicates(knowledge_base, duplicates: Dict[str, List[dict]]) -> Dict[str, List[dict]]:
+    """
+    把重复文本块的出处写入已加入向量库的代表文本块的元数据
+
+    参数:
+        knowledge_base: FAISS 向量库
+        duplicates: {代表文本块的向量ID: [出处, ...]}
+
+    返回:
+        代表文本块不在该向量库中的部分（例如在另一个分片中），格式同 duplicates
+    """
+    missing = {}
+    docstore = knowledge_base.docstore
+    for doc_id, origins in duplicates.items():
+        doc = docstore.search(doc_id)
+        if isinstance(doc, str):
+            missing[doc_id] = origins
+            continue
+        doc.metadata = {**doc.metadata, DUPLICATES_KEY: list(doc.metadata.get(DUPLICATES_KEY) or ()) + origins}
+        docstore.delete([doc_id])
+        docstore.add({doc_id: doc})
+    return missing
+
+
+def drop_origins(knowledge_base, doc_ids: list, sources: set) -> int:
+    """
+    从仍被其他文件引用的文本块中移除指定来源文件的出处（出处来自被删除的文件时，由下一个出处接替）
+
+    参数:
+        knowledge_base: FAISS 向量库
+        doc_ids: 向量ID列表
+        sources: 要移除的来源文件名集合
+
+    返回:
+        更新的文本块数量
+    """
+    docstore = knowledge_base.docstore
+    updated = 0
+    for doc_id in map(str, doc_ids):
+        doc = docstore.search(doc_id)
+        if isinstance(doc, str):
+            continue
+        origins = [item for item in chunk_origins(doc.metadata) if item.get("source") not in sources]
+        if not origins or len(origins) == len(chunk_origins(doc.metadata)):
+            continue
+        metadata = {key: value for key, value in doc.metadata.items() if key != DUPLICATES_KEY}
+        metadata.update(origins[0])
+        if origins[1:]:
+            metadata[DUPLICATES_KEY] = origins[1:]
+        doc.metadata = metadata
+        docstore.delete([doc_id])
+        docstore.add({doc_id: doc})
+        updated += 1
+    return updated
@@ -0,0 +1,439 @@
+"""
+磁盘文档存储模块
+文本块的文本、来源文件、页码和字符位置保存在快照目录的 SQLite 文件中，以整数向量ID为主键，
+取代 LangChain 以 pickle 保存的内存文档存储（index.pkl）和以文本为键的页码信息（page_info.pkl）。
+加载时只读入“索引位置 → 向量ID”数组，文本只在检索命中时按ID读取。
+每个文本块同时保存规范化文本的哈希和 MinHash 签名，增量更新去重时不需要读取已有文本块的文本
+"""
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+from dedup import chunk_origins, text_digest
+
+DOCSTORE_FILE = "docstore.sqlite"
+
+# 单次 IN 查询的最大ID数（SQLite 默认的参数数量上限为 999）
+_FETCH_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,   -- 向量ID；旧版知识库的非整数ID记为 -(索引位置+1)，原ID保存在 key 中
+    position INTEGER NOT NULL,  -- 在 FAISS 索引中的位置
+    key TEXT,
+    text TEXT NOT NULL,
+    source TEXT,
+    page,
+    start INTEGER,
+    end INTEGER,
+    extra TEXT,               -- 其余元数据（JSON），通常为空
+    digest BLOB,              -- 规范化文本的 SHA-1 哈希（去重）
+    minhash BLOB,             -- MinHash 签名（uint32 数组，只在近似去重时保存）
+    shingle INTEGER           -- 计算签名时的 shingle 长度
+);
+CREATE UNIQUE INDEX IF NOT EXISTS chunks_key ON chunks (key) WHERE key IS NOT NULL;
+"""
+
+_COLUMNS = "id, key, text, source, page, start, end, extra"
+
+# 旧版文件没有的签名列
+_SIGNATURE_COLUMNS = ("digest", "minhash", "shingle")
+
+
+def _int_id(doc_id):
+    """整数形式的向量ID返回 int，其余（旧版的 UUID 等）返回None"""
+    text = str(doc_id)
+    return int(text) if text.isdigit() else None
+
+
+def _has_signatures(conn: sqlite3.Connection, schema: str = "main") -> bool:
+    """文档存储文件是否包含签名列（旧版文件没有）"""
+    columns = {row[1] for row in conn.execute(f"PRAGMA {schema}.table_info(chunks)")}
+    return all(column in columns for column in _SIGNATURE_COLUMNS)
+
+
+def _document(row) -> Document:
+    id_, key, text, source, page, start, end, extra = row
+    metadata = {"source": source, "page": page, "start": start, "end": end}
+    if extra:
+        metadata.update(json.loads(extra))
+    return Document(id=key if key is not None else str(id_), page_content=text, metadata=metadata)
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """
+    以快照中的 SQLite 文件为底的只读文档存储，增量更新时新增和删除的文本块记录在内存中，
+    保存时与底层文件合并写入新快照（旧快照文件保持不变，正在读取它的进程不受影响）
+
+    参数:
+        path: docstore.sqlite 路径
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.modified = False
+        self._added = {}
+        self._deleted = set()
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        return self._conn
+
+    def _select(self, doc_ids: list) -> dict:
+        """从底层文件按ID读取文档，返回 {ID: Document}"""
+        int_ids = [id_ for id_ in map(_int_id, doc_ids) if id_ is not None]
+        keys = [str(doc_id) for doc_id in doc_ids if _int_id(doc_id) is None]
+        found = {}
+        with self._lock:
+            conn = self._connection()
+            for column, values in (("id", int_ids), ("key", keys)):
+                for i in range(0, len(values), _FETCH_BATCH):
+                    batch = values[i:i + _FETCH_BATCH]
+                    rows = conn.execute(
+                        f"SELECT {_COLUMNS} FROM chunks WHERE {column} IN ({','.join('?' * len(batch))})", batch
+                    )
+                    for row in rows:
+                        doc = _document(row)
+                        found[doc.id] = doc
+        return found
+
+    def search(self, search: str):
+        doc = self.get_many([search]).get(str(search))
+        return doc if doc is not None else f"ID {search} not found."
+
+    def get_many(self, doc_ids: list) -> dict:
+        """
+        按ID批量读取文档（检索命中的文本块一次查询取回）
+
+        返回:
+            {ID: Document}，不存在的ID不出现在结果中
+        """
+        doc_ids = [str(doc_id) for doc_id in doc_ids]
+        found = {doc_id: self._added[doc_id] for doc_id in doc_ids if doc_id in self._added}
+        missing = [doc_id for doc_id in doc_ids if doc_id not in found and doc_id not in self._deleted]
+        if missing:
+            found.update(self._select(missing))
+        return found
+
+    def add(self, texts: dict):
+        for doc_id, doc in texts.items():
+            self._added[str(doc_id)] = doc
+            self._deleted.discard(str(doc_id))
+        self.modified = True
+
+    def delete(self, ids: list):
+        for doc_id in map(str, ids):
+            if self._added.pop(doc_id, None) is None:
+                self._deleted.add(doc_id)
+        self.modified = True
+
+    def iter_locations(self):
+        """
+        按底层文件中记录的索引位置迭代 (位置, 来源文件, 页码)，不读取文本；
+        合并了重复文本块的位置对每个出处各产出一项
+        """
+        with self._lock:
+            rows = self._connection().execute("SELECT position, source, page, extra FROM chunks").fetchall()
+        for position, source, page, extra in rows:
+            yield position, source, page
+            if extra:
+                for item in chunk_origins(json.loads(extra))[1:]:
+                    yield position, item.get("source"), item.get("page")
+
+    def iter_signatures(self):
+        """
+        按底层文件迭代未删除、未在内存中修改的文本块的 (向量ID, 哈希, MinHash 签名, shingle 长度)，不读取文本；
+        旧版文件没有签名列时后三项为None
+        """
+        with self._lock:
+            conn = self._connection()
+            columns = ", ".join(_SIGNATURE_COLUMNS) if _has_signatures(conn) else "NULL, NULL, NULL"
+            rows = conn.execute(f"SELECT id, key, {columns} FROM chunks ORDER BY position").fetchall()
+        for id_, key, digest, minhash, shingle in rows:
+            doc_id = key if key is not None else str(id_)
+            if doc_id not in self._deleted and doc_id not in self._added:
+                yield doc_id, digest, minhash, shingle
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class PositionIds(MutableMapping):
+    """
+    “索引位置 → 向量ID”映射，用 int64 数组代替 Python 字典（每个向量 8 字节）
+
+    值与 LangChain 的 index_to_docstore_id 一样是字符串ID；旧版知识库的非整数ID单独记录
+
+    参数:
+        ids: 按索引位置排列的整数向量ID数组
+        keys: 可选，{索引位置: 非整数ID}
+    """
+
+    def __init__(self, ids: np.ndarray = None, keys: dict = None):
+        self._ids = np.asarray(ids if ids is not None else [], dtype=np.int64)
+        self._size = len(self._ids)
+        self._keys = dict(keys or {})
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self):
+        return iter(range(self._size))
+
+    def __getitem__(self, position):
+        position = int(position)
+        if not 0 <= position < self._size:
+            raise KeyError(position)
+        if self._keys:
+            key = self._keys.get(position)
+            if key is not None:
+                return key
+        return str(self._ids[position])
+
+    def __setitem__(self, position, doc_id):
+        self.update({position: doc_id})
+
+    def __delitem__(self, position):
+        # FAISS 删除向量后位置整体前移，调用方会重建整个映射
+        raise TypeError("PositionIds 不支持删除单个位置")
+
+    def update(self, other=(), **kwargs):
+        """追加或覆盖位置（LangChain 添加向量时以 {起始位置 + j: ID} 追加）"""
+        items = sorted(dict(other, **kwargs).items())
+        end = max([self._size] + [int(position) + 1 for position, _ in items])
+        if end > len(self._ids):
+            grown = np.empty(max(end, len(self._ids) * 2), dtype=np.int64)
+            grown[:self._size] = self._ids[:self._size]
+            self._ids = grown
+        for position, doc_id in items:
+            position = int(position)
+            int_id = _int_id(doc_id)
+            if int_id is None:
+                self._keys[position] = str(doc_id)
+                int_id = -(position + 1)
+            else:
+                self._keys.pop(position, None)
+            self._ids[position] = int_id
+        self._size = end
+
+
+def load_docstore(snapshot_path: str):
+    """
+    打开快照中的文档存储
+
+    返回:
+        (docstore, index_to_docstore_id)：SQLiteDocstore 和 PositionIds
+    """
+    path = os.path.join(snapshot_path, DOCSTORE_FILE)
+    docstore = SQLiteDocstore(path)
+    keys = {}
+    with docstore._lock:
+        conn = docstore._connection()
+        ids = np.empty(conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0], dtype=np.int64)
+        # 逐行读取，不一次性生成全部行的元组
+        for position, id_, key in conn.execute("SELECT position, id, key FROM chunks"):
+            ids[position] = id_
+            if key is not None:
+                keys[position] = key
+    return docstore, PositionIds(ids, keys)
+
+
+def attach_docstore(knowledge_base, snapshot_path: str):
+    """
+    保存快照后改为读取其中的文档存储：释放内存中的文本块，
+    并且不再依赖旧快照的文件（旧快照被清理后仍可继续更新和保存）
+    """
+    previous = knowledge_base.docstore
+    knowledge_base.docstore, knowledge_base.index_to_docstore_id = load_docstore(snapshot_path)
+    if isinstance(previous, SQLiteDocstore):
+        previous.close()
+    # 旧版知识库的页码信息和去重签名已写入文档存储
+    knowledge_base.__dict__.pop("page_info", None)
+    knowledge_base.__dict__.pop("deduplicator", None)
+
+
+def seed_deduplicator(knowledge_base, deduplicator):
+    """
+    把向量库中已有的文本块登记为去重的代表文本块，之后新文本块与它们比较
+
+    SQLiteDocstore 直接读取保存的哈希和签名；旧版文件、签名参数与当前配置不同或在内存中修改过的文本块
+    从文本重新计算，新签名在下次保存时写入
+
+    参数:
+        knowledge_base: 向量库（或带有 docstore、index_to_docstore_id 的对象）
+        deduplicator: ChunkDeduplicator
+    """
+    docstore = knowledge_base.docstore
+    if isinstance(docstore, SQLiteDocstore):
+        recompute = []
+        for doc_id, digest, minhash, shingle in docstore.iter_signatures():
+            signature = deduplicator.stored_signature(minhash, shingle)
+            if digest is None or (deduplicator.needs_signature and signature is None):
+                recompute.append(doc_id)
+            else:
+                deduplicator.register(doc_id, digest, signature)
+        recompute += list(docstore._added)
+    else:
+        recompute = [str(doc_id) for doc_id in knowledge_base.index_to_docstore_id.values()]
+    for i in range(0, len(recompute), _FETCH_BATCH):
+        batch = recompute[i:i + _FETCH_BATCH]
+        if isinstance(docstore, SQLiteDocstore):
+            docs = docstore.get_many(batch)
+        else:
+            docs = {doc_id: docstore.search(doc_id) for doc_id in batch}
+        for doc_id in batch:
+            doc = docs.get(doc_id)
+            if doc is not None and not isinstance(doc, str):
+                deduplicator.register_text(doc_id, doc.page_content)
+
+
+def _row(position: int, doc_id, doc: Document, page_info: dict = None, deduplicator=None) -> tuple:
+    """
+    把文档转换为 chunks 表的一行；旧版知识库元数据中没有来源时从页码信息解析，
+    去重器中有该文本块的签名时一并写入
+    """
+    metadata = dict(doc.metadata or {})
+    source = metadata.pop("source", None)
+    page = metadata.pop("page", None)
+    start = metadata.pop("start", None)
+    end = metadata.pop("end", None)
+    if source is None and page_info:
+        info = str(page_info.get(doc.page_content, ""))
+        if ":" in info:
+            source, page = info.rsplit(":", 1)
+            page = int(page) if page.isdigit() else page
+        elif info.isdigit() and page is None:
+            page = int(info)
+    int_id = _int_id(doc_id)
+    key = None if int_id is not None else str(doc_id)
+    signature = deduplicator.signature_of(str(doc_id)) if deduplicator is not None else None
+    return (int_id if int_id is not None else -(position + 1), position, key, doc.page_content,
+            source, page, start, end, json.dumps(metadata, ensure_ascii=False) if metadata else None,
+            text_digest(doc.page_content),
+            signature.tobytes() if signature is not None else None,
+            deduplicator.shingle_size if signature is not None else None)
+
+
+def write_docstore(knowledge_base, path: str, batch_size: int = 1000):
+    """
+    将向量库的文档存储写入 SQLite 文件
+
+    底层为 SQLiteDocstore 时直接在 SQLite 内部从旧文件复制未删除的行（文本不经过 Python），
+    再写入内存中新增的文本块；内存文档存储（新构建或旧版知识库）逐批写入。
+    知识库带有去重器（knowledge_base.deduplicator）时写入其中的 MinHash 签名，
+    旧文件中缺少哈希的行（旧版文件）在复制后补算
+
+    参数:
+        knowledge_base: FAISS 向量库（旧版知识库的 page_info 会合并进来源和页码列）
+        path: 目标文件路径
+    """
+    docstore = knowledge_base.docstore
+    mapping = knowledge_base.index_to_docstore_id
+    page_info = getattr(knowledge_base, "page_info", None)
+    deduplicator = getattr(knowledge_base, "deduplicator", None)
+    insert = ("INSERT INTO chunks (id, position, key, text, source, page, start, end, extra, digest, minhash, shingle) "
+              "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript(_SCHEMA)
+        if isinstance(docstore, SQLiteDocstore):
+            conn.execute("ATTACH DATABASE ? AS base", (docstore.path,))
+            signatures = "b.digest, b.minhash, b.shingle" if _has_signatures(conn, "base") else "NULL, NULL, NULL"
+            conn.execute("CREATE TEMP TABLE positions (position INTEGER PRIMARY KEY, id INTEGER, key TEXT)")
+            added = [(position, doc_id) for position, doc_id in mapping.items() if str(doc_id) in docstore._added]
+            conn.executemany("INSERT INTO temp.positions VALUES (?, ?, ?)", (
+                (position, _int_id(doc_id), None if _int_id(doc_id) is not None else str(doc_id))
+                for position, doc_id in mapping.items() if str(doc_id) not in docstore._added
+            ))
+            conn.execute(
+                f"INSERT INTO chunks SELECT b.id, p.position, NULL, b.text, b.source, b.page, b.start, b.end, b.extra, {signatures} "
+                "FROM temp.positions p JOIN base.chunks b ON b.id = p.id WHERE p.id IS NOT NULL"
+            )
+            conn.execute(
+                "INSERT INTO chunks SELECT -(p.position + 1), p.position, p.key, b.text, b.source, b.page, b.start, b.end, b.extra, "
+                f"{signatures} FROM temp.positions p JOIN base.chunks b ON b.key = p.key WHERE p.key IS NOT NULL"
+            )
+            conn.executemany(insert, [
+                _row(position, doc_id, docstore._added[str(doc_id)], deduplicator=deduplicator) for position, doc_id in added
+            ])
+            # 旧版文件的行补算哈希；去重时重新计算过签名的已有文本块写入新签名
+            missing = conn.execute("SELECT id, text FROM chunks WHERE digest IS NULL").fetchall()
+            conn.executemany("UPDATE chunks SET digest = ? WHERE id = ?", [(text_digest(text), id_) for id_, text in missing])
+            if deduplicator is not None:
+                updates = {"id": [], "key": []}
+                for doc_id in deduplicator.unsaved:
+                    signature = deduplicator.signature_of(doc_id)
+                    if signature is not None and doc_id not in docstore._added:
+                        int_id = _int_id(doc_id)
+                        column = "id" if int_id is not None else "key"
+                        updates[column].append((signature.tobytes(), deduplicator.shingle_size, doc_id if int_id is None else int_id))
+                for column, rows in updates.items():
+                    conn.executemany(f"UPDATE chunks SET minhash = ?, shingle = ? WHERE {column} = ?", rows)
+        else:
+            batch = []
+            for position, doc_id in mapping.items():
+                doc = docstore.search(doc_id)
+                if isinstance(doc, str):
+                    continue
+                batch.append(_row(position, doc_id, doc, page_info, deduplicator))
+                if len(batch) >= batch_size:
+                    conn.executemany(insert, batch)
+                    batch = []
+            conn.executemany(insert, batch)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def fetch_documents(knowledge_base, positions) -> list:
+    """
+    按索引位置批量取回文档（SQLiteDocstore 一次查询取回全部命中的文本块）
+
+    返回:
+        与 positions 一一对应的 Document 列表，找不到的位置为None
+    """
+    doc_ids = [knowledge_base.index_to_docstore_id[position] for position in positions]
+    docstore = knowledge_base.docstore
+    if isinstance(docstore, SQLiteDocstore):
+        found = docstore.get_many(doc_ids)
+        return [found.get(str(doc_id)) for doc_id in doc_ids]
+    docs = [docstore.search(doc_id) for doc_id in doc_ids]
+    return [None if isinstance(doc, str) else doc for doc in docs]
+
+
+def chunk_locations(knowledge_base):
+    """
+    迭代每个向量的 (索引位置, 来源文件, 页码)，合并了重复文本块的向量对每个出处各产出一项
+
+    未修改的 SQLiteDocstore 直接读取来源和页码列（不读取文本）；其余情况逐个读取文档元数据，
+    旧版知识库元数据中没有来源时从 page_info 解析
+    """
+    docstore = knowledge_base.docstore
+    if isinstance(docstore, SQLiteDocstore) and not docstore.modified:
+        yield from docstore.iter_locations()
+        return
+    page_info = getattr(knowledge_base, "page_info", None) or {}
+    for position, doc_id in knowledge_base.index_to_docstore_id.items():
+        doc = docstore.search(doc_id)
+        if isinstance(doc, str):
+            continue
+        metadata = doc.metadata or {}
+        source, page = metadata.get("source"), metadata.get("page")
+        if source is None and ":" in str(page_info.get(doc.page_content, "")):
+            source, page = page_info[doc.page_content].rsplit(":", 1)
+            page = int(page) if page.isdigit() else None
+        yield position, source, page
+        for item in chunk_origins(metadata)[1:]:
+            yield position, item.get("source"), item.get("page")
@@ -0,0 +1,308 @@
+"""
+嵌入后端模块
+按名称注册和创建嵌入模型，并提供完全本地运行的 CPU 嵌入模型：
+字符 n-gram（哈希到固定维度）TF-IDF 经随机化截断 SVD 降维，在语料上拟合后保存到快照中，
+构建和查询都不需要访问网络。快照的 store_meta.json 记录后端名称和向量维度，加载时不一致会立即报错
+"""
+import os
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from settings import DEFAULT_EMBEDDING_BACKEND
+
+# 默认 DashScope 嵌入模型（阿里百炼平台）及各模型的向量维度
+DASHSCOPE_MODEL = "text-embedding-v2"
+DASHSCOPE_DIMENSIONS = {"text-embedding-v1": 1536, "text-embedding-v2": 1536, "text-embedding-v3": 1024}
+
+# 本地嵌入模型在快照中保存拟合结果的文件
+LOCAL_EMBEDDER_FILE = "embedder.npz"
+
+# 名称 → (工厂函数, 是否为远程服务)；远程服务由 BatchedEmbeddings 并发、限速、重试并可包装持久化缓存
+EMBEDDING_BACKENDS = {}
+
+
+def register_backend(name: str, remote: bool = False):
+    """
+    注册嵌入后端的装饰器
+
+    参数:
+        name: 后端名称（用于 --embedding-backend 和 store_meta.json）
+        remote: 是否为远程服务
+    """
+    def decorator(factory):
+        EMBEDDING_BACKENDS[name] = (factory, remote)
+        return factory
+    return decorator
+
+
+def is_remote_backend(name: str) -> bool:
+    return EMBEDDING_BACKENDS[name][1]
+
+
+def create_embedding_backend(name: str = None, **options) -> Embeddings:
+    """
+    按名称创建嵌入模型
+
+    参数:
+        name: 后端名称，None 表示默认后端
+        options: 传给后端的参数，如本地模型的 dimension
+
+    返回:
+        嵌入模型（未包装）
+    """
+    name = name or DEFAULT_EMBEDDING_BACKEND
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"未知的嵌入后端: {name}（可选：{', '.join(EMBEDDING_BACKENDS)}）")
+    factory, _ = EMBEDDING_BACKENDS[name]
+    return factory(**options)
+
+
+@register_backend("dashscope", remote=True)
+def _create_dashscope(model: str = DASHSCOPE_MODEL) -> Embeddings:
+    # 调用阿里百炼平台文本嵌入模型，配置环境变量 DASHSCOPE_API_KEY
+    from langchain_community.embeddings import DashScopeEmbeddings
+
+    return DashScopeEmbeddings(model=model)
+
+
+def base_embeddings(embeddings: Embeddings) -> Embeddings:
+    """去掉缓存、批量并发等包装器，返回最内层的嵌入模型"""
+    while getattr(embeddings, "embeddings", None) is not None:
+        embeddings = embeddings.embeddings
+    return embeddings
+
+
+def describe_embeddings(embeddings: Embeddings) -> dict:
+    """
+    返回嵌入模型的后端名称、模型名称和向量维度（维度未知时为None），写入 store_meta.json
+
+    参数:
+        embeddings: 嵌入模型（可以带包装器）
+    """
+    base = base_embeddings(embeddings)
+    backend = getattr(base, "backend_name", None)
+    if backend is not None:
+        return {"backend": backend, "model": getattr(base, "model_name", backend), "dimension": base.dimension}
+    model = getattr(base, "model", None)
+    if type(base).__name__ == "DashScopeEmbeddings":
+        return {"backend": "dashscope", "model": model, "dimension": DASHSCOPE_DIMENSIONS.get(model)}
+    return {"backend": type(base).__name__, "model": model, "dimension": getattr(base, "dimension", None)}
+
+
+def check_embeddings(recorded: dict, embeddings: Embeddings):
+    """
+    加载知识库前检查当前嵌入模型与构建知识库时记录的是否一致，不一致时立即报错
+
+    参数:
+        recorded: store_meta.json 中记录的嵌入信息，旧版知识库为None（跳过检查）
+        embeddings: 当前嵌入模型
+
+    异常:
+        ValueError: 后端或向量维度不一致
+    """
+    if not recorded:
+        return
+    current = describe_embeddings(embeddings)
+    mismatch = recorded.get("backend") != current["backend"]
+    # 未拟合的本地模型加载时使用快照中的参数，只需后端一致
+    if not mismatch and current["dimension"] is not None:
+        mismatch = (recorded.get("model") and current["model"] and recorded["model"] != current["model"]) or (
+            recorded.get("dimension") and recorded["dimension"] != current["dimension"]
+        )
+    if mismatch:
+        raise ValueError(
+            f"知识库使用 {recorded.get('backend')}（{recorded.get('model')}，{recorded.get('dimension')} 维）构建，"
+            f"当前嵌入模型为 {current['backend']}（{current['model']}，{current['dimension']} 维）；"
+            f"请使用 --embedding-backend {recorded.get('backend')} 或重新构建知识库"
+        )
+
+
+def requires_fit(embeddings: Embeddings) -> bool:
+    """嵌入模型是否需要先在语料上拟合（本地模型首次构建时）"""
+    base = base_embeddings(embeddings)
+    return hasattr(base, "fit") and not base.fitted
+
+
+def fit_embeddings(embeddings: Embeddings, texts: List[str]):
+    """在语料上拟合最内层的本地模型"""
+    base_embeddings(embeddings).fit(texts)
+
+
+def save_embedder_state(embeddings: Embeddings, directory: str):
+    """本地模型将拟合结果写入快照目录，其他后端无需保存"""
+    base = base_embeddings(embeddings)
+    if isinstance(base, LocalTfidfEmbeddings) and base.fitted:
+        base.save(directory)
+
+
+def load_embedder_state(embeddings: Embeddings, directory: str):
+    """本地模型从快照目录读取拟合结果，保证查询向量与快照中的向量处于同一空间"""
+    base = base_embeddings(embeddings)
+    if isinstance(base, LocalTfidfEmbeddings):
+        base.load(directory)
+
+
+@register_backend("local-tfidf")
+class LocalTfidfEmbeddings(Embeddings):
+    """
+    本地 CPU 嵌入模型：字符 n-gram TF-IDF + 随机化截断 SVD
+
+    每个文本按字符 n-gram 计数（n-gram 用多项式滚动哈希映射到 n_features 个桶，无需词表），
+    词频取 1+log、乘以语料上拟合的 IDF 并做 L2 归一化，再投影到 SVD 得到的 dimension 维子空间。
+    拟合只使用最多 fit_size 个文本块；语料较小时维度会降为文本块数量
+
+    参数:
+        dimension: 输出向量维度
+        n_features: n-gram 哈希桶数量
+        ngram_range: n-gram 长度范围（包含两端）
+        fit_size: 拟合时最多使用的文本块数量
+        block_size: 每次矩阵乘法处理的文本数量
+        seed: 随机种子（采样和随机投影），保证拟合结果可复现
+    """
+
+    backend_name = "local-tfidf"
+
+    _PRIME = np.uint64(0x100000001B3)
+    _MIX = np.uint64(0x9E3779B97F4A7C15)
+
+    def __init__(self, dimension: int = 256, n_features: int = 2 ** 14, ngram_range: tuple = (1, 3),
+                 fit_size: int = 20000, block_size: int = 256, seed: int = 0):
+        self.requested_dimension = dimension
+        self.n_features = n_features
+        self.ngram_range = tuple(ngram_range)
+        self.fit_size = fit_size
+        self.block_size = block_size
+        self.seed = seed
+        self.idf = None
+        self.components = None
+
+    @property
+    def fitted(self) -> bool:
+        return self.components is not None
+
+    @property
+    def dimension(self):
+        """拟合后的向量维度，未拟合时为None"""
+        return None if self.components is None else self.components.shape[1]
+
+    @property
+    def model_name(self) -> str:
+        low, high = self.ngram_range
+        return f"char{low}-{high}gram-{self.n_features}"
+
+    def _features(self, text: str):
+        """返回文本的 (哈希桶下标, 1+log(词频))"""
+        codes = np.frombuffer(text.lower().encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        low, high = self.ngram_range
+        hashes = np.zeros(len(codes), dtype=np.uint64)
+        parts = []
+        with np.errstate(over="ignore"):
+            for n in range(1, high + 1):
+                if len(codes) < n:
+                    break
+                # h_n[i] = h_{n-1}[i] * P + codes[i + n - 1]，不同长度的 n-gram 互不冲突
+                hashes = hashes[:len(codes) - n + 1] * self._PRIME + codes[n - 1:] + np.uint64(n)
+                if n >= low:
+                    parts.append(((hashes * self._MIX) >> np.uint64(32)) % np.uint64(self.n_features))
+        if not parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        buckets, counts = np.unique(np.concatenate(parts), return_counts=True)
+        return buckets.astype(np.int64), (1.0 + np.log(counts)).astype(np.float32)
+
+    def _tfidf_block(self, features: list) -> np.ndarray:
+        """将一组文本的稀疏特征展开为 L2 归一化的稠密 TF-IDF 矩阵"""
+        block = np.zeros((len(features), self.n_features), dtype=np.float32)
+        for row, (buckets, weights) in enumerate(features):
+            block[row, buckets] = weights * self.idf[buckets]
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        np.divide(block, norms, out=block, where=norms > 0)
+        return block
+
+    def _blocks(self, features: list):
+        for start in range(0, len(features), self.block_size):
+            yield start, self._tfidf_block(features[start:start + self.block_size])
+
+    def fit(self, texts: List[str], power_iterations: int = 2):
+        """
+        在语料上拟合 IDF 和 SVD 投影
+
+        参数:
+            texts: 用于拟合的文本块（超过 fit_size 时随机采样）
+            power_iterations: 随机化 SVD 的幂迭代次数
+        """
+        rng = np.random.default_rng(self.seed)
+        texts = list(texts)
+        if not texts:
+            raise ValueError("没有用于拟合本地嵌入模型的文本")
+        if len(texts) > self.fit_size:
+            texts = [texts[i] for i in sorted(rng.choice(len(texts), self.fit_size, replace=False))]
+        features = [self._features(text) for text in texts]
+
+        document_frequency = np.zeros(self.n_features, dtype=np.float64)
+        for buckets, _ in features:
+            document_frequency[buckets] += 1
+        self.idf = (np.log((1 + len(features)) / (1 + document_frequency)) + 1).astype(np.float32)
+
+        # 随机化截断 SVD：Y = XΩ 近似 X 的列空间，幂迭代提高精度，再对 QᵀX 做精确 SVD
+        rank = min(self.requested_dimension, len(features))
+        width = min(rank + 10, len(features))
+        sample = np.empty((len(features), width), dtype=np.float32)
+        omega = rng.standard_normal((self.n_features, width)).astype(np.float32)
+        for start, block in self._blocks(features):
+            sample[start:start + len(block)] = block @ omega
+        for _ in range(power_iterations):
+            q, _ = np.linalg.qr(sample)
+            projected = np.zeros((self.n_features, width), dtype=np.float32)
+            for start, block in self._blocks(features):
+                projected += block.T @ q[start:start + len(block)]
+            for start, block in self._blocks(features):
+                sample[start:start + len(block)] = block @ projected
+        q, _ = np.linalg.qr(sample)
+        reduced = np.zeros((width, self.n_features), dtype=np.float32)
+        for start, block in self._blocks(features):
+            reduced += q[start:start + len(block)].T @ block
+        _, _, vt = np.linalg.svd(reduced, full_matrices=False)
+        self.components = np.ascontiguousarray(vt[:rank].T, dtype=np.float32)
+        return self
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        if not self.fitted:
+            raise RuntimeError("本地嵌入模型尚未拟合：请先构建知识库，或从快照加载拟合结果")
+        vectors = []
+        features = [self._features(text) for text in texts]
+        for _, block in self._blocks(features):
+            projected = block @ self.components
+            norms = np.linalg.norm(projected, axis=1, keepdims=True)
+            np.divide(projected, norms, out=projected, where=norms > 0)
+            vectors.extend(projected.tolist())
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts)
+
+    def save(self, directory: str):
+        """将拟合结果写入快照目录"""
+        low, high = self.ngram_range
+        np.savez(os.path.join(directory, LOCAL_EMBEDDER_FILE), idf=self.idf, components=self.components,
+                 config=np.array([self.n_features, low, high], dtype=np.int64))
+
+    def load(self, directory: str):
+        """从快照目录读取拟合结果（覆盖当前的哈希参数）"""
+        path = os.path.join(directory, LOCAL_EMBEDDER_FILE)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"快照中缺少本地嵌入模型文件: {path}")
+        with np.load(path) as data:
+            n_features, low, high = (int(value) for value in data["config"])
+            self.n_features = n_features
+            self.ngram_range = (low, high)
+            self.idf = data["idf"]
+            self.components = data["components"]
+        return self
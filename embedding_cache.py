@@ -0,0 +1,180 @@
+"""
+嵌入向量缓存模块
+以（模型名称，文本块内容哈希）为键，将嵌入向量持久化到 SQLite，
+重建或增量更新时只有缓存未命中的文本块才会调用远程嵌入模型
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from embedding_pipeline import embed_query_batch
+from instrumentation import count
+
+
+def text_hash(text: str) -> str:
+    """计算文本块内容的哈希值（sha256）"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    基于 SQLite 的嵌入向量缓存，超过容量上限时按最近使用时间淘汰
+
+    参数:
+        path: 缓存数据库文件路径
+        max_entries: 最多缓存的向量条数
+    """
+
+    def __init__(self, path: str, max_entries: int = 500_000):
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """
+        批量查询缓存
+
+        参数:
+            model: 嵌入模型名称
+            hashes: 文本块哈希列表
+
+        返回:
+            命中的 {哈希: 向量} 字典
+        """
+        found = {}
+        now = time.time()
+        with self._lock:
+            # SQLite 单条语句的参数数量有限，分批查询
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, h) for h in found],
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]):
+        """
+        批量写入缓存，并在超出容量时淘汰最久未使用的条目
+
+        参数:
+            model: 嵌入模型名称
+            items: {哈希: 向量} 字典
+        """
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(model, h, np.asarray(v, dtype=np.float32).tobytes(), now) for h, v in items.items()],
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """淘汰超出容量上限的最久未使用条目（调用方需持有锁）"""
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (overflow,),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    带缓存的嵌入模型包装器：文档嵌入先查缓存，只把未命中的文本块交给底层模型
+
+    参数:
+        embeddings: 底层嵌入模型
+        cache: EmbeddingCache 实例
+        model_name: 缓存键中的模型名称，默认读取底层模型的 model 属性
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model_name: str = None):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name or getattr(embeddings, "model", None) or type(embeddings).__name__
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_hash(text) for text in texts]
+        cached = self.cache.get_many(self.model_name, list(set(hashes)))
+
+        # 收集未命中的文本（同一批次内重复的文本只嵌入一次）
+        missing = {}
+        for h, text in zip(hashes, texts):
+            if h not in cached and h not in missing:
+                missing[h] = text
+        hit_count = sum(1 for h in hashes if h in cached)
+        self.hits += hit_count
+        self.misses += len(hashes) - hit_count
+        count("embedding_cache_hits", hit_count)
+        count("embedding_cache_misses", len(hashes) - hit_count)
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            new_items = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model_name, new_items)
+            cached.update(new_items)
+
+        return [cached[h] for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        # 查询向量不写入文档缓存
+        return self.embeddings.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        # 批量查询向量同样不写入文档缓存
+        return embed_query_batch(self.embeddings, texts)
+
+    def summary(self) -> str:
+        """返回缓存命中统计信息"""
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        return f"嵌入缓存：命中 {self.hits} 个，未命中 {self.misses} 个（命中率 {rate:.1f}%）"
@@ -0,0 +1,153 @@
+"""
+嵌入流水线模块
+将文本块切分为可配置大小的批次，在线程池中并发调用嵌入模型，
+通过令牌桶限制请求速率，失败的批次按指数退避重试，结果按原始顺序返回
+"""
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from instrumentation import count, is_enabled
+
+
+class TokenBucket:
+    """
+    令牌桶限速器（线程安全）
+
+    参数:
+        rate: 每秒补充的令牌数（即每秒允许的请求数）
+        capacity: 桶容量（允许的突发请求数），默认与 rate 相同
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        """阻塞直到取得指定数量的令牌"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    批量并发嵌入包装器
+
+    参数:
+        embeddings: 底层嵌入模型
+        batch_size: 每个批次的文本块数量（DashScope text-embedding-v2 单次最多25条）
+        max_workers: 并发请求的线程数
+        requests_per_second: 可选，每秒最多发出的批次请求数。为None时不限速
+        max_retries: 每个批次失败后的最大重试次数
+        backoff: 首次重试前的等待时间（秒），之后每次翻倍
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        batch_size: int = 25,
+        max_workers: int = 4,
+        requests_per_second: float = None,
+        max_retries: int = 3,
+        backoff: float = 1.0,
+    ):
+        self.embeddings = embeddings
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max(1, max_workers)
+        self.rate_limiter = TokenBucket(requests_per_second) if requests_per_second else None
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.retries = 0
+        self._retries_lock = threading.Lock()  # 多个批次可能在不同线程中同时重试
+
+    def _embed_batch(self, batch: List[str], embed=None, kind: str = "document") -> List[List[float]]:
+        """嵌入单个批次，失败时按指数退避重试"""
+        embed = embed or self.embeddings.embed_documents
+        if is_enabled():
+            count("embedding_texts", len(batch), kind=kind)
+            count("embedding_bytes", sum(len(text.encode("utf-8")) for text in batch), kind=kind)
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            count("embedding_requests", kind=kind)
+            try:
+                return embed(batch)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                with self._retries_lock:
+                    self.retries += 1
+                count("embedding_retries", kind=kind)
+                delay = self.backoff * (2 ** attempt) * (1 + random.random() * 0.1)
+                logging.warning(f"嵌入批次失败（第 {attempt + 1} 次），{delay:.1f} 秒后重试：{e}")
+                time.sleep(delay)
+
+    def _embed_all(self, texts: List[str], embed, kind: str = "document") -> List[List[float]]:
+        """按批次切分后并发嵌入，结果按原始顺序返回"""
+        texts = list(texts)
+        if not texts:
+            return []
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1 or self.max_workers == 1:
+            results = [self._embed_batch(batch, embed, kind) for batch in batches]
+        else:
+            # executor.map 按提交顺序返回结果，保证向量与文本块一一对应
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+                results = list(executor.map(lambda batch: self._embed_batch(batch, embed, kind), batches))
+        return [vector for batch_vectors in results for vector in batch_vectors]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed_all(texts, self.embeddings.embed_documents)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """批量计算查询向量，与 embed_documents 使用相同的分批、并发、限速和重试"""
+        return self._embed_all(texts, lambda batch: embed_query_batch(self.embeddings, batch), kind="query")
+
+    def embed_query(self, text: str) -> List[float]:
+        count("embedding_requests", kind="query")
+        count("embedding_texts", kind="query")
+        return self.embeddings.embed_query(text)
+
+
+def embed_query_batch(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    批量计算查询向量
+
+    包装器（带 embed_queries 方法）交给包装器处理；DashScope 模型用一次请求
+    以 text_type="query" 嵌入整批文本；其他模型逐条调用 embed_query
+
+    参数:
+        embeddings: 嵌入模型
+        texts: 查询文本列表
+
+    返回:
+        与 texts 一一对应的查询向量列表
+    """
+    texts = list(texts)
+    embed_queries = getattr(embeddings, "embed_queries", None)
+    if embed_queries is not None:
+        return embed_queries(texts)
+    from langchain_community.embeddings import DashScopeEmbeddings
+
+    if isinstance(embeddings, DashScopeEmbeddings):
+        from langchain_community.embeddings.dashscope import embed_with_retry
+
+        result = embed_with_retry(embeddings, input=texts, text_type="query", model=embeddings.model)
+        return [item["embedding"] for item in result]
+    return [embeddings.embed_query(text) for text in texts]
@@ -0,0 +1,195 @@
+"""
+PDF 文本提取缓存模块
+以（文件内容哈希，页码，提取器版本）为键，将逐页提取的文本压缩后持久化到 SQLite，
+强制重建或调整分块参数后重新构建时，内容未变的 PDF 直接读取缓存的页面文本，不再解析 PDF
+"""
+import copy
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import List, Optional, Tuple
+
+from instrumentation import count
+
+# 提取逻辑（页面文本的生成方式）变化时递增，使旧的缓存条目失效
+EXTRACTOR_REVISION = 1
+
+
+def file_sha256(file_path: str) -> str:
+    """计算文件内容的sha256哈希值"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extractor_version() -> str:
+    """当前提取器的版本标识：PDF 解析库版本 + 提取逻辑版本，任一变化都不再命中旧缓存"""
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        library = version("PyPDF2")
+    except PackageNotFoundError:
+        library = "unknown"
+    return f"PyPDF2-{library}/{EXTRACTOR_REVISION}"
+
+
+class ExtractionCache:
+    """
+    基于 SQLite 的逐页文本缓存，以文件为单位写入和淘汰（只缓存完整提取的文件），超过容量上限时按最近使用时间淘汰
+
+    参数:
+        path: 缓存数据库文件路径
+        max_files: 最多缓存的文件数
+        extractor: 提取器版本标识，默认为 extractor_version()
+    """
+
+    def __init__(self, path: str, max_files: int = 10_000, extractor: str = None):
+        self.path = path
+        self.max_files = max_files
+        self.extractor = extractor or extractor_version()
+        self.hits = 0
+        self.misses = 0
+        self.record_stats = True
+        self._parsed = set()  # 不计统计的视图在本次构建中解析后写入的文件，之后读取时仍计为未命中
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                file_hash TEXT NOT NULL,
+                extractor TEXT NOT NULL,
+                page_count INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (file_hash, extractor)
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                file_hash TEXT NOT NULL,
+                extractor TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                text BLOB NOT NULL,
+                PRIMARY KEY (file_hash, extractor, page)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_files_last_used ON files(last_used)")
+        self._conn.commit()
+
+    def contains(self, file_hash: str) -> bool:
+        """是否缓存了该文件的全部页面（未缓存时计为一次未命中，已缓存的文件在 get 时计为命中）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM files WHERE file_hash = ? AND extractor = ?", (file_hash, self.extractor)
+            ).fetchone()
+        if row is None and self.record_stats:
+            self._miss()
+        return row is not None
+
+    def get(self, file_hash: str) -> Optional[List[Tuple[int, str]]]:
+        """
+        读取文件的全部页面
+
+        返回:
+            按页码排列的 (页码, 页面文本) 列表，未缓存时返回None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT page_count FROM files WHERE file_hash = ? AND extractor = ?", (file_hash, self.extractor)
+            ).fetchone()
+            if row is None:
+                pages = None
+            else:
+                rows = self._conn.execute(
+                    "SELECT page, text FROM pages WHERE file_hash = ? AND extractor = ? ORDER BY page",
+                    (file_hash, self.extractor),
+                ).fetchall()
+                # 页面数不一致说明条目不完整（例如被其他进程淘汰到一半），视为未命中
+                pages = [(page, zlib.decompress(blob).decode("utf-8")) for page, blob in rows] if len(rows) == row[0] else None
+                if pages is not None:
+                    self._conn.execute(
+                        "UPDATE files SET last_used = ? WHERE file_hash = ? AND extractor = ?",
+                        (time.time(), file_hash, self.extractor),
+                    )
+                    self._conn.commit()
+        if not self.record_stats:
+            return pages
+        if pages is None or file_hash in self._parsed:
+            self._parsed.discard(file_hash)
+            self._miss()
+        else:
+            self.hits += 1
+            count("extraction_cache_hits")
+        return pages
+
+    def _miss(self):
+        self.misses += 1
+        count("extraction_cache_misses")
+
+    def put(self, file_hash: str, pages: List[Tuple[int, str]]):
+        """
+        写入一个文件完整提取的全部页面，并在超出容量时淘汰最久未使用的文件
+
+        参数:
+            file_hash: 文件内容哈希
+            pages: (页码, 页面文本) 列表
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM pages WHERE file_hash = ? AND extractor = ?", (file_hash, self.extractor))
+            self._conn.executemany(
+                "INSERT INTO pages (file_hash, extractor, page, text) VALUES (?, ?, ?, ?)",
+                [(file_hash, self.extractor, page, zlib.compress((text or "").encode("utf-8"), 1)) for page, text in pages],
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (file_hash, extractor, page_count, last_used) VALUES (?, ?, ?, ?)",
+                (file_hash, self.extractor, len(pages), time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+            if not self.record_stats:
+                self._parsed.add(file_hash)
+
+    def _evict(self):
+        """淘汰超出容量上限的最久未使用文件（调用方需持有锁）"""
+        overflow = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0] - self.max_files
+        if overflow > 0:
+            stale = self._conn.execute(
+                "SELECT file_hash, extractor FROM files ORDER BY last_used ASC LIMIT ?", (overflow,)
+            ).fetchall()
+            self._conn.executemany("DELETE FROM files WHERE file_hash = ? AND extractor = ?", stale)
+            self._conn.executemany("DELETE FROM pages WHERE file_hash = ? AND extractor = ?", stale)
+
+    def without_stats(self) -> "ExtractionCache":
+        """
+        返回共用同一数据库连接、但不计入命中统计的缓存视图
+        （同一次构建中额外读取一遍文件时使用，例如分片构建前拟合本地嵌入模型，命中率只反映一次构建）；
+        视图解析并写入的文件之后从本缓存读取时仍计为未命中
+        """
+        view = copy.copy(self)
+        view.record_stats = False
+        return view
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def summary(self) -> str:
+        """返回缓存命中统计信息"""
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        return f"提取缓存：命中 {self.hits} 个文件，未命中 {self.misses} 个（命中率 {rate:.1f}%）"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,282 @@
+"""
+性能剖析模块
+为知识库构建、加载和查询的各个阶段提供计时区间（span）和计数器，
+结果可导出为 JSON Lines（每个区间一行）和 Prometheus 文本格式。
+默认关闭：关闭时 span() 返回共享的空区间、count() 直接返回，几乎没有额外开销
+"""
+import functools
+import inspect
+import json
+import os
+import re
+import threading
+import time
+
+# Prometheus 指标名前缀
+METRIC_PREFIX = "rag"
+
+
+class _NoopSpan:
+    """剖析关闭时使用的空区间"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """
+    计时区间：进入时记录起点，退出时记录耗时并交给剖析器保存
+
+    同一线程内嵌套的区间会记录外层区间名称（parent）；区间内抛出异常时记录异常类型
+    """
+
+    __slots__ = ("name", "attrs", "parent", "start", "duration", "thread", "_profiler")
+
+    def __init__(self, profiler: "Profiler", name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+        self.parent = None
+        self.start = None
+        self.duration = None
+        self.thread = None
+        self._profiler = profiler
+
+    def set(self, **attrs):
+        """补充区间属性（如结果数量）"""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = self._profiler._stack()
+        self.parent = stack[-1].name if stack else None
+        self.thread = threading.current_thread().name
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        stack = self._profiler._stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        self._profiler._finish(self)
+        return False
+
+
+class Profiler:
+    """收集已结束的区间和计数器（线程安全）"""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.wall_origin = time.time()
+        self.spans = []
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _finish(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def count(self, name: str, value: float, labels: dict):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def span_stats(self) -> dict:
+        """按区间名称汇总：{名称: (次数, 总耗时, 最大耗时)}，按首次出现顺序排列"""
+        stats = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in sorted(spans, key=lambda s: s.start):
+            calls, total, longest = stats.get(span.name, (0, 0.0, 0.0))
+            stats[span.name] = (calls + 1, total + span.duration, max(longest, span.duration))
+        return stats
+
+    def summary(self) -> list:
+        """返回各阶段耗时和计数器的文本表格"""
+        lines = [f"{'阶段':<24} | {'次数':>6} | {'总耗时(ms)':>11} | {'平均(ms)':>9} | {'最大(ms)':>9}", "-" * 72]
+        for name, (calls, total, longest) in self.span_stats().items():
+            lines.append(f"{name:<24} | {calls:>6} | {total * 1000:>11.1f} | {total / calls * 1000:>9.2f} | {longest * 1000:>9.2f}")
+        with self._lock:
+            counters = sorted(self.counters.items())
+        for (name, labels), value in counters:
+            label_text = ",".join(f"{k}={v}" for k, v in labels)
+            lines.append(f"{name}{'{' + label_text + '}' if label_text else ''} = {value:g}")
+        return lines
+
+    def export_jsonl(self, path: str):
+        """每个区间写为一行 JSON（起点为相对剖析开始的毫秒数），最后写入计数器"""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+            counters = sorted(self.counters.items())
+        with open(path, "w", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps({
+                    "type": "span",
+                    "name": span.name,
+                    "parent": span.parent,
+                    "thread": span.thread,
+                    "start_ms": round((span.start - self.origin) * 1000, 3),
+                    "duration_ms": round(span.duration * 1000, 3),
+                    "attrs": span.attrs,
+                }, ensure_ascii=False, default=str) + "\n")
+            for (name, labels), value in counters:
+                f.write(json.dumps({"type": "counter", "name": name, "labels": dict(labels), "value": value},
+                                   ensure_ascii=False) + "\n")
+
+    def export_prometheus(self, path: str):
+        """
+        以 Prometheus 文本格式写出：各阶段耗时为 summary（_sum / _count）加最大值 gauge，
+        计数器为 counter（_total）
+        """
+        lines = [
+            f"# HELP {METRIC_PREFIX}_span_seconds 各阶段耗时（秒）",
+            f"# TYPE {METRIC_PREFIX}_span_seconds summary",
+        ]
+        stats = self.span_stats()
+        for name, (calls, total, _) in stats.items():
+            label = f'{{span="{_escape_label(name)}"}}'
+            lines.append(f"{METRIC_PREFIX}_span_seconds_sum{label} {total:.6f}")
+            lines.append(f"{METRIC_PREFIX}_span_seconds_count{label} {calls}")
+        lines.append(f"# HELP {METRIC_PREFIX}_span_seconds_max 各阶段单次最大耗时（秒）")
+        lines.append(f"# TYPE {METRIC_PREFIX}_span_seconds_max gauge")
+        for name, (_, _, longest) in stats.items():
+            lines.append(f'{METRIC_PREFIX}_span_seconds_max{{span="{_escape_label(name)}"}} {longest:.6f}')
+
+        with self._lock:
+            counters = sorted(self.counters.items())
+        declared = set()
+        for (name, labels), value in counters:
+            metric = f"{METRIC_PREFIX}_{_metric_name(name)}_total"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            label_text = ",".join(f'{_metric_name(k)}="{_escape_label(v)}"' for k, v in labels)
+            lines.append(f"{metric}{'{' + label_text + '}' if label_text else ''} {value:g}")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def export(self, prefix: str) -> tuple:
+        """
+        同时导出两种格式
+
+        参数:
+            prefix: 输出路径前缀，生成 <prefix>.jsonl 和 <prefix>.prom
+
+        返回:
+            (jsonl 路径, prom 路径)
+        """
+        directory = os.path.dirname(prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        jsonl_path, prom_path = f"{prefix}.jsonl", f"{prefix}.prom"
+        self.export_jsonl(jsonl_path)
+        self.export_prometheus(prom_path)
+        return jsonl_path, prom_path
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", str(name))
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_profiler = None
+
+
+def enable() -> Profiler:
+    """开启剖析（已开启时返回现有的剖析器）"""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    return _profiler
+
+
+def disable():
+    """关闭剖析并丢弃已收集的数据"""
+    global _profiler
+    _profiler = None
+
+
+def is_enabled() -> bool:
+    return _profiler is not None
+
+
+def get_profiler() -> Profiler:
+    """返回当前的剖析器，未开启时返回None"""
+    return _profiler
+
+
+def span(name: str, **attrs):
+    """
+    创建计时区间，用法：with span("query.search", k=4): ...
+
+    参数:
+        name: 区间名称，按“模块.阶段”命名
+        attrs: 附加属性，写入 JSON Lines 输出
+
+    返回:
+        剖析开启时为 Span，关闭时为共享的空区间
+    """
+    profiler = _profiler
+    if profiler is None:
+        return _NOOP_SPAN
+    return Span(profiler, name, attrs)
+
+
+def traced(name: str, *arg_names: str):
+    """
+    装饰器：每次调用函数都记录为一个计时区间，函数体不需要缩进到 with span(...) 中
+
+    参数:
+        name: 区间名称
+        arg_names: 记录为区间属性的参数名，如 "mmap"
+    """
+    def decorator(function):
+        signature = inspect.signature(function)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return function(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            with span(name, **{arg: bound.arguments[arg] for arg in arg_names}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name: str, value: float = 1, **labels):
+    """
+    累加计数器（剖析关闭时直接返回）
+
+    参数:
+        name: 计数器名称，如 "pages"、"embedding_requests"
+        value: 增量
+        labels: 标签，如 kind="query"
+    """
+    profiler = _profiler
+    if profiler is not None:
+        profiler.count(name, value, labels)
@@ -2,17 +2,56 @@
 知识库管理模块
 负责向量数据库的初始化、增量更新等功能
 """
+import json
 import os
 import pickle
-import shutil
-from PyPDF2 import PdfReader
-from langchain_community.embeddings import DashScopeEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import uuid
+from itertools import groupby
+from operator import itemgetter
+from dedup import ChunkDeduplicator, attach_duplicates, drop_origins, origin
+from docstore import attach_docstore, seed_deduplicator
+from embedding_cache import CachedEmbeddings
+from extraction_cache import file_sha256
+from instrumentation import count, span, traced
+from chunking import DEFAULT_WINDOW_CHARS, create_text_splitter, chunk_text_with_pages, chunk_metadata, iter_chunks_streaming
 from data_process import (
-    extract_text_with_page_numbers,
-    process_text_with_splitter,
-    load_knowledge_base
+    add_records,
+    create_embeddings,
+    extract_pdf_files,
+    ingest_documents,
+    iter_pdf_pages,
+    load_knowledge_base,
+    load_store_meta,
+    save_knowledge_base,
+    stored_embedding_backend,
+    write_knowledge_base_files
 )
+from embedding_backends import (
+    base_embeddings,
+    check_embeddings,
+    describe_embeddings,
+    fit_embeddings,
+    load_embedder_state,
+    requires_fit,
+    save_embedder_state
+)
+from sharded_store import (
+    ShardedKnowledgeBase,
+    assign_files,
+    cleanup_shards,
+    describe_sharding,
+    is_sharded_store,
+    load_shard_map,
+    new_shard_map,
+    remove_files,
+    seed_shard,
+    shard_ids,
+    update_shard_origins,
+    write_shard,
+    write_shard_map
+)
+from snapshot_store import SNAPSHOTS_DIR, resolve_snapshot_path, snapshot_exists, write_snapshot
+from vector_index import delete_vectors, make_index_config
 
 
 def get_processed_files(vector_store_path: str) -> set:
@@ -25,33 +64,226 @@ def get_processed_files(vector_store_path: str) -> set:
     返回:
         已处理文件名的集合
     """
-    processed_files_path = os.path.join(vector_store_path, "processed_files.pkl")
+    snapshot_path = resolve_snapshot_path(vector_store_path) or vector_store_path
+    processed_files_path = os.path.join(snapshot_path, "processed_files.pkl")
     if os.path.exists(processed_files_path):
         with open(processed_files_path, "rb") as f:
             return pickle.load(f)
     return set()
 
 
-def save_processed_files(vector_store_path: str, processed_files: set):
+def save_processed_files(snapshot_path: str, processed_files: set):
     """
     保存已处理的PDF文件列表
     
     参数:
-        vector_store_path: 向量数据库路径
+        snapshot_path: 快照目录路径
         processed_files: 已处理文件名的集合
     """
-    os.makedirs(vector_store_path, exist_ok=True)
-    processed_files_path = os.path.join(vector_store_path, "processed_files.pkl")
+    os.makedirs(snapshot_path, exist_ok=True)
+    processed_files_path = os.path.join(snapshot_path, "processed_files.pkl")
     with open(processed_files_path, "wb") as f:
         pickle.dump(processed_files, f)
 
 
+def load_manifest(vector_store_path: str) -> dict:
+    """
+    加载文件清单：记录每个已处理PDF的大小、修改时间、内容哈希和贡献的向量ID
+    
+    参数:
+        vector_store_path: 向量数据库路径
+    
+    返回:
+        清单字典，格式为 {"next_id": int, "files": {文件名: {"size", "mtime", "sha256", "ids"}}}；
+        不存在时返回None
+    """
+    snapshot_path = resolve_snapshot_path(vector_store_path)
+    if snapshot_path is None:
+        return None
+    manifest_path = os.path.join(snapshot_path, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(snapshot_path: str, manifest: dict):
+    """
+    保存文件清单，同时更新兼容旧版本的已处理文件列表
+    
+    参数:
+        snapshot_path: 快照目录路径
+        manifest: 清单字典
+    """
+    os.makedirs(snapshot_path, exist_ok=True)
+    manifest_path = os.path.join(snapshot_path, "manifest.json")
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+    save_processed_files(snapshot_path, set(manifest["files"]))
+
+
+def save_store(knowledge_base, vector_store_path: str, manifest: dict):
+    """
+    将向量数据库和文件清单写入同一个新快照，再原子切换 CURRENT 指针
+    
+    参数:
+        knowledge_base: 知识库对象
+        vector_store_path: 向量数据库路径
+        manifest: 文件清单
+    """
+    with span("store.save"), write_snapshot(vector_store_path) as snapshot_dir:
+        write_knowledge_base_files(knowledge_base, snapshot_dir)
+        save_manifest(snapshot_dir, manifest)
+    attach_docstore(knowledge_base, os.path.join(vector_store_path, SNAPSHOTS_DIR, snapshot_dir.version))
+    # 由分片知识库改为不分片重建时，清理不再被引用的分片
+    cleanup_shards(vector_store_path)
+    print(f"向量数据库已保存到: {vector_store_path}（快照 {snapshot_dir.version}）")
+
+
+def iter_documents(dataset_path: str, pdf_files: list, workers: int = 1, extraction_cache=None):
+    """
+    按文件流式读取PDF页面（提供提取缓存时，内容未变的文件直接读取缓存的页面文本）
+
+    返回:
+        (文件名, (页码, 页面文本) 迭代器) 的迭代器，供 ingest_documents 使用
+    """
+    file_paths = [os.path.join(dataset_path, pdf_file) for pdf_file in pdf_files]
+    pages = iter_pdf_pages(file_paths, workers=workers, cache=extraction_cache)
+    return (
+        (pdf_files[file_index], ((page_number, page_text) for _, page_number, page_text in group))
+        for file_index, group in groupby(pages, key=itemgetter(0))
+    )
+
+
+def manifest_entry(file_path: str, ids: list, sha256: str = None) -> dict:
+    """生成单个文件的清单条目"""
+    stat = os.stat(file_path)
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "sha256": sha256 or file_sha256(file_path),
+        "ids": [int(id_) if str(id_).isdigit() else id_ for id_ in ids],
+    }
+
+
+def migrate_manifest(knowledge_base, vector_store_path: str, dataset_path: str) -> dict:
+    """
+    从旧版本数据库（只有 processed_files.pkl）生成文件清单
+    
+    旧数据库的文本块没有整数ID，这里根据文档元数据中的来源文件反查每个文件的向量ID；
+    元数据中没有来源信息的文件无法单独删除，只能通过 --force 重建。
+    """
+    ids_by_file = {}
+    for docstore_id in knowledge_base.index_to_docstore_id.values():
+        doc = knowledge_base.docstore.search(docstore_id)
+        source = getattr(doc, "metadata", {}).get("source")
+        if source:
+            ids_by_file.setdefault(source, []).append(docstore_id)
+
+    files = {}
+    for pdf_file in get_processed_files(vector_store_path):
+        file_path = os.path.join(dataset_path, pdf_file)
+        if not os.path.exists(file_path):
+            files[pdf_file] = {"size": -1, "mtime": 0, "sha256": "", "ids": []}
+            continue
+        files[pdf_file] = manifest_entry(file_path, [])
+        files[pdf_file]["ids"] = ids_by_file.get(pdf_file, [])
+        if not files[pdf_file]["ids"]:
+            print(f"警告: 无法定位 {pdf_file} 的向量（旧版本数据库），修改或删除该文件后请使用 --force 重建")
+
+    # 新文本块的整数ID不能与已有ID冲突
+    int_ids = [int(id_) for id_ in knowledge_base.index_to_docstore_id.values() if str(id_).isdigit()]
+    return {"next_id": max(int_ids) + 1 if int_ids else 0, "files": files}
+
+
+def detect_changes(manifest: dict, dataset_path: str, pdf_files: list):
+    """
+    对比文件清单与数据集目录，找出新增、修改和删除的文件
+    
+    大小和修改时间都未变化的文件直接视为未修改；否则计算内容哈希，
+    内容相同（例如只是被 touch）的文件只刷新清单中的修改时间。
+    
+    参数:
+        manifest: 文件清单
+        dataset_path: 数据集目录路径
+        pdf_files: 数据集目录中当前的PDF文件名列表
+    
+    返回:
+        (new_files, changed_files, deleted_files)
+    """
+    files = manifest["files"]
+    new_files, changed_files = [], []
+    for pdf_file in pdf_files:
+        entry = files.get(pdf_file)
+        if entry is None:
+            new_files.append(pdf_file)
+            continue
+        file_path = os.path.join(dataset_path, pdf_file)
+        stat = os.stat(file_path)
+        if stat.st_size == entry["size"] and stat.st_mtime == entry["mtime"]:
+            continue
+        sha256 = file_sha256(file_path)
+        if sha256 == entry["sha256"]:
+            entry["size"], entry["mtime"] = stat.st_size, stat.st_mtime
+        else:
+            changed_files.append(pdf_file)
+    current = set(pdf_files)
+    deleted_files = [f for f in files if f not in current]
+    return new_files, changed_files, deleted_files
+
+
+def remove_documents_from_knowledge_base(knowledge_base, manifest: dict, pdf_files: list) -> int:
+    """
+    按向量ID移除指定文件贡献的全部文本块（HNSW 等不支持删除的索引会用其余向量重建）
+
+    去重合并后仍被其他文件引用的文本块不删除，只从其出处中移除这些文件
+    
+    参数:
+        knowledge_base: 现有的知识库对象
+        manifest: 文件清单（会移除对应条目）
+        pdf_files: 要移除的文件名列表
+    
+    返回:
+        删除的文本块数量
+    """
+    existing_ids = set(knowledge_base.index_to_docstore_id.values())
+    ids_to_delete = []
+    for pdf_file in pdf_files:
+        entry = manifest["files"].pop(pdf_file, None)
+        if entry:
+            ids_to_delete.extend(str(id_) for id_ in entry["ids"] if str(id_) in existing_ids)
+    referenced = {str(id_) for entry in manifest["files"].values() for id_ in entry["ids"]}
+    shared = sorted(set(ids_to_delete) & referenced)
+    if shared:
+        drop_origins(knowledge_base, shared, set(pdf_files))
+    ids_to_delete = list(dict.fromkeys(id_ for id_ in ids_to_delete if id_ not in referenced))
+    if not ids_to_delete:
+        return 0
+
+    # 旧版知识库：清理页码信息中属于被删除文本块的条目
+    page_info = getattr(knowledge_base, "page_info", None)
+    for doc in knowledge_base.get_by_ids(ids_to_delete) if page_info else ():
+        if page_info.get(doc.page_content) == f"{doc.metadata.get('source')}:{doc.metadata.get('page')}":
+            page_info.pop(doc.page_content)
+
+    delete_vectors(knowledge_base, ids_to_delete)
+    return len(ids_to_delete)
+
+
 def add_new_documents_to_knowledge_base(
     knowledge_base,
     new_pdf_files: list,
     dataset_path: str,
-    vector_store_path: str
-):
+    vector_store_path: str,
+    embeddings=None,
+    workers: int = 1,
+    start_id: int = None,
+    save: bool = True,
+    extraction_cache=None,
+    dedup_config: dict = None
+) -> dict:
     """
     将新文档添加到现有知识库
     
@@ -60,105 +292,457 @@ def add_new_documents_to_knowledge_base(
         new_pdf_files: 新增的PDF文件名列表
         dataset_path: 数据集目录路径
         vector_store_path: 向量数据库保存路径
+        embeddings: 可选，嵌入模型。如果为None，使用加载知识库时的嵌入模型
+        workers: PDF文本提取的并行进程数
+        start_id: 可选，第一个新文本块的向量ID，后续依次递增。为None时生成随机ID（uuid4）
+        save: 是否在添加后立即保存为新快照。为False时由调用方统一保存
+        extraction_cache: 可选，ExtractionCache 实例，内容已缓存的文件不再解析PDF
+        dedup_config: 可选，去重配置。新文本块与知识库中已有的文本块（按文档存储中保存的哈希和签名）
+                      以及彼此之间比较，重复的不嵌入，出处合并到已有的代表文本块
+    
+    返回:
+        每个文件贡献的向量ID列表（包括其文本块被合并到的已有文本块），格式为 {文件名: [id, ...]}
     """
-    print(f"\n发现 {len(new_pdf_files)} 个新PDF文件，开始增量更新...")
+    print(f"\n发现 {len(new_pdf_files)} 个新增或已修改的PDF文件，开始增量更新...")
     
     # 创建文本分割器和嵌入模型
-    text_splitter = RecursiveCharacterTextSplitter(
-        separators=["\n\n", "\n", ".", " ", ""],
-        chunk_size=512,
-        chunk_overlap=128,
-        length_function=len,
-    )
-    embeddings = DashScopeEmbeddings(model="text-embedding-v2")
+    text_splitter = create_text_splitter()
+    if embeddings is None:
+        embeddings = knowledge_base.embedding_function
     
     all_new_chunks = []
-    all_new_page_numbers = []
+    all_new_metadatas = []
+    all_new_files = []
+    
+    # 提取所有新PDF文件的文本（workers大于1时并行提取）
+    file_paths = [os.path.join(dataset_path, pdf_file) for pdf_file in new_pdf_files]
+    with span("add.extract", files=len(file_paths)):
+        extracted = extract_pdf_files(file_paths, workers=workers, cache=extraction_cache)
     
     # 处理每个新PDF文件
-    for pdf_file in new_pdf_files:
-        file_path = os.path.join(dataset_path, pdf_file)
+    for pdf_file, (text, page_numbers, line_ranges) in zip(new_pdf_files, extracted):
         print(f"\n正在处理新文件: {pdf_file}")
-        pdf_reader = PdfReader(file_path)
-        text, page_numbers, line_ranges = extract_text_with_page_numbers(pdf_reader)
-        
-        # 分割文本
-        chunks = text_splitter.split_text(text)
-        print(f"  - 提取了 {len(text)} 个字符，分割成 {len(chunks)} 个块")
+        count("text_chars", len(text))
         
-        # 为每个chunk找到对应的页码（根据chunk在原始文本中的位置）
-        search_start = 0  # 用于跟踪查找位置，考虑chunk overlap
+        # 分割文本，并根据chunk在原始文本中的位置找到对应的页码
+        with span("add.split", file=pdf_file):
+            chunk_records = chunk_text_with_pages(text, page_numbers, line_ranges, text_splitter)
+        print(f"  - 提取了 {len(text)} 个字符，分割成 {len(chunk_records)} 个块")
         
-        for chunk in chunks:
+        for chunk, page_num, start, end in chunk_records:
             all_new_chunks.append(chunk)
-            
-            # 从search_start开始查找chunk（考虑overlap，向前搜索一些位置）
-            search_from = max(0, search_start - 128)  # 128是chunk_overlap大小
-            chunk_start = text.find(chunk, search_from)
-            
-            if chunk_start == -1:
-                # 如果找不到，尝试全局查找
-                chunk_start = text.find(chunk)
-            
-            if chunk_start != -1:
-                # 找到包含chunk起始位置的行
-                page_num = page_numbers[0] if page_numbers else 1
-                
-                if line_ranges and len(line_ranges) == len(page_numbers):
-                    # 使用line_ranges进行精确映射
-                    for line_idx, (line_start, line_end) in enumerate(line_ranges):
-                        if line_start <= chunk_start <= line_end:
-                            # chunk起始位置在这一行内
-                            page_num = page_numbers[line_idx]
-                            break
-                        elif chunk_start < line_start:
-                            # chunk起始位置在行之前，使用前一行（如果存在）
-                            if line_idx > 0:
-                                page_num = page_numbers[line_idx - 1]
-                            break
-                    else:
-                        # chunk超出所有行范围，使用最后一个页码
-                        page_num = page_numbers[-1] if page_numbers else page_num
-                elif page_numbers:
-                    # 如果没有line_ranges，回退到根据行数估算
-                    lines_before = text[:chunk_start].count('\n')
-                    if lines_before < len(page_numbers):
-                        page_num = page_numbers[lines_before]
-                    else:
-                        page_num = page_numbers[-1] if page_numbers else 1
-                
-                # 更新search_start为当前chunk结束位置（考虑overlap）
-                search_start = chunk_start + len(chunk) - 64  # 减去部分overlap
-            else:
-                # 如果找不到chunk位置，使用默认值
-                page_num = page_numbers[-1] if page_numbers else 1
-            
-            all_new_page_numbers.append(f"{pdf_file}:{page_num}")
+            all_new_metadatas.append(chunk_metadata(f"{pdf_file}:{page_num}", start, end))
+            all_new_files.append(pdf_file)
     
     if not all_new_chunks:
         print("没有新的文本块需要添加")
-        return
+        return {}
     
     print(f"\n准备添加 {len(all_new_chunks)} 个新文本块到向量数据库...")
+    count("chunks", len(all_new_chunks))
     
-    # 添加到现有知识库
-    knowledge_base.add_texts(all_new_chunks, embeddings=embeddings)
+    # 与知识库中已有的文本块以及新文本块之间去重，重复文本块的出处合并到代表文本块
+    deduplicator = None
+    if dedup_config is not None:
+        deduplicator = ChunkDeduplicator(dedup_config)
+        with span("add.seed_dedup", vectors=len(knowledge_base.index_to_docstore_id)):
+            seed_deduplicator(knowledge_base, deduplicator)
+    kept_chunks, kept_metadatas, new_ids, chunk_ids = [], [], [], []
+    duplicates = {}
+    with span("add.dedup", chunks=len(all_new_chunks)):
+        for chunk, metadata in zip(all_new_chunks, all_new_metadatas):
+            id_ = str(start_id + len(kept_chunks)) if start_id is not None else str(uuid.uuid4())
+            representative = deduplicator.check(chunk, id_) if deduplicator is not None else None
+            if representative is not None:
+                duplicates.setdefault(representative, []).append(origin(metadata))
+                id_ = representative
+            else:
+                kept_chunks.append(chunk)
+                kept_metadatas.append(dict(metadata))
+                new_ids.append(id_)
+            chunk_ids.append(id_)
+    if deduplicator is not None and deduplicator.removed:
+        print(deduplicator.summary(len(all_new_chunks)))
     
-    # 更新页码信息
-    for i, chunk in enumerate(all_new_chunks):
-        knowledge_base.page_info[chunk] = all_new_page_numbers[i]
+    # 添加到现有知识库（使用传入的嵌入模型计算新文本块的向量）
+    if kept_chunks:
+        with span("add.embed", chunks=len(kept_chunks)):
+            new_vectors = embeddings.embed_documents(kept_chunks)
+        with span("add.index", chunks=len(kept_chunks)):
+            add_records(knowledge_base, list(zip(kept_chunks, new_vectors, kept_metadatas, new_ids)))
+    attach_duplicates(knowledge_base, duplicates)
+    knowledge_base.deduplicator = deduplicator
     
-    print(f"✅ 成功添加 {len(all_new_chunks)} 个新文本块")
+    print(f"✅ 成功添加 {len(kept_chunks)} 个新文本块")
     
-    # 保存更新后的向量数据库和页码信息
-    knowledge_base.save_local(vector_store_path)
-    with open(os.path.join(vector_store_path, "page_info.pkl"), "wb") as f:
-        pickle.dump(knowledge_base.page_info, f)
+    # 保存更新后的向量数据库
+    if save:
+        save_knowledge_base(knowledge_base, vector_store_path)
+        print("✅ 向量数据库已更新并保存")
     
+    ids_by_file = {}
+    for pdf_file, id_ in zip(all_new_files, chunk_ids):
+        ids = ids_by_file.setdefault(pdf_file, [])
+        if id_ not in ids:
+            ids.append(id_)
+    return ids_by_file
+
+
+def fit_embeddings_on_files(embeddings, dataset_path: str, pdf_files: list, workers: int = 1, window_chars: int = DEFAULT_WINDOW_CHARS, extraction_cache=None):
+    """
+    分片构建前用全部文件的前 fit_size 个文本块拟合本地嵌入模型，保证各分片的向量处于同一空间
+    （不分片构建在 ingest_documents 中边读边拟合）
+    """
+    fit_size = base_embeddings(embeddings).fit_size
+    text_splitter = create_text_splitter()
+    sample = []
+    # 拟合时读取的文件在构建时还会再读一遍，只统计构建那一遍的缓存命中
+    if extraction_cache is not None:
+        extraction_cache = extraction_cache.without_stats()
+    with span("embedding.fit"):
+        for _, pages in iter_documents(dataset_path, pdf_files, workers=workers, extraction_cache=extraction_cache):
+            for chunk, _, _, _ in iter_chunks_streaming(pages, text_splitter, window_chars):
+                sample.append(chunk)
+                if len(sample) >= fit_size:
+                    break
+            if len(sample) >= fit_size:
+                break
+        if sample:
+            fit_embeddings(embeddings, sample)
+
+
+def rebuild_shards(
+    shard_names: list,
+    shard_map: dict,
+    manifest: dict,
+    dataset_path: str,
+    vector_store_path: str,
+    embeddings,
+    refreshed_files: set = (),
+    workers: int = 1,
+    window_chars: int = DEFAULT_WINDOW_CHARS,
+    batch_size: int = 256,
+    index_config: dict = None,
+    extraction_cache=None,
+    dedup_config: dict = None,
+    deduplicator: ChunkDeduplicator = None,
+    owners: dict = None,
+    stale_origins: dict = None
+) -> int:
+    """
+    用分片当前包含的文件重新构建指定分片，每个分片写入自己的新快照；文件已全部移除的分片从分片表中删除
+
+    未修改的文件同样重新嵌入（带缓存的嵌入模型直接命中缓存），新文本块的向量ID从 manifest["next_id"] 起分配。
+    启用去重时各分片共用一个去重器，文本块也与之前重建的分片和去重器中已登记的未重建分片比较；
+    重复文本块的出处写回代表文本块所在的分片（本次重建的分片直接替换其新快照中的文档存储，
+    未重建的分片只改写文档存储，生成新快照）
+
+    参数:
+        shard_names: 要重建的分片名
+        shard_map: 分片表（会更新各分片的快照版本和向量数）
+        manifest: 文件清单（会更新文件的向量ID和所属分片）
+        dataset_path: 数据集目录路径
+        vector_store_path: 向量数据库路径
+        embeddings: 嵌入模型
+        refreshed_files: 新增或内容已修改的文件，重新生成清单条目（其余文件只更新向量ID）
+        workers: PDF文本提取的并行进程数
+        window_chars: 每个文档驻留在内存中的最大文本字符数
+        batch_size: 每个嵌入批次的文本块数量
+        index_config: 分片的索引配置
+        extraction_cache: 可选，ExtractionCache 实例
+        dedup_config: 可选，去重配置（在全部重建的分片之间去重）
+        deduplicator: 可选，已登记未重建分片中文本块的去重器（见 plan_shard_dedup），传入时忽略 dedup_config
+        owners: 可选，去重器中已登记的向量ID → 所属分片
+        stale_origins: 可选，未重建分片中要移除的出处，{分片名: (向量ID列表, 来源文件名集合)}
+
+    返回:
+        各分片中向量维度（没有写入任何向量时为None）
+    """
+    if deduplicator is None and dedup_config is not None:
+        deduplicator = ChunkDeduplicator(dedup_config)
+    owners = dict(owners or {})
+    stale_origins = stale_origins or {}
+    external = {}  # 代表文本块在其他分片中的重复出处
+    rebuilt = set()
+    dimension = None
+    for name in sorted(shard_names):
+        shard = shard_map["shards"].get(name)
+        if shard is None:
+            continue
+        if not shard["files"]:
+            print(f"\n分片 {name} 的文件已全部删除，移除该分片")
+            del shard_map["shards"][name]
+            continue
+        print(f"\n构建分片 {name}（{len(shard['files'])} 个文件）...")
+        ids_by_file = {}
+        with span("init.shard", shard=name, files=len(shard["files"])):
+            knowledge_base = ingest_documents(
+                iter_documents(dataset_path, shard["files"], workers=workers, extraction_cache=extraction_cache),
+                embeddings=embeddings,
+                window_chars=window_chars,
+                batch_size=batch_size,
+                start_id=manifest["next_id"],
+                ids_by_file=ids_by_file,
+                index_config=index_config,
+                deduplicator=deduplicator,
+                external_duplicates=external
+            )
+            shard["duplicate_files"] = []
+            if knowledge_base is not None:
+                shard["version"] = write_shard(knowledge_base, vector_store_path, name)
+                shard["vectors"] = knowledge_base.index.ntotal
+                dimension = knowledge_base.index.d
+                owners.update(dict.fromkeys(knowledge_base.index_to_docstore_id.values(), name))
+                rebuilt.add(name)
+            else:
+                shard["version"], shard["vectors"] = None, 0
+        for pdf_file in shard["files"]:
+            ids = ids_by_file.get(pdf_file, [])
+            entry = manifest["files"].get(pdf_file)
+            if entry is None or pdf_file in refreshed_files:
+                entry = manifest["files"][pdf_file] = manifest_entry(os.path.join(dataset_path, pdf_file), ids)
+            else:
+                entry["ids"] = [int(id_) for id_ in ids]
+            entry["shard"] = name
+            manifest["next_id"] = max([manifest["next_id"]] + [int(id_) + 1 for id_ in ids])
+
+    # 重复文本块的出处写回代表文本块所在的分片，同时移除未重建分片中过期的出处
+    by_shard = {}
+    for doc_id, origins in external.items():
+        by_shard.setdefault(owners[doc_id], {})[doc_id] = origins
+    for name in sorted(set(by_shard) | set(stale_origins)):
+        drop_ids, drop_sources = stale_origins.get(name, ((), set()))
+        with span("init.shard_origins", shard=name):
+            update_shard_origins(
+                vector_store_path, name, shard_map["shards"][name], by_shard.get(name), drop_ids, drop_sources,
+                deduplicator=deduplicator, in_place=name in rebuilt
+            )
+    return dimension
+
+
+def plan_shard_dedup(shard_map: dict, manifest: dict, dirty: set, deleted_entries: dict, vector_store_path: str, dedup_config: dict = None):
+    """
+    分片增量更新的跨分片去重准备
+
+    未重建分片中的文件有文本块被合并到要重建的分片时，重建后这些出处和向量ID都会失效，这些分片一并重建；
+    要重建分片中的文件和已删除文件合并到未重建分片中的出处先移除，重建时按新的文本块重新合并；
+    启用去重时把未重建分片中已有的文本块登记到去重器（读取文档存储中保存的哈希和签名，不读取文本）
+
+    参数:
+        shard_map: 分片表
+        manifest: 文件清单（已删除文件的条目已移除）
+        dirty: 要重建的分片名集合（会加入需要一并重建的分片）
+        deleted_entries: 已删除文件的清单条目
+        vector_store_path: 向量数据库路径
+        dedup_config: 去重配置，None 表示不去重
+
+    返回:
+        (去重器或None, 向量ID → 所属的未重建分片, {分片名: (要移除出处的向量ID列表, 来源文件名集合)})
+    """
+    shards = shard_map["shards"]
+    if dedup_config is None and not any(shard.get("duplicate_files") for shard in shards.values()):
+        return None, {}, {}
+
+    owners = {}
+    for name, shard in sorted(shards.items()):
+        if name not in dirty and shard["version"]:
+            owners.update(dict.fromkeys(shard_ids(vector_store_path, name, shard), name))
+
+    def references_dirty(pdf_file: str) -> bool:
+        ids = manifest["files"].get(pdf_file, {}).get("ids", [])
+        return any(owners.get(str(id_)) is None or owners[str(id_)] in dirty for id_ in ids)
+
+    changed = True
+    while changed:
+        changed = False
+        for name, shard in sorted(shards.items()):
+            if name not in dirty and any(references_dirty(pdf_file) for pdf_file in shard["files"]):
+                print(f"分片 {name} 中的文件与要重建的分片共用文本块，一并重建")
+                dirty.add(name)
+                changed = True
+    owners = {id_: name for id_, name in owners.items() if name not in dirty}
+
+    stale_files = {pdf_file for name in dirty for pdf_file in shards.get(name, {}).get("files", [])} | set(deleted_entries)
+    entries = {**manifest["files"], **deleted_entries}
+    stale_origins = {}
+    for name, shard in sorted(shards.items()):
+        sources = stale_files & set(shard.get("duplicate_files", ()))
+        if name in dirty or not sources:
+            continue
+        ids = sorted({str(id_) for pdf_file in sources for id_ in entries.get(pdf_file, {}).get("ids", [])
+                      if owners.get(str(id_)) == name})
+        stale_origins[name] = (ids, sources)
+
+    deduplicator = None
+    if dedup_config is not None:
+        deduplicator = ChunkDeduplicator(dedup_config)
+        with span("init.seed_dedup", shards=len(shards) - len(dirty)):
+            for name, shard in sorted(shards.items()):
+                if name not in dirty and shard["version"]:
+                    seed_shard(vector_store_path, name, shard, deduplicator)
+    return deduplicator, owners, stale_origins
+
+
+def save_sharded_store(vector_store_path: str, shard_map: dict, manifest: dict, store_meta: dict, embeddings):
+    """将分片表、文件清单和本地嵌入模型写入新的顶层快照，再原子切换 CURRENT 指针（各分片的新快照随之生效）"""
+    with span("store.save"), write_snapshot(vector_store_path) as snapshot_dir:
+        write_shard_map(snapshot_dir, shard_map, store_meta)
+        save_embedder_state(embeddings, snapshot_dir)
+        save_manifest(snapshot_dir, manifest)
+    cleanup_shards(vector_store_path)
+    shards = [shard for shard in shard_map["shards"].values() if shard["version"]]
+    print(f"分片向量数据库已保存到: {vector_store_path}（快照 {snapshot_dir.version}，"
+          f"{len(shards)} 个分片，共 {sum(shard['vectors'] for shard in shards)} 个向量）")
+
+
+def build_sharded_knowledge_base(
+    dataset_path: str,
+    vector_store_path: str,
+    pdf_files: list,
+    shard_config: dict,
+    embeddings=None,
+    workers: int = 1,
+    window_chars: int = DEFAULT_WINDOW_CHARS,
+    batch_size: int = 256,
+    index_config: dict = None,
+    extraction_cache=None,
+    dedup_config: dict = None
+):
+    """
+    全量构建分片知识库：按分片配置分配文件，逐个分片流式构建并写入各自的快照，最后写入顶层快照
+
+    返回:
+        ShardedKnowledgeBase，没有任何文本块时返回None
+    """
+    if embeddings is None:
+        embeddings = create_embeddings()
+    if index_config is None:
+        index_config = make_index_config()
+    pdf_files = sorted(pdf_files)
+    print(f"分片方式：{describe_sharding(shard_config)}")
+    if requires_fit(embeddings):
+        fit_embeddings_on_files(embeddings, dataset_path, pdf_files, workers=workers, window_chars=window_chars,
+                                extraction_cache=extraction_cache)
+
+    shard_map = new_shard_map(shard_config, vector_store_path)
+    names = assign_files(shard_map, {pdf_file: os.path.getsize(os.path.join(dataset_path, pdf_file)) for pdf_file in pdf_files})
+    manifest = {"next_id": 0, "files": {}}
+    dimension = rebuild_shards(
+        names, shard_map, manifest, dataset_path, vector_store_path, embeddings,
+        refreshed_files=set(pdf_files), workers=workers, window_chars=window_chars,
+        batch_size=batch_size, index_config=index_config, extraction_cache=extraction_cache,
+        dedup_config=dedup_config
+    )
+    if dimension is None:
+        print("没有提取到任何文本块")
+        return None
+
+    store_meta = {"index": index_config, "sharding": shard_config, "embedding": describe_embeddings(embeddings)}
+    store_meta["embedding"]["dimension"] = dimension
+    save_sharded_store(vector_store_path, shard_map, manifest, store_meta, embeddings)
+    return ShardedKnowledgeBase(vector_store_path, embeddings, mmap=False)
+
+
+def update_sharded_knowledge_base(
+    dataset_path: str,
+    vector_store_path: str,
+    pdf_files: list,
+    embeddings=None,
+    workers: int = 1,
+    window_chars: int = DEFAULT_WINDOW_CHARS,
+    batch_size: int = 256,
+    shards_to_rebuild: list = None,
+    extraction_cache=None,
+    dedup_config: dict = None
+):
+    """
+    增量更新分片知识库：只重建包含新增、修改或删除文件的分片（以及与它们共用文本块的分片）。
+    其余分片的向量索引不读取也不改写；去重时读取它们文档存储中的哈希和签名，
+    重复文本块的出处合并到其中的文本块时只改写文档存储
+
+    参数:
+        dataset_path: 数据集目录路径
+        vector_store_path: 向量数据库路径
+        pdf_files: 数据集目录中当前的PDF文件名列表
+        embeddings: 可选，嵌入模型。如果为None，按知识库记录的嵌入后端创建
+        workers: PDF文本提取的并行进程数
+        window_chars: 每个文档驻留在内存中的最大文本字符数
+        batch_size: 每个嵌入批次的文本块数量
+        shards_to_rebuild: 可选，无论文件是否变化都要重建的分片名或PDF文件名
+        extraction_cache: 可选，ExtractionCache 实例
+        dedup_config: 可选，去重配置（重建分片中的文本块也与未重建分片中已有的文本块比较）
+
+    返回:
+        ShardedKnowledgeBase
+    """
+    snapshot_path = resolve_snapshot_path(vector_store_path)
+    store_meta = load_store_meta(snapshot_path)
+    shard_map = load_shard_map(snapshot_path)
+    if embeddings is None:
+        embeddings = create_embeddings(backend=stored_embedding_backend(vector_store_path))
+    check_embeddings(store_meta.get("embedding"), embeddings)
+    load_embedder_state(embeddings, snapshot_path)
+    print(f"分片知识库：{len(shard_map['shards'])} 个分片（{describe_sharding(shard_map['config'])}）")
+
+    with span("init.detect_changes", files=len(pdf_files)):
+        manifest = load_manifest(vector_store_path)
+        new_pdf_files, changed_pdf_files, deleted_pdf_files = detect_changes(manifest, dataset_path, pdf_files)
+
+    # 已修改文件留在原分片；已删除文件从分片中移除；新文件（以及之前没有文本、不属于任何分片的文件）分配到分片
+    dirty = set()
+    unassigned = sorted(new_pdf_files + [f for f in changed_pdf_files if not manifest["files"][f].get("shard")])
+    dirty.update(manifest["files"][f]["shard"] for f in changed_pdf_files if manifest["files"][f].get("shard"))
+    dirty.update(remove_files(shard_map, {f: manifest["files"][f]["size"] for f in deleted_pdf_files}))
+    deleted_entries = {pdf_file: manifest["files"].pop(pdf_file) for pdf_file in deleted_pdf_files}
+    dirty.update(assign_files(shard_map, {f: os.path.getsize(os.path.join(dataset_path, f)) for f in unassigned}))
+
+    # 手动指定重建的分片（可以用分片名或其中的文件名指定）
+    for item in shards_to_rebuild or []:
+        if item in shard_map["shards"]:
+            dirty.add(item)
+        elif manifest["files"].get(item, {}).get("shard"):
+            dirty.add(manifest["files"][item]["shard"])
+        else:
+            print(f"警告: 未找到分片或文件 {item}")
+
+    if not dirty:
+        # 与不分片知识库一样不改写已发布的快照
+        print("✅ 所有PDF文件已处理且未修改，无需更新")
+        return ShardedKnowledgeBase(vector_store_path, embeddings, mmap=False)
+
+    deduplicator, owners, stale_origins = plan_shard_dedup(
+        shard_map, manifest, dirty, deleted_entries, vector_store_path, dedup_config
+    )
+    print(f"\n新增 {len(new_pdf_files)} 个、修改 {len(changed_pdf_files)} 个、删除 {len(deleted_pdf_files)} 个PDF文件，"
+          f"需要重建 {len(dirty)} / {len(shard_map['shards'])} 个分片")
+    dimension = rebuild_shards(
+        dirty, shard_map, manifest, dataset_path, vector_store_path, embeddings,
+        refreshed_files=set(new_pdf_files + changed_pdf_files), workers=workers, window_chars=window_chars,
+        batch_size=batch_size, index_config=store_meta["index"], extraction_cache=extraction_cache,
+        deduplicator=deduplicator, owners=owners, stale_origins=stale_origins
+    )
+    if dimension is not None:
+        store_meta.setdefault("embedding", describe_embeddings(embeddings))["dimension"] = dimension
+    save_sharded_store(vector_store_path, shard_map, manifest, store_meta, embeddings)
     print("✅ 向量数据库已更新并保存")
+    return ShardedKnowledgeBase(vector_store_path, embeddings, mmap=False)
 
 
-def initialize_knowledge_base(dataset_path: str, vector_store_path: str, force_rebuild: bool = False):
+@traced("init", "force_rebuild")
+def initialize_knowledge_base(
+    dataset_path: str,
+    vector_store_path: str,
+    force_rebuild: bool = False,
+    embeddings=None,
+    workers: int = 1,
+    window_chars: int = DEFAULT_WINDOW_CHARS,
+    batch_size: int = 256,
+    index_config: dict = None,
+    shard_config: dict = None,
+    shards_to_rebuild: list = None,
+    extraction_cache=None,
+    dedup_config: dict = None
+):
     """
     初始化知识库（向量数据库），支持增量更新
     
@@ -166,9 +750,21 @@ def initialize_knowledge_base(dataset_path: str, vector_store_path: str, force_r
         dataset_path: 数据集目录路径（会处理目录下所有PDF文件）
         vector_store_path: 向量数据库保存路径
         force_rebuild: 是否强制重新构建（忽略已处理的文件）
+        embeddings: 可选，嵌入模型（例如带缓存的嵌入模型）。如果为None，将创建默认的DashScope嵌入模型
+        workers: PDF文本提取的并行进程数，1表示串行提取
+        window_chars: 全量构建时每个文档驻留在内存中的最大文本字符数
+        batch_size: 全量构建时每个嵌入批次的文本块数量
+        index_config: 全量构建时使用的索引配置（见 vector_index.make_index_config），默认为 Flat。
+                      增量更新沿用已保存的索引类型
+        shard_config: 全量构建时的分片配置（见 sharded_store.make_shard_config），None 表示不分片；
+                      强制重建分片知识库时为None则沿用原来的分片方式，{"mode": "none"} 表示改为不分片
+        shards_to_rebuild: 可选，增量更新分片知识库时无论文件是否变化都要重建的分片名或PDF文件名
+        extraction_cache: 可选，PDF 文本提取缓存（ExtractionCache），内容未变的文件不再解析PDF
+        dedup_config: 可选，去重配置（见 dedup.make_dedup_config），None 表示不去重。
+                      新文本块与知识库中已有的文本块以及彼此之间比较（分片知识库跨分片比较）
     
     返回:
-        knowledge_base: FAISS向量数据库对象
+        knowledge_base: FAISS向量数据库对象（分片知识库为 ShardedKnowledgeBase）
     """
     # 检查目录是否存在
     if not os.path.isdir(dataset_path):
@@ -179,78 +775,115 @@ def initialize_knowledge_base(dataset_path: str, vector_store_path: str, force_r
     if not all_pdf_files:
         raise FileNotFoundError(f"目录 {dataset_path} 中没有找到PDF文件")
     
-    # 检查向量数据库是否已存在
-    db_exists = os.path.exists(vector_store_path) and os.path.exists(os.path.join(vector_store_path, 'index.faiss'))
+    # 检查向量数据库是否已存在（快照布局、分片布局或旧版本布局）
+    sharded = is_sharded_store(vector_store_path)
+    db_exists = sharded or snapshot_exists(vector_store_path)
+    if force_rebuild and sharded and shard_config is None:
+        shard_config = load_shard_map(resolve_snapshot_path(vector_store_path))["config"]
+    if shard_config is not None and shard_config.get("mode") == "none":
+        shard_config = None
     
-    if db_exists and not force_rebuild:
-        print("检测到已存在的向量数据库，检查是否有新文件...")
-        knowledge_base = load_knowledge_base(vector_store_path)
-        
-        # 获取已处理的文件列表
-        processed_files = get_processed_files(vector_store_path)
+    if db_exists and not force_rebuild and sharded:
+        print("检测到已存在的分片向量数据库，检查文件变化...")
+        knowledge_base = update_sharded_knowledge_base(
+            dataset_path, vector_store_path, all_pdf_files, embeddings=embeddings, workers=workers,
+            window_chars=window_chars, batch_size=batch_size, shards_to_rebuild=shards_to_rebuild,
+            extraction_cache=extraction_cache, dedup_config=dedup_config
+        )
+    elif db_exists and not force_rebuild:
+        if shard_config is not None or shards_to_rebuild:
+            print("⚠️ 现有向量数据库未分片，分片参数只在 --force 全量构建时生效，已忽略")
+        print("检测到已存在的向量数据库，检查文件变化...")
+        knowledge_base = load_knowledge_base(vector_store_path, embeddings)
         
-        # 找出新增的文件
-        new_pdf_files = [f for f in all_pdf_files if f not in processed_files]
+        with span("init.detect_changes", files=len(all_pdf_files)):
+            # 获取文件清单（旧版本数据库从已处理文件列表迁移）
+            manifest = load_manifest(vector_store_path)
+            if manifest is None:
+                manifest = migrate_manifest(knowledge_base, vector_store_path, dataset_path)
+            
+            # 找出新增、修改和删除的文件
+            new_pdf_files, changed_pdf_files, deleted_pdf_files = detect_changes(manifest, dataset_path, all_pdf_files)
         
-        if new_pdf_files:
-            # 增量更新：添加新文件
-            add_new_documents_to_knowledge_base(
-                knowledge_base, new_pdf_files, dataset_path, vector_store_path
-            )
-            # 更新已处理文件列表
-            processed_files.update(new_pdf_files)
-            save_processed_files(vector_store_path, processed_files)
+        if new_pdf_files or changed_pdf_files or deleted_pdf_files:
+            # 移除已修改和已删除文件的旧向量
+            stale_files = changed_pdf_files + deleted_pdf_files
+            if stale_files:
+                print(f"\n发现 {len(changed_pdf_files)} 个已修改、{len(deleted_pdf_files)} 个已删除的PDF文件")
+                with span("init.remove", files=len(stale_files)):
+                    removed = remove_documents_from_knowledge_base(knowledge_base, manifest, stale_files)
+                print(f"✅ 已删除 {removed} 个旧文本块")
+            
+            # 增量更新：添加新文件和已修改文件的新文本块
+            files_to_add = new_pdf_files + changed_pdf_files
+            if files_to_add:
+                ids_by_file = add_new_documents_to_knowledge_base(
+                    knowledge_base, files_to_add, dataset_path, vector_store_path,
+                    embeddings=embeddings, workers=workers, start_id=manifest["next_id"], save=False,
+                    extraction_cache=extraction_cache, dedup_config=dedup_config
+                )
+                for pdf_file in files_to_add:
+                    ids = ids_by_file.get(pdf_file, [])
+                    manifest["files"][pdf_file] = manifest_entry(os.path.join(dataset_path, pdf_file), ids)
+                    manifest["next_id"] = max([manifest["next_id"]] + [int(id_) + 1 for id_ in ids])
+            
+            # 向量数据库与文件清单写入同一个新快照
+            save_store(knowledge_base, vector_store_path, manifest)
+            print("✅ 向量数据库已更新并保存")
         else:
-            print("✅ 所有PDF文件已处理，无需更新")
+            # 已发布的快照不再改写：内容未变文件刷新的修改时间不保存，下次运行时再比对一次哈希
+            print("✅ 所有PDF文件已处理且未修改，无需更新")
     else:
-        # 首次构建或强制重建
+        # 首次构建或强制重建：写入新快照，旧快照在切换后按保留策略清理
         if force_rebuild and db_exists:
-            print("强制重建：删除旧的向量数据库...")
-            shutil.rmtree(vector_store_path)
+            print("强制重建：忽略旧的向量数据库，构建新的快照...")
         
         print("开始处理PDF文件并创建向量数据库...")
+        if shard_config is not None:
+            with span("init.ingest", files=len(all_pdf_files), sharded=True):
+                knowledge_base = build_sharded_knowledge_base(
+                    dataset_path, vector_store_path, all_pdf_files, shard_config, embeddings=embeddings,
+                    workers=workers, window_chars=window_chars, batch_size=batch_size, index_config=index_config,
+                    extraction_cache=extraction_cache, dedup_config=dedup_config
+                )
+            if isinstance(embeddings, CachedEmbeddings):
+                print(embeddings.summary())
+            if extraction_cache is not None:
+                print(extraction_cache.summary())
+            print("\n向量数据库准备完成！")
+            return knowledge_base
         
-        all_text = ""
-        all_page_numbers = []
-        all_line_ranges = []
-        current_text_pos = 0
-        
-        for pdf_file in all_pdf_files:
-            file_path = os.path.join(dataset_path, pdf_file)
-            print(f"\n正在处理: {pdf_file}")
-            pdf_reader = PdfReader(file_path)
-            text, page_numbers, line_ranges = extract_text_with_page_numbers(pdf_reader)
-            
-            # 添加文档标记
-            doc_marker = f"\n\n[文档: {pdf_file}]\n\n"
-            all_text += doc_marker + text
-            
-            # 调整line_ranges的位置偏移（因为添加了文档标记）
-            marker_len = len(doc_marker)
-            adjusted_line_ranges = [
-                (start + current_text_pos + marker_len, end + current_text_pos + marker_len)
-                for start, end in line_ranges
-            ]
-            all_line_ranges.extend(adjusted_line_ranges)
-            
-            # 添加页码信息（带文件名前缀）
-            all_page_numbers.extend([f"{pdf_file}:{p}" for p in page_numbers])
-            
-            current_text_pos += len(doc_marker) + len(text)
-            print(f"  - 提取了 {len(text)} 个字符")
-        
-        print(f"\n总共提取文本，共 {len(all_text)} 个字符。")
-        
-        # 处理所有文本并创建向量存储
-        knowledge_base = process_text_with_splitter(
-            text=all_text,
-            page_numbers=all_page_numbers,
-            line_ranges=all_line_ranges,
-            save_path=vector_store_path
-        )
+        # 流式处理：逐页提取 → 窗口内分块 → 分批嵌入 → 追加到索引，内存占用与语料总量无关
+        documents = iter_documents(dataset_path, all_pdf_files, workers=workers, extraction_cache=extraction_cache)
+        ids_by_file = {}
+        with span("init.ingest", files=len(all_pdf_files)):
+            knowledge_base = ingest_documents(
+                documents,
+                embeddings=embeddings,
+                window_chars=window_chars,
+                batch_size=batch_size,
+                ids_by_file=ids_by_file,
+                index_config=index_config,
+                dedup_config=dedup_config
+            )
+        if knowledge_base is None:
+            return None
         
-        # 保存已处理文件列表
-        save_processed_files(vector_store_path, set(all_pdf_files))
+        # 向量数据库与文件清单（同时包含已处理文件列表）写入同一个快照
+        manifest = {
+            "next_id": len(knowledge_base.index_to_docstore_id),
+            "files": {
+                pdf_file: manifest_entry(os.path.join(dataset_path, pdf_file), ids_by_file.get(pdf_file, []))
+                for pdf_file in all_pdf_files
+            },
+        }
+        save_store(knowledge_base, vector_store_path, manifest)
+    
+    # 报告嵌入缓存和提取缓存命中情况
+    if isinstance(embeddings, CachedEmbeddings):
+        print(embeddings.summary())
+    if extraction_cache is not None:
+        print(extraction_cache.summary())
     
     print("\n向量数据库准备完成！")
     return knowledge_base
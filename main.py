@@ -3,8 +3,33 @@ RAG 系统主入口文件
 """
 import os
 import argparse
-from knowledge_base_manager import initialize_knowledge_base
-from user_query import run_query_mode
+# 解析参数只需要标准库中的默认配置；faiss、LangChain 等依赖在各命令的分支中导入，--help 不加载
+from settings import (
+    COMPRESSION_TYPES,
+    DEFAULT_BATCH_WINDOW_MS,
+    DEFAULT_DEBOUNCE,
+    DEFAULT_DEDUP_THRESHOLD,
+    DEFAULT_HOST,
+    DEFAULT_POLL_INTERVAL,
+    DEFAULT_PORT,
+    DEFAULT_SEARCH_WORKERS,
+    INDEX_TYPES,
+    SHARD_MODES,
+    WATCH_MODES,
+)
+from instrumentation import enable as enable_profiling, get_profiler
+
+
+def report_profile(output_prefix: str):
+    """打印各阶段耗时和计数器，并导出 JSON Lines 和 Prometheus 文本格式文件"""
+    profiler = get_profiler()
+    print("\n" + "=" * 50)
+    print("⏱ 性能剖析")
+    print("=" * 50)
+    for line in profiler.summary():
+        print(line)
+    jsonl_path, prom_path = profiler.export(output_prefix)
+    print(f"剖析结果已保存到: {jsonl_path}、{prom_path}")
 
 
 def main():
@@ -21,11 +46,37 @@ def main():
      # 强制重新构建向量数据库
      python main.py --init --force
      
+     # 使用 HNSW 近似索引重建（索引类型随快照保存，查询时自动沿用）
+     python main.py --init --force --index-type hnsw --hnsw-m 32 --ef-search 64
+     
+     # 以 8 位标量量化压缩向量，查询时取 4 倍候选用原始向量精确重排
+     python main.py --init --force --compression sq8 --rerank 4
+     
+     # 每个 PDF 一个分片构建，之后只重建发生变化的分片；也可以手动重建某个分片
+     python main.py --init --force --shard-by file
+     python main.py --init --rebuild-shard 中华人民共和国劳动法.pdf
+     
+     # 使用本地 CPU 嵌入模型构建（无需网络，查询时自动沿用）
+     python main.py --init --force --embedding-backend local-tfidf --embedding-dim 256
+     
      # 执行查询
      python main.py --query "客户经理的考核标准是什么？"
      
      # 连续交互式查询模式（退出：quit/exit/退出）
      python main.py --interactive
+     
+     # 批量回答 JSONL 文件中的问题（每行 {"id": ..., "query": ...}）
+     python main.py --batch questions.jsonl --output results.jsonl --llm-concurrency 8
+     
+     # 启动本地 HTTP 查询服务（并发问题合并为微批检索，重复问题共享一次大模型调用）
+     python main.py --serve --port 8000 --batch-window-ms 5 --llm-concurrency 16
+     curl -X POST http://127.0.0.1:8000/query -d '{"query": "投诉一次扣多少分？"}'
+     
+     # 监视 dataset/，新增、修改或删除 PDF 后自动增量更新；与 --serve 同时使用时服务不中断地切换到新快照
+     python main.py --watch --serve
+     
+     # 记录各阶段耗时和计数器，导出 profile.jsonl 和 profile.prom
+     python main.py --query "客户经理的考核标准是什么？" --profile
         """
     )
     
@@ -49,6 +100,75 @@ def main():
         action="store_true",
         help="进入交互式查询模式"
     )
+    parser.add_argument(
+        "--batch",
+        type=str,
+        help="批量问答：JSONL 问题文件路径，每行一个 {\"id\": ..., \"query\": ...} 对象"
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="results.jsonl",
+        help="批量问答的结果文件路径（默认：results.jsonl）"
+    )
+    parser.add_argument(
+        "--query-batch-size",
+        type=int,
+        default=64,
+        help="批量问答时每组批量嵌入和检索的问题数，服务模式下为每个微批的最大问题数（默认：64）"
+    )
+    parser.add_argument(
+        "--llm-concurrency",
+        type=int,
+        default=8,
+        help="批量问答和服务模式下同时进行的大模型请求数上限（默认：8）"
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="启动本地 HTTP 查询服务（POST /query），知识库常驻内存"
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default=DEFAULT_HOST,
+        help=f"查询服务的监听地址（默认：{DEFAULT_HOST}）"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_PORT,
+        help=f"查询服务的监听端口（默认：{DEFAULT_PORT}）"
+    )
+    parser.add_argument(
+        "--batch-window-ms",
+        type=float,
+        default=DEFAULT_BATCH_WINDOW_MS,
+        help=f"查询服务收集并发问题组成微批的等待时间（毫秒，默认：{DEFAULT_BATCH_WINDOW_MS:g}）"
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="先增量更新一次，再持续监视数据集目录，文件变化后在后台增量更新知识库（可与 --serve / --interactive 同时使用）"
+    )
+    parser.add_argument(
+        "--watch-mode",
+        choices=WATCH_MODES,
+        default="auto",
+        help="监视方式：inotify、poll（轮询）或 auto（优先 inotify，默认）"
+    )
+    parser.add_argument(
+        "--watch-debounce",
+        type=float,
+        default=DEFAULT_DEBOUNCE,
+        help=f"最后一次文件变化后等待多少秒再开始增量更新，合并成批的文件变化（默认：{DEFAULT_DEBOUNCE:g}）"
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL,
+        help=f"轮询方式下扫描数据集目录的间隔（秒，默认：{DEFAULT_POLL_INTERVAL:g}）"
+    )
     parser.add_argument(
         "--dataset",
         type=str,
@@ -61,32 +181,381 @@ def main():
         default="./vector_store",
         help="向量数据库保存路径（默认：./vector_store）"
     )
+    parser.add_argument(
+        "--embedding-cache",
+        type=str,
+        default="./.cache/embeddings.sqlite",
+        help="嵌入向量缓存路径，重建时只为未缓存的文本块调用嵌入模型（默认：./.cache/embeddings.sqlite）"
+    )
+    parser.add_argument(
+        "--no-embedding-cache",
+        action="store_true",
+        help="禁用嵌入向量缓存"
+    )
+    parser.add_argument(
+        "--dedup-threshold",
+        type=float,
+        default=DEFAULT_DEDUP_THRESHOLD,
+        help="构建时合并重复文本块的相似度阈值（MinHash 估计的 Jaccard 相似度），每组重复文本块只嵌入和存储一个向量，"
+             "保留全部出处；默认 1.0 只合并完全重复的文本块，0.9 等较低的值同时合并近似重复的文本块"
+    )
+    parser.add_argument(
+        "--no-dedup",
+        action="store_true",
+        help="构建时不合并重复的文本块"
+    )
+    parser.add_argument(
+        "--extraction-cache",
+        type=str,
+        default="./.cache/extraction.sqlite",
+        help="PDF 文本提取缓存路径，重建时内容未变的 PDF 直接读取缓存的页面文本（默认：./.cache/extraction.sqlite）"
+    )
+    parser.add_argument(
+        "--no-extraction-cache",
+        action="store_true",
+        help="禁用 PDF 文本提取缓存"
+    )
+    parser.add_argument(
+        "--no-mmap",
+        action="store_true",
+        help="查询时将向量索引完整读入内存，而不是以内存映射方式打开"
+    )
+    parser.add_argument(
+        "--no-stream",
+        action="store_true",
+        help="等待完整回答后再输出（默认流式逐段输出回答）"
+    )
+    parser.add_argument(
+        "--context-budget",
+        type=int,
+        default=3000,
+        help="提示词上下文的 token 预算，检索结果合并去重后按相关度装入（默认：3000）"
+    )
+    parser.add_argument(
+        "--no-query-cache",
+        action="store_true",
+        help="查询时禁用查询向量缓存和语义答案缓存"
+    )
+    parser.add_argument(
+        "--query-cache-ttl",
+        type=float,
+        default=3600,
+        help="查询向量缓存条目的有效期（秒，默认：3600）"
+    )
+    parser.add_argument(
+        "--answer-cache-threshold",
+        type=float,
+        default=0.95,
+        help="语义答案缓存的余弦相似度阈值，新问题与已回答问题的相似度达到该值时直接返回缓存的答案（默认：0.95）"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="PDF文本提取的并行进程数（默认：1，串行提取）"
+    )
+    parser.add_argument(
+        "--ingest-window",
+        type=int,
+        default=1_000_000,
+        help="全量构建时每个文档驻留在内存中的最大文本字符数（默认：1000000）"
+    )
+    parser.add_argument(
+        "--ingest-batch",
+        type=int,
+        default=256,
+        help="全量构建时每批嵌入并写入索引的文本块数量（默认：256）"
+    )
+    parser.add_argument(
+        "--index-type",
+        choices=INDEX_TYPES,
+        default="flat",
+        help="全量构建时使用的向量索引类型：flat 精确搜索、ivf 倒排聚类、hnsw 图索引（默认：flat）"
+    )
+    parser.add_argument(
+        "--nlist",
+        type=int,
+        default=None,
+        help="IVF 索引的聚类数（默认：1024，训练向量不足时自动减小）"
+    )
+    parser.add_argument(
+        "--nprobe",
+        type=int,
+        default=None,
+        help="IVF 索引每次查询搜索的聚类数（默认：构建时为16，查询时沿用保存的值）"
+    )
+    parser.add_argument(
+        "--hnsw-m",
+        type=int,
+        default=None,
+        help="HNSW 索引每个节点的邻居数（默认：32）"
+    )
+    parser.add_argument(
+        "--ef-search",
+        type=int,
+        default=None,
+        help="HNSW 索引的查询候选队列长度（默认：构建时为64，查询时沿用保存的值）"
+    )
+    parser.add_argument(
+        "--compression",
+        choices=COMPRESSION_TYPES,
+        default="none",
+        help="全量构建时的向量压缩方式：none 不压缩、fp16 半精度、sq8 8位标量量化、pq 乘积量化（默认：none）"
+    )
+    parser.add_argument(
+        "--pq-m",
+        type=int,
+        default=None,
+        help="乘积量化的子量化器数量，必须整除向量维度（默认：维度/16）"
+    )
+    parser.add_argument(
+        "--rerank",
+        type=int,
+        default=None,
+        help="压缩索引的精确重排序候选倍数：先取 k×N 个候选，再用磁盘上的原始向量重排（默认：0，不重排；查询时可覆盖）"
+    )
+    parser.add_argument(
+        "--shard-by",
+        choices=SHARD_MODES,
+        default=None,
+        help="全量构建时的分片方式：none 不分片、file 每个 PDF 一个分片、size 按文件大小装箱"
+             "（默认：新建知识库不分片，--force 重建时沿用原来的分片方式）"
+    )
+    parser.add_argument(
+        "--shard-size-mb",
+        type=float,
+        default=None,
+        help="按大小分片时每个分片的 PDF 总大小上限（MB，默认：64）"
+    )
+    parser.add_argument(
+        "--rebuild-shard",
+        action="append",
+        default=None,
+        metavar="SHARD_OR_PDF",
+        help="增量更新时无论文件是否变化都重建该分片（分片名或其中的 PDF 文件名，可多次指定）"
+    )
+    parser.add_argument(
+        "--search-workers",
+        type=int,
+        default=DEFAULT_SEARCH_WORKERS,
+        help=f"查询分片知识库时并行搜索分片的线程数（默认：{DEFAULT_SEARCH_WORKERS}）"
+    )
+    parser.add_argument(
+        "--doc",
+        action="append",
+        default=None,
+        help="只在文件名包含该字符串的文档中检索（不区分大小写，可多次指定）"
+    )
+    parser.add_argument(
+        "--pages",
+        type=str,
+        default=None,
+        help="只在指定页码范围内检索，如 1-5,8（可与 --doc 组合）"
+    )
+    parser.add_argument(
+        "--embedding-backend",
+        default=os.getenv("RAG_EMBEDDING_BACKEND"),
+        help="嵌入后端：dashscope 远程模型、local-tfidf 本地 CPU 模型（默认：环境变量 RAG_EMBEDDING_BACKEND，"
+             "未设置时沿用知识库记录的后端，新建知识库使用 dashscope）"
+    )
+    parser.add_argument(
+        "--embedding-dim",
+        type=int,
+        default=None,
+        help="本地嵌入模型的向量维度（默认：256，语料较小时自动减小）"
+    )
+    parser.add_argument(
+        "--embed-batch-size",
+        type=int,
+        default=25,
+        help="每个嵌入请求包含的文本块数量（默认：25）"
+    )
+    parser.add_argument(
+        "--embed-workers",
+        type=int,
+        default=4,
+        help="并发嵌入请求数（默认：4）"
+    )
+    parser.add_argument(
+        "--embed-rate",
+        type=float,
+        default=None,
+        help="每秒最多发出的嵌入请求数（默认：不限速）"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="记录构建、加载和查询各阶段的耗时及页数、文本块数、嵌入请求数等计数器，结束时打印并导出"
+    )
+    parser.add_argument(
+        "--profile-output",
+        type=str,
+        default="./profile",
+        help="剖析结果的输出路径前缀，生成 <前缀>.jsonl 和 <前缀>.prom（默认：./profile）"
+    )
     
     args = parser.parse_args()
     
+    from data_process import create_embeddings, stored_embedding_backend
+    from embedding_backends import EMBEDDING_BACKENDS, is_remote_backend
+
+    # 嵌入后端在 embedding_backends.py 中注册，解析参数后再检查名称
+    if args.embedding_backend is not None and args.embedding_backend not in EMBEDDING_BACKENDS:
+        parser.error(f"argument --embedding-backend: invalid choice: '{args.embedding_backend}' "
+                     f"(choose from {', '.join(repr(name) for name in EMBEDDING_BACKENDS)})")
+    
     # 配置参数
     dataset_path = args.dataset
     vector_store_path = args.vector_store
     
     # 如果没有指定任何操作，默认初始化知识库
-    if not args.init and not args.query and not args.interactive:
+    # 监视模式先做一次增量更新，补上未运行期间的文件变化
+    if args.watch or (not args.init and not args.query and not args.interactive and not args.batch and not args.serve):
         args.init = True
     
+    if args.profile:
+        enable_profiling()
+    
+    # 嵌入后端：命令行或环境变量指定，否则沿用知识库记录的后端（强制重建时使用默认后端）
+    embedding_backend = args.embedding_backend
+    if embedding_backend is None and not args.force:
+        embedding_backend = stored_embedding_backend(vector_store_path)
+    backend_options = {}
+    if args.embedding_dim:
+        if embedding_backend and not is_remote_backend(embedding_backend):
+            backend_options["dimension"] = args.embedding_dim
+        else:
+            print("⚠️ --embedding-dim 只对本地嵌入模型生效，已忽略")
+    
+    watcher = None
     try:
         # 初始化知识库（如果需要）
         if args.init:
+            # 构建知识库的依赖（PDF 解析、文本分割）只在需要时导入，查询命令不加载
+            from dedup import make_dedup_config
+            from extraction_cache import ExtractionCache
+            from knowledge_base_manager import initialize_knowledge_base
+            from sharded_store import make_shard_config
+            from vector_index import make_index_config
+
             print("=" * 50)
             print("初始化知识库...")
             print("=" * 50)
-            knowledge_base = initialize_knowledge_base(dataset_path, vector_store_path, force_rebuild=args.force)
+            dedup_config = None if args.no_dedup else make_dedup_config(args.dedup_threshold)
+            cache_path = None if args.no_embedding_cache else args.embedding_cache
+            ingest_embeddings = create_embeddings(
+                cache_path,
+                batch_size=args.embed_batch_size,
+                max_workers=args.embed_workers,
+                requests_per_second=args.embed_rate,
+                backend=embedding_backend,
+                **backend_options
+            )
+            extraction_cache = None if args.no_extraction_cache else ExtractionCache(args.extraction_cache)
+            knowledge_base = initialize_knowledge_base(
+                dataset_path, vector_store_path, force_rebuild=args.force,
+                embeddings=ingest_embeddings,
+                workers=args.workers,
+                window_chars=args.ingest_window,
+                batch_size=args.ingest_batch,
+                index_config=make_index_config(
+                    args.index_type,
+                    compression=args.compression,
+                    nlist=args.nlist,
+                    nprobe=args.nprobe,
+                    m=args.hnsw_m,
+                    ef_search=args.ef_search,
+                    pq_m=args.pq_m,
+                    rerank=args.rerank
+                ),
+                shard_config=make_shard_config(args.shard_by, args.shard_size_mb) if args.shard_by else None,
+                shards_to_rebuild=args.rebuild_shard,
+                extraction_cache=extraction_cache,
+                dedup_config=dedup_config
+            )
             if knowledge_base is None:
                 print("❌ 知识库初始化失败")
                 return None
             print("✅ 知识库初始化完成")
         
+        # 查询模式下只创建一次查询引擎，后续问题复用已加载的知识库
+        engine = None
+        if args.query or args.interactive or args.batch or args.serve:
+            # 大模型客户端只在查询时导入，--init 不加载
+            from search_filter import make_search_filter
+            from user_query import QueryEngine, run_query_mode
+
+            search_filter = make_search_filter(args.doc, args.pages)
+            if search_filter is not None:
+                print(f"🔎 检索范围：{search_filter.describe()}")
+            engine = QueryEngine(
+                vector_store_path,
+                embeddings=create_embeddings(backend=args.embedding_backend) if args.embedding_backend else None,
+                mmap=not args.no_mmap,
+                search_params={"nprobe": args.nprobe, "ef_search": args.ef_search, "rerank": args.rerank},
+                query_cache_size=0 if args.no_query_cache else 1024,
+                query_cache_ttl=args.query_cache_ttl,
+                answer_cache_threshold=None if args.no_query_cache else args.answer_cache_threshold,
+                context_budget=args.context_budget,
+                search_workers=args.search_workers,
+                search_filter=search_filter
+            )
+        
+        # 监视数据集目录：单独使用时在前台运行，与查询模式同时使用时在后台线程中运行
+        if args.watch:
+            from dataset_watcher import DatasetWatcher
+
+            watcher = DatasetWatcher(
+                dataset_path, vector_store_path, engine=engine,
+                debounce=args.watch_debounce,
+                mode=args.watch_mode,
+                poll_interval=args.poll_interval,
+                ingest_options={
+                    "embeddings": ingest_embeddings,
+                    "workers": args.workers,
+                    "window_chars": args.ingest_window,
+                    "batch_size": args.ingest_batch,
+                    "extraction_cache": extraction_cache,
+                    "dedup_config": dedup_config
+                }
+            )
+            if engine is None:
+                try:
+                    watcher.run()
+                except KeyboardInterrupt:
+                    print("\n已停止监视")
+                return True
+            watcher.start()
+        
+        # 批量问答
+        if args.batch:
+            from batch_query import run_batch
+
+            print(f"\n批量问答：{args.batch} → {args.output}")
+            stats = run_batch(
+                engine, args.batch, args.output,
+                batch_size=args.query_batch_size,
+                max_concurrency=args.llm_concurrency
+            )
+            print(f"✅ 完成 {stats['total']} 个问题：成功 {stats['succeeded']} 个，失败 {stats['failed']} 个，"
+                  f"耗时 {stats['seconds']:.1f}s")
+            return stats["failed"] == 0
+        
+        # HTTP 查询服务
+        if args.serve:
+            from query_service import run_server
+
+            run_server(
+                engine, args.host, args.port,
+                batch_window_ms=args.batch_window_ms,
+                max_batch=args.query_batch_size,
+                llm_concurrency=args.llm_concurrency
+            )
+            return True
+        
         # 执行单次查询
         if args.query:
-            success = run_query_mode(args.query, vector_store_path)
+            success = run_query_mode(args.query, vector_store_path, engine=engine, stream=not args.no_stream)
             return success
         
         # 交互式查询模式
@@ -104,10 +573,12 @@ def main():
                         continue
                     
                     if query.lower() in ['quit', 'exit', '退出']:
+                        for line in engine.cache_summary():
+                            print(line)
                         print("\n感谢使用，再见！")
                         break
                     
-                    run_query_mode(query, vector_store_path)
+                    run_query_mode(query, vector_store_path, engine=engine, stream=not args.no_stream)
                     
                 except KeyboardInterrupt:
                     print("\n\n程序被用户中断")
@@ -126,6 +597,11 @@ def main():
     except Exception as e:
         print(f"❌ 错误：{e}")
         return None
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        if args.profile:
+            report_profile(args.profile_output)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,185 @@
+"""
+查询缓存模块
+第一级：规范化查询文本 → 查询向量的 LRU/TTL 缓存，重复问题不再调用嵌入模型；
+第二级：语义答案缓存，新问题的向量与已回答问题的余弦相似度超过阈值时直接返回缓存的答案和来源。
+两级缓存都与知识库快照版本绑定，快照切换后自动清空
+"""
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+# 规范化时去掉的句末标点
+_TRAILING_PUNCTUATION = "？?。.!！~～ "
+
+
+def normalize_query(query: str) -> str:
+    """
+    规范化查询文本：全角转半角（NFKC）、合并空白、转小写、去掉句末标点
+
+    参数:
+        query: 原始查询文本
+
+    返回:
+        规范化后的文本
+    """
+    text = unicodedata.normalize("NFKC", query)
+    text = re.sub(r"\s+", " ", text).strip().lower()
+    return text.rstrip(_TRAILING_PUNCTUATION)
+
+
+class CacheStats:
+    """缓存命中计数和命中/未命中两条路径的累计耗时"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.hit_seconds = 0.0
+        self.miss_seconds = 0.0
+
+    def record(self, hit: bool, seconds: float):
+        if hit:
+            self.hits += 1
+            self.hit_seconds += seconds
+        else:
+            self.misses += 1
+            self.miss_seconds += seconds
+
+    def summary(self, name: str) -> str:
+        """返回命中率和平均延迟"""
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        hit_ms = self.hit_seconds / self.hits * 1000 if self.hits else 0.0
+        miss_ms = self.miss_seconds / self.misses * 1000 if self.misses else 0.0
+        return (f"{name}：命中 {self.hits} 次，未命中 {self.misses} 次（命中率 {rate:.1f}%），"
+                f"平均延迟 命中 {hit_ms:.1f}ms / 未命中 {miss_ms:.1f}ms")
+
+
+class QueryEmbeddingCache:
+    """
+    规范化查询文本到查询向量的 LRU 缓存，条目超过 ttl 秒后失效
+
+    参数:
+        max_entries: 最多缓存的查询数
+        ttl: 条目有效期（秒），None 表示不过期
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, query: str) -> Optional[List[float]]:
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, vector = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return vector
+
+    def put(self, query: str, vector: List[float]):
+        key = normalize_query(query)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SemanticAnswerCache:
+    """
+    语义答案缓存：按余弦相似度查找已回答过的相近问题
+
+    条目数量较少（默认最多 256 条），每次查找对全部缓存向量做一次矩阵乘法即可，无需建索引
+
+    参数:
+        threshold: 余弦相似度阈值，达到该值才视为同一问题
+        max_entries: 最多缓存的答案数，超出时淘汰最久未命中的条目
+        ttl: 条目有效期（秒），None 表示不过期
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 256, ttl: Optional[float] = None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._vectors = []
+        self._entries = []  # (写入时间, 答案, 文档块列表, 检索范围)，与 _vectors 一一对应
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, vector, scope=None):
+        """
+        查找相近问题的答案
+
+        参数:
+            vector: 新问题的查询向量
+            scope: 检索范围（过滤条件的标识），只匹配在相同范围内回答的问题
+
+        返回:
+            (答案, 文档块列表)，没有足够相近的问题时返回None
+        """
+        with self._lock:
+            if self.ttl is not None:
+                self._expire()
+            if not self._vectors:
+                return None
+            similarities = np.stack(self._vectors) @ self._unit(vector)
+            # 其他检索范围内的回答不参与匹配
+            other_scope = np.array([entry[3] != scope for entry in self._entries])
+            similarities[other_scope] = -np.inf
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            # 命中的条目移到末尾，淘汰时从头部开始
+            self._vectors.append(self._vectors.pop(best))
+            self._entries.append(self._entries.pop(best))
+            _, answer, docs, _ = self._entries[-1]
+            return answer, docs
+
+    def put(self, vector, answer, docs: list, scope=None):
+        with self._lock:
+            self._vectors.append(self._unit(vector))
+            self._entries.append((time.monotonic(), answer, docs, scope))
+            if len(self._vectors) > self.max_entries:
+                del self._vectors[0]
+                del self._entries[0]
+
+    def _expire(self):
+        """移除过期条目（调用方需持有锁）"""
+        now = time.monotonic()
+        alive = [i for i, entry in enumerate(self._entries) if now - entry[0] <= self.ttl]
+        if len(alive) != len(self._entries):
+            self._vectors = [self._vectors[i] for i in alive]
+            self._entries = [self._entries[i] for i in alive]
+
+    def clear(self):
+        with self._lock:
+            self._vectors = []
+            self._entries = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,474 @@
+"""
+HTTP 查询服务模块
+常驻进程内提供基于 asyncio 的本地 HTTP 问答接口（只使用标准库）：
+- 同一时间窗口内到达的问题合并为一个微批，用一次嵌入请求计算查询向量、用一次多查询 FAISS 搜索检索文档块
+- 规范化后相同且检索范围相同的问题在处理期间只处理一次，共享同一次大模型调用的结果
+- 大模型请求在固定大小的线程池中执行，DashScope SDK 共享的 HTTP 会话按并发数保留长连接
+
+接口：
+    POST /query  请求体 {"query": "...", "doc": "劳动法", "pages": "1-5"}（doc / pages 可选）
+    GET  /health 服务状态和知识库快照版本
+    GET  /stats  请求数、微批大小、合并的重复问题数等统计
+"""
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+from batch_query import embed_group
+from instrumentation import count, span
+from query_cache import normalize_query
+from search_filter import make_search_filter
+from settings import DEFAULT_BATCH_WINDOW_MS, DEFAULT_HOST, DEFAULT_PORT
+
+# 请求头行数和请求体大小上限
+MAX_HEADER_LINES = 100
+MAX_BODY_BYTES = 1 << 20
+
+
+class HttpError(Exception):
+    """请求格式错误，按 status 返回给客户端"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def configure_http_pool(max_connections: int) -> bool:
+    """
+    按并发数扩大 DashScope SDK 共享 HTTP 会话的连接池
+
+    SDK 的大模型和嵌入请求共用一个 requests 会话，默认每个主机只保留 10 个长连接，
+    并发请求超过时多出的连接用完即关闭，下次请求要重新建立 TCP / TLS 连接
+
+    参数:
+        max_connections: 每个主机保留的长连接数
+
+    返回:
+        是否已配置（未安装 DashScope 或 SDK 版本没有共享会话时返回False）
+    """
+    try:
+        from dashscope.api_entities import http_request
+    except ImportError:
+        return False
+    get_session = getattr(http_request, "_get_shared_sync_session", None)
+    if get_session is None:
+        return False
+    session = get_session()
+    # 沿用 SDK 自己的适配器类型（开启了 TCP keepalive），只调整连接池大小
+    adapter = type(session.get_adapter("https://"))(pool_maxsize=max_connections)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return True
+
+
+def close_http_pool():
+    """关闭 DashScope SDK 共享 HTTP 会话中的长连接"""
+    try:
+        import dashscope
+    except ImportError:
+        return
+    close = getattr(dashscope, "close_shared_sync_session", None)
+    if close is not None:
+        close()
+
+
+async def read_request(reader: asyncio.StreamReader):
+    """
+    读取一个 HTTP/1.x 请求
+
+    返回:
+        (method, path, headers, body)，连接已关闭时返回None
+
+    异常:
+        HttpError: 请求行、请求头或请求体不合法
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    parts = line.decode("latin-1").split()
+    if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+        raise HttpError(400, "请求行格式错误")
+    method, target, version = parts
+
+    headers = {"_version": version}
+    for _ in range(MAX_HEADER_LINES):
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise HttpError(431, "请求头过多")
+
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HttpError(400, "Content-Length 不是整数")
+    if length < 0 or length > MAX_BODY_BYTES:
+        raise HttpError(413, f"请求体超过 {MAX_BODY_BYTES} 字节")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target.split("?", 1)[0], headers, body
+
+
+def keep_alive(headers: dict) -> bool:
+    """HTTP/1.1 默认保持连接，HTTP/1.0 需要显式的 Connection: keep-alive"""
+    connection = headers.get("connection", "").lower()
+    if headers.get("_version") == "HTTP/1.0":
+        return connection == "keep-alive"
+    return connection != "close"
+
+
+def encode_response(status: int, payload: dict, alive: bool = True) -> bytes:
+    """将 JSON 响应编码为 HTTP/1.1 报文"""
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if alive else 'close'}\r\n"
+        "\r\n"
+    )
+    return head.encode("latin-1") + body
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+class QueryService:
+    """
+    常驻查询服务：微批检索、合并重复问题、并发调用大模型
+
+    参数:
+        engine: QueryEngine 实例（知识库、嵌入模型、大模型和两级缓存都常驻内存）
+        batch_window: 微批的收集窗口（秒）：第一个问题到达后最多再等待这么久，收集同时到达的问题
+        max_batch: 每个微批的最大问题数
+        llm_concurrency: 同时进行的大模型请求数上限
+        coalesce: 是否合并处理中的重复问题
+    """
+
+    def __init__(self, engine, batch_window: float = DEFAULT_BATCH_WINDOW_MS / 1000, max_batch: int = 64,
+                 llm_concurrency: int = 8, coalesce: bool = True):
+        self.engine = engine
+        self.batch_window = max(0.0, batch_window)
+        self.max_batch = max(1, max_batch)
+        self.llm_concurrency = max(1, llm_concurrency)
+        self.coalesce = coalesce
+        self.stats = {
+            "requests": 0, "coalesced": 0, "batches": 0, "batched_queries": 0, "max_batch_size": 0,
+            "cache_hits": 0, "llm_calls": 0, "errors": 0,
+        }
+        self._inflight = {}  # (规范化问题, 检索范围) → 正在处理的 Future
+        self._queue = None
+        self._batcher = None
+        # 嵌入和检索按微批依次在一个线程中执行；大模型请求在固定大小的线程池中并发执行
+        self._search_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query-search")
+        self._llm_executor = ThreadPoolExecutor(max_workers=self.llm_concurrency, thread_name_prefix="query-llm")
+        self._tasks = set()
+
+    async def start(self):
+        """启动微批处理任务（需要在事件循环中调用）"""
+        if self._batcher is None:
+            self._queue = asyncio.Queue()
+            self._batcher = asyncio.create_task(self._run_batches())
+            configure_http_pool(self.llm_concurrency + 1)
+
+    async def close(self):
+        """停止微批处理，未完成的问题返回错误，并释放线程池和长连接"""
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+            self._batcher = None
+            while not self._queue.empty():
+                _, _, future, _ = self._queue.get_nowait()
+                if not future.done():
+                    future.set_exception(RuntimeError("查询服务已停止"))
+        self._search_executor.shutdown(wait=False, cancel_futures=True)
+        self._llm_executor.shutdown(wait=False, cancel_futures=True)
+        close_http_pool()
+
+    async def answer(self, query: str, search_filter=None) -> dict:
+        """
+        回答一个问题：与同一时间窗口内的其他问题一起嵌入和检索，重复的问题共享同一个结果
+
+        参数:
+            query: 用户查询问题
+            search_filter: 可选，检索过滤条件，默认使用引擎的过滤条件
+
+        返回:
+            结果字典：query / answer / sources / cached / coalesced / batch_size / timings_ms
+
+        异常:
+            ValueError: 过滤条件下没有可检索的文档块
+            RuntimeError: 查询嵌入、检索或大模型调用失败
+        """
+        start = time.perf_counter()
+        self.stats["requests"] += 1
+        count("service_requests")
+        key = (normalize_query(query), self.engine.cache_scope(search_filter))
+
+        future = self._inflight.get(key) if self.coalesce else None
+        coalesced = future is not None
+        if coalesced:
+            self.stats["coalesced"] += 1
+            count("service_coalesced")
+        else:
+            future = asyncio.get_running_loop().create_future()
+            if self.coalesce:
+                self._inflight[key] = future
+                future.add_done_callback(lambda _: self._inflight.pop(key, None))
+            await self._queue.put((query, search_filter, future, start))
+
+        # 客户端断开只取消自己的等待，不影响共享同一结果的其他请求
+        try:
+            result = await asyncio.shield(future)
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        timings = dict(result["timings_ms"], total=_ms(time.perf_counter() - start))
+        return dict(result, coalesced=coalesced, timings_ms=timings)
+
+    async def _run_batches(self):
+        """不断从队列中取出问题组成微批：第一个问题到达后最多等待 batch_window 秒或凑满 max_batch 个"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self.stats["batches"] += 1
+            self.stats["batched_queries"] += len(batch)
+            self.stats["max_batch_size"] = max(self.stats["max_batch_size"], len(batch))
+            batch_start = time.perf_counter()
+            try:
+                outcomes, timings = await loop.run_in_executor(self._search_executor, self._search_batch, batch)
+            except Exception as e:
+                outcomes, timings = [RuntimeError(f"检索失败：{e}")] * len(batch), {}
+
+            for (query, search_filter, future, enqueued), outcome in zip(batch, outcomes):
+                if future.done():
+                    continue
+                item_timings = dict(timings, queue=_ms(batch_start - enqueued))
+                if isinstance(outcome, Exception):
+                    future.set_exception(outcome)
+                    continue
+                embedding, cached, docs = outcome
+                if cached is not None:
+                    self.stats["cache_hits"] += 1
+                    self.engine.answer_cache.stats.record(True, time.perf_counter() - enqueued)
+                    future.set_result(self._result(query, cached[0], cached[1], len(batch), item_timings, cached=True))
+                    continue
+                task = asyncio.create_task(
+                    self._generate(query, embedding, docs, self.engine.cache_scope(search_filter), future,
+                                   enqueued, len(batch), item_timings)
+                )
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    def _search_batch(self, batch: list):
+        """
+        在检索线程中处理一个微批：一次嵌入请求、查找语义答案缓存、每个检索范围一次多查询搜索
+
+        返回:
+            (outcomes, timings)：outcomes 与 batch 一一对应，为 (查询向量, 命中的缓存答案, 文档块) 或异常
+        """
+        engine = self.engine
+        engine.check_snapshot()
+        outcomes = [None] * len(batch)
+        with span("service.batch", queries=len(batch)):
+            embed_start = time.perf_counter()
+            vectors = embed_group(engine, [query for query, _, _, _ in batch])
+            search_start = time.perf_counter()
+
+            groups = {}  # 检索范围 → (过滤条件, 问题下标)
+            for i, ((_, search_filter, _, _), vector) in enumerate(zip(batch, vectors)):
+                if isinstance(vector, Exception):
+                    outcomes[i] = RuntimeError(f"查询嵌入失败：{vector}")
+                    continue
+                scope = engine.cache_scope(search_filter)
+                cached = engine.answer_cache.get(vector, scope) if engine.answer_cache is not None else None
+                if cached is not None:
+                    count("answer_cache_lookups", result="hit")
+                    outcomes[i] = (vector, cached, cached[1])
+                    continue
+                if engine.answer_cache is not None:
+                    count("answer_cache_lookups", result="miss")
+                groups.setdefault(scope, (engine.resolve_filter(search_filter), []))[1].append(i)
+
+            for search_filter, indices in groups.values():
+                try:
+                    results = engine.retrieve_many([vectors[i] for i in indices], search_filter)
+                except Exception as e:
+                    for i in indices:
+                        outcomes[i] = RuntimeError(f"检索失败：{e}")
+                    continue
+                for i, docs in zip(indices, results):
+                    if not docs and search_filter is not None:
+                        outcomes[i] = ValueError(f"检索范围内没有文档块（{search_filter.describe()}）")
+                    else:
+                        outcomes[i] = (vectors[i], None, docs)
+        done = time.perf_counter()
+        return outcomes, {"embed": _ms(search_start - embed_start), "search": _ms(done - search_start)}
+
+    def _invoke(self, prompt: str) -> str:
+        with span("query.llm"):
+            return self.engine.llm.invoke(prompt)
+
+    async def _generate(self, query, embedding, docs, scope, future, enqueued, batch_size, timings):
+        """构建上下文并在线程池中调用大模型，完成后写入语义答案缓存"""
+        engine = self.engine
+        context = engine.build_context(docs)
+        prompt = engine.build_prompt(query, context.text)
+        self.stats["llm_calls"] += 1
+        count("llm_calls")
+        count("prompt_chars", len(prompt))
+        llm_start = time.perf_counter()
+        try:
+            response_text = await asyncio.get_running_loop().run_in_executor(self._llm_executor, self._invoke, prompt)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(RuntimeError(f"大模型调用失败：{e}"))
+            return
+        timings["llm"] = _ms(time.perf_counter() - llm_start)
+        engine.remember(embedding, response_text, context.docs, enqueued, scope)
+        if not future.done():
+            future.set_result(self._result(query, response_text, context.docs, batch_size, timings))
+
+    def _result(self, query, answer, docs, batch_size, timings, cached=False) -> dict:
+        return {
+            "query": query,
+            "answer": answer,
+            "sources": self.engine.get_sources(docs),
+            "cached": cached,
+            "coalesced": False,
+            "batch_size": batch_size,
+            "timings_ms": timings,
+        }
+
+    def summary(self) -> dict:
+        """服务统计：请求数、微批数和平均大小、合并的重复问题数、缓存命中数、大模型调用数"""
+        stats = dict(self.stats)
+        stats["avg_batch_size"] = round(stats["batched_queries"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["in_flight"] = len(self._inflight)
+        return stats
+
+    async def handle(self, method: str, path: str, body: bytes) -> tuple:
+        """
+        处理一个请求
+
+        返回:
+            (HTTP 状态码, 响应 JSON 对象)
+        """
+        if path == "/health":
+            if method != "GET":
+                return 405, {"error": "只支持 GET"}
+            return 200, {"status": "ok", "snapshot": self.engine.cache_version}
+        if path == "/stats":
+            if method != "GET":
+                return 405, {"error": "只支持 GET"}
+            return 200, self.summary()
+        if path != "/query":
+            return 404, {"error": f"未知路径: {path}"}
+        if method != "POST":
+            return 405, {"error": "只支持 POST"}
+
+        try:
+            request = json.loads(body.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            return 400, {"error": f"请求体不是合法的 JSON：{e}"}
+        query = request.get("query") if isinstance(request, dict) else None
+        if not isinstance(query, str) or not query.strip():
+            return 400, {"error": "缺少 query 字段"}
+        try:
+            search_filter = make_search_filter(request.get("doc"), request.get("pages"))
+            return 200, await self.answer(query.strip(), search_filter)
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": str(e)}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个客户端连接，支持 HTTP/1.1 长连接上的连续请求"""
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HttpError as e:
+                    writer.write(encode_response(e.status, {"error": str(e)}, alive=False))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                alive = keep_alive(headers)
+                status, payload = await self.handle(method, path, body)
+                writer.write(encode_response(status, payload, alive))
+                await writer.drain()
+                if not alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start_server(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        """
+        启动微批处理并开始监听
+
+        返回:
+            asyncio.Server（port 为 0 时由系统分配端口，可从 server.sockets 读取）
+        """
+        await self.start()
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+
+def run_server(engine, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+               batch_window_ms: float = DEFAULT_BATCH_WINDOW_MS, max_batch: int = 64, llm_concurrency: int = 8):
+    """
+    运行查询服务直到 Ctrl+C，退出时打印服务统计和缓存命中情况
+
+    参数:
+        engine: QueryEngine 实例
+        host: 监听地址
+        port: 监听端口
+        batch_window_ms: 微批的收集窗口（毫秒）
+        max_batch: 每个微批的最大问题数
+        llm_concurrency: 同时进行的大模型请求数上限
+    """
+    service = QueryService(engine, batch_window_ms / 1000, max_batch, llm_concurrency)
+
+    async def serve():
+        server = await service.start_server(host, port)
+        bound_port = server.sockets[0].getsockname()[1]
+        print(f"🚀 查询服务已启动：http://{host}:{bound_port}（POST /query，GET /health，GET /stats）")
+        print(f"   微批窗口 {batch_window_ms:g}ms，每批最多 {service.max_batch} 个问题，大模型并发 {service.llm_concurrency}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await service.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("\n查询服务已停止")
+    stats = service.summary()
+    print(f"共 {stats['requests']} 个请求：{stats['batches']} 个微批（平均 {stats['avg_batch_size']} 个问题），"
+          f"合并重复问题 {stats['coalesced']} 个，大模型调用 {stats['llm_calls']} 次")
+    for line in engine.cache_summary():
+        print(line)
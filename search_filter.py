@@ -0,0 +1,197 @@
+"""
+检索过滤模块
+按来源文档和页码范围限定检索范围：根据文本块元数据建立“索引位置 → 文档 / 页码”对照表，
+把过滤条件转换为允许的索引位置，由 FAISS 在搜索时跳过其余向量（而不是多取结果后再过滤）
+"""
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from docstore import chunk_locations
+from vector_index import make_selector
+
+# 每个向量库缓存的过滤条件数量（允许的索引位置和选择器）
+FILTER_CACHE_SIZE = 32
+
+_PAGE_RANGE = re.compile(r"^\s*(\d+)\s*(?:-\s*(\d+)\s*)?$")
+
+_table_lock = threading.Lock()
+
+
+def parse_page_ranges(text: str) -> list:
+    """
+    解析页码范围，如 "3"、"1-5"、"1-5,8,10-12"
+
+    返回:
+        [(起始页, 结束页), ...]，两端都包含
+
+    异常:
+        ValueError: 格式错误或起始页大于结束页
+    """
+    ranges = []
+    for part in str(text).replace("，", ",").split(","):
+        if not part.strip():
+            continue
+        match = _PAGE_RANGE.match(part)
+        if match is None:
+            raise ValueError(f"无法解析页码范围: {part.strip()}（示例：1-5,8）")
+        first = int(match.group(1))
+        last = int(match.group(2) or first)
+        if first > last:
+            raise ValueError(f"页码范围的起始页大于结束页: {part.strip()}")
+        ranges.append((first, last))
+    if not ranges:
+        raise ValueError(f"页码范围为空: {text}")
+    return ranges
+
+
+class SearchFilter:
+    """
+    检索过滤条件
+
+    参数:
+        docs: 允许的来源文档，文件名或文件名的一部分（不区分大小写），如 ["劳动法"]；为空表示不限文档
+        pages: 允许的页码范围 [(起始页, 结束页), ...]；为空表示不限页码
+    """
+
+    def __init__(self, docs=None, pages=None):
+        self.docs = tuple(docs or ())
+        self.pages = tuple(tuple(page_range) for page_range in pages or ())
+
+    @property
+    def key(self) -> tuple:
+        """过滤条件的标识，用于缓存"""
+        return self.docs, self.pages
+
+    def match_source(self, source: str) -> bool:
+        """来源文档是否满足文档条件"""
+        if not self.docs:
+            return True
+        if not source:
+            return False
+        name = source.lower()
+        return any(doc.lower() in name for doc in self.docs)
+
+    def match_files(self, file_names: list) -> bool:
+        """文件列表中是否有满足文档条件的文件（用于跳过整个分片）"""
+        return any(self.match_source(file_name) for file_name in file_names)
+
+    def describe(self) -> str:
+        parts = []
+        if self.docs:
+            parts.append(f"文档：{'、'.join(self.docs)}")
+        if self.pages:
+            parts.append("页码：" + ",".join(f"{first}-{last}" if first != last else str(first) for first, last in self.pages))
+        return "；".join(parts)
+
+
+def make_search_filter(docs=None, pages=None):
+    """
+    生成检索过滤条件
+
+    参数:
+        docs: 文档名（字符串或列表），匹配文件名中包含该字符串的文档
+        pages: 页码范围，字符串（如 "1-5,8"）或 [(起始页, 结束页), ...]
+
+    返回:
+        SearchFilter，两个条件都为空时返回None
+    """
+    if isinstance(docs, str):
+        docs = [docs]
+    docs = [doc.strip() for doc in docs or () if doc and doc.strip()]
+    if isinstance(pages, str):
+        pages = parse_page_ranges(pages)
+    if not docs and not pages:
+        return None
+    return SearchFilter(docs, pages)
+
+
+class PositionTable:
+    """
+    向量库的“索引位置 → (来源文档编号, 页码)”对照表，并缓存各过滤条件对应的索引位置和 FAISS 选择器。
+    去重合并了多个出处的向量，其余出处记录在附加表中，任一出处满足过滤条件即可命中
+
+    参数:
+        knowledge_base: FAISS 向量库（来源和页码取自文档存储；旧版知识库从页码信息解析）
+    """
+
+    def __init__(self, knowledge_base):
+        self.size = knowledge_base.index.ntotal
+        self.codes = np.full(self.size, -1, dtype=np.int32)
+        self.page_numbers = np.full(self.size, -1, dtype=np.int32)
+        sources = {}
+        seen = np.zeros(self.size, dtype=bool)
+        extra = []  # 附加出处 (位置, 来源文档编号, 页码)
+        for position, source, page in chunk_locations(knowledge_base):
+            if position >= self.size:
+                continue
+            code = sources.setdefault(source, len(sources)) if source is not None else -1
+            page = page if isinstance(page, int) else -1
+            if seen[position]:
+                extra.append((position, code, page))
+                continue
+            seen[position] = True
+            self.codes[position] = code
+            self.page_numbers[position] = page
+        self.sources = list(sources)
+        extra = np.asarray(extra, dtype=np.int64).reshape(-1, 3)
+        self.extra_positions = extra[:, 0]
+        self.extra_codes = extra[:, 1].astype(np.int32)
+        self.extra_pages = extra[:, 2].astype(np.int32)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def select(self, search_filter: SearchFilter) -> tuple:
+        """
+        返回满足过滤条件的索引位置
+
+        返回:
+            (positions, selector)：升序的 int64 索引位置数组和对应的 PositionSelector（没有位置时为None），
+            调用方在搜索结束前持有 selector，缓存淘汰或对照表重建后位图仍然有效
+        """
+        key = search_filter.key
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+                return entry
+
+        matched = [code for code, source in enumerate(self.sources) if search_filter.match_source(source)]
+        mask = self._match(search_filter, matched, self.codes, self.page_numbers)
+        if len(self.extra_positions):
+            mask[self.extra_positions[self._match(search_filter, matched, self.extra_codes, self.extra_pages)]] = True
+        positions = np.flatnonzero(mask).astype(np.int64)
+        selector = make_selector(positions, self.size) if len(positions) else None
+
+        with self._lock:
+            self._cache[key] = (positions, selector)
+            while len(self._cache) > FILTER_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return positions, selector
+
+    @staticmethod
+    def _match(search_filter: SearchFilter, matched: list, codes: np.ndarray, page_numbers: np.ndarray) -> np.ndarray:
+        """同一个出处的来源和页码都满足过滤条件"""
+        mask = np.ones(len(codes), dtype=bool)
+        if search_filter.docs:
+            mask &= np.isin(codes, matched)
+        if search_filter.pages:
+            in_pages = np.zeros(len(codes), dtype=bool)
+            for first, last in search_filter.pages:
+                in_pages |= (page_numbers >= first) & (page_numbers <= last)
+            mask &= in_pages
+        return mask
+
+
+def position_table(knowledge_base) -> PositionTable:
+    """返回向量库的位置对照表（首次过滤时建立，向量数量变化后重建）"""
+    table = getattr(knowledge_base, "_position_table", None)
+    if table is None or table.size != knowledge_base.index.ntotal:
+        with _table_lock:
+            table = getattr(knowledge_base, "_position_table", None)
+            if table is None or table.size != knowledge_base.index.ntotal:
+                table = PositionTable(knowledge_base)
+                knowledge_base._position_table = table
+    return table
@@ -0,0 +1,38 @@
+"""
+默认配置模块
+命令行参数的可选值和默认值（索引类型、压缩方式、分片、嵌入后端、去重、查询服务、数据集监视），
+只使用标准库，main.py 解析参数和打印帮助时不需要加载 faiss、LangChain 等依赖；
+各功能模块从这里导入同名常量
+"""
+
+# 索引类型
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+
+# 向量压缩方式：不压缩、float16、8 位标量量化、乘积量化
+COMPRESSION_TYPES = ("none", "fp16", "sq8", "pq")
+
+# 分片方式：不分片、每个 PDF 一个分片、按文件大小阈值装箱
+SHARD_MODES = ("none", "file", "size")
+
+# 按大小分片时每个分片的默认 PDF 总大小上限（MB）
+DEFAULT_SHARD_MB = 64
+
+# 并行搜索分片的默认线程数
+DEFAULT_SEARCH_WORKERS = 4
+
+# 默认嵌入后端（全部后端在 embedding_backends.py 中注册）
+DEFAULT_EMBEDDING_BACKEND = "dashscope"
+
+# 默认只合并完全重复（规范化空白后相同）的文本块，保留的文本与被合并的文本一致；
+# 近似重复需要显式指定阈值（估计的 Jaccard 相似度，如 0.9），只差几个字符（例如条款中的数字）的文本块也会被合并
+DEFAULT_DEDUP_THRESHOLD = 1.0
+
+# 查询服务的默认监听地址、端口和微批等待时间
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+DEFAULT_BATCH_WINDOW_MS = 5.0
+
+# 数据集监视的默认平静时间、轮询间隔（秒）和监视方式
+DEFAULT_DEBOUNCE = 2.0
+DEFAULT_POLL_INTERVAL = 1.0
+WATCH_MODES = ("auto", "inotify", "poll")
@@ -0,0 +1,507 @@
+"""
+分片向量数据库模块
+按来源 PDF（每个文件一个分片）或按文件大小阈值（多个文件装入同一分片）把知识库拆分为多个独立的 FAISS 索引。
+每个分片是 shards/<分片名>/ 下的一个快照目录，顶层快照的 shards.json 记录每个分片当前使用的快照版本，
+切换顶层 CURRENT 指针即原子地切换整组分片；只有文件发生变化的分片需要重建。
+查询时分片按需加载，在线程池中并行搜索各分片并合并每个分片的 top-k 结果
+"""
+import heapq
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+import numpy as np
+
+from dedup import attach_duplicates, drop_origins
+from docstore import DOCSTORE_FILE, attach_docstore, fetch_documents, load_docstore, seed_deduplicator, write_docstore
+from data_process import create_embeddings, load_knowledge_base, load_snapshot, load_store_meta, stored_embedding_backend, write_knowledge_base_files
+from embedding_backends import check_embeddings, load_embedder_state
+from instrumentation import count, span
+from search_filter import position_table
+from settings import DEFAULT_SEARCH_WORKERS, DEFAULT_SHARD_MB, SHARD_MODES
+from snapshot_store import SNAPSHOTS_DIR, list_snapshots, resolve_snapshot, resolve_snapshot_path, write_snapshot
+from vector_index import filtered_search
+
+SHARDS_DIR = "shards"
+SHARD_MAP_FILE = "shards.json"
+
+
+def make_shard_config(mode: str = "file", max_mb: float = None) -> dict:
+    """
+    生成分片配置
+
+    参数:
+        mode: none 不分片（把分片知识库重建为单一索引）；file 每个 PDF 一个分片；
+              size 按 PDF 文件大小装箱，单个分片不超过 max_mb
+        max_mb: 按大小分片时每个分片的 PDF 总大小上限（MB），默认64；超过上限的单个文件独占一个分片
+
+    返回:
+        分片配置字典，例如 {"mode": "size", "max_bytes": 67108864}
+    """
+    mode = mode.lower()
+    if mode not in SHARD_MODES:
+        raise ValueError(f"不支持的分片方式: {mode}（可选：{', '.join(SHARD_MODES)}）")
+    if mode == "none":
+        return {"mode": "none"}
+    if mode == "file":
+        return {"mode": "file", "max_bytes": 0}
+    return {"mode": "size", "max_bytes": int((DEFAULT_SHARD_MB if max_mb is None else max_mb) * 2**20)}
+
+
+def describe_sharding(config: dict) -> str:
+    """返回分片配置的简短描述，用于打印"""
+    if config["mode"] == "file":
+        return "每个 PDF 一个分片"
+    return f"每个分片不超过 {config['max_bytes'] / 2**20:g} MB"
+
+
+def shard_path(store_path: str, name: str) -> str:
+    """分片的快照存储目录"""
+    return os.path.join(store_path, SHARDS_DIR, name)
+
+
+def shard_snapshot_path(store_path: str, name: str, version: str) -> str:
+    """分片某个快照版本所在的目录"""
+    return os.path.join(shard_path(store_path, name), SNAPSHOTS_DIR, version)
+
+
+def is_sharded_store(store_path: str) -> bool:
+    """当前快照是否为分片知识库"""
+    snapshot_path = resolve_snapshot_path(store_path)
+    return snapshot_path is not None and os.path.exists(os.path.join(snapshot_path, SHARD_MAP_FILE))
+
+
+def new_shard_map(config: dict, store_path: str = None) -> dict:
+    """
+    创建空的分片表
+
+    格式为 {"config": 分片配置, "next_shard": int,
+            "shards": {分片名: {"version": 快照版本, "files": [文件名, ...], "bytes": int, "vectors": int,
+                               "duplicate_files": [出处合并进该分片的其他分片的文件名, ...]}}}
+
+    参数:
+        config: 分片配置
+        store_path: 可选，向量数据库路径。重建时分片编号接在已有分片目录之后，
+                    不改写仍被旧快照引用的分片
+    """
+    next_shard = 0
+    shards_root = os.path.join(store_path, SHARDS_DIR) if store_path else None
+    if shards_root and os.path.isdir(shards_root):
+        numbers = [int(name[6:]) for name in os.listdir(shards_root) if name.startswith("shard-") and name[6:].isdigit()]
+        next_shard = max(numbers, default=-1) + 1
+    return {"config": config, "next_shard": next_shard, "shards": {}}
+
+
+def allocate_shard(shard_map: dict) -> str:
+    """分配新的分片名（按创建顺序编号，删除后不复用）"""
+    name = f"shard-{shard_map['next_shard']:05d}"
+    shard_map["next_shard"] += 1
+    shard_map["shards"][name] = {"version": None, "files": [], "bytes": 0, "vectors": 0}
+    return name
+
+
+def assign_files(shard_map: dict, file_sizes: dict) -> set:
+    """
+    将文件分配到分片：每个 PDF 一个分片时为每个文件新建分片；
+    按大小分片时优先装入最近创建且仍有余量的分片，否则新建分片
+
+    参数:
+        shard_map: 分片表（会被修改）
+        file_sizes: {文件名: 文件字节数}，按字典顺序分配
+
+    返回:
+        被修改（需要重建）的分片名集合
+    """
+    max_bytes = shard_map["config"]["max_bytes"]
+    touched = set()
+    for file_name, size in file_sizes.items():
+        target = None
+        if max_bytes and shard_map["shards"]:
+            last = list(shard_map["shards"])[-1]
+            if shard_map["shards"][last]["bytes"] + size <= max_bytes:
+                target = last
+        if target is None:
+            target = allocate_shard(shard_map)
+        shard_map["shards"][target]["files"].append(file_name)
+        shard_map["shards"][target]["bytes"] += size
+        touched.add(target)
+    return touched
+
+
+def remove_files(shard_map: dict, file_sizes: dict) -> set:
+    """
+    从分片表中移除文件
+
+    参数:
+        shard_map: 分片表（会被修改）
+        file_sizes: {文件名: 原来的文件字节数}
+
+    返回:
+        被修改（需要重建）的分片名集合
+    """
+    touched = set()
+    for name, shard in shard_map["shards"].items():
+        for file_name in [f for f in shard["files"] if f in file_sizes]:
+            shard["files"].remove(file_name)
+            shard["bytes"] -= max(file_sizes[file_name], 0)
+            touched.add(name)
+    return touched
+
+
+def write_shard(knowledge_base, store_path: str, name: str) -> str:
+    """
+    将一个分片写入新的快照（不修改顶层 CURRENT，读取方仍使用顶层快照记录的旧版本）
+
+    返回:
+        分片的新快照版本
+    """
+    with span("store.write_shard", shard=name), write_snapshot(shard_path(store_path, name)) as snapshot_dir:
+        write_knowledge_base_files(knowledge_base, snapshot_dir, embedder_state=False)
+    version = snapshot_dir.version
+    attach_docstore(knowledge_base, shard_snapshot_path(store_path, name, version))
+    return version
+
+
+class _ShardDocuments:
+    """分片快照中的文档存储（不加载向量索引），只修改文本块出处时使用"""
+
+    def __init__(self, snapshot_path: str, deduplicator=None):
+        self.docstore, self.index_to_docstore_id = load_docstore(snapshot_path)
+        self.deduplicator = deduplicator
+
+
+def shard_ids(store_path: str, name: str, shard: dict) -> list:
+    """分片当前快照中的向量ID列表（不读取文本）"""
+    documents = _ShardDocuments(shard_snapshot_path(store_path, name, shard["version"]))
+    documents.docstore.close()
+    return list(documents.index_to_docstore_id.values())
+
+
+def seed_shard(store_path: str, name: str, shard: dict, deduplicator):
+    """把分片中已有的文本块登记到去重器（读取文档存储中保存的哈希和签名）"""
+    documents = _ShardDocuments(shard_snapshot_path(store_path, name, shard["version"]))
+    try:
+        seed_deduplicator(documents, deduplicator)
+    finally:
+        documents.docstore.close()
+
+
+def update_shard_origins(store_path: str, name: str, shard: dict, duplicates: dict = None, drop_ids: list = (),
+                         drop_sources: set = frozenset(), deduplicator=None, in_place: bool = False):
+    """
+    只修改分片中文本块的出处（向量索引不变）：移除指定来源文件的出处，再把其他分片中重复文本块的出处
+    写入分片中的代表文本块；shard["duplicate_files"] 同步记录出处合并进该分片的其他分片的文件
+
+    参数:
+        store_path: 向量数据库路径
+        name: 分片名
+        shard: 分片表中的分片条目（会更新 version 和 duplicate_files）
+        duplicates: {代表文本块的向量ID: [出处, ...]}
+        drop_ids: 要移除出处的向量ID
+        drop_sources: 要移除的来源文件名集合
+        deduplicator: 可选，去重器（写入重新计算过的签名）
+        in_place: 为 True 时直接替换分片当前快照中的文档存储，只用于本次更新刚写入、
+                  还没有被任何顶层快照引用的分片快照；否则写入分片的新快照（复制索引文件）
+    """
+    duplicates = duplicates or {}
+    snapshot_path = shard_snapshot_path(store_path, name, shard["version"])
+    documents = _ShardDocuments(snapshot_path, deduplicator)
+    try:
+        if drop_ids:
+            drop_origins(documents, drop_ids, set(drop_sources))
+        attach_duplicates(documents, duplicates)
+        if in_place:
+            tmp_path = os.path.join(snapshot_path, DOCSTORE_FILE + ".tmp")
+            write_docstore(documents, tmp_path)
+            documents.docstore.close()
+            os.replace(tmp_path, os.path.join(snapshot_path, DOCSTORE_FILE))
+        else:
+            with span("store.write_shard", shard=name), write_snapshot(shard_path(store_path, name)) as snapshot_dir:
+                for entry in os.scandir(snapshot_path):
+                    if entry.is_file() and entry.name != DOCSTORE_FILE:
+                        shutil.copy2(entry.path, snapshot_dir)
+                write_docstore(documents, os.path.join(snapshot_dir, DOCSTORE_FILE))
+            shard["version"] = snapshot_dir.version
+    finally:
+        documents.docstore.close()
+    sources = {item["source"] for origins in duplicates.values() for item in origins}
+    shard["duplicate_files"] = sorted((set(shard.get("duplicate_files", ())) - set(drop_sources)) | sources)
+
+
+def write_shard_map(directory: str, shard_map: dict, store_meta: dict):
+    """将分片表和顶层构建参数写入顶层快照目录"""
+    with open(os.path.join(directory, SHARD_MAP_FILE), "w", encoding="utf-8") as f:
+        json.dump(shard_map, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(directory, "store_meta.json"), "w", encoding="utf-8") as f:
+        json.dump(store_meta, f, ensure_ascii=False, indent=2)
+
+
+def load_shard_map(snapshot_path: str) -> dict:
+    """读取顶层快照中的分片表"""
+    with open(os.path.join(snapshot_path, SHARD_MAP_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def cleanup_shards(store_path: str):
+    """删除保留的顶层快照都不再引用的分片目录（如文件全部删除后的分片、改为不分片后的旧分片）"""
+    shards_root = os.path.join(store_path, SHARDS_DIR)
+    if not os.path.isdir(shards_root):
+        return
+    referenced = set()
+    for version in list_snapshots(store_path):
+        snapshot_path = os.path.join(store_path, SNAPSHOTS_DIR, version)
+        if os.path.exists(os.path.join(snapshot_path, SHARD_MAP_FILE)):
+            referenced.update(load_shard_map(snapshot_path)["shards"])
+    for name in os.listdir(shards_root):
+        if name not in referenced:
+            shutil.rmtree(os.path.join(shards_root, name), ignore_errors=True)
+
+
+class ShardedKnowledgeBase:
+    """
+    分片知识库的只读查询视图
+
+    打开时只读取分片表；每个分片在第一次被搜索时才加载（可以内存映射方式打开）。
+    搜索时在线程池中并行搜索各分片（FAISS 搜索期间释放 GIL），再按距离合并各分片的 top-k 结果。
+    提供与 FAISS 向量库相同的 similarity_search_by_vector，查询引擎无需区分
+
+    参数:
+        store_path: 向量数据库路径
+        embeddings: 嵌入模型（已加载本地模型的拟合结果）
+        mmap: 是否以内存映射方式只读打开分片索引
+        search_params: 可选，覆盖构建时保存的搜索参数
+        search_workers: 并行搜索分片的线程数，1 表示依次搜索
+    """
+
+    def __init__(self, store_path: str, embeddings, mmap: bool = True, search_params: dict = None, search_workers: int = DEFAULT_SEARCH_WORKERS):
+        # 版本和快照目录来自同一次读取 CURRENT，并发发布时不会把两个版本混在一起
+        self.snapshot_version, self.snapshot_path = resolve_snapshot(store_path)
+        self.store_path = store_path
+        self.embedding_function = embeddings
+        self.store_meta = load_store_meta(self.snapshot_path)
+        self.shard_map = load_shard_map(self.snapshot_path)
+        self.read_only = True
+        self.mmap = mmap
+        self.search_params = search_params
+        self.shards = {name: shard for name, shard in self.shard_map["shards"].items() if shard["version"]}
+        self._loaded = {}
+        self._locks = {name: threading.Lock() for name in self.shards}
+        workers = min(search_workers, len(self.shards))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shard-search") if workers > 1 else None
+
+    @property
+    def loaded_shards(self) -> int:
+        return len(self._loaded)
+
+    def shard(self, name: str):
+        """返回分片的向量库，第一次访问时加载"""
+        knowledge_base = self._loaded.get(name)
+        if knowledge_base is not None:
+            return knowledge_base
+        with self._locks[name]:
+            if name not in self._loaded:
+                path = shard_snapshot_path(self.store_path, name, self.shards[name]["version"])
+                with span("load.shard", shard=name, mmap=self.mmap):
+                    self._loaded[name] = load_snapshot(
+                        path, self.embedding_function, mmap=self.mmap, search_params=self.search_params,
+                        embedder_state=False, verbose=False
+                    )
+                count("shards_loaded")
+            return self._loaded[name]
+
+    def adopt_shards(self, previous) -> int:
+        """
+        沿用上一个知识库视图中已加载且版本未变的分片（重新打开快照时只需加载有变化的分片）
+
+        参数:
+            previous: 切换前的 ShardedKnowledgeBase
+
+        返回:
+            沿用的分片数
+        """
+        adopted = 0
+        for name, knowledge_base in list(getattr(previous, "_loaded", {}).items()):
+            shard = self.shards.get(name)
+            if shard is None or previous.shards.get(name, {}).get("version") != shard["version"]:
+                continue
+            with self._locks[name]:
+                if name not in self._loaded:
+                    self._loaded[name] = knowledge_base
+                    adopted += 1
+        return adopted
+
+    def _search_shard(self, name: str, matrix: np.ndarray, k: int, search_filter=None) -> list:
+        """搜索一个分片，返回每个查询的 [(距离, 分片名, 索引位置), ...]（此时还不读取文本）"""
+        knowledge_base = self.shard(name)
+        with span("query.search.shard", shard=name):
+            distances, indices = search_positions(knowledge_base, matrix, k, search_filter)
+        return [[(float(distance), name, int(position)) for distance, position in zip(row_distances, row) if position != -1]
+                for row_distances, row in zip(distances, indices)]
+
+    def search_with_scores(self, matrix: np.ndarray, k: int, shard_names: list = None, search_filter=None) -> list:
+        """
+        并行搜索各分片，按距离合并为每个查询的 top-k
+
+        参数:
+            matrix: 查询向量矩阵（每行一个查询）
+            k: 每个查询返回的结果数量
+            shard_names: 可选，只搜索这些分片
+            search_filter: 可选，检索过滤条件；不包含任何匹配文档的分片直接跳过，不加载也不搜索
+
+        返回:
+            与查询一一对应的 [(距离, 文档块), ...] 列表，按相关度排列
+        """
+        names = list(self.shards) if shard_names is None else shard_names
+        if search_filter is not None and search_filter.docs:
+            # 分片中的文本块也可能是其他分片中文件的重复文本块的代表
+            names = [name for name in names
+                     if search_filter.match_files(self.shards[name]["files"] + self.shards[name].get("duplicate_files", []))]
+        if not names:
+            return [[] for _ in range(len(matrix))]
+        if self._executor is None or len(names) == 1:
+            partials = [self._search_shard(name, matrix, k, search_filter) for name in names]
+        else:
+            partials = list(self._executor.map(lambda name: self._search_shard(name, matrix, k, search_filter), names))
+        count("shards_searched", len(names))
+
+        # 内积越大越相关，L2 距离越小越相关
+        largest = self.shard(names[0]).index.metric_type == faiss.METRIC_INNER_PRODUCT
+        select = heapq.nlargest if largest else heapq.nsmallest
+        merged = [select(k, (hit for partial in partials for hit in partial[row]), key=lambda hit: hit[0])
+                  for row in range(len(matrix))]
+
+        # 合并后只为最终的 top-k 读取文本，每个分片一次批量读取
+        by_shard = {}
+        for hits in merged:
+            for _, name, position in hits:
+                by_shard.setdefault(name, set()).add(position)
+        docs = {}
+        for name, positions in by_shard.items():
+            positions = sorted(positions)
+            for position, doc in zip(positions, fetch_documents(self.shard(name), positions)):
+                docs[name, position] = doc
+        return [[(distance, docs[name, position]) for distance, name, position in hits if docs[name, position] is not None]
+                for hits in merged]
+
+    def similarity_search_by_vector(self, embedding: list, k: int = 4, **kwargs) -> list:
+        """与 FAISS.similarity_search_by_vector 相同：返回与查询向量最相关的 k 个文档块"""
+        matrix = np.asarray([embedding], dtype=np.float32)
+        return [doc for _, doc in self.search_with_scores(matrix, k)[0]]
+
+    def close(self):
+        """关闭搜索线程池和已加载分片的文档存储"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        for knowledge_base in list(self._loaded.values()):
+            close = getattr(knowledge_base.docstore, "close", None)
+            if close is not None:
+                close()
+
+
+def search_positions(knowledge_base, matrix: np.ndarray, k: int, search_filter=None):
+    """
+    用一次多查询 FAISS 搜索检索单个向量库，只返回距离和索引位置
+
+    参数:
+        knowledge_base: FAISS 向量库
+        matrix: 查询向量矩阵
+        k: 每个查询返回的结果数量
+        search_filter: 可选，检索过滤条件，在索引搜索时只考虑满足条件的向量
+
+    返回:
+        (distances, indices)，与 faiss.Index.search 相同，不足 k 个时位置为 -1
+    """
+    if getattr(knowledge_base, "_normalize_L2", False):
+        matrix = matrix.copy()
+        faiss.normalize_L2(matrix)
+    if search_filter is not None:
+        # 持有 selector 直到搜索结束：其他线程淘汰过滤缓存或重建对照表时，位图不会被释放
+        positions, selector = position_table(knowledge_base).select(search_filter)
+        count("filtered_candidates", len(positions))
+        distances, indices = filtered_search(
+            knowledge_base.index, matrix, k, positions, selector, getattr(knowledge_base, "exact_vectors", None)
+        )
+    else:
+        distances, indices = knowledge_base.index.search(matrix, k)
+    return distances, indices
+
+
+def search_store(knowledge_base, matrix: np.ndarray, k: int, search_filter=None) -> list:
+    """
+    检索单个向量库，并一次批量读取全部命中文本块
+
+    参数:
+        knowledge_base: FAISS 向量库
+        matrix: 查询向量矩阵
+        k: 每个查询返回的结果数量
+        search_filter: 可选，检索过滤条件
+
+    返回:
+        与查询一一对应的 [(距离, 文档块), ...] 列表
+    """
+    distances, indices = search_positions(knowledge_base, matrix, k, search_filter)
+    positions = sorted({int(position) for row in indices for position in row if position != -1})
+    docs = dict(zip(positions, fetch_documents(knowledge_base, positions)))
+    return [
+        [(float(distance), docs[position]) for distance, position in zip(row_distances, row)
+         if position != -1 and docs[position] is not None]
+        for row_distances, row in zip(distances, indices)
+    ]
+
+
+def search_many(knowledge_base, vectors: list, k: int, search_filter=None) -> list:
+    """
+    检索多个查询向量的文档块（单个向量库或分片知识库）
+
+    参数:
+        knowledge_base: FAISS 向量库或 ShardedKnowledgeBase
+        vectors: 查询向量列表
+        k: 每个查询返回的文档块数量
+        search_filter: 可选，检索过滤条件（见 search_filter.make_search_filter）
+
+    返回:
+        与 vectors 一一对应的文档块列表
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if isinstance(knowledge_base, ShardedKnowledgeBase):
+        results = knowledge_base.search_with_scores(matrix, k, search_filter=search_filter)
+    else:
+        results = search_store(knowledge_base, matrix, k, search_filter)
+    return [[doc for _, doc in hits] for hits in results]
+
+
+def load_vector_store(load_path: str, embeddings=None, mmap: bool = False, search_params: dict = None, search_workers: int = DEFAULT_SEARCH_WORKERS,
+                      verbose: bool = True):
+    """
+    打开向量数据库：分片知识库返回 ShardedKnowledgeBase（分片按需加载），否则与 load_knowledge_base 相同
+
+    参数:
+        load_path: 向量数据库路径
+        embeddings: 可选，嵌入模型。如果为None，按快照记录的嵌入后端创建
+        mmap: 是否以内存映射方式只读打开向量索引
+        search_params: 可选，覆盖构建时保存的搜索参数
+        search_workers: 并行搜索分片的线程数
+        verbose: 是否打印加载信息
+
+    返回:
+        FAISS 向量库或 ShardedKnowledgeBase
+    """
+    if not is_sharded_store(load_path):
+        return load_knowledge_base(load_path, embeddings, mmap=mmap, search_params=search_params, verbose=verbose)
+    with span("load", mmap=mmap, sharded=True):
+        knowledge_base = ShardedKnowledgeBase(load_path, embeddings, mmap=mmap, search_params=search_params, search_workers=search_workers)
+        # 嵌入模型按分片知识库打开的那个快照检查和加载
+        if embeddings is None:
+            embeddings = knowledge_base.embedding_function = create_embeddings(backend=stored_embedding_backend(load_path))
+        check_embeddings(knowledge_base.store_meta.get("embedding"), embeddings)
+        load_embedder_state(embeddings, knowledge_base.snapshot_path)
+    if not verbose:
+        return knowledge_base
+    vectors = sum(shard["vectors"] for shard in knowledge_base.shards.values())
+    print(f"分片向量数据库已从 {load_path} 打开（{len(knowledge_base.shards)} 个分片，共 {vectors} 个向量，"
+          f"{describe_sharding(knowledge_base.shard_map['config'])}；首次检索时按需加载）。")
+    return knowledge_base
@@ -0,0 +1,201 @@
+"""
+向量数据库快照模块
+每次保存都写入一个新的版本化快照目录，再原子替换 CURRENT 指针文件切换版本，
+保存中途崩溃不会留下不一致的数据库，读取方始终看到完整的快照；
+多个进程（例如监视模式的后台更新和手动 --init）同时发布时，用数据库目录下的文件锁串行化版本分配和指针切换
+"""
+import os
+import re
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+CURRENT_FILE = "CURRENT"
+SNAPSHOTS_DIR = "snapshots"
+LOCK_FILE = ".lock"
+# 保留的历史快照数量（正在读取旧快照的进程不受影响）
+KEEP_SNAPSHOTS = 3
+# 旧版本直接保存在数据库根目录下的文件
+LEGACY_FILES = ("index.faiss", "index.pkl", "page_info.pkl", "manifest.json", "processed_files.pkl")
+
+_VERSION_PATTERN = re.compile(r"^v(\d+)$")
+
+
+def current_version(store_path: str) -> str:
+    """
+    读取 CURRENT 指针指向的快照版本
+
+    返回:
+        快照版本名（如 "v000003"），不存在时返回None
+    """
+    current_path = os.path.join(store_path, CURRENT_FILE)
+    if not os.path.exists(current_path):
+        return None
+    with open(current_path, "r", encoding="utf-8") as f:
+        return f.read().strip() or None
+
+
+def resolve_snapshot(store_path: str) -> tuple:
+    """
+    只读取一次 CURRENT 指针，返回当前快照的版本和目录（二者来自同一次读取，不会因并发发布而错位）
+
+    兼容旧版本布局：没有 CURRENT 指针但根目录下存在 index.faiss 时目录为根目录本身、版本为None
+
+    返回:
+        (版本名, 快照目录路径)，数据库不存在时目录为None
+    """
+    version = current_version(store_path)
+    if version is not None:
+        return version, os.path.join(store_path, SNAPSHOTS_DIR, version)
+    if os.path.exists(os.path.join(store_path, "index.faiss")):
+        return None, store_path
+    return None, None
+
+
+def resolve_snapshot_path(store_path: str) -> str:
+    """
+    返回当前快照所在的目录（同时需要版本名时使用 resolve_snapshot）
+
+    返回:
+        快照目录路径，数据库不存在时返回None
+    """
+    return resolve_snapshot(store_path)[1]
+
+
+def snapshot_exists(store_path: str) -> bool:
+    """检查向量数据库是否存在（快照布局或旧版本布局）"""
+    snapshot_path = resolve_snapshot_path(store_path)
+    return snapshot_path is not None and os.path.exists(os.path.join(snapshot_path, "index.faiss"))
+
+
+def list_snapshots(store_path: str) -> list:
+    """返回已保存的快照版本名列表（按版本从旧到新）"""
+    return [name for _, name in _list_versions(os.path.join(store_path, SNAPSHOTS_DIR))]
+
+
+def _list_versions(snapshots_path: str) -> list:
+    versions = []
+    if os.path.isdir(snapshots_path):
+        for name in os.listdir(snapshots_path):
+            match = _VERSION_PATTERN.match(name)
+            if match:
+                versions.append((int(match.group(1)), name))
+    return sorted(versions)
+
+
+def _fsync_path(path: str):
+    """将文件或目录的内容刷到磁盘（部分平台不支持对目录 fsync，忽略即可）"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class SnapshotDir(str):
+    """write_snapshot 产出的临时目录路径；发布后 version 为本次写入的版本名（发布前为None）"""
+    version = None
+
+
+@contextmanager
+def store_lock(store_path: str):
+    """
+    数据库目录的进程间排他锁（<store_path>/.lock），阻塞直到取得
+
+    Linux / macOS 使用 fcntl.flock，Windows 使用 msvcrt.locking；进程退出时锁由系统自动释放
+    """
+    os.makedirs(store_path, exist_ok=True)
+    fd = os.open(os.path.join(store_path, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def write_snapshot(store_path: str):
+    """
+    写入新快照的上下文管理器
+
+    在临时目录中写入全部文件，正常退出后依次：刷盘、（持有数据库目录锁）选择下一个版本号、重命名为新版本目录、
+    原子替换 CURRENT 指针、清理过旧的快照。发生异常时删除临时目录，当前快照保持不变。
+
+    用法:
+        with write_snapshot(store_path) as snapshot_dir:
+            ...  # 把索引和元数据写入 snapshot_dir
+        snapshot_dir.version  # 本次发布的版本（不必再读 CURRENT，其他进程可能已发布更新的版本）
+    """
+    snapshots_path = os.path.join(store_path, SNAPSHOTS_DIR)
+    os.makedirs(snapshots_path, exist_ok=True)
+    tmp_dir = SnapshotDir(tempfile.mkdtemp(prefix=".tmp-", dir=snapshots_path))
+    try:
+        yield tmp_dir
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    for name in os.listdir(tmp_dir):
+        _fsync_path(os.path.join(tmp_dir, name))
+
+    # 版本分配、重命名和指针切换必须串行：并发发布的进程否则可能选到同一个版本号
+    with store_lock(store_path):
+        versions = _list_versions(snapshots_path)
+        version = f"v{(versions[-1][0] + 1 if versions else 1):06d}"
+        os.rename(tmp_dir, os.path.join(snapshots_path, version))
+        _fsync_path(snapshots_path)
+
+        # 原子切换 CURRENT 指针
+        current_tmp = os.path.join(store_path, CURRENT_FILE + ".tmp")
+        with open(current_tmp, "w", encoding="utf-8") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(current_tmp, os.path.join(store_path, CURRENT_FILE))
+        _fsync_path(store_path)
+
+        _cleanup(store_path, snapshots_path, version)
+    tmp_dir.version = version
+
+
+def _cleanup(store_path: str, snapshots_path: str, current: str):
+    """删除过旧的快照和旧版本布局遗留的文件"""
+    versions = [name for _, name in _list_versions(snapshots_path)]
+    for name in versions[:-KEEP_SNAPSHOTS]:
+        if name != current:
+            # Windows 下被其他进程映射的文件无法删除，留待下次清理
+            shutil.rmtree(os.path.join(snapshots_path, name), ignore_errors=True)
+    for name in LEGACY_FILES:
+        legacy_path = os.path.join(store_path, name)
+        if os.path.exists(legacy_path):
+            try:
+                os.remove(legacy_path)
+            except OSError:
+                pass
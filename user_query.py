@@ -1,18 +1,531 @@
-from langchain_community.llms import Tongyi
-from data_process import load_knowledge_base
-from langchain_community.embeddings import DashScopeEmbeddings
+from context_builder import DEFAULT_CONTEXT_BUDGET, build_context
+from data_process import create_embeddings, stored_embedding_backend
+from dedup import chunk_origins
+from embedding_pipeline import embed_query_batch
+from instrumentation import count, span
+from query_cache import QueryEmbeddingCache, SemanticAnswerCache
+from search_filter import make_search_filter
+from sharded_store import DEFAULT_SEARCH_WORKERS, load_vector_store, search_many
+from snapshot_store import current_version
+import asyncio
 import os
+import threading
+import time
 
 # 设置查询问题
 # query = "客户经理被投诉了，投诉一次扣多少分？"
 
-def run_query_mode(query: str, vector_store_path: str = "./vector_store"):
+
+class QueryEngine:
+    """
+    常驻查询引擎
+
+    在整个进程生命周期内只加载一次向量数据库、页码信息、嵌入模型和大模型客户端，
+    交互式模式下的每个问题都复用同一份资源，不再重复读取索引。
+    重复或相近的问题由查询向量缓存和语义答案缓存直接应答，知识库快照切换后两级缓存自动清空。
+    其他进程发布新快照后，查询引擎在后台线程中打开新快照并整体替换，替换前的查询继续使用旧快照。
+    """
+
+    def __init__(
+        self,
+        vector_store_path: str = "./vector_store",
+        embeddings=None,
+        llm=None,
+        k: int = 4,
+        mmap: bool = True,
+        search_params: dict = None,
+        query_cache_size: int = 1024,
+        query_cache_ttl: float = 3600,
+        answer_cache_threshold: float = 0.95,
+        context_budget: int = DEFAULT_CONTEXT_BUDGET,
+        search_workers: int = DEFAULT_SEARCH_WORKERS,
+        search_filter=None,
+        auto_reload: bool = True
+    ):
+        """
+        参数:
+            vector_store_path: 向量数据库路径
+            embeddings: 可选，嵌入模型。如果为None，按知识库记录的嵌入后端创建
+            llm: 可选，对话大模型。如果为None，将创建Tongyi实例
+            k: 每次检索返回的文档块数量
+            mmap: 是否以内存映射方式只读打开向量索引（启动更快，向量按需换入内存）
+            search_params: 可选，覆盖知识库保存的搜索参数，如 {"nprobe": 32}、{"ef_search": 128} 或 {"rerank": 4}
+            query_cache_size: 查询向量缓存的最大条目数，0 表示不缓存
+            query_cache_ttl: 查询向量缓存条目的有效期（秒），None 表示不过期
+            answer_cache_threshold: 语义答案缓存的余弦相似度阈值，None 表示不缓存答案
+            context_budget: 提示词上下文的 token 预算，None 表示不限制
+            search_workers: 分片知识库并行搜索分片的线程数
+            search_filter: 可选，默认的检索过滤条件（make_search_filter 生成），只在指定文档 / 页码范围内检索
+            auto_reload: 检测到新快照时是否在后台重新加载知识库（False 时只清空查询缓存，继续使用已加载的快照）
+        """
+        self.vector_store_path = vector_store_path
+        self.k = k
+        self.search_filter = search_filter
+        self.mmap = mmap
+        self.search_params = search_params
+        self.search_workers = search_workers
+        self.auto_reload = auto_reload
+
+        # 创建嵌入模型
+        if embeddings is None:
+            embeddings = create_embeddings(backend=stored_embedding_backend(vector_store_path))
+        self.embeddings = embeddings
+
+        # 从磁盘加载向量数据库（只加载一次；分片知识库的各分片在首次检索时加载）
+        self.knowledge_base = load_vector_store(
+            vector_store_path, embeddings, mmap=mmap, search_params=search_params, search_workers=search_workers
+        )
+
+        # 初始化对话大模型
+        if llm is None:
+            # 大模型客户端只在查询时需要，构建知识库的进程不导入
+            from langchain_community.llms import Tongyi
+
+            DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY")
+            llm = Tongyi(model_name="deepseek-v3", dashscope_api_key=DASHSCOPE_API_KEY)
+        self.llm = llm
+
+        # 两级查询缓存，与加载时的快照版本绑定
+        self.query_cache = QueryEmbeddingCache(query_cache_size, query_cache_ttl) if query_cache_size else None
+        self.answer_cache = SemanticAnswerCache(answer_cache_threshold) if answer_cache_threshold is not None else None
+        self.cache_version = getattr(self.knowledge_base, "snapshot_version", None)
+
+        # 快照重新加载：同一时间只有一个加载线程，加载失败的版本不再重试
+        self._reload_lock = threading.Lock()
+        self._reload_thread = None
+        self._failed_version = None
+
+        # 上下文构建：最近一次的结果和累计节省量
+        self.context_budget = context_budget
+        self.last_context = None
+        self.context_stats = {"queries": 0, "saved_chars": 0, "saved_tokens": 0}
+
+    def check_snapshot(self):
+        """
+        检查知识库快照是否已切换：开启自动重新加载时在后台线程中打开新快照（加载完成前继续使用当前快照），
+        否则只清空查询缓存（缓存的答案可能引用已删除或已修改的文档）
+        """
+        version = current_version(self.vector_store_path)
+        if version == self.cache_version:
+            return
+        if self.auto_reload:
+            if version != self._failed_version:
+                self.reload_in_background()
+            return
+        self.clear_caches()
+        self.cache_version = version
+
+    def clear_caches(self):
+        for cache in (self.query_cache, self.answer_cache):
+            if cache is not None:
+                cache.clear()
+
+    def reload(self) -> bool:
+        """
+        打开 CURRENT 指向的新快照，加载完成后一次性替换常驻的知识库并清空查询缓存
+
+        替换只是一次属性赋值：正在进行的检索继续使用替换前的知识库对象，不会被打断或阻塞，
+        旧知识库在不再被引用后由垃圾回收释放。分片知识库沿用已加载且版本未变的分片
+
+        返回:
+            是否切换到了新快照
+        """
+        with self._reload_lock:
+            version = current_version(self.vector_store_path)
+            if version == self.cache_version:
+                return False
+            start = time.perf_counter()
+            with span("query.reload", version=version):
+                knowledge_base = load_vector_store(
+                    self.vector_store_path, self.embeddings, mmap=self.mmap, search_params=self.search_params,
+                    search_workers=self.search_workers, verbose=False
+                )
+                adopt_shards = getattr(knowledge_base, "adopt_shards", None)
+                if adopt_shards is not None:
+                    adopt_shards(self.knowledge_base)
+            self.knowledge_base = knowledge_base
+            self.clear_caches()
+            self.cache_version = knowledge_base.snapshot_version
+            count("snapshot_reloads")
+            print(f"🔄 知识库已切换到快照 {self.cache_version}（加载耗时 {time.perf_counter() - start:.2f}s）")
+            return True
+
+    def reload_in_background(self):
+        """在后台线程中重新加载知识库（已有加载线程在运行时直接返回）"""
+        with self._reload_lock:
+            if self._reload_thread is not None and self._reload_thread.is_alive():
+                return
+            self._reload_thread = threading.Thread(target=self._reload_quietly, name="snapshot-reload", daemon=True)
+            self._reload_thread.start()
+
+    def _reload_quietly(self):
+        version = current_version(self.vector_store_path)
+        try:
+            self.reload()
+        except Exception as e:
+            self._failed_version = version
+            print(f"⚠️ 加载快照 {version} 失败：{e}（继续使用快照 {self.cache_version}）")
+
+    def embed_query(self, query: str) -> list:
+        """计算查询向量，规范化后相同的问题直接使用缓存的向量"""
+        with span("query.embed") as s:
+            if self.query_cache is None:
+                return self.embeddings.embed_query(query)
+            start = time.perf_counter()
+            vector = self.query_cache.get(query)
+            hit = vector is not None
+            if not hit:
+                vector = self.embeddings.embed_query(query)
+                self.query_cache.put(query, vector)
+            self.query_cache.stats.record(hit, time.perf_counter() - start)
+            s.set(cached=hit)
+            return vector
+
+    def embed_queries(self, queries: list) -> list:
+        """
+        批量计算查询向量：缓存命中的直接返回，未命中的合并为一批请求嵌入模型
+
+        参数:
+            queries: 查询问题列表
+
+        返回:
+            与 queries 一一对应的查询向量列表
+        """
+        vectors = [None] * len(queries)
+        if self.query_cache is not None:
+            for i, query in enumerate(queries):
+                vectors[i] = self.query_cache.get(query)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            start = time.perf_counter()
+            with span("query.embed", queries=len(missing)):
+                computed = embed_query_batch(self.embeddings, [queries[i] for i in missing])
+            elapsed = time.perf_counter() - start
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+                if self.query_cache is not None:
+                    self.query_cache.put(queries[i], vector)
+                    self.query_cache.stats.record(False, elapsed / len(missing))
+        if self.query_cache is not None:
+            for _ in range(len(queries) - len(missing)):
+                self.query_cache.stats.record(True, 0.0)
+        return vectors
+
+    def resolve_filter(self, search_filter=None):
+        """返回本次检索使用的过滤条件：未指定时使用引擎默认的过滤条件"""
+        return search_filter if search_filter is not None else self.search_filter
+
+    def cache_scope(self, search_filter=None):
+        """语义答案缓存的检索范围标识：不同过滤条件下的答案互不复用"""
+        search_filter = self.resolve_filter(search_filter)
+        return search_filter.key if search_filter is not None else None
+
+    def retrieve_many(self, embeddings: list, search_filter=None) -> list:
+        """
+        用一次多查询 FAISS 搜索检索多个问题的文档块（分片知识库对每个分片各搜索一次后合并）
+
+        参数:
+            embeddings: 查询向量列表
+            search_filter: 可选，检索过滤条件，默认使用引擎的过滤条件
+
+        返回:
+            与 embeddings 一一对应的文档块列表
+        """
+        search_filter = self.resolve_filter(search_filter)
+        with span("query.search", queries=len(embeddings), k=self.k, filtered=search_filter is not None):
+            return search_many(self.knowledge_base, embeddings, self.k, search_filter)
+
+    def retrieve(self, query: str, embedding: list = None, search_filter=None) -> list:
+        """
+        检索与问题最相关的文档块
+
+        参数:
+            query: 用户查询问题
+            embedding: 可选，已计算好的查询向量
+            search_filter: 可选，检索过滤条件，默认使用引擎的过滤条件
+
+        返回:
+            docs: 检索到的文档块列表
+        """
+        if embedding is None:
+            embedding = self.embed_query(query)
+        return self.retrieve_many([embedding], search_filter)[0]
+
+    def search(self, query: str, docs=None, pages=None, k: int = None) -> list:
+        """
+        只在指定文档 / 页码范围内检索文档块（不调用大模型）
+
+        参数:
+            query: 查询问题
+            docs: 可选，文档名（字符串或列表），匹配文件名中包含该字符串的文档
+            pages: 可选，页码范围，如 "1-5,8"
+            k: 可选，返回的文档块数量，默认使用引擎的 k
+
+        返回:
+            检索到的文档块列表
+        """
+        search_filter = self.resolve_filter(make_search_filter(docs, pages))
+        embedding = self.embed_query(query)
+        k = k or self.k
+        with span("query.search", k=k, filtered=search_filter is not None):
+            return search_many(self.knowledge_base, [embedding], k, search_filter)[0]
+
+    def build_context(self, docs: list):
+        """
+        合并重叠的文本块、去重并按 token 预算构建上下文，同时累计节省的字符数和 token 数
+
+        参数:
+            docs: 按检索排名排列的文档块
+
+        返回:
+            ContextResult: 上下文文本和实际装入的文档块
+        """
+        with span("query.context", docs=len(docs)):
+            context = build_context(docs, self.context_budget)
+        self.last_context = context
+        self.context_stats["queries"] += 1
+        self.context_stats["saved_chars"] += context.saved_chars
+        self.context_stats["saved_tokens"] += context.saved_tokens
+        return context
+
+    def build_prompt(self, query: str, context: str) -> str:
+        """将上下文和问题组合为提示词"""
+        return f"基于以下文档内容回答问题：\n\n{context}\n\n问题：{query}\n\n答案："
+
+    def prepare(self, query: str, search_filter=None):
+        """
+        检查快照、计算查询向量并查找语义答案缓存；未命中时检索文档块
+
+        参数:
+            query: 用户查询问题
+            search_filter: 可选，检索过滤条件，默认使用引擎的过滤条件
+
+        返回:
+            (embedding, cached, docs): 查询向量、命中的 (答案, 文档块)（未命中为None）、检索到的文档块
+
+        异常:
+            ValueError: 过滤条件下没有可检索的文档块
+        """
+        self.check_snapshot()
+        search_filter = self.resolve_filter(search_filter)
+        embedding = self.embed_query(query)
+
+        # 相近的问题已经回答过时直接返回缓存的答案和来源
+        if self.answer_cache is not None:
+            cached = self.answer_cache.get(embedding, self.cache_scope(search_filter))
+            count("answer_cache_lookups", result="miss" if cached is None else "hit")
+            if cached is not None:
+                self.last_context = None
+                return embedding, cached, cached[1]
+
+        docs = self.retrieve(query, embedding, search_filter)
+        if not docs and search_filter is not None:
+            raise ValueError(f"检索范围内没有文档块（{search_filter.describe()}）")
+        return embedding, None, docs
+
+    def remember(self, embedding: list, response_text: str, docs: list, start: float, scope=None):
+        """将新生成的答案写入语义答案缓存，并记录未命中路径的耗时"""
+        if self.answer_cache is not None:
+            self.answer_cache.put(embedding, response_text, docs, scope)
+            self.answer_cache.stats.record(False, time.perf_counter() - start)
+
+    def answer(self, query: str, search_filter=None):
+        """
+        检索并生成答案
+
+        参数:
+            query: 用户查询问题
+            search_filter: 可选，检索过滤条件，默认使用引擎的过滤条件
+
+        返回:
+            (response_text, docs): 大模型回答和检索到的文档块
+        """
+        start = time.perf_counter()
+        embedding, cached, docs = self.prepare(query, search_filter)
+        if cached is not None:
+            self.answer_cache.stats.record(True, time.perf_counter() - start)
+            return cached
+
+        # 使用简单的 LLM 调用模式（兼容所有版本）
+        context = self.build_context(docs)
+        prompt = self.build_prompt(query, context.text)
+        count("llm_calls")
+        count("prompt_chars", len(prompt))
+        with span("query.llm"):
+            response_text = self.llm.invoke(prompt)
+        self.remember(embedding, response_text, context.docs, start, self.cache_scope(search_filter))
+        return response_text, context.docs
+
+    def stream_answer(self, query: str, search_filter=None) -> "StreamingAnswer":
+        """
+        检索文档块后以流式方式生成答案，迭代返回值即可逐段得到回答文本
+
+        参数:
+            query: 用户查询问题
+            search_filter: 可选，检索过滤条件，默认使用引擎的过滤条件
+
+        返回:
+            StreamingAnswer: 流式回答（docs 属性为检索到的文档块）
+        """
+        start = time.perf_counter()
+        embedding, cached, docs = self.prepare(query, search_filter)
+        scope = self.cache_scope(search_filter)
+        if cached is not None:
+            self.answer_cache.stats.record(True, time.perf_counter() - start)
+            return StreamingAnswer(docs, chunks=[cached[0]], start=start)
+
+        context = self.build_context(docs)
+        prompt = self.build_prompt(query, context.text)
+        count("llm_calls")
+        count("prompt_chars", len(prompt))
+        chunks = self.llm.stream(prompt)
+        return StreamingAnswer(
+            context.docs, chunks=chunks, start=start,
+            on_complete=lambda text: self.remember(embedding, text, context.docs, start, scope)
+        )
+
+    async def astream_answer(self, query: str, search_filter=None) -> "StreamingAnswer":
+        """
+        stream_answer 的异步版本：检索在线程中执行，回答通过大模型的 astream 异步获取
+
+        参数:
+            query: 用户查询问题
+            search_filter: 可选，检索过滤条件，默认使用引擎的过滤条件
+
+        返回:
+            StreamingAnswer: 用 async for 迭代的流式回答
+        """
+        start = time.perf_counter()
+        embedding, cached, docs = await asyncio.to_thread(self.prepare, query, search_filter)
+        scope = self.cache_scope(search_filter)
+        if cached is not None:
+            self.answer_cache.stats.record(True, time.perf_counter() - start)
+            return StreamingAnswer(docs, chunks=[cached[0]], start=start)
+
+        context = self.build_context(docs)
+        prompt = self.build_prompt(query, context.text)
+        count("llm_calls")
+        count("prompt_chars", len(prompt))
+        chunks = self.llm.astream(prompt)
+        return StreamingAnswer(
+            context.docs, achunks=chunks, start=start,
+            on_complete=lambda text: self.remember(embedding, text, context.docs, start, scope)
+        )
+
+    async def astream(self, query: str, search_filter=None):
+        """异步生成器：逐段产出回答文本（需要来源信息时使用 astream_answer）"""
+        answer = await self.astream_answer(query, search_filter)
+        async for chunk in answer:
+            yield chunk
+
+    def cache_summary(self) -> list:
+        """返回两级查询缓存的命中率、延迟统计和上下文构建的累计节省量"""
+        lines = []
+        if self.query_cache is not None:
+            lines.append(self.query_cache.stats.summary("查询向量缓存"))
+        if self.answer_cache is not None:
+            lines.append(self.answer_cache.stats.summary("语义答案缓存"))
+        stats = self.context_stats
+        if stats["queries"]:
+            lines.append(f"上下文构建：{stats['queries']} 次查询共节省 {stats['saved_chars']} 字符（约 {stats['saved_tokens']} tokens）")
+        return lines
+
+    def get_sources(self, docs: list) -> list:
+        """
+        获取文档块的来源信息（去重并保持顺序）
+
+        参数:
+            docs: 检索到的文档块列表
+
+        返回:
+            来源信息列表，格式为"文档名.pdf:页码"
+        """
+        # 来源和页码记录在文本块元数据中（去重合并的文本块还列出其余出处）；
+        # 旧版知识库（元数据没有来源）按原文查找页码信息
+        page_info = getattr(self.knowledge_base, "page_info", None) or {}
+        sources = []
+        for doc in docs:
+            metadata = getattr(doc, "metadata", None) or {}
+            if metadata.get("source") is not None:
+                source_infos = [f"{item['source']}:{item.get('page')}" for item in chunk_origins(metadata)
+                                if item.get("source") is not None]
+            else:
+                source_infos = [page_info.get(getattr(doc, "page_content", ""), metadata.get("page") or "未知")]
+            for source_info in source_infos:
+                if source_info not in sources:
+                    sources.append(source_info)
+        return sources
+
+
+class StreamingAnswer:
+    """
+    流式回答：同步（for）或异步（async for）迭代得到回答片段
+
+    迭代结束后 text 为完整答案，first_token_seconds / total_seconds 为从提问开始到第一个片段、
+    到回答结束的耗时（秒）
+
+    参数:
+        docs: 检索到的文档块
+        chunks: 同步的回答片段迭代器
+        achunks: 异步的回答片段迭代器
+        start: 提问时刻（time.perf_counter()）
+        on_complete: 可选，回答结束后以完整答案调用的回调
+    """
+
+    def __init__(self, docs: list, chunks=None, achunks=None, start: float = None, on_complete=None):
+        self.docs = docs
+        self.text = ""
+        self.first_token_seconds = None
+        self.total_seconds = None
+        self._chunks = chunks
+        self._achunks = achunks
+        self._start = time.perf_counter() if start is None else start
+        self._parts = []
+        self._on_complete = on_complete
+
+    def _record(self, chunk) -> str:
+        # 对话模型返回消息片段，文本模型直接返回字符串
+        text = getattr(chunk, "content", chunk)
+        if self.first_token_seconds is None:
+            self.first_token_seconds = time.perf_counter() - self._start
+        self._parts.append(text)
+        return text
+
+    def _finish(self):
+        self.text = "".join(self._parts)
+        self.total_seconds = time.perf_counter() - self._start
+        if self.first_token_seconds is None:
+            self.first_token_seconds = self.total_seconds
+        if self._on_complete is not None:
+            self._on_complete(self.text)
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            yield self._record(chunk)
+        self._finish()
+
+    async def _aiterate(self):
+        if self._achunks is None:
+            for chunk in self._chunks:
+                yield self._record(chunk)
+        else:
+            async for chunk in self._achunks:
+                yield self._record(chunk)
+        self._finish()
+
+    def __aiter__(self):
+        return self._aiterate()
+
+
+def run_query_mode(query: str, vector_store_path: str = "./vector_store", engine: QueryEngine = None, stream: bool = True):
     """
     运行查询模式：使用已初始化的知识库进行问答
     
     参数:
         query: 用户查询问题
         vector_store_path: 向量数据库路径（默认使用 ./vector_store）
+        engine: 可选，已创建的查询引擎。如果为None，将临时创建一个
+        stream: 是否以流式方式逐段打印回答
     
     返回:
         bool: 查询是否成功执行
@@ -20,7 +533,7 @@ def run_query_mode(query: str, vector_store_path: str = "./vector_store"):
     try:
         print(f"\n正在处理查询：{query}")
         print("-" * 50)
-        user_query(query, vector_store_path)
+        user_query(query, vector_store_path, engine=engine, stream=stream)
         print("-" * 50)
         return True
     except Exception as e:
@@ -28,57 +541,49 @@ def run_query_mode(query: str, vector_store_path: str = "./vector_store"):
         return False
 
 
-def user_query(query: str, vector_store_path: str = "./vector_store"):
+def user_query(query: str, vector_store_path: str = "./vector_store", engine: QueryEngine = None, stream: bool = False):
     if query:
-        # 示例：如何加载已保存的向量数据库
-        # 注释掉以下代码以避免在当前运行中重复加载
-        # 创建嵌入模型
-        embeddings = DashScopeEmbeddings(
-            model="text-embedding-v2"
-        )
-        # 从磁盘加载向量数据库
-        loaded_knowledgeBase = load_knowledge_base(vector_store_path, embeddings)
-        # 使用加载的知识库进行查询
-        docs = loaded_knowledgeBase.similarity_search(query)
-        
-        # 初始化对话大模型
-        DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY")
-        llm = Tongyi(model_name="deepseek-v3", dashscope_api_key=DASHSCOPE_API_KEY)
-        
-        # 使用简单的 LLM 调用模式（兼容所有版本）
-        # 将文档内容组合作为上下文
-        context = "\n\n".join([doc.page_content for doc in docs])
-        prompt = f"基于以下文档内容回答问题：\n\n{context}\n\n问题：{query}\n\n答案："
-        
-
-        response_text = llm.invoke(prompt)
+        # 未传入查询引擎时临时创建（会加载一次向量数据库）
+        if engine is None:
+            with span("query.engine_init"):
+                engine = QueryEngine(vector_store_path)
 
-        
-        print("查询已处理。")
-        print(response_text)
+        if stream:
+            # 流式输出：收到回答片段后立即打印
+            with span("query", stream=True):
+                answer = engine.stream_answer(query)
+                print("查询已处理。")
+                with span("query.llm", stream=True) as s:
+                    for chunk in answer:
+                        print(chunk, end="", flush=True)
+                    s.set(first_token_ms=round(answer.first_token_seconds * 1000, 1))
+            print()
+            docs = answer.docs
+            print(f"⏱ 首字延迟 {answer.first_token_seconds:.2f}s，总耗时 {answer.total_seconds:.2f}s")
+        else:
+            start = time.perf_counter()
+            with span("query", stream=False):
+                response_text, docs = engine.answer(query)
+            print("查询已处理。")
+            print(response_text)
+            print(f"⏱ 总耗时 {time.perf_counter() - start:.2f}s")
+        if engine.last_context is not None:
+            print(f"🧩 {engine.last_context.summary()}")
+        else:
+            print("🧩 命中语义答案缓存")
         print("\n" + "=" * 50)
         print("📚 答案来源:")
         print("=" * 50)
 
-        # 记录唯一的来源信息（PDF名称和页码）
-        unique_sources = set()
-
-        # 显示每个文档块的来源信息
-        for doc in docs:
-            text_content = getattr(doc, "page_content", "")
-            source_info = loaded_knowledgeBase.page_info.get(
-                text_content.strip(), "未知"
-            )
-
-            if source_info not in unique_sources:
-                unique_sources.add(source_info)
-                # 解析PDF名称和页码
-                if ":" in str(source_info):
-                    pdf_name, page_num = str(source_info).split(":", 1)
-                    print(f"  📄 文档: {pdf_name}")
-                    print(f"  📑 页码: 第 {page_num} 页")
-                    print()
-                else:
-                    # 兼容旧格式（纯数字页码）
-                    print(f"  📑 页码: 第 {source_info} 页")
-                    print()
\ No newline at end of file
+        # 显示每个文档块的来源信息（PDF名称和页码）
+        for source_info in engine.get_sources(docs):
+            # 解析PDF名称和页码
+            if ":" in str(source_info):
+                pdf_name, page_num = str(source_info).split(":", 1)
+                print(f"  📄 文档: {pdf_name}")
+                print(f"  📑 页码: 第 {page_num} 页")
+                print()
+            else:
+                # 兼容旧格式（纯数字页码）
+                print(f"  📑 页码: 第 {source_info} 页")
+                print()
@@ -0,0 +1,427 @@
+"""
+向量索引配置模块
+根据配置创建 Flat（精确搜索）、IVF（倒排聚类）或 HNSW（图索引）类型的 FAISS 索引，
+可选地以 float16 / 8 位标量量化 / 乘积量化压缩向量，
+负责索引训练、搜索参数（nprobe / efSearch）的设置、基于原始向量的精确重排序，以及向量删除
+"""
+import logging
+import math
+import shutil
+import tempfile
+
+import faiss
+import numpy as np
+
+from settings import COMPRESSION_TYPES, INDEX_TYPES
+
+# 各索引类型的默认参数
+DEFAULT_INDEX_PARAMS = {
+    "flat": {},
+    "ivf": {"nlist": 1024, "nprobe": 16},
+    "hnsw": {"m": 32, "ef_construction": 200, "ef_search": 64},
+}
+
+# 每个聚类中心至少需要的训练向量数（低于该值 FAISS 会给出聚类质量警告）
+MIN_POINTS_PER_CENTROID = 39
+
+# 8 位标量量化估计各维度取值范围所用的训练向量数
+SQ8_TRAINING_SIZE = 1000
+
+# 乘积量化的默认编码位数（每个子量化器 256 个中心）
+PQ_NBITS = 8
+
+# 过滤后候选向量不超过该数量时，近似索引（IVF / HNSW）直接对候选逐一计算距离：
+# 条件很严格时 HNSW 图搜索和 IVF 探测的聚类中可能找不到足够的候选
+SUBSET_SCAN_LIMIT = 4096
+
+
+def make_index_config(index_type: str = "flat", compression: str = "none", **params) -> dict:
+    """
+    生成索引配置，未指定（为None）的参数使用默认值
+
+    参数:
+        index_type: 索引类型，flat / ivf / hnsw
+        compression: 向量压缩方式，none / fp16 / sq8 / pq
+        params: 索引参数，如 nlist、nprobe、m、ef_search、ef_construction，
+                以及压缩参数 pq_m（子量化器数量，默认为维度/16）和 rerank（重排序候选倍数，0 表示不重排序）
+
+    返回:
+        索引配置字典，例如 {"type": "ivf", "nlist": 1024, "nprobe": 16, "compression": "sq8", "rerank": 4}
+    """
+    index_type = index_type.lower()
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"不支持的索引类型: {index_type}（可选：{', '.join(INDEX_TYPES)}）")
+    compression = compression.lower()
+    if compression not in COMPRESSION_TYPES:
+        raise ValueError(f"不支持的压缩方式: {compression}（可选：{', '.join(COMPRESSION_TYPES)}）")
+
+    config = {"type": index_type}
+    for name, default in DEFAULT_INDEX_PARAMS[index_type].items():
+        value = params.get(name)
+        config[name] = default if value is None else value
+
+    # 不压缩时不写入压缩相关的键，与旧版本保存的配置保持一致
+    if compression != "none":
+        config["compression"] = compression
+        if compression == "pq":
+            config["pq_m"] = params.get("pq_m")
+            config["pq_nbits"] = PQ_NBITS
+        config["rerank"] = params.get("rerank") or 0
+    return config
+
+
+def is_compressed(config: dict) -> bool:
+    """索引是否以压缩形式保存向量（需要在磁盘上另存原始向量）"""
+    return config.get("compression", "none") != "none"
+
+
+def training_size(config: dict) -> int:
+    """创建索引前需要缓冲的训练向量数量"""
+    size = 0
+    if config["type"] == "ivf":
+        size = config["nlist"] * MIN_POINTS_PER_CENTROID
+    compression = config.get("compression", "none")
+    if compression == "sq8":
+        size = max(size, SQ8_TRAINING_SIZE)
+    elif compression == "pq":
+        size = max(size, (1 << config["pq_nbits"]) * MIN_POINTS_PER_CENTROID)
+    return size
+
+
+def _pq_subquantizers(dimension: int, pq_m: int = None) -> int:
+    """确定乘积量化的子量化器数量：必须整除向量维度，默认每个子量化器负责约 16 维"""
+    if pq_m is not None:
+        if dimension % pq_m:
+            raise ValueError(f"乘积量化的子量化器数量 {pq_m} 必须整除向量维度 {dimension}")
+        return pq_m
+    pq_m = max(1, dimension // 16)
+    while dimension % pq_m:
+        pq_m -= 1
+    return pq_m
+
+
+def _codec(dimension: int, config: dict, n_train: int) -> str:
+    """生成 index_factory 中描述向量编码方式的部分，训练向量不足时调整参数并写回 config"""
+    compression = config.get("compression", "none")
+    if compression == "fp16":
+        return "SQfp16"
+    if compression == "sq8":
+        return "SQ8"
+    if compression == "pq":
+        config["pq_m"] = _pq_subquantizers(dimension, config.get("pq_m"))
+        # k-means 的训练向量数不能少于聚类中心数，向量太少时减少编码位数
+        nbits = min(config["pq_nbits"], max(1, int(math.log2(max(n_train, 2)))))
+        if nbits != config["pq_nbits"]:
+            logging.warning(f"训练向量只有 {n_train} 个，乘积量化编码位数从 {config['pq_nbits']} 调整为 {nbits}")
+            config["pq_nbits"] = nbits
+        return f"PQ{config['pq_m']}x{nbits}"
+    return "Flat"
+
+
+def create_index(dimension: int, config: dict, training_vectors: np.ndarray = None):
+    """
+    根据配置创建空索引，需要训练的索引（IVF、标量量化、乘积量化）会用 training_vectors 训练
+
+    训练向量不足时自动减小 nlist 或乘积量化编码位数，实际使用的值会写回 config
+
+    参数:
+        dimension: 向量维度
+        config: 索引配置
+        training_vectors: 训练向量（float32，形状为 [n, dimension]）
+
+    返回:
+        FAISS 索引对象
+    """
+    n_train = 0 if training_vectors is None else len(training_vectors)
+    codec = _codec(dimension, config, n_train)
+    index_type = config["type"]
+    if index_type == "flat":
+        factory = codec
+    elif index_type == "hnsw":
+        factory = f"HNSW{config['m']}" if codec == "Flat" else f"HNSW{config['m']}_{codec}"
+    else:
+        # IVF：训练向量不足时减小聚类数
+        nlist = min(config["nlist"], max(1, n_train // MIN_POINTS_PER_CENTROID))
+        if nlist != config["nlist"]:
+            logging.warning(f"训练向量只有 {n_train} 个，IVF 聚类数从 {config['nlist']} 调整为 {nlist}")
+            config["nlist"] = nlist
+        factory = f"IVF{nlist},{codec}"
+
+    # index_factory 创建的索引持有量化器，无需额外保存引用
+    index = faiss.index_factory(dimension, factory)
+    if index_type == "hnsw":
+        index.hnsw.efConstruction = config["ef_construction"]
+    if not index.is_trained:
+        if n_train == 0:
+            raise ValueError(f"{describe_index(config)} 索引需要训练向量")
+        index.train(np.ascontiguousarray(training_vectors, dtype=np.float32))
+    apply_search_params(index, config)
+    return index
+
+
+def apply_search_params(index, config: dict):
+    """设置搜索参数：IVF 的 nprobe、HNSW 的 efSearch，以及重排序的候选倍数"""
+    if isinstance(index, RerankIndex):
+        index.factor = config.get("rerank") or 1
+        index = index.index
+    parameter_space = faiss.ParameterSpace()
+    if config["type"] == "ivf":
+        parameter_space.set_index_parameter(index, "nprobe", min(config["nprobe"], config["nlist"]))
+    elif config["type"] == "hnsw":
+        parameter_space.set_index_parameter(index, "efSearch", config["ef_search"])
+
+
+def describe_index(config: dict) -> str:
+    """返回索引配置的简短描述"""
+    params = ", ".join(f"{k}={v}" for k, v in config.items() if k != "type")
+    return f"{config['type'].upper()}({params})" if params else config["type"].upper()
+
+
+class ExactVectors:
+    """
+    按索引位置保存的原始 float32 向量，供压缩索引精确重排序和删除后重建使用
+
+    已保存的部分以 np.memmap 只读打开，不占用常驻内存；新增的向量追加到临时文件，
+    保存快照时与已保存部分一起写出
+
+    参数:
+        dimension: 向量维度
+        path: 可选，已保存的原始向量文件路径
+    """
+
+    def __init__(self, dimension: int, path: str = None):
+        self.dimension = dimension
+        if path is not None:
+            self._stored = np.memmap(path, dtype=np.float32, mode="r").reshape(-1, dimension)
+        else:
+            self._stored = np.empty((0, dimension), dtype=np.float32)
+        self._spill = None
+        self._spill_count = 0
+
+    def __len__(self) -> int:
+        return len(self._stored) + self._spill_count
+
+    def append(self, vectors):
+        """追加一批向量（按索引位置顺序）"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dimension)
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile()
+        self._spill.seek(0, 2)
+        self._spill.write(vectors.tobytes())
+        self._spill_count += len(vectors)
+
+    def _spilled(self) -> np.ndarray:
+        self._spill.flush()
+        return np.memmap(self._spill, dtype=np.float32, mode="r", shape=(self._spill_count, self.dimension))
+
+    def take(self, positions) -> np.ndarray:
+        """按索引位置取回原始向量"""
+        positions = np.asarray(positions, dtype=np.int64)
+        result = np.empty((len(positions), self.dimension), dtype=np.float32)
+        stored = positions < len(self._stored)
+        result[stored] = self._stored[positions[stored]]
+        if not stored.all():
+            result[~stored] = self._spilled()[positions[~stored] - len(self._stored)]
+        return result
+
+    def keep(self, positions, block_size: int = 65536):
+        """只保留指定位置的向量（删除向量后与索引的位置编号保持一致）"""
+        positions = np.asarray(positions, dtype=np.int64)
+        spill = tempfile.TemporaryFile()
+        for i in range(0, len(positions), block_size):
+            spill.write(self.take(positions[i:i + block_size]).tobytes())
+        if self._spill is not None:
+            self._spill.close()
+        self._stored = np.empty((0, self.dimension), dtype=np.float32)
+        self._spill = spill
+        self._spill_count = len(positions)
+
+    def write(self, path: str, block_size: int = 65536):
+        """将全部原始向量写入文件"""
+        with open(path, "wb") as f:
+            for i in range(0, len(self._stored), block_size):
+                f.write(np.ascontiguousarray(self._stored[i:i + block_size]).tobytes())
+            if self._spill is not None:
+                self._spill.flush()
+                self._spill.seek(0)
+                shutil.copyfileobj(self._spill, f)
+
+
+class RerankIndex:
+    """
+    精确重排序包装器：先从压缩索引中取出 k × factor 个候选，
+    再用 ExactVectors 中的原始向量计算精确的 L2 距离，返回距离最小的 k 个
+
+    其他属性和方法（add、ntotal、d 等）都转发给被包装的索引
+
+    参数:
+        index: 压缩后的 FAISS 索引
+        exact_vectors: 原始向量
+        factor: 候选倍数
+    """
+
+    def __init__(self, index, exact_vectors: ExactVectors, factor: int):
+        self.index = index
+        self.exact_vectors = exact_vectors
+        self.factor = factor
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+    def search(self, x, k, params=None):
+        _, candidates = self.index.search(x, k * self.factor, params=params)
+        distances = np.full((len(x), k), np.inf, dtype=np.float32)
+        labels = np.full((len(x), k), -1, dtype=np.int64)
+        for row, (query, row_candidates) in enumerate(zip(x, candidates)):
+            row_candidates = row_candidates[row_candidates >= 0]
+            if not len(row_candidates):
+                continue
+            exact = ((self.exact_vectors.take(row_candidates) - query) ** 2).sum(axis=1)
+            order = np.argsort(exact)[:k]
+            distances[row, :len(order)] = exact[order]
+            labels[row, :len(order)] = row_candidates[order]
+        return distances, labels
+
+
+class PositionSelector:
+    """
+    FAISS IDSelector 及其引用的位图内存
+
+    IDSelectorBitmap 只保存位图的指针，不持有 numpy 数组的引用；搜索期间必须持有本对象，
+    位图才不会在其他线程淘汰缓存或重建位置对照表时被释放
+
+    参数:
+        selector: FAISS IDSelector
+        bitmap: 位图选择器引用的 uint8 数组（区间选择器为None）
+    """
+
+    def __init__(self, selector, bitmap: np.ndarray = None):
+        self.selector = selector
+        self.bitmap = bitmap
+
+
+def make_selector(positions: np.ndarray, ntotal: int) -> PositionSelector:
+    """
+    由索引位置生成 FAISS IDSelector：连续的位置（如同一文档的文本块）用区间选择器，其余用位图
+
+    返回:
+        PositionSelector：选择器和位图一起保存
+    """
+    if len(positions) and positions[-1] - positions[0] + 1 == len(positions):
+        return PositionSelector(faiss.IDSelectorRange(int(positions[0]), int(positions[-1]) + 1))
+    bitmap = np.zeros((ntotal + 7) // 8, dtype=np.uint8)
+    np.bitwise_or.at(bitmap, positions >> 3, (1 << (positions & 7)).astype(np.uint8))
+    return PositionSelector(faiss.IDSelectorBitmap(ntotal, faiss.swig_ptr(bitmap)), bitmap)
+
+
+def _search_parameters(index, selector):
+    """按索引类型生成带选择器的搜索参数，沿用索引当前的 nprobe / efSearch"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    hnsw = getattr(index, "hnsw", None)
+    if hnsw is not None:
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def _subset_search(index, x, k: int, positions: np.ndarray, exact_vectors: "ExactVectors" = None):
+    """只对指定位置的向量计算距离（有原始向量时用原始向量，否则用索引解码的向量）"""
+    vectors = exact_vectors.take(positions) if exact_vectors is not None else reconstruct_vectors(index, positions)
+    distances, rows = faiss.knn(np.ascontiguousarray(x, dtype=np.float32), vectors, min(k, len(positions)), metric=index.metric_type)
+    labels = np.where(rows >= 0, positions[np.maximum(rows, 0)], -1)
+    if distances.shape[1] < k:
+        pad = ((0, 0), (0, k - distances.shape[1]))
+        fill = -np.inf if index.metric_type == faiss.METRIC_INNER_PRODUCT else np.inf
+        distances = np.pad(distances, pad, constant_values=fill)
+        labels = np.pad(labels, pad, constant_values=-1)
+    return distances, labels
+
+
+def filtered_search(index, x, k: int, positions: np.ndarray, selector: PositionSelector = None, exact_vectors: "ExactVectors" = None):
+    """
+    只在指定位置的向量中搜索（在索引内部过滤，而不是多取结果后再过滤）
+
+    Flat 类索引和候选较多的 IVF / HNSW 通过 IDSelector 在搜索时跳过其余向量；
+    候选不超过 SUBSET_SCAN_LIMIT 的 IVF / HNSW 以及不支持选择器的乘积量化 Flat 索引，
+    直接对候选向量计算距离
+
+    参数:
+        index: FAISS 索引（可以是重排序包装器）
+        x: 查询向量矩阵
+        k: 每个查询返回的结果数量
+        positions: 允许返回的索引位置（升序）
+        selector: 可选，预先由 make_selector 生成的选择器（调用方在搜索结束前持有它）
+        exact_vectors: 可选，压缩索引的原始向量，直接计算距离时优先使用
+
+    返回:
+        (distances, labels)，与 index.search 相同
+    """
+    inner = unwrap_index(index)
+    if exact_vectors is None and isinstance(index, RerankIndex):
+        exact_vectors = index.exact_vectors
+    if not len(positions):
+        return np.full((len(x), k), np.inf, dtype=np.float32), np.full((len(x), k), -1, dtype=np.int64)
+    approximate = faiss.try_extract_index_ivf(inner) is not None or hasattr(inner, "hnsw")
+    if isinstance(inner, faiss.IndexPQ) or (approximate and len(positions) <= SUBSET_SCAN_LIMIT):
+        return _subset_search(inner, x, k, positions, exact_vectors)
+    if selector is None:
+        selector = make_selector(positions, inner.ntotal)
+    # selector 在搜索返回前一直被本函数引用，位图不会被提前释放
+    return index.search(x, k, params=_search_parameters(inner, selector.selector))
+
+
+def unwrap_index(index):
+    """返回重排序包装器内部的 FAISS 索引"""
+    return index.index if isinstance(index, RerankIndex) else index
+
+
+def reconstruct_vectors(index, positions) -> np.ndarray:
+    """按位置取回索引中存储的向量（压缩索引得到的是解码后的近似向量）"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    vectors = np.empty((len(positions), index.d), dtype=np.float32)
+    for row, position in enumerate(positions):
+        vectors[row] = index.reconstruct(int(position))
+    return vectors
+
+
+def delete_vectors(knowledge_base, ids: list):
+    """
+    从知识库中删除指定ID的向量
+
+    Flat 类索引（包括标量量化、乘积量化）的 remove_ids 会压缩位置编号，与向量库的 delete 一致，直接使用 delete；
+    IVF 删除后不会重新编号、HNSW 不支持删除，因此用其余向量重建同配置的索引（保留已训练的聚类中心和量化器），
+    有原始向量时用原始向量重建，避免重复量化带来的误差。
+
+    参数:
+        knowledge_base: FAISS 向量数据库对象
+        ids: 要删除的向量ID列表
+    """
+    index = unwrap_index(knowledge_base.index)
+    exact_vectors = getattr(knowledge_base, "exact_vectors", None)
+    to_delete = set(ids)
+    kept = [(position, id_) for position, id_ in sorted(knowledge_base.index_to_docstore_id.items()) if id_ not in to_delete]
+    positions = [position for position, _ in kept]
+
+    if isinstance(index, getattr(faiss, "IndexFlatCodes", faiss.IndexFlat)):
+        knowledge_base.delete(ids)
+    else:
+        if exact_vectors is not None:
+            vectors = exact_vectors.take(positions)
+        else:
+            vectors = reconstruct_vectors(index, positions)
+        rebuilt = faiss.clone_index(index)
+        rebuilt.reset()
+        if len(vectors):
+            rebuilt.add(vectors)
+        if isinstance(knowledge_base.index, RerankIndex):
+            knowledge_base.index.index = rebuilt
+        else:
+            knowledge_base.index = rebuilt
+        knowledge_base.docstore.delete(list(to_delete))
+        knowledge_base.index_to_docstore_id = {i: id_ for i, (_, id_) in enumerate(kept)}
+
+    if exact_vectors is not None:
+        exact_vectors.keep(positions)